@@ -3,6 +3,7 @@
 import os
 import logging
 import json
+import click
 from datetime import datetime, timezone
 
 # Load environment variables from .env file
@@ -68,6 +69,28 @@ init_extensions(app)
 # Initialize analytics middleware
 init_analytics_middleware(app)
 
+# Initialize write-behind activity queue (page views, activity logs, last_login)
+from utils.activity_queue import init_activity_queue
+init_activity_queue(app)
+
+# Initialize background bulk email delivery queue
+from utils.bulk_email_queue import init_bulk_email_queue
+init_bulk_email_queue(app)
+
+# Initialize incremental mailbox sync (admin inbox)
+from utils.mailbox_sync import init_mailbox_sync
+init_mailbox_sync(app)
+
+# Load parsed English reading lessons (precompiled JSON when available)
+from utils.english_lessons import init_english_lessons
+init_english_lessons(app)
+
+# Process-wide content tree for the learning map (invalidated on content commits)
+from utils.content_tree import init_content_tree
+init_content_tree(app)
+from utils.daily_plan_snapshots import init_daily_plan_snapshots
+init_daily_plan_snapshots(app)
+
 # ========================================
 # STATIC FILE VERSIONING
 # ========================================
@@ -170,16 +193,16 @@ def before_request():
     g.current_language = g.locale
     
     # Update user's last activity and log activity
+    # (write-behind: last_login схлопывается по пользователю, лог уходит в очередь)
     if current_user.is_authenticated:
-        current_user.last_login = datetime.now(timezone.utc)
         try:
-            db.session.commit()
+            from utils.activity_queue import touch_user_last_login
+            touch_user_last_login(current_user.id)
             
             # Log user activity
             from utils.activity_logger import log_user_activity
             log_user_activity(action_type='page_view', action_description=f"Visited {path}")
         except Exception as e:
-            db.session.rollback()
             logger.error(f"Error updating user activity: {e}")
     
     # DigiD Session Management
@@ -223,9 +246,11 @@ def after_request(response):
     
     # Add cache control headers to prevent browser caching during development
     # This ensures CSS/JS changes are immediately visible without manual cache clear
-    response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate, public, max-age=0'
-    response.headers['Pragma'] = 'no-cache'
-    response.headers['Expires'] = '0'
+    # (responses with their own max-age, e.g. sitemap/robots.txt, keep it)
+    if response.cache_control.max_age is None:
+        response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate, public, max-age=0'
+        response.headers['Pragma'] = 'no-cache'
+        response.headers['Expires'] = '0'
     
     # Update DigiD session if user is authenticated and has active DigiD session
     if current_user.is_authenticated and current_user.is_digid_user():
@@ -1067,6 +1092,178 @@ def update_domains_command():
     from scripts.update_questions_domains import update_questions_domains
     update_questions_domains()
 
+# Nightly ability recomputation command
+@app.cli.command('rescore-diagnostics')
+@click.option('--status', default='completed', help='Session status to rescore')
+@click.option('--chunk-size', default=1000, type=int, help='Sessions per batch')
+@click.option('--method', default='mle', type=click.Choice(['mle', 'eap']), help='Estimation method')
+def rescore_diagnostics_command(status, chunk_size, method):
+    """Recompute ability estimates for diagnostic sessions in batches"""
+    from utils.irt_engine import rescore_diagnostic_sessions
+    stats = rescore_diagnostic_sessions(status=status, chunk_size=chunk_size, method=method)
+    print(f"✅ Rescored {stats['rescored']}/{stats['sessions']} sessions ({stats['skipped']} skipped)")
+
+# Nightly IRT bank calibration command
+@app.cli.command('calibrate-irt-bank')
+@click.option('--domain', 'domain_code', default=None, help='Limit to one BIG domain code')
+@click.option('--profession', default=None, help='Limit to one profession')
+def calibrate_irt_bank_command(domain_code, profession):
+    """Jointly recalibrate IRT parameters from all stored responses"""
+    from utils.irt_calibration import calibration_service
+    report = calibration_service.calibrate_bank(domain_code=domain_code, profession=profession)
+    if not report.get('success'):
+        print(f"❌ Calibration failed: {report.get('error')}")
+        return
+    print(f"✅ Calibrated {report['calibrated']}/{report['total_questions']} questions "
+          f"({report['defaults']} defaults) from {report.get('responses', 0)} responses "
+          f"in {report['duration_seconds']}s, converged={report['converged']}")
+    for item in report['items']:
+        if item['infit'] > 1.3 or item['outfit'] > 1.3:
+            print(f"⚠️ Question {item['question_id']}: infit={item['infit']:.2f}, outfit={item['outfit']:.2f}")
+
+@app.cli.command('precompute-daily-plans')
+@click.option('--processes', default=4, show_default=True, help='Worker processes')
+@click.option('--chunk-size', default=100, show_default=True, help='Users per worker task')
+@click.option('--target-minutes', default=30, show_default=True, help='Daily study time')
+def precompute_daily_plans_command(processes, chunk_size, target_minutes):
+    """Materialize today's daily plan snapshots for all active users (nightly)"""
+    from utils.daily_plan_snapshots import daily_plan_snapshots
+    result = daily_plan_snapshots.precompute_all(
+        processes=processes, chunk_size=chunk_size, target_minutes=target_minutes
+    )
+    print(f"✅ Daily plans: {result['materialized']} materialized, {result['skipped']} skipped, "
+          f"{result['failed']} failed ({result['users']} active users)")
+
+@app.cli.command('compile-translations')
+def compile_translations_command():
+    """Compile flat per-language translation catalogs (fallbacks resolved)"""
+    from translations.catalog import compile_all, catalogs
+    for lang, size in compile_all().items():
+        print(f"✅ {lang}: {size} keys")
+    catalogs.reset()
+
+@app.cli.command('check-translations')
+@click.option('--verbose', is_flag=True, help='List every missing and duplicate key')
+def check_translations_command(verbose):
+    """Report missing and duplicate translation keys"""
+    from translations.catalog import check_catalogs
+    for lang, info in check_catalogs().items():
+        status = '⚠️' if info['missing'] or info['duplicates'] else '✅'
+        print(f"{status} {lang}: {info['keys']} keys, {len(info['missing'])} missing, "
+              f"{len(info['extra'])} extra, {len(info['duplicates'])} duplicates")
+        if verbose:
+            for key in info['missing']:
+                print(f"    missing: {key}")
+            for key in sorted(set(info['duplicates'])):
+                print(f"    duplicate: {key}")
+
+@app.cli.command('rollup-analytics')
+@click.option('--days', default=30, show_default=True, help='Period to aggregate')
+def rollup_analytics_command(days):
+    """Recompute DeviceAnalytics/CountryAnalytics traffic from sample-weighted visits"""
+    from utils.activity_queue import activity_queue
+    from utils.analytics import rollup_traffic_analytics
+    activity_queue.flush()
+    result = rollup_traffic_analytics(days=days)
+    if result is None:
+        print("❌ Analytics rollup failed")
+        return
+    print(f"✅ Rolled up {result['devices']} device groups and {result['countries']} countries "
+          f"for the last {result['period_days']} days")
+
+@app.cli.command('schedule-review-queues')
+@click.option('--minutes', default=30, show_default=True, help='Review time per user')
+@click.option('--benchmark', is_flag=True, help='Compare with the per-item scheduling path')
+@click.option('--sample', default=50, show_default=True, help='Users sampled for --benchmark')
+@click.option('--dry-run', is_flag=True, help='Compute the queues without storing them')
+def schedule_review_queues_command(minutes, benchmark, sample, dry_run):
+    """Build and store every user's next-day spaced-repetition queue in one pass"""
+    from utils.sr_scheduler import schedule_all_review_queues, benchmark_scheduler
+    if benchmark:
+        report = benchmark_scheduler(sample=sample)
+        print(f"✅ {report['users']} users: per-item {report['per_item_seconds']}s/"
+              f"{report['per_item_queries']} queries, top-k {report['vectorized_seconds']}s/"
+              f"{report['vectorized_queries']} queries, bulk {report['bulk_seconds']}s/"
+              f"{report['bulk_queries']} queries, matching top-k for {report['matching_users']} users")
+        return
+    queues = schedule_all_review_queues(minutes=minutes, persist=not dry_run)
+    total = sum(len(question_ids) for question_ids in queues.values())
+    print(f"✅ Scheduled {total} reviews for {len(queues)} users ({minutes} min each)"
+          f"{' (dry run, not stored)' if dry_run else ''}")
+
+@app.cli.command('resume-email-campaigns')
+def resume_email_campaigns_command():
+    """Deliver the remaining recipients of interrupted bulk email campaigns"""
+    from utils.bulk_email_queue import bulk_email_queue
+    results = bulk_email_queue.resume_pending()
+    if not results:
+        print("✅ No pending email campaigns")
+    for stats in results:
+        print(f"✅ Campaign {stats.campaign_id}: {stats.sent} sent, {stats.failed} failed, "
+              f"{stats.requests} requests in {stats.seconds:.1f}s ({stats.status})")
+
+@app.cli.command('benchmark-security')
+@click.option('--iterations', default=20000, show_default=True, help='Requests classified per variant')
+def benchmark_security_command(iterations):
+    """Per-request overhead of the security middleware pattern matcher"""
+    from utils.security import benchmark_security_matcher
+    report = benchmark_security_matcher(iterations)
+    status = '✅' if report['mismatches'] == 0 else '❌'
+    print(f"{status} {report['iterations']} requests: pattern loop {report['pattern_loop_us']}µs, "
+          f"compiled {report['compiled_us']}µs, cached {report['cached_us']}µs per request, "
+          f"{report['mismatches']} mismatches")
+
+@app.cli.command('rate-limit-stats')
+def rate_limit_stats_command():
+    """Allowed/rejected requests per rate limit bucket"""
+    from utils.rate_limiter import get_rate_limit_stats
+    stats = get_rate_limit_stats()
+    print(f"✅ Storage: {stats['storage']}")
+    for bucket, counts in sorted(stats['buckets'].items()):
+        print(f"   {bucket}: {counts['allowed']} allowed, {counts['rejected']} rejected "
+              f"({counts['rejection_rate']:.1%})")
+
+@app.cli.command('compile-english-lessons')
+def compile_english_lessons_command():
+    """Parse, validate and precompile English reading lessons to JSON"""
+    from utils.english_lessons import compile_english_lessons
+    report = compile_english_lessons()
+    for lesson_num, errors in report.items():
+        if errors:
+            print(f"❌ lesson_{lesson_num:03d}: {'; '.join(errors)}")
+        else:
+            print(f"✅ lesson_{lesson_num:03d}")
+    if any(report.values()):
+        raise SystemExit(1)
+
+@app.cli.command('diagnostic-scheduler-check')
+@click.option('--benchmark', is_flag=True, help='Compare batch and per-plan scoring on synthetic plans')
+@click.option('--sizes', default='10000,100000', show_default=True, help='Plan counts for --benchmark')
+@click.option('--sample', default=2000, show_default=True, help='Plans scored one by one for --benchmark')
+def diagnostic_scheduler_check_command(benchmark, sizes, sample):
+    """Send overdue diagnostic reminders and reschedule urgent reassessments"""
+    from utils.scheduler_service import run_daily_scheduler_check, benchmark_reassessment_scheduler
+    if benchmark:
+        for report in benchmark_reassessment_scheduler([int(size) for size in sizes.split(',')], sample=sample):
+            status = '✅' if report['mismatches'] == 0 and report['top_k_matches_sort'] else '❌'
+            print(f"{status} {report['plans']} plans / {report['sessions']} sessions: batch "
+                  f"{report['batch_seconds']}s, per-plan ~{report['per_plan_seconds_estimated']}s "
+                  f"(sampled {report['per_plan_sample']}), {report['mismatches']} mismatches")
+        return
+    summary = run_daily_scheduler_check()
+    print(f"✅ {summary['overdue']} overdue, {summary['reminders_queued']} reminders queued, "
+          f"{summary['schedules_updated']} of {summary['recommendations']} recommended schedules updated")
+
+@app.cli.command('sync-mailboxes')
+def sync_mailboxes_command():
+    """Incrementally sync all configured mailboxes into the admin inbox"""
+    from utils.mailbox_sync import mailbox_sync
+    for result in mailbox_sync.sync_all():
+        status = '❌' if result.error else '✅'
+        print(f"{status} {result.account} ({result.protocol}): {result.new_messages} new, "
+              f"{result.bodies_loaded} bodies, {result.attachments_stored} attachments"
+              + (f", error: {result.error}" if result.error else ''))
+
 # ========================================
 # DEVELOPMENT ROUTES
 # ========================================
@@ -118,6 +118,9 @@ class Config:
     RESEND_API_KEY = os.environ.get('RESEND_API_KEY', None)
     RESEND_FROM_EMAIL = os.environ.get('RESEND_FROM_EMAIL', 'Mentora <info@bigmentor.nl>')
     
+    # Analytics page tracking: sampling per path prefix ("/learning-map:0.1,/admin:0.25")
+    ANALYTICS_SAMPLE_RATES = os.environ.get('ANALYTICS_SAMPLE_RATES', '')
+    
     # DigiD Configuration
     DIGID_ENABLED = True
     DIGID_SESSION_TIMEOUT = 14400  # 4 hours in seconds
@@ -0,0 +1,33 @@
+"""Add sample_weight to website_visits and page_view
+
+Revision ID: a7c3e91d5b20
+Revises: df528c6ddffd
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c3e91d5b20'
+down_revision = 'df528c6ddffd'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Weight of a sampled page view (1 / sampling rate); existing rows are unsampled
+    with op.batch_alter_table('website_visits', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('sample_weight', sa.Float(), nullable=False, server_default='1.0'))
+
+    with op.batch_alter_table('page_views', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('sample_weight', sa.Float(), nullable=False, server_default='1.0'))
+
+
+def downgrade():
+    with op.batch_alter_table('page_views', schema=None) as batch_op:
+        batch_op.drop_column('sample_weight')
+
+    with op.batch_alter_table('website_visits', schema=None) as batch_op:
+        batch_op.drop_column('sample_weight')
@@ -0,0 +1,40 @@
+"""Add review_queue_snapshot table
+
+Revision ID: a9e4c7b2d815
+Revises: f3b8d1e5a902
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a9e4c7b2d815'
+down_revision = 'f3b8d1e5a902'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'review_queue_snapshot',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('queue_date', sa.Date(), nullable=False),
+        sa.Column('minutes', sa.Integer(), nullable=False),
+        sa.Column('question_ids', sa.Text(), nullable=False),
+        sa.Column('generated_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'queue_date', name='_user_queue_date_uc')
+    )
+    with op.batch_alter_table('review_queue_snapshot', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_review_queue_snapshot_user_id'), ['user_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('review_queue_snapshot', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_review_queue_snapshot_user_id'))
+
+    op.drop_table('review_queue_snapshot')
@@ -0,0 +1,26 @@
+"""Add POP3 UIDLs skipped as duplicates to mailbox sync state
+
+Revision ID: b4d2f8a6c153
+Revises: a9e4c7b2d815
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b4d2f8a6c153'
+down_revision = 'a9e4c7b2d815'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('mailbox_sync_state', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('skipped_uids', sa.Text(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('mailbox_sync_state', schema=None) as batch_op:
+        batch_op.drop_column('skipped_uids')
@@ -0,0 +1,43 @@
+"""Add daily_plan_snapshot table
+
+Revision ID: b4d8f2a6c913
+Revises: a7c3e91d5b20
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b4d8f2a6c913'
+down_revision = 'a7c3e91d5b20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'daily_plan_snapshot',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('plan_date', sa.Date(), nullable=False),
+        sa.Column('target_minutes', sa.Integer(), nullable=False),
+        sa.Column('payload', sa.LargeBinary(), nullable=False),
+        sa.Column('plan_fingerprint', sa.String(length=100), nullable=True),
+        sa.Column('stale_sections', sa.String(length=100), nullable=True),
+        sa.Column('generated_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'plan_date', name='_user_plan_date_uc')
+    )
+    with op.batch_alter_table('daily_plan_snapshot', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_daily_plan_snapshot_user_id'), ['user_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('daily_plan_snapshot', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_daily_plan_snapshot_user_id'))
+
+    op.drop_table('daily_plan_snapshot')
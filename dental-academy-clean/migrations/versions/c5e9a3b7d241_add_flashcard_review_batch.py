@@ -0,0 +1,41 @@
+"""Add flashcard_review_batch table
+
+Revision ID: c5e9a3b7d241
+Revises: b4d8f2a6c913
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5e9a3b7d241'
+down_revision = 'b4d8f2a6c913'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'flashcard_review_batch',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('batch_id', sa.String(length=64), nullable=False),
+        sa.Column('review_count', sa.Integer(), nullable=True),
+        sa.Column('xp_earned', sa.Integer(), nullable=True),
+        sa.Column('result', sa.JSON(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'batch_id', name='uq_flashcard_review_batch')
+    )
+    with op.batch_alter_table('flashcard_review_batch', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_flashcard_review_batch_user_id'), ['user_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('flashcard_review_batch', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_flashcard_review_batch_user_id'))
+
+    op.drop_table('flashcard_review_batch')
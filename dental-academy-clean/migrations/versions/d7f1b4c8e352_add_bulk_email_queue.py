@@ -0,0 +1,43 @@
+"""Add bulk email delivery queue columns
+
+Revision ID: d7f1b4c8e352
+Revises: c5e9a3b7d241
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7f1b4c8e352'
+down_revision = 'c5e9a3b7d241'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('communication_history', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('campaign_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('attempts', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('claimed_at', sa.DateTime(), nullable=True))
+        batch_op.create_foreign_key(
+            'fk_communication_history_campaign_id', 'communication_campaigns',
+            ['campaign_id'], ['id'], ondelete='CASCADE'
+        )
+        batch_op.create_index('ix_communication_history_campaign_status', ['campaign_id', 'status'], unique=False)
+
+    with op.batch_alter_table('communication_campaigns', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('attachments', sa.JSON(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('communication_campaigns', schema=None) as batch_op:
+        batch_op.drop_column('attachments')
+
+    with op.batch_alter_table('communication_history', schema=None) as batch_op:
+        batch_op.drop_index('ix_communication_history_campaign_status')
+        batch_op.drop_constraint('fk_communication_history_campaign_id', type_='foreignkey')
+        batch_op.drop_column('claimed_at')
+        batch_op.drop_column('attempts')
+        batch_op.drop_column('campaign_id')
@@ -0,0 +1,58 @@
+"""Add incremental mailbox sync state
+
+Revision ID: e2a6c9d4f718
+Revises: d7f1b4c8e352
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2a6c9d4f718'
+down_revision = 'd7f1b4c8e352'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'mailbox_sync_state',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('account', sa.String(length=50), nullable=False),
+        sa.Column('folder', sa.String(length=100), nullable=False),
+        sa.Column('uidvalidity', sa.BigInteger(), nullable=True),
+        sa.Column('last_uid', sa.BigInteger(), nullable=True),
+        sa.Column('synced_count', sa.Integer(), nullable=True),
+        sa.Column('last_synced_at', sa.DateTime(), nullable=True),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('account', 'folder', name='uq_mailbox_sync_state')
+    )
+
+    with op.batch_alter_table('incoming_emails', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('folder', sa.String(length=100), nullable=True))
+        batch_op.add_column(sa.Column('remote_uid', sa.String(length=100), nullable=True))
+        batch_op.add_column(sa.Column('uidvalidity', sa.BigInteger(), nullable=True))
+        batch_op.add_column(sa.Column('body_loaded', sa.Boolean(), nullable=True, server_default=sa.true()))
+        batch_op.create_index('ix_incoming_emails_remote', ['source_account', 'folder', 'remote_uid'], unique=False)
+
+    with op.batch_alter_table('email_attachments', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('content', sa.LargeBinary(), nullable=True))
+        batch_op.add_column(sa.Column('content_id', sa.String(length=255), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('email_attachments', schema=None) as batch_op:
+        batch_op.drop_column('content_id')
+        batch_op.drop_column('content')
+
+    with op.batch_alter_table('incoming_emails', schema=None) as batch_op:
+        batch_op.drop_index('ix_incoming_emails_remote')
+        batch_op.drop_column('body_loaded')
+        batch_op.drop_column('uidvalidity')
+        batch_op.drop_column('remote_uid')
+        batch_op.drop_column('folder')
+
+    op.drop_table('mailbox_sync_state')
@@ -0,0 +1,29 @@
+"""Add packed running IRT state to diagnostic sessions
+
+Revision ID: f3b8d1e5a902
+Revises: e2a6c9d4f718
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b8d1e5a902'
+down_revision = 'e2a6c9d4f718'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing sessions keep NULL and are packed lazily on their next answer
+    with op.batch_alter_table('diagnostic_session', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('irt_state', sa.LargeBinary(), nullable=True))
+        batch_op.add_column(sa.Column('irt_state_responses', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('diagnostic_session', schema=None) as batch_op:
+        batch_op.drop_column('irt_state_responses')
+        batch_op.drop_column('irt_state')
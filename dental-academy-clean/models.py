@@ -9,6 +9,7 @@ from werkzeug.security import generate_password_hash, check_password_hash
 from extensions import db
 from typing import Dict, Tuple, List
 from utils.serializers import JSONSerializableMixin, to_json_safe
+from utils.json_columns import JSONDict, JSONList, assign_json
 
 def safe_json_dumps(obj):
     """Safely serialize object to JSON string, handling datetime objects"""
@@ -747,6 +748,7 @@ class WebsiteVisit(db.Model):
     os = db.Column(db.String(50), nullable=True)
     device_type = db.Column(db.String(20), nullable=True)  # desktop, mobile, tablet
     visit_duration = db.Column(db.Integer, nullable=True)  # seconds
+    sample_weight = db.Column(db.Float, nullable=False, default=1.0, server_default='1.0')  # 1 / sampling rate
     created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     
     # Relationship
@@ -771,6 +773,7 @@ class WebsiteVisit(db.Model):
             'os': self.os,
             'device_type': self.device_type,
             'visit_duration': self.visit_duration,
+            'sample_weight': self.sample_weight,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
@@ -785,6 +788,7 @@ class PageView(db.Model):
     page_title = db.Column(db.String(200), nullable=True)
     time_on_page = db.Column(db.Integer, nullable=True)  # seconds
     scroll_depth = db.Column(db.Integer, nullable=True)  # percentage
+    sample_weight = db.Column(db.Float, nullable=False, default=1.0, server_default='1.0')  # 1 / sampling rate
     created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     
     # Relationships
@@ -3201,9 +3205,13 @@ class DiagnosticSession(db.Model):
     time_spent = db.Column(db.Float, default=0.0)  # Minutes spent in this session
     
     # Session data (JSON)
-    session_data = db.Column(db.Text, nullable=True)  # JSON with response history
-    ability_history = db.Column(db.Text, nullable=True)  # JSON with ability progression
-    
+    session_data = db.Column(JSONDict, nullable=True)  # JSON with response history
+    ability_history = db.Column(db.Text, nullable=True)  # JSON lines with ability progression
+
+    # Running IRT state: packed float64 rows (a, b, c, u), see utils.irt_engine.pack_irt_state
+    irt_state = db.Column(db.LargeBinary, nullable=True)
+    irt_state_responses = db.Column(db.Integer, nullable=True)  # Responses folded into irt_state
+
     # Status
     status = db.Column(db.String(20), default='active')  # active, completed, paused, terminated
     termination_reason = db.Column(db.String(50), nullable=True)  # max_questions, time_limit, precision_reached
@@ -3221,18 +3229,9 @@ class DiagnosticSession(db.Model):
     responses = db.relationship('DiagnosticResponse', backref='session', lazy='dynamic', cascade='all, delete-orphan')
     
     def get_session_data(self):
-        """Get session data as dict"""
-        if self.session_data:
-            try:
-                data = json.loads(self.session_data)
-                # Ensure we return a valid dict, not None or empty
-                if isinstance(data, dict):
-                    return data
-            except (json.JSONDecodeError, TypeError) as e:
-                # Log the error for debugging
-                import logging
-                logger = logging.getLogger(__name__)
-                logger.warning(f"Failed to parse session_data for session {self.id}: {e}")
+        """Get session data as dict (decoded once per load; invalid JSON loads as None)"""
+        if self.session_data is not None:
+            return self.session_data
         
         # Return default session data structure instead of empty dict
         return {
@@ -3249,27 +3248,31 @@ class DiagnosticSession(db.Model):
     
     def set_session_data(self, data):
         """Set session data from dict"""
-        self.session_data = safe_json_dumps(data)
+        assign_json(self, 'session_data', data)
     
     def get_ability_history(self):
-        """Get ability progression as list"""
+        """Get ability progression as list (one JSON object per line, legacy JSON array supported)"""
         if self.ability_history:
             try:
-                return json.loads(self.ability_history)
-            except:
+                if self.ability_history.lstrip().startswith('['):
+                    return json.loads(self.ability_history)
+                return [json.loads(line) for line in self.ability_history.splitlines() if line.strip()]
+            except (json.JSONDecodeError, TypeError):
                 pass
         return []
-    
+
     def add_ability_estimate(self, ability, se, question_id):
-        """Add ability estimate to history"""
-        history = self.get_ability_history()
-        history.append({
+        """Append ability estimate to history without re-reading earlier entries"""
+        history = self.ability_history or ''
+        if history.lstrip().startswith('['):
+            # Старый формат (JSON массив) переводится в построчный один раз
+            history = ''.join(safe_json_dumps(entry) + '\n' for entry in self.get_ability_history())
+        self.ability_history = history + safe_json_dumps({
             'ability': ability,
             'se': se,
             'question_id': question_id,
             'timestamp': datetime.now(timezone.utc).isoformat()
-        })
-        self.ability_history = safe_json_dumps(history)
+        }) + '\n'
     
     def get_accuracy(self):
         """Get current accuracy"""
@@ -3464,8 +3467,8 @@ class DiagnosticSession(db.Model):
     
     def record_response(self, question_id, selected_option, response_time=None):
         """Record a response to a question"""
-        # Get question to check if answer is correct
-        question = Question.query.get(question_id)
+        # Get question (with IRT parameters) to check if answer is correct
+        question = Question.query.options(db.joinedload(Question.irt_parameters)).get(question_id)
         if not question:
             raise ValueError(f"Question {question_id} not found")
         
@@ -3501,66 +3504,102 @@ class DiagnosticSession(db.Model):
         self.last_activity = datetime.now(timezone.utc)
         
         # Update ability estimate using IRT
-        self._update_ability_estimate()
+        self._update_ability_estimate(response, question)
         
         db.session.commit()
         return response
     
-    def _update_ability_estimate(self):
-        """Update ability estimate using IRT algorithm with proper MLE and standard errors"""
-        from utils.irt_engine import IRTEngine
+    def _update_ability_estimate(self, response, question):
+        """
+        Incremental IRT update: the new item is appended to the packed running state
+        (irt_state) and the estimate is re-solved with Newton steps warm-started from
+        the current ability, so earlier responses and their questions are not reloaded
+        """
+        from utils.irt_engine import update_irt_state
         import math
         
-        # Get all responses for this session
-        responses = self.responses.all()
+        ability_before = self.current_ability if self.current_ability is not None else 0.0
+        se_before = self.ability_se if self.ability_se is not None else 1.0
         
-        if not responses:
-            return
+        previous_count = self.questions_answered - 1
+        state = self.irt_state
+        if previous_count <= 0:
+            state = b''
+        elif state is None or self.irt_state_responses != previous_count:
+            # Сессия без состояния (создана до его появления) или ответы записаны в обход record_response
+            state = self._build_irt_state()
         
-        # Prepare response data for IRT engine with validation
-        response_data = []
-        for resp in responses:
-            question = resp.question
-            # Validate IRT parameters before using them
-            if (question.irt_difficulty is not None and 
-                question.irt_discrimination is not None and 
-                question.irt_guessing is not None):
-                
-                response_data.append({
-                    'question_id': resp.question_id,
-                    'is_correct': resp.is_correct,
-                    'irt_params': {
-                        'difficulty': question.irt_difficulty,
-                        'discrimination': question.irt_discrimination,
-                        'guessing': question.irt_guessing
-                    }
-                })
+        state, theta, se, is_valid = update_irt_state(
+            state, self._item_irt_params(question), response.is_correct, ability_before
+        )
+        self.irt_state = state
+        self.irt_state_responses = self.questions_answered
         
-        if response_data:
-            # Use IRT engine to estimate ability with proper MLE
-            # Pass the session to the engine to ensure it has context
-            irt_engine = IRTEngine(session=self)
-            theta, se = irt_engine.estimate_ability(response_data)
-            
-            # Update session with new estimates
-            self.current_ability = theta
-            self.ability_se = se
-            
-            # Add to ability history
-            self.add_ability_estimate(theta, se, responses[-1].question_id)
-        else:
+        if not is_valid:
             # Fallback: if no valid IRT parameters, use simple proportion
-            correct_count = sum(1 for r in responses if r.is_correct)
-            total_count = len(responses)
-            if total_count > 0:
-                proportion = correct_count / total_count
-                # Simple mapping to theta scale
-                theta = 2 * (proportion - 0.5)  # Maps 0->-1, 0.5->0, 1->1
-                se = 1.0 / math.sqrt(total_count)  # Simple standard error
-                
-                self.current_ability = theta
-                self.ability_se = se
-                self.add_ability_estimate(theta, se, responses[-1].question_id)
+            proportion = self.correct_answers / self.questions_answered
+            theta = 2 * (proportion - 0.5)  # Maps 0->-1, 0.5->0, 1->1
+            se = 1.0 / math.sqrt(self.questions_answered)  # Simple standard error
+        
+        self.current_ability = theta
+        self.ability_se = se
+        
+        response.ability_before = ability_before
+        response.se_before = se_before
+        response.ability_after = theta
+        response.se_after = se
+        
+        self.add_ability_estimate(theta, se, response.question_id)
+    
+    @staticmethod
+    def _item_irt_params(question):
+        """IRT parameters of a question as a dict for utils.irt_engine"""
+        params = question.irt_parameters
+        if params and None not in (params.difficulty, params.discrimination, params.guessing):
+            return {
+                'difficulty': params.difficulty,
+                'discrimination': params.discrimination,
+                'guessing': params.guessing
+            }
+        # Без сохраненных параметров - автокалибровка или оценка по статистике ответов
+        return {
+            'difficulty': question.irt_difficulty,
+            'discrimination': question.irt_discrimination,
+            'guessing': question.irt_guessing
+        }
+    
+    def _build_irt_state(self):
+        """Pack already stored responses of this session (one query) into an irt_state blob"""
+        from utils.irt_engine import pack_irt_responses, pack_irt_state
+        
+        # no_autoflush: отвечаемый сейчас вопрос добавляется в состояние отдельно
+        with db.session.no_autoflush:
+            rows = db.session.query(
+                DiagnosticResponse.question_id,
+                DiagnosticResponse.is_correct,
+                IRTParameters.difficulty,
+                IRTParameters.discrimination,
+                IRTParameters.guessing
+            ).outerjoin(
+                IRTParameters, IRTParameters.question_id == DiagnosticResponse.question_id
+            ).filter(
+                DiagnosticResponse.session_id == self.id
+            ).order_by(DiagnosticResponse.id).all()
+            
+            responses = []
+            for question_id, is_correct, difficulty, discrimination, guessing in rows:
+                if None in (difficulty, discrimination, guessing):
+                    question = db.session.get(Question, question_id)
+                    irt_params = self._item_irt_params(question) if question else None
+                else:
+                    irt_params = {
+                        'difficulty': difficulty,
+                        'discrimination': discrimination,
+                        'guessing': guessing
+                    }
+                responses.append({'is_correct': is_correct, 'irt_params': irt_params})
+        
+        return pack_irt_state(*pack_irt_responses(responses))
     
     def _generate_insight_text(self, score):
         """Generate dynamic insight text based on readiness score"""
@@ -3658,13 +3697,13 @@ class PersonalLearningPlan(db.Model, JSONSerializableMixin):
     estimated_readiness = db.Column(db.Float, nullable=True)  # Probability of passing
     
     # Domain analysis (JSON)
-    domain_analysis = db.Column(db.Text, nullable=True)  # JSON with domain-specific data
-    weak_domains = db.Column(db.Text, nullable=True)     # JSON list of weak domains
-    strong_domains = db.Column(db.Text, nullable=True)   # JSON list of strong domains
+    domain_analysis = db.Column(JSONDict, nullable=True)  # JSON with domain-specific data
+    weak_domains = db.Column(JSONList, nullable=True)     # JSON list of weak domains
+    strong_domains = db.Column(JSONList, nullable=True)   # JSON list of strong domains
     
     # Study schedule (JSON)
-    study_schedule = db.Column(db.Text, nullable=True)   # JSON with weekly schedule
-    milestones = db.Column(db.Text, nullable=True)       # JSON with milestone dates
+    study_schedule = db.Column(JSONDict, nullable=True)   # JSON with weekly schedule
+    milestones = db.Column(JSONList, nullable=True)       # JSON with milestone dates
     
     # Status
     status = db.Column(db.String(20), default='active')  # active, completed, paused
@@ -3684,9 +3723,9 @@ class PersonalLearningPlan(db.Model, JSONSerializableMixin):
     total_sr_reviews = db.Column(db.Integer, default=0)  # Total SR reviews completed
     
     # Domain Category Integration (from Phase 3)
-    category_progress = db.Column(db.Text, nullable=True)  # JSON: {category_id: progress_percent}
-    weak_categories = db.Column(db.Text, nullable=True)    # JSON: [category_ids]
-    strong_categories = db.Column(db.Text, nullable=True)  # JSON: [category_ids]
+    category_progress = db.Column(JSONDict, nullable=True)  # JSON: {category_id: progress_percent}
+    weak_categories = db.Column(JSONList, nullable=True)    # JSON: [category_ids]
+    strong_categories = db.Column(JSONList, nullable=True)  # JSON: [category_ids]
     current_category_focus = db.Column(db.Integer, nullable=True)  # Current category being studied
     
     # Daily Tasks and Goals
@@ -3698,7 +3737,7 @@ class PersonalLearningPlan(db.Model, JSONSerializableMixin):
     daily_goal_met_count = db.Column(db.Integer, default=0) # Total days goal was met
     
     # Enhanced Progress Tracking
-    category_abilities = db.Column(db.Text, nullable=True)  # JSON: {category_id: ability_score}
+    category_abilities = db.Column(JSONDict, nullable=True)  # JSON: {category_id: ability_score}
     learning_velocity = db.Column(db.Float, nullable=True)  # Questions per hour
     retention_rate = db.Column(db.Float, nullable=True)     # % of reviewed questions retained
     time_invested = db.Column(db.Integer, default=0)        # Total minutes studied
@@ -3710,25 +3749,15 @@ class PersonalLearningPlan(db.Model, JSONSerializableMixin):
     
     def get_domain_analysis(self):
         """Get domain analysis as dict"""
-        if self.domain_analysis:
-            try:
-                return json.loads(self.domain_analysis)
-            except:
-                pass
-        return {}
+        return self.domain_analysis if self.domain_analysis is not None else {}
     
     def set_domain_analysis(self, analysis):
         """Set domain analysis from dict"""
-        self.domain_analysis = safe_json_dumps(analysis)
+        assign_json(self, 'domain_analysis', analysis)
     
     def get_weak_domains(self):
         """Get weak domains as list"""
-        if self.weak_domains:
-            try:
-                return json.loads(self.weak_domains)
-            except:
-                pass
-        return []
+        return self.weak_domains if self.weak_domains is not None else []
     
     def get_weak_domain_names(self):
         """Get weak domain names instead of codes"""
@@ -3746,16 +3775,11 @@ class PersonalLearningPlan(db.Model, JSONSerializableMixin):
     
     def set_weak_domains(self, domains):
         """Set weak domains from list"""
-        self.weak_domains = safe_json_dumps(domains)
+        assign_json(self, 'weak_domains', domains)
     
     def get_strong_domains(self):
         """Get strong domains as list"""
-        if self.strong_domains:
-            try:
-                return json.loads(self.strong_domains)
-            except:
-                pass
-        return []
+        return self.strong_domains if self.strong_domains is not None else []
     
     def get_strong_domain_names(self):
         """Get strong domain names instead of codes"""
@@ -3773,20 +3797,15 @@ class PersonalLearningPlan(db.Model, JSONSerializableMixin):
     
     def set_strong_domains(self, domains):
         """Set strong domains from list"""
-        self.strong_domains = safe_json_dumps(domains)
+        assign_json(self, 'strong_domains', domains)
     
     def get_study_schedule(self):
         """Get study schedule as dict"""
-        if self.study_schedule:
-            try:
-                return json.loads(self.study_schedule)
-            except:
-                pass
-        return {}
+        return self.study_schedule if self.study_schedule is not None else {}
     
     def set_study_schedule(self, schedule):
         """Set study schedule from dict"""
-        self.study_schedule = safe_json_dumps(schedule)
+        assign_json(self, 'study_schedule', schedule)
     
     def get_milestones(self):
         """Get real milestones based on user progress"""
@@ -3806,7 +3825,7 @@ class PersonalLearningPlan(db.Model, JSONSerializableMixin):
     
     def set_milestones(self, milestones):
         """Set milestones from list"""
-        self.milestones = safe_json_dumps(milestones)
+        assign_json(self, 'milestones', milestones)
     
     def calculate_readiness(self):
         """Calculate probability of passing exam"""
@@ -4347,16 +4366,11 @@ class PersonalLearningPlan(db.Model, JSONSerializableMixin):
     # Category Progress Methods
     def get_category_progress(self):
         """Get category progress as dict"""
-        if not self.category_progress:
-            return {}
-        try:
-            return json.loads(self.category_progress)
-        except:
-            return {}
+        return self.category_progress if self.category_progress is not None else {}
     
     def set_category_progress(self, progress_dict):
         """Set category progress from dict"""
-        self.category_progress = json.dumps(progress_dict)
+        assign_json(self, 'category_progress', progress_dict)
     
     def update_category_progress(self, category_id, progress_percent):
         """Update progress for specific category"""
@@ -4367,29 +4381,19 @@ class PersonalLearningPlan(db.Model, JSONSerializableMixin):
     # Weak/Strong Categories Methods
     def get_weak_categories(self):
         """Get list of weak category IDs"""
-        if not self.weak_categories:
-            return []
-        try:
-            return json.loads(self.weak_categories)
-        except:
-            return []
+        return self.weak_categories if self.weak_categories is not None else []
     
     def set_weak_categories(self, category_ids):
         """Set weak categories"""
-        self.weak_categories = json.dumps(category_ids)
+        assign_json(self, 'weak_categories', category_ids)
     
     def get_strong_categories(self):
         """Get list of strong category IDs"""
-        if not self.strong_categories:
-            return []
-        try:
-            return json.loads(self.strong_categories)
-        except:
-            return []
+        return self.strong_categories if self.strong_categories is not None else []
     
     def set_strong_categories(self, category_ids):
         """Set strong categories"""
-        self.strong_categories = json.dumps(category_ids)
+        assign_json(self, 'strong_categories', category_ids)
     
     # Daily Streak Methods
     def update_daily_streak(self, activity_date=None):
@@ -4435,16 +4439,11 @@ class PersonalLearningPlan(db.Model, JSONSerializableMixin):
     # Category Abilities Methods
     def get_category_abilities(self):
         """Get category abilities as dict"""
-        if not self.category_abilities:
-            return {}
-        try:
-            return json.loads(self.category_abilities)
-        except:
-            return {}
+        return self.category_abilities if self.category_abilities is not None else {}
     
     def set_category_abilities(self, abilities_dict):
         """Set category abilities from dict"""
-        self.category_abilities = json.dumps(abilities_dict)
+        assign_json(self, 'category_abilities', abilities_dict)
     
     def update_category_ability(self, category_id, ability_score):
         """Update ability for specific category"""
@@ -4710,6 +4709,51 @@ class StudySession(db.Model):
             'version': self.version
         }
 
+class DailyPlanSnapshot(db.Model):
+    """Materialized daily plan (one per user and day), see utils.daily_plan_snapshots"""
+    __tablename__ = 'daily_plan_snapshot'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False, index=True)
+    plan_date = db.Column(db.Date, nullable=False)
+    target_minutes = db.Column(db.Integer, nullable=False, default=30)
+    
+    # zlib-сжатый JSON плана
+    payload = db.Column(db.LargeBinary, nullable=False)
+    
+    # Отпечаток PersonalLearningPlan на момент расчета ("plan_id:diagnostic_session_id:next_diagnostic_date")
+    plan_fingerprint = db.Column(db.String(100), nullable=True)
+    
+    # Секции, требующие пересчета (через запятую: review, insights); '*' - весь план
+    stale_sections = db.Column(db.String(100), nullable=True)
+    
+    generated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    
+    __table_args__ = (db.UniqueConstraint('user_id', 'plan_date', name='_user_plan_date_uc'),)
+    
+    def __repr__(self):
+        return f'<DailyPlanSnapshot user={self.user_id} date={self.plan_date}>'
+
+class ReviewQueueSnapshot(db.Model):
+    """Precomputed spaced-repetition queue (one per user and day), see utils.sr_scheduler.schedule_all"""
+    __tablename__ = 'review_queue_snapshot'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False, index=True)
+    queue_date = db.Column(db.Date, nullable=False)
+    minutes = db.Column(db.Integer, nullable=False, default=30)
+    
+    # ID вопросов по убыванию приоритета
+    question_ids = db.Column(JSONList, nullable=False)
+    
+    generated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    
+    __table_args__ = (db.UniqueConstraint('user_id', 'queue_date', name='_user_queue_date_uc'),)
+    
+    def __repr__(self):
+        return f'<ReviewQueueSnapshot user={self.user_id} date={self.queue_date}>'
+
 # ========================================
 # EXTEND EXISTING MODELS
 # ========================================
@@ -5994,6 +6038,15 @@ class CommunicationHistory(db.Model):
     clicked_at = db.Column(db.DateTime, nullable=True)
     extra_data = db.Column(db.JSON, nullable=True)
     
+    # Очередь массовой рассылки: queued -> sending -> sent/failed
+    campaign_id = db.Column(db.Integer, db.ForeignKey('communication_campaigns.id', ondelete='CASCADE'), nullable=True)
+    attempts = db.Column(db.Integer, default=0)
+    claimed_at = db.Column(db.DateTime, nullable=True)
+    
+    __table_args__ = (
+        db.Index('ix_communication_history_campaign_status', 'campaign_id', 'status'),
+    )
+    
     def __repr__(self):
         return f'<CommunicationHistory {self.id}: {self.recipient_email}>'
 class CommunicationCampaign(db.Model):
@@ -6020,6 +6073,7 @@ class CommunicationCampaign(db.Model):
     opened_count = db.Column(db.Integer, default=0)
     clicked_count = db.Column(db.Integer, default=0)
     failed_count = db.Column(db.Integer, default=0)
+    attachments = db.Column(db.JSON, nullable=True)  # [{"filename", "content" (base64), "cid"}]
     created_by = db.Column(db.Integer, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -6307,10 +6361,20 @@ class IncomingEmail(db.Model):
     is_replied = db.Column(db.Boolean, default=False)
     reply_sent_at = db.Column(db.DateTime, nullable=True)
     
+    # Incremental sync: position on the server; body is fetched after the headers
+    folder = db.Column(db.String(100), nullable=True)  # IMAP folder or 'POP3'
+    remote_uid = db.Column(db.String(100), nullable=True)  # IMAP UID or POP3 UIDL
+    uidvalidity = db.Column(db.BigInteger, nullable=True)
+    body_loaded = db.Column(db.Boolean, default=True)
+    
     # Timestamps
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    __table_args__ = (
+        db.Index('ix_incoming_emails_remote', 'source_account', 'folder', 'remote_uid'),
+    )
+    
     def __repr__(self):
         return f'<IncomingEmail {self.message_id}: {self.subject}>'
     
@@ -6355,6 +6419,8 @@ class EmailAttachment(db.Model):
     content_type = db.Column(db.String(100), nullable=False)
     size_bytes = db.Column(db.Integer, nullable=False)
     file_path = db.Column(db.String(500), nullable=True)  # Path to stored file
+    content = db.Column(db.LargeBinary, nullable=True)  # Blob stored by the mailbox sync worker
+    content_id = db.Column(db.String(255), nullable=True)  # Content-ID of inline parts
     
     # Timestamps
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -6378,6 +6444,28 @@ class EmailAttachment(db.Model):
         }
 
 
+class MailboxSyncState(db.Model):
+    """Incremental sync position per mailbox (UIDVALIDITY + last seen UID)"""
+    __tablename__ = 'mailbox_sync_state'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    account = db.Column(db.String(50), nullable=False)  # info, support, etc.
+    folder = db.Column(db.String(100), nullable=False, default='INBOX')  # IMAP folder or 'POP3'
+    uidvalidity = db.Column(db.BigInteger, nullable=True)
+    last_uid = db.Column(db.BigInteger, default=0)
+    synced_count = db.Column(db.Integer, default=0)
+    skipped_uids = db.Column(JSONList, nullable=True)  # POP3 UIDLs already stored under another mailbox
+    last_synced_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    
+    __table_args__ = (
+        db.UniqueConstraint('account', 'folder', name='uq_mailbox_sync_state'),
+    )
+    
+    def __repr__(self):
+        return f'<MailboxSyncState {self.account}/{self.folder}: {self.uidvalidity}:{self.last_uid}>'
+
+
 # ========================================
 # MEDICAL TERMINOLOGY FLASHCARD SYSTEM
 # ========================================
@@ -6494,10 +6582,17 @@ class UserTermProgress(db.Model):
         
         return now >= next_review
     
-    def update_progress_sm2(self, quality: int):
-        self.times_reviewed += 1
+    def update_progress_sm2(self, quality: int, reviewed_at: datetime = None):
+        # reviewed_at - время ответа на клиенте (пакетная синхронизация), иначе сейчас
+        reviewed_at = reviewed_at or datetime.now(timezone.utc)
+        self.times_reviewed = (self.times_reviewed or 0) + 1
+        self.times_correct = self.times_correct or 0
+        self.repetitions = self.repetitions or 0
+        self.ease_factor = self.ease_factor or 2.5
+        self.interval = self.interval or 1
+        self.mastery_level = self.mastery_level or 0
         self.last_quality = quality
-        self.last_reviewed = datetime.now(timezone.utc)
+        self.last_reviewed = reviewed_at
         
         if quality >= 3:
             self.times_correct += 1
@@ -6527,14 +6622,14 @@ class UserTermProgress(db.Model):
         max_interval = 365  # Максимум 1 год
         safe_interval = min(self.interval, max_interval)
         try:
-            self.next_review = datetime.now(timezone.utc) + timedelta(days=safe_interval)
+            self.next_review = reviewed_at + timedelta(days=safe_interval)
         except OverflowError:
             # Если все еще ошибка, устанавливаем максимальную дату (примерно через год)
             import logging
             logger = logging.getLogger(__name__)
             logger.warning(f"OverflowError prevented for UserTermProgress {self.id}: interval={self.interval}, setting to max")
             self.interval = max_interval
-            self.next_review = datetime.now(timezone.utc) + timedelta(days=max_interval)
+            self.next_review = reviewed_at + timedelta(days=max_interval)
     
     def to_dict(self):
         return {
@@ -6578,6 +6673,24 @@ class DailyFlashcardProgress(db.Model):
         return f'<DailyFlashcardProgress User:{self.user_id} Date:{self.date} Completed:{self.terms_completed}>'
 
 
+class FlashcardReviewBatch(db.Model):
+    """Принятые пакеты ответов на карточки (идемпотентность повторной отправки)"""
+    __tablename__ = 'flashcard_review_batch'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False, index=True)
+    batch_id = db.Column(db.String(64), nullable=False)  # ключ, сгенерированный клиентом
+    review_count = db.Column(db.Integer, default=0)
+    xp_earned = db.Column(db.Integer, default=0)
+    result = db.Column(db.JSON, nullable=True)  # ответ, возвращаемый при повторе
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    
+    __table_args__ = (db.UniqueConstraint('user_id', 'batch_id', name='uq_flashcard_review_batch'),)
+    
+    def __repr__(self):
+        return f'<FlashcardReviewBatch User:{self.user_id} Batch:{self.batch_id} Reviews:{self.review_count}>'
+
+
 # ========================================
 # ENGLISH LEARNING (IELTS)
 # ========================================
@@ -687,3 +687,28 @@ def api_events_stats():
     except Exception as e:
         current_app.logger.error(f"Error getting events stats: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
+
+@monitoring_bp.route('/api/activity-queue/stats')
+@login_required
+@admin_required
+def api_activity_queue_stats():
+    """Get write-behind activity queue metrics (queue depth, dropped events, flushes)"""
+    try:
+        from utils.activity_queue import get_activity_queue_stats
+        return jsonify({'success': True, 'stats': get_activity_queue_stats()})
+    except Exception as e:
+        current_app.logger.error(f"Error getting activity queue stats: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@monitoring_bp.route('/api/activity-queue/flush', methods=['POST'])
+@login_required
+@admin_required
+def api_activity_queue_flush():
+    """Force flush of the activity queue"""
+    try:
+        from utils.activity_queue import activity_queue
+        written = activity_queue.flush()
+        return jsonify({'success': True, 'written': written, 'stats': activity_queue.get_stats()})
+    except Exception as e:
+        current_app.logger.error(f"Error flushing activity queue: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
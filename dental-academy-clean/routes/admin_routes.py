@@ -527,12 +527,7 @@ def diagnostic_session_detail(session_id):
     ).order_by(DiagnosticResponse.responded_at).all()
     
     # График изменения способности
-    ability_history = []
-    if session.ability_history:
-        try:
-            ability_history = json.loads(session.ability_history)
-        except:
-            ability_history = []
+    ability_history = session.get_ability_history()
     
     # Результаты по доменам
     results = None
@@ -2235,6 +2230,7 @@ def performance_status():
     """Get performance status and optimization metrics"""
     from utils.performance_optimizer import performance_optimizer
     from utils.cache_manager import get_cache_stats
+    from utils.rate_limiter import get_rate_limit_stats
     import logging
     
     logger = logging.getLogger(__name__)
@@ -2260,6 +2256,7 @@ def performance_status():
             'timestamp': datetime.now(timezone.utc).isoformat(),
             'performance': performance_report,
             'caching': cache_stats,
+            'rate_limits': get_rate_limit_stats(),
             'system': system_info,
             'overall_status': 'healthy'
         }
@@ -2389,19 +2386,21 @@ def clear_cache():
         cache_type = data.get('cache_type', 'all') if data else 'all'
         
         if cache_type == 'all':
+            from utils.seo_artifacts import invalidate_seo_artifacts
             cache_manager.clear_all_caches()
+            invalidate_seo_artifacts()
             message = "All caches cleared"
         elif cache_type == 'questions':
-            cache_manager.question_cache.clear()
+            cache_manager.clear_namespace('questions')
             message = "Question cache cleared"
         elif cache_type == 'irt_params':
-            cache_manager.irt_params_cache.clear()
+            cache_manager.clear_namespace('irt_params')
             message = "IRT parameters cache cleared"
         elif cache_type == 'sessions':
-            cache_manager.session_cache.clear()
+            cache_manager.clear_namespace('sessions')
             message = "Sessions cache cleared"
         elif cache_type == 'plans':
-            cache_manager.plan_cache.clear()
+            cache_manager.clear_namespace('plans')
             message = "Learning plans cache cleared"
         else:
             return jsonify({'error': 'Invalid cache type'}), 400
@@ -2828,6 +2827,12 @@ def users_list():
         
         stats['inactive_users'] = stats['total_users'] - stats['active_users']
         
+        # Learning progress for the current page (one grouped query for all users on the page)
+        user_stats = {}
+        if users and users.items:
+            from utils.unified_stats import get_unified_user_stats_bulk
+            user_stats = get_unified_user_stats_bulk([u.id for u in users.items])
+        
         # Get distinct values for filter dropdowns
         professions_list = [r[0] for r in db.session.query(User.profession).filter(
             User.profession.isnot(None), User.profession != ''
@@ -2848,6 +2853,7 @@ def users_list():
         return render_template('admin/users_list.html',
                              users=users,
                              stats=stats,
+                             user_stats=user_stats,
                              search=search,
                              status_filter=status_filter,
                              role_filter=role_filter,
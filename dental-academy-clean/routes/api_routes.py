@@ -104,10 +104,9 @@ def update_progress():
 def get_daily_progress():
     """Получение прогресса ежедневного плана"""
     try:
-        from utils.daily_learning_algorithm import DailyLearningAlgorithm
+        from utils.daily_plan_snapshots import get_daily_plan
         
-        algorithm = DailyLearningAlgorithm()
-        today_plan = algorithm.generate_daily_plan(current_user.id)
+        today_plan = get_daily_plan(current_user.id)
         
         if not today_plan.get('success'):
             return jsonify({'error': 'Failed to generate daily plan'}), 500
@@ -152,9 +151,8 @@ def regenerate_daily_plan():
         data = request.get_json() or {}
         target_minutes = data.get('target_minutes', 30)
         
-        from utils.daily_learning_algorithm import DailyLearningAlgorithm
-        algorithm = DailyLearningAlgorithm()
-        new_plan = algorithm.generate_daily_plan(current_user.id, target_minutes)
+        from utils.daily_plan_snapshots import get_daily_plan
+        new_plan = get_daily_plan(current_user.id, target_minutes, force=True)
         
         return jsonify(new_plan)
         
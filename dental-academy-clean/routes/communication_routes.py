@@ -1,8 +1,11 @@
-from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify, current_app
+from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify, current_app, send_file
+from io import BytesIO
 from flask_login import login_required, current_user
 from extensions import db
 from models import User, Contact, EmailTemplate, IncomingEmail, EmailAttachment
 from utils.decorators import admin_required
+from utils.bulk_email_queue import Recipient, bulk_email_queue, enqueue_bulk_email, get_campaign_progress
+from utils.email_templates import register_email_template, compile_email_template, encode_attachment
 from datetime import datetime, timedelta
 import json
 import logging
@@ -219,16 +222,15 @@ def bulk_email():
             # Определяем получателей
             recipients = []
             
-            if recipient_type == 'all':
-                query = User.query.filter(User.email.isnot(None), User.is_active == True)
-                if filter_marketing_consent:
-                    query = query.filter(User.optional_consents == True)
-                recipients = [user.email for user in query.all()]
-            elif recipient_type == 'users':
+            def user_recipient(user):
+                name = f"{user.first_name or ''} {user.last_name or ''}".strip() or None
+                return Recipient(email=user.email, recipient_type='user', recipient_id=user.id, name=name)
+            
+            if recipient_type in ('all', 'users'):
                 query = User.query.filter(User.email.isnot(None), User.is_active == True)
                 if filter_marketing_consent:
                     query = query.filter(User.optional_consents == True)
-                recipients = [user.email for user in query.all()]
+                recipients = [user_recipient(user) for user in query.all()]
             elif recipient_type == 'selected':
                 # Выбранные пользователи из списка
                 if selected_user_ids:
@@ -236,7 +238,7 @@ def bulk_email():
                         selected_user_ids = [int(id.strip()) for id in selected_user_ids.split(',') if id.strip()]
                     elif not isinstance(selected_user_ids, list):
                         selected_user_ids = []
-                    recipients = [user.email for user in User.query.filter(
+                    recipients = [user_recipient(user) for user in User.query.filter(
                         User.id.in_(selected_user_ids),
                         User.email.isnot(None),
                         User.is_active == True
@@ -244,21 +246,22 @@ def bulk_email():
                 else:
                     recipients = []
             elif recipient_type == 'contacts':
-                recipients = [contact.email for contact in Contact.query.filter(Contact.email.isnot(None)).all()]
+                recipients = [
+                    Recipient(email=contact.email, recipient_type='contact', recipient_id=contact.id, name=contact.full_name)
+                    for contact in Contact.query.filter(Contact.email.isnot(None)).all()
+                ]
             elif recipient_type == 'custom':
-                recipients = [email.strip() for email in recipient_emails if email.strip()]
+                recipients = [Recipient(email=email.strip()) for email in recipient_emails if email.strip()]
             
             if not recipients:
                 return jsonify({'success': False, 'error': 'Нет получателей для рассылки'}), 400
             
-            # Генерируем HTML на основе выбранного шаблона
+            # Шаблон рендерится один раз на кампанию; обращение подставляется для каждого получателя
             if email_template_type == 'big_preparation':
-                html_content = generate_big_preparation_email(
-                    greeting_name=greeting_name,
-                    cta_url=cta_url
-                )
+                template = compile_email_template('big_preparation', greeting_name=greeting_name, cta_url=cta_url)
             elif email_template_type == 'learning_map_welcome':
-                html_content = generate_learning_map_welcome_email(
+                template = compile_email_template(
+                    'learning_map_welcome',
                     greeting_name=greeting_name,
                     cta_url=cta_url,
                     has_gif=bool(gif_file and gif_file.filename)
@@ -271,7 +274,8 @@ def bulk_email():
                 elif not isinstance(value_prop_items, list):
                     value_prop_items = []
                 
-                html_content = generate_email_template(
+                template = compile_email_template(
+                    'universal',
                     greeting_name=greeting_name,
                     main_title=main_title,
                     main_subtitle=main_subtitle,
@@ -284,96 +288,29 @@ def bulk_email():
                     motivation_text=motivation_text
                 )
             
-            # Обрабатываем GIF файл как встроенное изображение через CID
+            # GIF встраивается через CID; base64 кешируется по хешу содержимого
             attachments = None
             if gif_file and gif_file.filename:
-                import base64
-                gif_content = gif_file.read()
-                gif_base64 = base64.b64encode(gif_content).decode('utf-8')
-                # Используем CID для встроенного изображения в Resend API
-                attachments = [{
-                    "filename": gif_file.filename,
-                    "content": gif_base64,
-                    "cid": "learning_map_gif"  # Content-ID для встраивания в HTML
-                }]
-            
-            # Отправляем через Resend API
-            from utils.resend_email_service import send_email_via_resend
-            import time
-            
-            sent_count = 0
-            failed_count = 0
-            errors = []
-            
-            # Resend API лимит: 2 запроса в секунду, добавляем задержку 0.6 сек между запросами
-            delay_between_emails = 0.6  # 600 мс для надежности (чуть больше чем минимум 0.5 сек)
-            
-            for idx, recipient_email in enumerate(recipients):
-                try:
-                    # Добавляем задержку перед каждым запросом (кроме первого)
-                    if idx > 0:
-                        time.sleep(delay_between_emails)
-                    
-                    # Попытка отправки с retry при rate limit
-                    max_retries = 3
-                    retry_delay = 1.0  # Начальная задержка для retry
-                    success = False
-                    
-                    for attempt in range(max_retries):
-                        success = send_email_via_resend(
-                            to_email=recipient_email,
-                            subject=subject,
-                            html_content=html_content,
-                            from_name="Mentora Team",
-                            attachments=attachments
-                        )
-                        
-                        if success:
-                            break
-                        
-                        # Если это не последняя попытка и была ошибка rate limit, ждем и повторяем
-                        if attempt < max_retries - 1:
-                            # Проверяем, была ли это ошибка rate limit (429)
-                            # send_email_via_resend возвращает False при любой ошибке
-                            # Добавляем дополнительную задержку перед retry
-                            time.sleep(retry_delay * (attempt + 1))  # Экспоненциальная задержка
-                    
-                    if success:
-                        sent_count += 1
-                        current_app.logger.info(f'Bulk email sent to {recipient_email} via Resend')
-                    else:
-                        failed_count += 1
-                        errors.append(f"Failed to send to {recipient_email} after {max_retries} attempts")
-                        current_app.logger.error(f'Failed to send bulk email to {recipient_email} after {max_retries} attempts')
-                        
-                except Exception as e:
-                    failed_count += 1
-                    errors.append(f"Error sending to {recipient_email}: {str(e)}")
-                    current_app.logger.error(f'Error sending bulk email to {recipient_email}: {str(e)}')
-            
-            # Результат
-            if sent_count > 0:
-                if failed_count == 0:
-                    return jsonify({
-                        'success': True,
-                        'message': f'✅ Email успешно отправлен {sent_count} получателям!',
-                        'sent': sent_count,
-                        'failed': failed_count
-                    })
-                else:
-                    return jsonify({
-                        'success': True,
-                        'message': f'⚠️ Email отправлен {sent_count} получателям, {failed_count} не удалось отправить',
-                        'sent': sent_count,
-                        'failed': failed_count,
-                        'errors': errors[:10]  # Первые 10 ошибок
-                    })
-            else:
-                return jsonify({
-                    'success': False,
-                    'error': 'Не удалось отправить email ни одному получателю',
-                    'errors': errors[:10]
-                }), 400
+                attachments = [encode_attachment(gif_file.read(), gif_file.filename, cid='learning_map_gif')]
+            
+            # Доставка идет в фоне: кампания и получатели сохраняются в очереди
+            campaign = enqueue_bulk_email(
+                subject, template.skeleton, recipients, current_user,
+                target_type=recipient_type,
+                attachments=attachments,
+                template_used=email_template_type
+            )
+            current_app.logger.info(f'Bulk email campaign {campaign.id} queued for {campaign.total_recipients} recipients')
+            
+            return jsonify({
+                'success': True,
+                'message': f'📬 Рассылка поставлена в очередь: {campaign.total_recipients} получателей',
+                'campaign_id': campaign.id,
+                'queued': campaign.total_recipients,
+                'sent': 0,
+                'failed': 0,
+                'progress_url': url_for('communication.bulk_email_progress', campaign_id=campaign.id)
+            }), 202
                 
         except Exception as e:
             current_app.logger.error(f'Bulk email sending failed: {str(e)}', exc_info=True)
@@ -395,6 +332,29 @@ def bulk_email():
                          total_contacts=total_contacts,
                          all_users=all_users)
 
+# Прогресс фоновой массовой рассылки
+@communication_bp.route('/bulk-email/<int:campaign_id>/progress')
+@login_required
+@admin_required
+def bulk_email_progress(campaign_id):
+    """Живые счетчики доставки кампании"""
+    progress = get_campaign_progress(campaign_id)
+    if progress is None:
+        return jsonify({'success': False, 'error': 'Кампания не найдена'}), 404
+    return jsonify(dict(progress, success=True))
+
+# Возобновление прерванной рассылки (после рестарта процесса)
+@communication_bp.route('/bulk-email/<int:campaign_id>/resume', methods=['POST'])
+@login_required
+@admin_required
+def bulk_email_resume(campaign_id):
+    """Продолжить доставку оставшимся получателям"""
+    progress = get_campaign_progress(campaign_id)
+    if progress is None:
+        return jsonify({'success': False, 'error': 'Кампания не найдена'}), 404
+    started = bulk_email_queue.start(campaign_id)
+    return jsonify({'success': True, 'started': started, 'progress': get_campaign_progress(campaign_id)})
+
 def generate_big_preparation_email(greeting_name="there", cta_url="https://bigmentor.nl/en/learning-map"):
     """Генерирует HTML шаблон письма 'Ready to Start Your BIG Preparation?'"""
     
@@ -1263,6 +1223,10 @@ def generate_email_template(greeting_name, main_title, main_subtitle, intro_text
 </body>
 </html>'''
 
+register_email_template('big_preparation', generate_big_preparation_email)
+register_email_template('learning_map_welcome', generate_learning_map_welcome_email)
+register_email_template('universal', generate_email_template)
+
 # Отправка профессиональных email
 @communication_bp.route('/send-professional', methods=['GET', 'POST'])
 @login_required
@@ -1892,6 +1856,11 @@ def view_email(email_id):
     try:
         email = IncomingEmail.query.get_or_404(email_id)
         
+        # Body not fetched by the sync worker yet - load it now
+        if not email.body_loaded:
+            from utils.mailbox_sync import mailbox_sync
+            mailbox_sync.load_body(email)
+        
         # Mark as read
         if not email.is_read:
             email.is_read = True
@@ -1909,85 +1878,54 @@ def view_email(email_id):
 @login_required
 @admin_required
 def fetch_emails():
-    """Fetch new emails from POP/IMAP server"""
+    """Start an incremental sync of all mailboxes (headers first, bodies in the background)"""
     try:
-        from utils.email_client import EmailClient, get_multiple_email_configs
-        
-        # Get configurations for all email accounts
-        configs = get_multiple_email_configs()
-        total_saved = 0
-        
-        for account_key, config in configs.items():
-            try:
-                current_app.logger.info(f"Fetching emails from {config['name']} ({config['email']})")
-                
-                client = EmailClient(config)
-                
-                # Try IMAP first, then POP
-                emails_data = client.fetch_emails_imap(limit=50)
-                if not emails_data:
-                    emails_data = client.fetch_emails_pop(limit=50)
-                
-                client.disconnect()
-                
-                if not emails_data:
-                    current_app.logger.info(f"No emails found in {config['name']} account")
-                    continue
-                
-                # Save emails to database
-                saved_count = 0
-                for email_data in emails_data:
-                    try:
-                        # Check if email already exists
-                        existing = IncomingEmail.query.filter_by(
-                            message_id=email_data['message_id']
-                        ).first()
-                        
-                        if existing:
-                            continue
-                        
-                        # Create new email record
-                        email = IncomingEmail(
-                            message_id=email_data['message_id'],
-                            subject=email_data['subject'],
-                            sender_email=email_data['sender_email'],
-                            sender_name=email_data['sender_name'],
-                            recipient_email=email_data['recipient_email'],
-                            source_account=account_key,  # Add source account
-                            html_content=email_data['html_content'],
-                            text_content=email_data['text_content'],
-                            date_received=email_data['date_received'],
-                            size_bytes=email_data['size_bytes'],
-                            has_attachments=email_data['has_attachments'],
-                            attachment_count=email_data['attachment_count']
-                        )
-                        
-                        db.session.add(email)
-                        saved_count += 1
-                        
-                    except Exception as e:
-                        current_app.logger.error(f"Error saving email from {config['name']}: {str(e)}")
-                        continue
-                
-                total_saved += saved_count
-                current_app.logger.info(f"Saved {saved_count} emails from {config['name']} account")
-                
-            except Exception as e:
-                current_app.logger.error(f"Error fetching emails from {config['name']}: {str(e)}")
-                continue
-        
-        db.session.commit()
+        from utils.mailbox_sync import mailbox_sync
+        
+        # Background worker; wait briefly so a quick incremental sync reports its count
+        finished = mailbox_sync.trigger(wait=current_app.config.get('MAILBOX_SYNC_WAIT_SECONDS', 10))
+        if not finished:
+            return jsonify({
+                'success': True,
+                'running': True,
+                'message': 'Mailbox sync is running in the background',
+                'count': 0
+            }), 202
+        
+        results = mailbox_sync.last_results
+        total_saved = sum(result.new_messages for result in results)
+        errors = [f"{result.account}: {result.error}" for result in results if result.error]
+        for error in errors:
+            current_app.logger.error(f"Error fetching emails from {error}")
         
         return jsonify({
             'success': True, 
             'message': f'Fetched {total_saved} new emails from all accounts',
-            'count': total_saved
+            'count': total_saved,
+            'results': [result.to_dict() for result in results]
         })
         
     except Exception as e:
         current_app.logger.error(f"Error fetching emails: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@communication_bp.route('/inbox/attachments/<int:attachment_id>')
+@login_required
+@admin_required
+def download_attachment(attachment_id):
+    """Download an attachment stored by the mailbox sync"""
+    attachment = EmailAttachment.query.get_or_404(attachment_id)
+    if attachment.content is None:
+        flash('Attachment content is not stored (too large)', 'error')
+        return redirect(url_for('communication.view_email', email_id=attachment.email_id))
+    # send_file кодирует имя файла по RFC 5987 (не-latin-1 символы, кавычки, ';')
+    return send_file(
+        BytesIO(attachment.content),
+        mimetype=attachment.content_type or 'application/octet-stream',
+        as_attachment=True,
+        download_name=attachment.filename or f'attachment-{attachment.id}'
+    )
+
 @communication_bp.route('/inbox/<int:email_id>/mark-important', methods=['POST'])
 @login_required
 @admin_required
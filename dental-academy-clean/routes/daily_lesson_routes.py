@@ -7,7 +7,7 @@ from flask import Blueprint, render_template, request, jsonify, redirect, url_fo
 from flask_login import login_required, current_user
 from datetime import datetime, timezone, timedelta
 from models import MedicalTerm, UserTermProgress, db
-from utils.flashcard_helpers import get_session_terms, calculate_flashcard_xp
+from utils.flashcard_helpers import get_session_terms, calculate_flashcard_xp, get_progress_snapshot, invalidate_progress_snapshot
 from sqlalchemy import func, and_
 
 daily_lesson_bp = Blueprint('daily_lesson', __name__, url_prefix='/daily-lesson')
@@ -28,31 +28,20 @@ def index():
         
         categories_with_progress = []
         
+        # User's progress for all categories from one snapshot
+        summaries = get_progress_snapshot(current_user).category_summaries()
+        
         for category_name, total_terms in categories_data:
-            # Get user's progress for this category
-            user_progress = db.session.query(UserTermProgress).join(
-                MedicalTerm, UserTermProgress.term_id == MedicalTerm.id
-            ).filter(
-                UserTermProgress.user_id == current_user.id,
-                MedicalTerm.category == category_name
-            ).all()
-            
-            # Count by status
-            new_count = total_terms - len(user_progress)
-            learning_count = sum(1 for p in user_progress if 0 < p.mastery_level < 4)
-            mastered_count = sum(1 for p in user_progress if p.mastery_level >= 4)
-            
-            # Count due reviews
-            due_count = sum(1 for p in user_progress if p.is_due)
+            summary = summaries.get(category_name, {'studied': 0, 'learning': 0, 'mastered': 0, 'due': 0})
             
             categories_with_progress.append({
                 'name': category_name,
                 'total': total_terms,
-                'new': new_count,
-                'learning': learning_count,
-                'mastered': mastered_count,
-                'due_today': due_count,
-                'progress_percent': int((len(user_progress) / total_terms * 100)) if total_terms > 0 else 0
+                'new': total_terms - summary['studied'],
+                'learning': summary['learning'],
+                'mastered': summary['mastered'],
+                'due_today': summary['due'],
+                'progress_percent': int((summary['studied'] / total_terms * 100)) if total_terms > 0 else 0
             })
         
         # Sort by most progress
@@ -219,6 +208,7 @@ def submit_answer():
                 session['daily_lesson']['correct_answers'] += 1
         
         db.session.commit()
+        invalidate_progress_snapshot(current_user.id)
         
         current_app.logger.info(f"User {current_user.id} answered term {term_id}: quality={quality}, xp={xp_earned}")
         
@@ -16,7 +16,7 @@ from sqlalchemy import func
 from models import db, DiagnosticSession, Question, IRTParameters, User, PersonalLearningPlan, StudySession, BIGDomain, DiagnosticResponse, TestAttempt
 from utils.serializers import safe_jsonify
 from utils.irt_engine import IRTEngine
-from utils.rate_limiter import RateLimiter
+from utils.rate_limiter import rate_limit as shared_rate_limit
 from utils.session_validator import SessionValidator
 from utils.translations import t
 from utils.irt_calibration import calibration_service
@@ -38,9 +38,6 @@ diagnostic_bp = Blueprint('diagnostic', __name__, url_prefix='/<string:lang>/big
 SUPPORTED_LANGUAGES = ['en', 'ru', 'nl', 'uk', 'es', 'pt', 'tr', 'fa', 'ar']
 DEFAULT_LANGUAGE = 'en'
 
-# Rate limiter instance
-rate_limiter = RateLimiter()
-
 # Session validator instance
 session_validator = SessionValidator()
 
@@ -59,16 +56,8 @@ def before_request_diagnostic():
         session['lang'] = g.lang
 
 def rate_limit(requests_per_minute=60):
-    """Rate limiting decorator"""
-    def decorator(f):
-        @wraps(f)
-        def decorated_function(*args, **kwargs):
-            user_id = current_user.id if current_user.is_authenticated else request.remote_addr
-            if not rate_limiter.check_rate_limit(user_id, requests_per_minute):
-                raise TooManyRequests('Rate limit exceeded')
-            return f(*args, **kwargs)
-        return decorated_function
-    return decorator
+    """Rate limiting decorator (TooManyRequests is handled by handle_rate_limit)"""
+    return shared_rate_limit(requests_per_minute, bucket='diagnostic')
 
 def validate_session(f):
     """Session validation decorator - temporarily simplified for testing"""
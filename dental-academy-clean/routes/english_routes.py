@@ -8,10 +8,9 @@ from extensions import db, csrf
 from models import EnglishPassage, EnglishQuestion, UserEnglishProgress
 from datetime import datetime, timezone
 import json
-import os
-import re
 from utils.ielts_generator import parse_generated_passage, generate_passage_title_from_topic
 from utils.mastery_helpers import update_item_mastery
+from utils.english_lessons import get_english_lesson, get_english_passage
 
 english_bp = Blueprint('english', __name__, url_prefix='/api/english')
 
@@ -30,217 +29,12 @@ PASSAGE_ID_TO_LESSON_MAP = {
     14: 10  # Space Exploration Milestones
 }
 
-def parse_lesson_js(js_content):
-    """Parse JavaScript lesson object to Python dict - uses Node.js if available"""
-    import subprocess
-    import tempfile
-    
-    # First, try using Node.js to parse (most reliable)
-    try:
-        # Extract the variable name from export statement
-        export_match = re.search(r'export\s+const\s+(\w+)\s*=', js_content)
-        var_name = export_match.group(1) if export_match else 'lesson'
-        
-        # Create a temporary JS file
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.js', delete=False, encoding='utf-8') as f:
-            # Write the JS content
-            f.write(js_content)
-            temp_file = f.name
-        
-        try:
-            # Use node to evaluate and convert to JSON
-            # Create a wrapper script that properly handles ES6 export
-            wrapper_script = f'''
-const fs = require('fs');
-const content = fs.readFileSync('{temp_file}', 'utf8');
-// Replace export with module.exports
-const modifiedContent = content.replace(/export\\s+const\\s+(\\w+)\\s*=\\s*/, 'const $1 = ');
-// Add module.exports at the end
-const finalContent = modifiedContent + '\\nmodule.exports = {var_name};';
-// Write to a new temp file and require it
-const tempModule = require('path').join(require('path').dirname('{temp_file}'), 'temp_module.js');
-fs.writeFileSync(tempModule, finalContent);
-const data = require(tempModule);
-fs.unlinkSync(tempModule);
-console.log(JSON.stringify(data, null, 2));
-'''
-            result = subprocess.run(
-                ['node', '-e', wrapper_script],
-                capture_output=True,
-                text=True,
-                timeout=10
-            )
-            
-            if result.returncode == 0 and result.stdout.strip():
-                lesson_data = json.loads(result.stdout)
-                os.unlink(temp_file)
-                current_app.logger.info("Successfully parsed lesson using Node.js")
-                return lesson_data
-            else:
-                current_app.logger.warning(f"Node.js parsing failed: {result.stderr}")
-        except Exception as e:
-            current_app.logger.warning(f"Node.js parsing error: {str(e)}")
-        finally:
-            if os.path.exists(temp_file):
-                os.unlink(temp_file)
-    except Exception as e:
-        current_app.logger.warning(f"Node.js not available or failed: {str(e)}")
-    
-    # Fallback: try improved regex parser
-    try:
-        # Remove export statement
-        original_content = js_content
-        js_content = re.sub(r'export\s+const\s+\w+\s*=\s*', '', js_content)
-        
-        # Remove comments (simple approach)
-        js_content = re.sub(r'//.*?$', '', js_content, flags=re.MULTILINE)
-        js_content = re.sub(r'/\*.*?\*/', '', js_content, flags=re.DOTALL)
-        
-        # Handle template literals (backticks) - convert to double quotes
-        def replace_backticks(match):
-            content = match.group(1)
-            # Escape special characters for JSON
-            content = json.dumps(content)[1:-1]  # Use json.dumps to properly escape
-            return f'"{content}"'
-        
-        js_content = re.sub(r'`([^`]*)`', replace_backticks, js_content)
-        
-        # For single quotes, we need to be very careful
-        # Only replace if it's clearly a string delimiter (not an apostrophe)
-        # This is a simplified approach - may not work for all cases
-        def replace_single_quotes(match):
-            content = match.group(1)
-            # Use json.dumps to properly escape
-            return json.dumps(content)
-        
-        js_content = re.sub(r"'([^']*)'", replace_single_quotes, js_content)
-        
-        # Remove trailing semicolon
-        js_content = js_content.rstrip().rstrip(';').strip()
-        
-        # Try to parse as JSON
-        lesson_data = json.loads(js_content)
-        current_app.logger.info("Successfully parsed lesson using regex parser")
-        return lesson_data
-        
-    except json.JSONDecodeError as e:
-        current_app.logger.error(f"JSON decode error: {str(e)}")
-        # Last resort: try the reading_comprehension parser
-        try:
-            from routes.reading_comprehension import parse_lesson_js as parse_rc
-            return parse_rc(original_content)
-        except:
-            pass
-        
-        current_app.logger.error(f"All parsing methods failed for lesson JS")
-        return None
-    except Exception as e:
-        current_app.logger.error(f"Error parsing lesson JS: {str(e)}")
-        import traceback
-        current_app.logger.error(traceback.format_exc())
-        return None
-
 def get_lesson_from_file(lesson_num):
-    """Load lesson from JS file"""
-    try:
-        # Try multiple path strategies
-        lessons_dir = None
-        lesson_file = None
-        
-        # Strategy 1: Use static_folder if available
-        if hasattr(current_app, 'static_folder') and current_app.static_folder:
-            lessons_dir = os.path.join(current_app.static_folder, 'js', 'lessons')
-            lesson_file = os.path.join(lessons_dir, f'lesson_{lesson_num:03d}.js')
-            if os.path.exists(lesson_file):
-                current_app.logger.info(f"Found lesson file via static_folder: {lesson_file}")
-            else:
-                lesson_file = None
-        
-        # Strategy 2: Use root_path with relative path
-        if not lesson_file or not os.path.exists(lesson_file):
-            lessons_dir = os.path.join(current_app.root_path, '..', 'static', 'js', 'lessons')
-            lessons_dir = os.path.abspath(lessons_dir)
-            lesson_file = os.path.join(lessons_dir, f'lesson_{lesson_num:03d}.js')
-            if os.path.exists(lesson_file):
-                current_app.logger.info(f"Found lesson file via root_path: {lesson_file}")
-            else:
-                lesson_file = None
-        
-        # Strategy 3: Use absolute path from project root
-        if not lesson_file or not os.path.exists(lesson_file):
-            # Get project root (parent of routes directory)
-            project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-            lessons_dir = os.path.join(project_root, 'static', 'js', 'lessons')
-            lesson_file = os.path.join(lessons_dir, f'lesson_{lesson_num:03d}.js')
-            if os.path.exists(lesson_file):
-                current_app.logger.info(f"Found lesson file via project root: {lesson_file}")
-            else:
-                current_app.logger.error(f"Lesson file not found: lesson_{lesson_num:03d}.js")
-                current_app.logger.error(f"Tried paths: static_folder={getattr(current_app, 'static_folder', None)}, root_path={current_app.root_path}")
-                return None
-        
-        # Read and parse file
-        with open(lesson_file, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        current_app.logger.info(f"Successfully loaded lesson {lesson_num}, content length: {len(content)}")
-        
-        parsed_data = parse_lesson_js(content)
-        if not parsed_data:
-            current_app.logger.error(f"Failed to parse lesson {lesson_num}")
-            return None
-        
-        current_app.logger.info(f"Successfully parsed lesson {lesson_num}")
-        return parsed_data
-        
-    except Exception as e:
-        current_app.logger.error(f"Error loading lesson {lesson_num}: {str(e)}")
-        import traceback
-        current_app.logger.error(traceback.format_exc())
-        return None
-
-def convert_lesson_to_passage_format(lesson_data, passage_id):
-    """Convert new lesson format to old passage format for compatibility"""
+    """Load lesson from JS file (parsed once, cached until the file changes)"""
+    lesson_data = get_english_lesson(lesson_num)
     if not lesson_data:
-        return None, []
-    
-    # Convert passage info
-    passage_info = {
-        'id': passage_id,
-        'title': lesson_data.get('title', ''),
-        'text': lesson_data.get('text', ''),
-        'category': 'general',
-        'difficulty': 7.0,
-        'word_count': len(lesson_data.get('text', '').split()),
-        'image_url': lesson_data.get('imageUrl', '')
-    }
-    
-    # Convert questions
-    questions_data = []
-    for idx, q in enumerate(lesson_data.get('questions', []), 1):
-        # Find correct answer option ID
-        correct_answer = None
-        options_dict = {}
-        
-        for opt in q.get('options', []):
-            opt_id = opt.get('id', '')
-            opt_text = opt.get('text', '')
-            options_dict[opt_id] = opt_text
-            if opt.get('correct'):
-                correct_answer = opt_id
-        
-        question_data = {
-            'id': idx,  # Use index as ID for compatibility
-            'question_number': idx,
-            'question_type': 'multiple_choice',  # All new questions are multiple choice
-            'question_text': q.get('question', ''),
-            'correct_answer': correct_answer or '',
-            'explanation': next((opt.get('explanation', '') for opt in q.get('options', []) if opt.get('correct')), ''),
-            'options': options_dict
-        }
-        questions_data.append(question_data)
-    
-    return passage_info, questions_data
+        current_app.logger.error(f"Lesson {lesson_num} not found or failed to parse")
+    return lesson_data
 
 
 @english_bp.route('/passage/<int:passage_id>', methods=['GET'])
@@ -334,7 +128,7 @@ def get_passage(passage_id):
         else:
             # Convert to old format for backward compatibility
             current_app.logger.info(f"Converting lesson {lesson_num} to old passage format")
-            passage_info, questions_data = convert_lesson_to_passage_format(lesson_data, passage_id)
+            passage_info, questions_data = get_english_passage(lesson_num, passage_id)
             
             if not passage_info:
                 current_app.logger.error(f"Failed to convert lesson {lesson_num} to passage format")
@@ -9,6 +9,7 @@ Routes:
 - GET /flashcards/study-simple/<category> - Start simplified study session
 - GET /flashcards/due-reviews - Terms due for review
 - POST /flashcards/review/<int:term_id> - Submit review
+- POST /flashcards/api/review-batch - Submit a whole session of reviews at once
 - GET /flashcards/stats - User statistics
 - GET /flashcards/category-stats/<category> - Category stats
 - POST /flashcards/api/session-complete - Mark session complete
@@ -25,7 +26,10 @@ from utils.flashcard_helpers import (
     get_mastery_distribution,
     get_category_progress,
     get_due_reviews_by_category,
-    get_allowed_categories
+    get_allowed_categories,
+    get_due_count,
+    get_progress_snapshot,
+    invalidate_progress_snapshot
 )
 from utils.mastery_helpers import update_item_mastery
 
@@ -215,32 +219,20 @@ def categories():
         
         categories_with_progress = []
         
+        # User's progress for all categories from one snapshot
+        summaries = get_progress_snapshot(current_user).category_summaries()
+        
         for category_name, total_terms in categories_data:
-            # Get user's progress for this category
-            # Fixed: Join properly with term table
-            user_progress = db.session.query(UserTermProgress).join(
-                MedicalTerm, UserTermProgress.term_id == MedicalTerm.id
-            ).filter(
-                UserTermProgress.user_id == current_user.id,
-                MedicalTerm.category == category_name
-            ).all()
-            
-            # Count by status
-            new_count = total_terms - len(user_progress)
-            learning_count = sum(1 for p in user_progress if 0 < p.mastery_level < 4)
-            mastered_count = sum(1 for p in user_progress if p.mastery_level >= 4)
-            
-            # Count due reviews
-            due_count = sum(1 for p in user_progress if p.is_due)
+            summary = summaries.get(category_name, {'studied': 0, 'learning': 0, 'mastered': 0, 'due': 0})
             
             categories_with_progress.append({
                 'name': category_name,
                 'total': total_terms,
-                'new': new_count,
-                'learning': learning_count,
-                'mastered': mastered_count,
-                'due_today': due_count,
-                'progress_percent': int((len(user_progress) / total_terms * 100)) if total_terms > 0 else 0
+                'new': total_terms - summary['studied'],
+                'learning': summary['learning'],
+                'mastered': summary['mastered'],
+                'due_today': summary['due'],
+                'progress_percent': int((summary['studied'] / total_terms * 100)) if total_terms > 0 else 0
             })
         
         # Sort by most progress
@@ -589,6 +581,7 @@ def review_term(term_id):
                     current_user.level += 1
         
         db.session.commit()
+        invalidate_progress_snapshot(current_user.id)
         
         current_app.logger.info(f"User {current_user.id} reviewed term {term_id}: quality={quality}, xp={xp_earned}")
         
@@ -624,6 +617,49 @@ def review_term(term_id):
         return jsonify({'error': f'Failed to process review: {str(e)}'}), 500
 
 
+@flashcard_bp.route('/api/review-batch', methods=['POST'])
+@login_required
+def review_batch():
+    """
+    Submit an ordered batch of reviews in one transaction (offline / mobile sync)
+    
+    Input (JSON):
+    {
+        "batch_id": "uuid",  // idempotency key - a retry returns the stored result
+        "reviews": [
+            {"term_id": 12, "quality": 1-4, "time_spent": 10, "reviewed_at": "2025-10-29T10:15:00Z"},
+            ...
+        ]
+    }
+    
+    Returns:
+    {
+        "success": true,
+        "applied": 20,
+        "rejected": 0,
+        "xp_earned": 230,
+        "duplicate": false,
+        "results": [{"term_id": 12, "status": "applied", "next_review": "...", ...}, ...]
+    }
+    """
+    from utils.flashcard_review_batch import apply_review_batch, ReviewBatchError
+    
+    data = request.get_json(silent=True) or {}
+    try:
+        return jsonify(apply_review_batch(current_user, data.get('batch_id'), data.get('reviews')))
+    
+    except ReviewBatchError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    
+    except Exception as e:
+        import traceback
+        current_app.logger.error(f"Error applying review batch for user {current_user.id}: {e}")
+        current_app.logger.error(f"Traceback: {traceback.format_exc()}")
+        db.session.rollback()
+        return jsonify({'error': 'Failed to process review batch'}), 500
+
+
 @flashcard_bp.route('/due-reviews')
 @login_required
 def due_reviews():
@@ -779,20 +815,7 @@ def api_due_count():
     API endpoint to get count of terms due for review (for dashboard badge)
     """
     try:
-        due_count = UserTermProgress.query.filter(
-            UserTermProgress.user_id == current_user.id,
-            UserTermProgress.next_review <= datetime.now(timezone.utc)
-        )
-
-        allowed_categories = get_allowed_categories(current_user)
-        if allowed_categories:
-            due_count = due_count.join(
-                MedicalTerm, UserTermProgress.term_id == MedicalTerm.id
-            ).filter(
-                MedicalTerm.category.in_(allowed_categories)
-            )
-
-        due_count = due_count.count()
+        due_count = get_due_count(current_user)
         
         return jsonify({'due_count': due_count})
     
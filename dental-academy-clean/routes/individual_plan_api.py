@@ -16,25 +16,19 @@ from utils.individual_plan_helpers import (
     update_daily_progress,
     select_questions_for_today
 )
-from utils.rate_limiter import rate_limiter
+from utils.rate_limiter import rate_limit as shared_rate_limit
 
 individual_plan_api_bp = Blueprint('individual_plan_api', __name__)
 
+def _rate_limited_response():
+    return jsonify({
+        'success': False,
+        'error': 'Rate limit exceeded. Please try again later.'
+    }), 429
+
 def rate_limit(requests_per_minute=120):
     """Rate limiting decorator for API endpoints"""
-    def decorator(f):
-        from functools import wraps
-        @wraps(f)
-        def decorated_function(*args, **kwargs):
-            user_id = current_user.id if current_user.is_authenticated else request.remote_addr
-            if not rate_limiter.check_rate_limit(user_id, requests_per_minute):
-                return jsonify({
-                    'success': False,
-                    'error': 'Rate limit exceeded. Please try again later.'
-                }), 429
-            return f(*args, **kwargs)
-        return decorated_function
-    return decorator
+    return shared_rate_limit(requests_per_minute, bucket='learning_map', on_limit=_rate_limited_response)
 
 
 @individual_plan_api_bp.route('/api/individual-plan/daily-tasks')
@@ -2,7 +2,7 @@
 
 from flask import (
     Blueprint, render_template, request, session, redirect, url_for, g, flash, 
-    jsonify, current_app
+    jsonify, current_app, abort
 )
 from flask_login import login_required, current_user
 from extensions import db
@@ -17,6 +17,13 @@ import os
 import subprocess
 from datetime import datetime, timezone, timedelta
 from utils.unified_stats import get_unified_user_stats, get_module_stats_unified, get_subject_stats_unified, clear_stats_cache
+from utils.content_tree import content_tree, load_user_progress, get_user_content_categories, overlay_subject_progress
+from utils.profession_maps import profession_maps, fragment_response
+from utils.plan_instrumentation import query_budget
+from utils.analytics_middleware import page_title
+
+# Бюджет SQL запросов страницы карты обучения (проверяется в тестах, см. query_budget)
+LEARNING_MAP_QUERY_BUDGET = int(os.environ.get('LEARNING_MAP_QUERY_BUDGET', 40))
 
 # Создаем Blueprint для карты обучения
 learning_map_bp = Blueprint(
@@ -168,8 +175,8 @@ PROFESSION_NAMES = {
     'verpleegkunde': '👩‍⚕️ Verpleegkunde'
 }
 
-def get_pharmacy_learning_data(user_id):
-    """Генерирует данные карты обучения для фармацевтов"""
+def get_pharmacy_learning_data(lang):
+    """Генерирует данные карты обучения для фармацевтов (статические, без данных пользователя)"""
     
     # Фармацевтические пути обучения
     pharmacy_paths = [
@@ -319,8 +326,8 @@ def get_pharmacy_learning_data(user_id):
         'subjects': pharmacy_subjects
     }
 
-def get_gp_learning_data(user_id):
-    """Генерирует данные карты обучения для врачей общей практики"""
+def get_gp_learning_data(lang):
+    """Генерирует данные карты обучения для врачей общей практики (статические, без данных пользователя)"""
     
     # Пути обучения для врачей общей практики
     gp_paths = [
@@ -448,8 +455,8 @@ def get_gp_learning_data(user_id):
         'subjects': gp_subjects
     }
 
-def get_nursing_learning_data(user_id):
-    """Генерирует данные карты обучения для медсестер"""
+def get_nursing_learning_data(lang):
+    """Генерирует данные карты обучения для медсестер (статические, без данных пользователя)"""
     
     # Пути обучения для медсестер
     nursing_paths = [
@@ -601,24 +608,18 @@ def get_nursing_learning_data(user_id):
         'subjects': nursing_subjects
     }
 
-def get_dentistry_learning_data(user_id):
-    """Генерирует данные карты обучения для стоматологов (BI-toets структура)"""
+def get_dentistry_learning_data(lang):
+    """
+    Генерирует статическую часть карты обучения для стоматологов (BI-toets структура)
+
+    Прогресс пользователя накладывается в overlay_dentistry_progress.
+    """
     
     # Получаем пути обучения из базы данных
-    from models import UserLearningProgress
-    
     learning_paths = LearningPath.query.filter_by(is_active=True).order_by(LearningPath.exam_weight.desc()).all()
     
     dentistry_paths = []
     for path in learning_paths:
-        # Получаем прогресс пользователя
-        user_progress = UserLearningProgress.query.filter_by(
-            user_id=user_id,
-            learning_path_id=path.id
-        ).first()
-        
-        progress_percent = user_progress.progress_percentage if user_progress else 0
-        
         # Определяем иконку в зависимости от типа экзамена
         icon_map = {
             'multiple_choice': 'question-circle',
@@ -663,7 +664,6 @@ def get_dentistry_learning_data(user_id):
             'order': path.exam_weight,  # Используем вес как порядок
             'is_active': path.is_active,
             'css_class': css_class_map.get(path.exam_component, 'knowledge-center'),
-            'progress_percent': progress_percent,
             'exam_component': path.exam_component,
             'exam_weight': path.exam_weight,
             'exam_type': path.exam_type,
@@ -672,76 +672,48 @@ def get_dentistry_learning_data(user_id):
         }
         dentistry_paths.append(path_data)
     
-    # Получаем реальные предметы из базы данных
-    dentistry_subjects = []
-    subjects = Subject.query.all()
-    
-    for subject in subjects:
-        # Получаем модули для этого предмета
-        modules = Module.query.filter_by(subject_id=subject.id).order_by(Module.order).all()
-        
-        # Обрабатываем модули
-        processed_modules = []
-        total_progress = 0
-        
-        for module in modules:
-            # Получаем статистику модуля
-            module_stats = get_module_stats_unified(module.id, user_id)
-            
-            # Добавляем модуль с прогрессом
-            processed_modules.append({
-                'id': module.id,
-                'title': module.title,
-                'description': module.description if hasattr(module, 'description') else '',
-                'is_premium': module.is_premium if hasattr(module, 'is_premium') else False,
-                'is_final_test': module.is_final_test if hasattr(module, 'is_final_test') else False,
-                'icon': module.icon if hasattr(module, 'icon') else 'file-earmark-text',
-                'progress': module_stats['progress'],
-                'completed_lessons': module_stats['completed_lessons'],
-                'total_lessons': module_stats['total_lessons']
-            })
-            
-            total_progress += module_stats['progress']
-        
-        # Вычисляем средний прогресс предмета
-        subject_progress = round(total_progress / len(modules)) if modules else 0
-        
-        # Создаем словарь с информацией о предмете
-        subject_data = {
-            'id': subject.id,
-            'name': subject.name,
-            'description': subject.description if hasattr(subject, 'description') else '',
-            'icon': subject.icon if hasattr(subject, 'icon') else 'folder2-open',
-            'learning_path_id': subject.learning_path_id,
-            'progress': subject_progress,
-            'modules': processed_modules
-        }
-        
-        dentistry_subjects.append(subject_data)
-    
-    # Привязываем предметы к путям обучения
-    for path in dentistry_paths:
-        path['subjects'] = [subject for subject in dentistry_subjects if subject['learning_path_id'] == path['id']]
+    # Предметы и модули из дерева контента (кэш процесса)
+    dentistry_subjects = content_tree.get().subjects
     
     return {
         'learning_paths': dentistry_paths,
         'subjects': dentistry_subjects
     }
 
-def get_profession_specific_data(profession, user_id):
+def overlay_dentistry_progress(data, user_id):
+    """Накладывает прогресс пользователя на копию стоматологической карты"""
+    from models import UserLearningProgress
+    
+    # Прогресс по путям обучения одним запросом
+    path_progress = {
+        learning_path_id: progress_percentage
+        for learning_path_id, progress_percentage in db.session.query(
+            UserLearningProgress.learning_path_id, UserLearningProgress.progress_percentage
+        ).filter(UserLearningProgress.user_id == user_id).all()
+    }
+    
+    # Прогресс модулей и предметов одним агрегированным запросом
+    overlay_subject_progress(data['subjects'], load_user_progress(user_id))
+    
+    # Привязываем предметы к путям обучения
+    for path in data['learning_paths']:
+        path['progress_percent'] = path_progress.get(path['id']) or 0
+        path['subjects'] = [subject for subject in data['subjects'] if subject['learning_path_id'] == path['id']]
+
+# Реестр профессиональных карт: статическая часть компилируется один раз на профессию
+# (сборщики не зависят от языка - один фрагмент на все языки)
+profession_maps.register('farmacie', get_pharmacy_learning_data)
+profession_maps.register('huisartsgeneeskunde', get_gp_learning_data)
+profession_maps.register('verpleegkunde', get_nursing_learning_data)
+profession_maps.register('tandheelkunde', get_dentistry_learning_data, overlay_dentistry_progress)
+
+def get_profession_specific_data(profession, user_id, lang=None):
     """Возвращает данные карты обучения в зависимости от профессии"""
     
-    if profession == 'farmacie':
-        return get_pharmacy_learning_data(user_id)
-    elif profession == 'tandheelkunde':
-        return get_dentistry_learning_data(user_id)
-    elif profession == 'huisartsgeneeskunde':
-        return get_gp_learning_data(user_id)
-    elif profession == 'verpleegkunde':
-        return get_nursing_learning_data(user_id)
-    else:
+    if profession not in profession_maps:
         # Fallback на стоматологические данные
-        return get_dentistry_learning_data(user_id)
+        profession = 'tandheelkunde'
+    return profession_maps.user_data(profession, lang or DEFAULT_LANGUAGE, user_id)
 
 @profession_map_bp.route('/')
 @login_required 
@@ -766,6 +738,7 @@ def profession_redirect(lang):
 
 @profession_map_bp.route('/<string:profession>')
 @login_required
+@page_title('Profession Learning Map')
 def profession_learning_map(lang, profession):
     """Отображает карту обучения для конкретной профессии"""
     
@@ -793,58 +766,13 @@ def profession_learning_map(lang, profession):
     
     try:
         # Получаем профессиональные данные
-        profession_data = get_profession_specific_data(profession, current_user.id)
+        profession_data = get_profession_specific_data(profession, current_user.id, g.lang)
         
         # Статистика пользователя
         stats = get_unified_user_stats(current_user.id)
 
-        # Загружаем общие категории контента
-        content_categories = ContentCategory.query.order_by(ContentCategory.order).all()
-        
-        # Обрабатываем категории для отображения в карте обучения
-        processed_categories = []
-        for category in content_categories:
-            subcategories = []
-            for subcategory in category.subcategories.order_by(ContentSubcategory.order).all():
-                topics = []
-                for topic in subcategory.topics.order_by(ContentTopic.order).all():
-                    lessons_count = Lesson.query.filter_by(topic_id=topic.id).count()
-                    topics.append({
-                        'id': topic.id,
-                        'name': topic.name,
-                        'slug': topic.slug,
-                        'lessons_count': lessons_count,
-                        'url': url_for('content_nav.view_topic', 
-                                     lang=lang, 
-                                     category_slug=category.slug,
-                                     subcategory_slug=subcategory.slug,
-                                     topic_slug=topic.slug)
-                    })
-                
-                subcategories.append({
-                    'id': subcategory.id,
-                    'name': subcategory.name,
-                    'slug': subcategory.slug,
-                    'topics': topics,
-                    'topics_count': len(topics),
-                    'url': url_for('content_nav.view_subcategory',
-                                 lang=lang,
-                                 category_slug=category.slug,
-                                 subcategory_slug=subcategory.slug)
-                })
-            
-            category_data = {
-                'id': category.id,
-                'name': category.name,
-                'slug': category.slug,
-                'icon': category.icon or 'bi-book',
-                'subcategories': subcategories,
-                'subcategories_count': len(subcategories),
-                'url': url_for('content_nav.view_category',
-                             lang=lang,
-                             category_slug=category.slug)
-            }
-            processed_categories.append(category_data)
+        # Общие категории контента (дерево из кэша процесса) с прогрессом пользователя
+        processed_categories = get_user_content_categories(lang, current_user.id)
 
         # Дополнительный контекст для профессиональных карт
         profession_context = {
@@ -855,11 +783,13 @@ def profession_learning_map(lang, profession):
             'is_own_profession': user_profession == requested_profession
         }
         
-        has_completed_diagnostic = DiagnosticSession.query.filter(
-            DiagnosticSession.user_id == current_user.id,
-            DiagnosticSession.completed_at.isnot(None),
-            DiagnosticSession.session_type != 'daily_practice'
-        ).first() is not None
+        has_completed_diagnostic = db.session.query(
+            DiagnosticSession.query.filter(
+                DiagnosticSession.user_id == current_user.id,
+                DiagnosticSession.completed_at.isnot(None),
+                DiagnosticSession.session_type != 'daily_practice'
+            ).exists()
+        ).scalar()
 
         active_plan = PersonalLearningPlan.query.filter_by(
             user_id=current_user.id,
@@ -1061,6 +991,8 @@ def complete_profile(lang):
 @learning_map_bp.route("/", strict_slashes=False)
 @learning_map_bp.route("/<string:path_id>", strict_slashes=False)
 @login_required
+@query_budget('learning_map', LEARNING_MAP_QUERY_BUDGET)
+@page_title('Learning Map')
 def learning_map(lang, path_id=None):
     """Отображает интерактивную карту обучения."""
     current_lang = g.lang
@@ -1075,32 +1007,15 @@ def learning_map(lang, path_id=None):
         return redirect(url_for('learning_map_bp.complete_profile', lang=current_lang))
     
     try:
-        # Добавьте явный импорт ContentCategory
-        from models import ContentCategory
-        
-        # Добавьте загрузку категорий
-        content_categories = ContentCategory.query.order_by(ContentCategory.order).all()
-        print(f"DEBUG: Загружено категорий: {len(content_categories)}")
-
-        for cat in content_categories:
-            print(f"DEBUG: Категория: {cat.name}, подкатегорий: {cat.subcategories.count()}")
-            for subcat in cat.subcategories.all():
-                print(f"DEBUG:   Подкатегория: {subcat.name}, тем: {subcat.topics.count()}")
-                for topic in subcat.topics.all():
-                    print(f"DEBUG:     Тема: {topic.name}")
-        # Определяем, прошел ли пользователь основной скрининг (Gatekeeper)
-        has_completed_screening = DiagnosticSession.query.filter(
-            DiagnosticSession.user_id == current_user.id,
-            DiagnosticSession.diagnostic_type == 'quick_scan_10',
-            DiagnosticSession.completed_at.isnot(None)
-        ).first() is not None
-        
-        has_completed_any_diagnostic = DiagnosticSession.query.filter(
-            DiagnosticSession.user_id == current_user.id,
-            DiagnosticSession.completed_at.isnot(None),
-            DiagnosticSession.status == 'completed',
-            DiagnosticSession.session_type != 'daily_practice'
-        ).first() is not None
+        # Пройдена ли диагностика (Gatekeeper) - один запрос EXISTS
+        has_completed_any_diagnostic = db.session.query(
+            DiagnosticSession.query.filter(
+                DiagnosticSession.user_id == current_user.id,
+                DiagnosticSession.completed_at.isnot(None),
+                DiagnosticSession.status == 'completed',
+                DiagnosticSession.session_type != 'daily_practice'
+            ).exists()
+        ).scalar()
 
         active_plan = PersonalLearningPlan.query.filter_by(
             user_id=current_user.id,
@@ -1122,7 +1037,7 @@ def learning_map(lang, path_id=None):
 
         diagnostic_flag_updated = False
         requires_diagnostic_flag = getattr(current_user, 'requires_diagnostic', False)
-        if has_completed_diagnostic and requires_diagnostic_flag:
+        if has_completed_any_diagnostic and requires_diagnostic_flag:
             current_user.requires_diagnostic = False
             diagnostic_flag_updated = True
             current_app.logger.info(f"Diagnostic requirement flag cleared for user {current_user.id}")
@@ -1168,6 +1083,11 @@ def learning_map(lang, path_id=None):
             current_path = learning_paths[0]
             path_id = current_path.id
         
+        # Дерево контента из кэша процесса + прогресс пользователя одним запросом
+        content_progress = load_user_progress(current_user.id)
+        all_subjects = content_tree.user_subjects(content_progress)
+        processed_categories = content_tree.user_categories(lang, content_progress)
+        
         # Получаем выбранный предмет из параметра URL
         selected_subject_id = request.args.get('subject', type=int)
         selected_subject = None
@@ -1176,124 +1096,12 @@ def learning_map(lang, path_id=None):
         if selected_subject_id:
             selected_subject = Subject.query.get(selected_subject_id)
             if selected_subject:
-                # Получаем модули для выбранного предмета
-                modules = Module.query.filter_by(subject_id=selected_subject.id).order_by(Module.order).all()
-                for module in modules:
-                    module_stats = get_module_stats_unified(module.id, current_user.id)
-                    subject_modules.append({
-                        'id': module.id,
-                        'title': module.title,
-                        'description': module.description if hasattr(module, 'description') else '',
-                        'is_premium': module.is_premium if hasattr(module, 'is_premium') else False,
-                        'is_final_test': module.is_final_test if hasattr(module, 'is_final_test') else False,
-                        'icon': module.icon if hasattr(module, 'icon') else 'file-earmark-text',
-                        'progress': module_stats['progress'],
-                        'completed_lessons': module_stats['completed_lessons'],
-                        'total_lessons': module_stats['total_lessons']
-                    })
-        
-        # Получаем все предметы с предзагрузкой модулей
-        all_subjects = []
-        
-        # Обрабатываем предметы и их модули
-        subjects_query = Subject.query.all()
-        for subject in subjects_query:
-            # Получаем все модули для этого предмета
-            modules = Module.query.filter_by(subject_id=subject.id).order_by(Module.order).all()
-            
-            # Обрабатываем каждый модуль
-            processed_modules = []
-            total_progress = 0
-            
-            for module in modules:
-                # Получаем статистику модуля
-                module_stats = get_module_stats_unified(module.id, current_user.id)
-                
-                # Добавляем модуль с прогрессом
-                processed_modules.append({
-                    'id': module.id,
-                    'title': module.title,
-                    'description': module.description if hasattr(module, 'description') else '',
-                    'is_premium': module.is_premium if hasattr(module, 'is_premium') else False,
-                    'is_final_test': module.is_final_test if hasattr(module, 'is_final_test') else False,
-                    'icon': module.icon if hasattr(module, 'icon') else 'file-earmark-text',
-                    'progress': module_stats['progress'],
-                    'completed_lessons': module_stats['completed_lessons'],
-                    'total_lessons': module_stats['total_lessons']
-                })
-                
-                total_progress += module_stats['progress']
-            
-            # Вычисляем средний прогресс предмета
-            subject_progress = round(total_progress / len(modules)) if modules else 0
-            
-            # Создаем словарь с информацией о предмете
-            subject_data = {
-                'id': subject.id,
-                'name': subject.name,
-                'description': subject.description if hasattr(subject, 'description') else '',
-                'icon': subject.icon if hasattr(subject, 'icon') else 'folder2-open',
-                'learning_path_id': subject.learning_path_id,
-                'progress': subject_progress,
-                'modules': processed_modules
-            }
-            
-            all_subjects.append(subject_data)
+                subject_modules = next(
+                    (subject['modules'] for subject in all_subjects if subject['id'] == selected_subject.id), []
+                )
         
         # Статистика пользователя
         stats = get_unified_user_stats(current_user.id)
-
-        # Загружаем категории контента с подкатегориями и темами
-        content_categories = ContentCategory.query.order_by(ContentCategory.order).all()
-        print(f"🔍 DEBUG: Загружено категорий из БД: {len(content_categories)}")
-        
-        # Обрабатываем категории для отображения в карте обучения
-        processed_categories = []
-        for category in content_categories:
-            subcategories = []
-            for subcategory in category.subcategories.order_by(ContentSubcategory.order).all():
-                topics = []
-                for topic in subcategory.topics.order_by(ContentTopic.order).all():
-                    # Подсчитываем уроки для темы
-                    lessons_count = Lesson.query.filter_by(topic_id=topic.id).count()
-                    topics.append({
-                        'id': topic.id,
-                        'name': topic.name,
-                        'slug': topic.slug,
-                        'lessons_count': lessons_count,
-                        'url': url_for('content_nav.view_topic', 
-                                     lang=lang, 
-                                     category_slug=category.slug,
-                                     subcategory_slug=subcategory.slug,
-                                     topic_slug=topic.slug)
-                    })
-                
-                subcategories.append({
-                    'id': subcategory.id,
-                    'name': subcategory.name,
-                    'slug': subcategory.slug,
-                    'topics': topics,
-                    'topics_count': len(topics),
-                    'url': url_for('content_nav.view_subcategory',
-                                 lang=lang,
-                                 category_slug=category.slug,
-                                 subcategory_slug=subcategory.slug)
-                })
-            
-            category_data = {
-                'id': category.id,
-                'name': category.name,
-                'slug': category.slug,
-                'icon': category.icon or 'bi-book',
-                'subcategories': subcategories,
-                'subcategories_count': len(subcategories),
-                'url': url_for('content_nav.view_category',
-                             lang=lang,
-                             category_slug=category.slug)
-            }
-            processed_categories.append(category_data)
-            print(f"✅ DEBUG: Обработана категория ID={category.id}, name='{category.name}', подкатегорий={len(subcategories)}")
-
         
         # Add flashcard data
         try:
@@ -1590,67 +1398,58 @@ def start_module_redirect(lang, module_id):
         return redirect(url_for('learning_map_bp.learning_map', lang=g.lang, path_id='irt'))
 
 # --- API-эндпоинт ---
+def build_path_map_data(learning_path_id):
+    """Статическая часть карты пути обучения для API (без прогресса пользователя)"""
+    learning_path = db.session.get(LearningPath, learning_path_id)
+    if learning_path is None:
+        abort(404)
+    
+    return {
+        "path": {
+            "id": learning_path.id,
+            "name": learning_path.name,
+            "description": learning_path.description
+        },
+        "subjects": [
+            subject for subject in content_tree.get().subjects
+            if subject['learning_path_id'] == learning_path.id
+        ]
+    }
+
 @learning_map_bp.route("/api/data/<string:path_id>")
 @login_required
 def get_learning_map_data(lang, path_id):
-    """API-эндпоинт для получения данных карты обучения"""
+    """
+    API-эндпоинт для получения данных карты обучения
+    
+    Структура пути отдается из предкомпилированного фрагмента; прогресс
+    пользователя дописывается под ключом "progress". Ответ содержит ETag -
+    клиент может перепроверять его через If-None-Match (304).
+    """
     try:
-        # Получаем запрашиваемый путь обучения
-        learning_path = LearningPath.query.get_or_404(path_id)
-        
-        # Формируем базовый ответ
-        result = {
-            "path": {
-                "id": learning_path.id,
-                "name": learning_path.name,
-                "description": learning_path.description
-            },
-            "subjects": []
-        }
-        
-        # Получаем все предметы для этого пути
-        subjects = Subject.query.filter_by(learning_path_id=path_id).order_by(subject.order).all()
-        
-        # Добавляем информацию о каждом предмете
-        for subject in subjects:
-            # Рассчитываем прогресс предмета
-            subject_progress = calculate_subject_progress(subject.id, current_user.id)
-            
-            subject_data = {
-                "id": subject.id,
-                "name": subject.name,
-                "description": subject.description,
-                "icon": subject.icon,
-                "progress": subject_progress,
-                "modules": []
-            }
-            
-            # Получаем модули для предмета
-            modules = Module.query.filter_by(subject_id=subject.id).order_by(Module.order).all()
-            
-            # Добавляем информацию о каждом модуле
-            for module in modules:
-                # Получаем статистику для модуля
-                module_stats = get_module_stats_unified(module.id, current_user.id)
-                
-                module_data = {
-                    "id": module.id,
-                    "title": module.title,
-                    "description": module.description,
-                    "icon": module.icon,
-                    "order": module.order,
-                    "is_premium": module.is_premium,
-                    "is_final_test": module.is_final_test,
-                    "progress": module_stats["progress"],
-                    "completed_lessons": module_stats["completed_lessons"],
-                    "total_lessons": module_stats["total_lessons"]
+        learning_path_id = int(path_id)
+    except ValueError:
+        abort(404)
+    
+    # Структура пути не зависит от языка: один фрагмент на путь
+    fragment = profession_maps.fragment(
+        f'path:{learning_path_id}', None,
+        lambda _lang: build_path_map_data(learning_path_id)
+    )
+    
+    try:
+        subjects = content_tree.user_subjects(load_user_progress(current_user.id), learning_path_id)
+        progress = {
+            "subjects": {subject['id']: subject['progress'] for subject in subjects},
+            "modules": {
+                module['id']: {
+                    "progress": module['progress'],
+                    "completed_lessons": module['completed_lessons']
                 }
-                
-                subject_data["modules"].append(module_data)
-            
-            result["subjects"].append(subject_data)
-        
-        return jsonify(result)
+                for subject in subjects for module in subject['modules']
+            }
+        }
+        return fragment_response(fragment, progress)
     except Exception as e:
         # Логируем ошибку
         current_app.logger.error(f"Общая ошибка API: {str(e)}")
@@ -84,6 +84,9 @@ def update_lesson_progress(user_id, lesson_id, viewed=False, completed=False):
                 from utils.diagnostic_data_manager import clear_cache
                 clear_cache(user_id)
         
+        from utils.unified_stats import bump_stats_version
+        bump_stats_version(user_id)
+        
     except Exception as e:
         current_app.logger.error(f"Error updating lesson progress: {e}")
         db.session.rollback()
@@ -9,6 +9,7 @@ from datetime import datetime, timezone
 import json
 import os
 import re
+from utils.english_lessons import english_lessons
 
 reading_comprehension_bp = Blueprint('reading_comprehension', __name__, url_prefix='/api/reading-comprehension')
 
@@ -18,35 +19,7 @@ reading_comprehension_bp = Blueprint('reading_comprehension', __name__, url_pref
 def get_all_lessons():
     """Get list of all available lessons"""
     try:
-        lessons_list = []
-        
-        # Read all lesson files from static/js/lessons/
-        lessons_dir = os.path.join(current_app.root_path, '..', 'static', 'js', 'lessons')
-        lessons_dir = os.path.abspath(lessons_dir)
-        
-        for i in range(1, 11):
-            lesson_file = os.path.join(lessons_dir, f'lesson_{i:03d}.js')
-            if os.path.exists(lesson_file):
-                try:
-                    # Read and parse lesson file
-                    with open(lesson_file, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                    
-                    # Extract basic info using regex (simple approach)
-                    title_match = re.search(r"title:\s*['\"]([^'\"]+)['\"]", content)
-                    id_match = re.search(r"id:\s*['\"]([^'\"]+)['\"]", content)
-                    image_match = re.search(r"imageUrl:\s*['\"]([^'\"]+)['\"]", content)
-                    
-                    lesson_info = {
-                        'id': id_match.group(1) if id_match else f'lesson_{i:03d}',
-                        'title': title_match.group(1) if title_match else f'Lesson {i}',
-                        'index': i,
-                        'imageUrl': image_match.group(1) if image_match else None
-                    }
-                    lessons_list.append(lesson_info)
-                except Exception as e:
-                    current_app.logger.error(f"Error reading lesson {i}: {str(e)}")
-                    continue
+        lessons_list = english_lessons.summaries()
         
         return jsonify({
             'success': True,
@@ -75,22 +48,11 @@ def get_lesson(lesson_id):
         if lesson_num < 1 or lesson_num > 10:
             return jsonify({'error': 'Lesson number out of range'}), 400
         
-        # Read lesson file
-        lessons_dir = os.path.join(current_app.root_path, '..', 'static', 'js', 'lessons')
-        lessons_dir = os.path.abspath(lessons_dir)
-        lesson_file = os.path.join(lessons_dir, f'lesson_{lesson_num:03d}.js')
-        
-        if not os.path.exists(lesson_file):
+        # Parsed lesson from the shared lesson store
+        if not os.path.exists(english_lessons.source_path(lesson_num)):
             return jsonify({'error': 'Lesson not found'}), 404
         
-        # Read and parse lesson
-        with open(lesson_file, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        # Parse JavaScript object to JSON (simplified approach)
-        # For production, consider using a proper JS parser
-        # This is a basic regex-based parser
-        lesson_data = parse_lesson_js(content)
+        lesson_data = english_lessons.get(lesson_num)
         
         if not lesson_data:
             return jsonify({'error': 'Failed to parse lesson'}), 500
@@ -107,36 +69,6 @@ def get_lesson(lesson_id):
         }), 500
 
 
-def parse_lesson_js(js_content):
-    """Parse JavaScript lesson object to Python dict"""
-    try:
-        # Remove export statement
-        js_content = re.sub(r'export\s+const\s+\w+\s*=\s*', '', js_content)
-        
-        # Remove comments
-        js_content = re.sub(r'//.*?$', '', js_content, flags=re.MULTILINE)
-        js_content = re.sub(r'/\*.*?\*/', '', js_content, flags=re.DOTALL)
-        
-        # Convert JavaScript object to JSON-like string
-        # Replace single quotes with double quotes (simple approach)
-        js_content = re.sub(r"'([^']*)'", r'"\1"', js_content)
-        
-        # Handle template literals in text fields
-        # Replace backticks with double quotes
-        js_content = re.sub(r'`([^`]*)`', r'"\1"', js_content)
-        
-        # Remove trailing semicolon
-        js_content = js_content.rstrip().rstrip(';')
-        
-        # Try to parse as JSON
-        lesson_data = json.loads(js_content)
-        return lesson_data
-    except Exception as e:
-        current_app.logger.error(f"Error parsing lesson JS: {str(e)}")
-        # Fallback: return basic structure
-        return None
-
-
 @reading_comprehension_bp.route('/lesson/<lesson_id>/progress', methods=['GET', 'POST'])
 @login_required
 def lesson_progress(lesson_id):
@@ -196,17 +128,10 @@ def submit_lesson_answers(lesson_id):
             return jsonify({'error': 'Invalid lesson ID'}), 400
         
         lesson_num = int(lesson_num_match.group(1))
-        lessons_dir = os.path.join(current_app.root_path, '..', 'static', 'js', 'lessons')
-        lessons_dir = os.path.abspath(lessons_dir)
-        lesson_file = os.path.join(lessons_dir, f'lesson_{lesson_num:03d}.js')
-        
-        if not os.path.exists(lesson_file):
+        if not os.path.exists(english_lessons.source_path(lesson_num)):
             return jsonify({'error': 'Lesson not found'}), 404
         
-        with open(lesson_file, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        lesson_data = parse_lesson_js(content)
+        lesson_data = english_lessons.get(lesson_num)
         if not lesson_data:
             return jsonify({'error': 'Failed to parse lesson'}), 500
         
@@ -5,7 +5,7 @@ from flask_login import login_required, current_user
 from extensions import db
 from models import UserProgress, DiagnosticSession, UserActivity, TestAttempt
 from datetime import datetime, timedelta, timezone
-from utils.rate_limiter import rate_limiter
+from utils.rate_limiter import rate_limit as shared_rate_limit
 from werkzeug.exceptions import TooManyRequests
 
 # Создаем Blueprint для статистики
@@ -15,21 +15,15 @@ statistics_bp = Blueprint(
     url_prefix='/<string:lang>/api'
 )
 
+def _rate_limited_response():
+    return jsonify({
+        'success': False,
+        'error': 'Rate limit exceeded. Please try again later.'
+    }), 429
+
 def rate_limit(requests_per_minute=120):
     """Rate limiting decorator for API endpoints"""
-    def decorator(f):
-        from functools import wraps
-        @wraps(f)
-        def decorated_function(*args, **kwargs):
-            user_id = current_user.id if current_user.is_authenticated else request.remote_addr
-            if not rate_limiter.check_rate_limit(user_id, requests_per_minute):
-                return jsonify({
-                    'success': False,
-                    'error': 'Rate limit exceeded. Please try again later.'
-                }), 429
-            return f(*args, **kwargs)
-        return decorated_function
-    return decorator
+    return shared_rate_limit(requests_per_minute, bucket='statistics', on_limit=_rate_limited_response)
 
 
 @statistics_bp.route('/user-statistics')
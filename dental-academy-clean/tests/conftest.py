@@ -0,0 +1,43 @@
+"""
+Общие фикстуры тестов
+
+Приложение импортируется один раз на временной SQLite базе (DATABASE_URL
+задается до импорта app, таблицы создаются при импорте).
+"""
+
+import os
+import tempfile
+
+import pytest
+
+_db_fd, _db_path = tempfile.mkstemp(prefix='mentora-tests-', suffix='.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{_db_path}'
+# Фоновые записи активности - синхронно, в потоке запроса
+os.environ['ACTIVITY_QUEUE_ENABLED'] = 'false'
+
+from app import app as flask_app  # noqa: E402
+from extensions import db  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def app():
+    flask_app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    yield flask_app
+    os.close(_db_fd)
+    os.unlink(_db_path)
+
+
+@pytest.fixture
+def app_ctx(app):
+    """Контекст приложения; таблицы очищаются после теста"""
+    with app.app_context():
+        yield app
+        db.session.remove()
+        for table in reversed(db.metadata.sorted_tables):
+            db.session.execute(table.delete())
+        db.session.commit()
+
+
+@pytest.fixture
+def client(app_ctx):
+    return app_ctx.test_client()
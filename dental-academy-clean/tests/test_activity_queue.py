@@ -0,0 +1,37 @@
+from datetime import datetime
+
+from extensions import db
+from models import PageView, User, UserActivityLog, WebsiteVisit
+from utils.activity_queue import RECORD_ACTIVITY, RECORD_PAGE_VIEW, ActivityWriteQueue
+
+
+def activity(user_id, action_type='page_view'):
+    return RECORD_ACTIVITY, {'user_id': user_id, 'action_type': action_type, 'page_url': '/en/learning-map/',
+                             'created_at': datetime.utcnow()}
+
+
+def page_view(url):
+    now = datetime.utcnow()
+    return RECORD_PAGE_VIEW, {
+        'visit': {'ip_address': '127.0.0.1', 'page_url': url, 'sample_weight': 1.0, 'created_at': now},
+        'page_view': {'page_url': url, 'sample_weight': 1.0, 'created_at': now}
+    }
+
+
+def test_failing_record_does_not_drop_its_batch(app_ctx):
+    user = User(email='learner@example.org')
+    db.session.add(user)
+    db.session.commit()
+    queue = ActivityWriteQueue(enabled=False)
+
+    # action_type NOT NULL - вся пачка падает, запись отвергается только одна
+    batch = [activity(user.id), page_view('/en/a'), activity(user.id, action_type=None), page_view('/en/b')]
+    assert queue._write_batch(batch) == 3
+
+    assert UserActivityLog.query.count() == 1
+    assert WebsiteVisit.query.count() == 2
+    assert sorted(view.visit_id for view in PageView.query) == sorted(visit.id for visit in WebsiteVisit.query)
+    stats = queue.get_stats()
+    assert (stats['flushed'], stats['failed'], stats['rejected_kept']) == (3, 1, 1)
+    assert queue.rejected[0]['kind'] == RECORD_ACTIVITY
+    assert queue.rejected[0]['payload']['action_type'] is None
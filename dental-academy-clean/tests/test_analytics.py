@@ -0,0 +1,50 @@
+from datetime import datetime
+
+import pytest
+
+from extensions import db
+from models import DeviceAnalytics, WebsiteVisit
+from utils.analytics import rollup_traffic_analytics
+from utils.analytics_middleware import ENDPOINT_TITLES, _resolve_page_title, register_page_title
+
+
+def add_visits(session_id, count, weight):
+    for _ in range(count):
+        db.session.add(WebsiteVisit(ip_address='127.0.0.1', page_url='/en/learning-map/', session_id=session_id,
+                                    device_type='desktop', browser='Chrome', os='Linux',
+                                    sample_weight=weight, created_at=datetime.utcnow()))
+
+
+def test_rollup_weights_sessions_like_page_views(app_ctx):
+    # 3 сессии попали в выборку 1/10 (по одному просмотру), 2 сессии без выборки
+    for index in range(3):
+        add_visits(f'sampled-{index}', 1, 10.0)
+    for index in range(2):
+        add_visits(f'full-{index}', 2, 1.0)
+    db.session.commit()
+
+    assert rollup_traffic_analytics(days=1)['devices'] == 1
+
+    device = DeviceAnalytics.query.one()
+    assert device.page_views_count == 34
+    assert device.sessions_count == 32
+    assert device.avg_pages_per_session == pytest.approx(34 / 32)
+
+
+def test_page_title_is_resolved_by_full_endpoint(app):
+    with app.test_request_context('/en/learning-map/'):
+        assert _resolve_page_title(app) == 'Learning Map'
+
+    # Заголовок другого blueprint с тем же именем view не применяется
+    register_page_title('admin.learning_map', 'Admin Map')
+    try:
+        with app.test_request_context('/en/learning-map/'):
+            assert _resolve_page_title(app) == 'Learning Map'
+        register_page_title('learning_map_bp.learning_map', 'Map')
+        with app.test_request_context('/en/learning-map/'):
+            assert _resolve_page_title(app) == 'Map'
+        with app.test_request_context('/en/learning-map/check-categories'):
+            assert _resolve_page_title(app) is None
+    finally:
+        ENDPOINT_TITLES.pop('admin.learning_map', None)
+        ENDPOINT_TITLES.pop('learning_map_bp.learning_map', None)
@@ -0,0 +1,109 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from extensions import db
+from models import CommunicationCampaign, CommunicationHistory, User
+from utils.bulk_email_queue import (
+    STATUS_FAILED, STATUS_QUEUED, STATUS_SENDING, STATUS_SENT, BulkEmailQueue, EmailProvider, FakeEmailProvider,
+    OutgoingEmail, Recipient, SendResult, idempotency_key
+)
+
+
+@pytest.fixture
+def sender(app_ctx):
+    user = User(email='admin@example.org', username='admin', role='admin')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def make_queue(**kwargs):
+    options = dict(workers=2, rate=1000, batch_size=3, max_attempts=3, lease_seconds=60, enabled=False)
+    options.update(kwargs)
+    return BulkEmailQueue(**options)
+
+
+def make_campaign(queue, sender, count):
+    recipients = [Recipient(f'user{index}@example.org', name=f'User {index}') for index in range(count)]
+    return queue.create_campaign('Hello', '<p>Hello</p>', recipients, sender)
+
+
+def statuses(campaign_id):
+    return [row.status for row in CommunicationHistory.query.filter_by(campaign_id=campaign_id)
+            .order_by(CommunicationHistory.id)]
+
+
+def test_recipients_are_sent_in_provider_batches(sender):
+    queue = make_queue()
+    campaign = make_campaign(queue, sender, 7)
+    provider = FakeEmailProvider(fail_emails=['user6@example.org'])
+
+    stats = queue.run_campaign(campaign.id, provider=provider)
+
+    # 6 получателей за проход (workers * batch_size) пакетами по 3, затем повторы отказа
+    assert provider.batch_sizes[:3] == [3, 3, 1]
+    assert len(provider.sent) == 6
+    assert (stats.sent, stats.failed, stats.status) == (6, 1, 'completed')
+    assert statuses(campaign.id) == [STATUS_SENT] * 6 + [STATUS_FAILED]
+    failed = CommunicationHistory.query.filter_by(campaign_id=campaign.id, status=STATUS_FAILED).one()
+    assert failed.attempts == 3
+
+    campaign = db.session.get(CommunicationCampaign, campaign.id)
+    assert (campaign.sent_count, campaign.failed_count) == (6, 1)
+
+
+def test_rate_limited_batches_are_requeued_without_an_attempt(sender):
+    queue = make_queue(workers=1)
+    campaign = make_campaign(queue, sender, 6)
+    provider = FakeEmailProvider(rate_limit_every=2)
+
+    stats = queue.run_campaign(campaign.id, provider=provider)
+
+    assert stats.requeued >= 3
+    assert stats.status == 'completed'
+    assert sorted(email.to_email for email in provider.sent) == sorted(f'user{index}@example.org' for index in range(6))
+    rows = CommunicationHistory.query.filter_by(campaign_id=campaign.id).all()
+    assert all(row.status == STATUS_SENT and row.attempts == 1 for row in rows)
+
+
+def test_expired_lease_is_redelivered_once(sender):
+    queue = make_queue()
+    campaign = make_campaign(queue, sender, 4)
+    provider = FakeEmailProvider()
+    rows = CommunicationHistory.query.filter_by(campaign_id=campaign.id).order_by(CommunicationHistory.id).all()
+    crashed, live = rows[:2], rows[2]
+
+    # Процесс упал после ответа провайдера, но до записи результата
+    for row in crashed:
+        provider.send(OutgoingEmail(row.id, row.recipient_email, 'Hello', '<p>Hello</p>', 'info@example.org',
+                                    idempotency_key=idempotency_key(campaign.id, row.id)))
+        row.status = STATUS_SENDING
+        row.claimed_at = datetime.utcnow() - timedelta(minutes=10)
+    # Получатель, которого сейчас отправляет другой процесс (lease не истек)
+    live.status = STATUS_SENDING
+    live.claimed_at = datetime.utcnow()
+    db.session.commit()
+    live_id = live.id
+
+    stats = queue.run_campaign(campaign.id, provider=provider)
+
+    assert stats.sent == 3
+    assert len(provider.sent) == 3  # idempotency key отбросил повтор упавших писем
+    assert db.session.get(CommunicationHistory, live_id).status == STATUS_SENDING
+    assert stats.status == 'sending'  # Кампанию завершит процесс, владеющий lease
+
+    db.session.get(CommunicationHistory, live_id).claimed_at = datetime.utcnow() - timedelta(minutes=10)
+    db.session.commit()
+    assert queue.run_campaign(campaign.id, provider=provider).status == 'completed'
+    assert STATUS_QUEUED not in statuses(campaign.id)
+    assert len(provider.sent) == 4
+
+
+def test_provider_must_implement_send():
+    class BatchOnlyProvider(EmailProvider):
+        def send_batch(self, emails):
+            return [SendResult(True) for _ in emails]
+
+    with pytest.raises(TypeError):
+        BatchOnlyProvider()
@@ -0,0 +1,82 @@
+"""IRT cache: snapshot hits skip the database, SQLite hits do not write"""
+
+import pytest
+from sqlalchemy import event
+
+from extensions import db
+from models import Question
+from utils.cache_manager import CacheBackend, CacheLevel, IRTCacheManager, SQLiteCacheBackend
+
+
+def _statements(backend):
+    statements = []
+    backend._connect().set_trace_callback(statements.append)
+    return statements
+
+
+def test_question_snapshot_hit_does_not_query_database(app_ctx, tmp_path):
+    question = Question(text='Q', options=['a', 'b'], correct_answer_index=0, correct_answer_text='a',
+                        explanation='-', category='test', domain='PERIO', difficulty_level=1)
+    db.session.add(question)
+    db.session.commit()
+    backend = SQLiteCacheBackend(str(tmp_path / 'cache.sqlite3'))
+    manager = IRTCacheManager(CacheLevel.BASIC, backend=backend)
+
+    assert manager.get_question_snapshot(question.id)['id'] == question.id
+    queries = []
+    listener = lambda *args: queries.append(args[2])
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        assert manager.get_question_snapshot(question.id)['text'] == 'Q'
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+    assert queries == []
+
+    stats = backend.get_namespace_stats()['questions']
+    assert (stats['sets'], stats['misses'], stats['hits']) == (1, 1, 1)
+
+
+def test_get_question_returns_session_object_without_backend(app_ctx, tmp_path):
+    question = Question(text='Q', options=['a', 'b'], correct_answer_index=0, correct_answer_text='a',
+                        explanation='-', category='test', domain='PERIO', difficulty_level=1)
+    db.session.add(question)
+    db.session.commit()
+    backend = SQLiteCacheBackend(str(tmp_path / 'cache.sqlite3'))
+    manager = IRTCacheManager(CacheLevel.BASIC, backend=backend)
+
+    assert manager.get_question(question.id) is question
+    assert backend.get_namespace_stats() == {}
+
+
+def test_sqlite_hits_batch_access_time_updates(tmp_path):
+    backend = SQLiteCacheBackend(str(tmp_path / 'cache.sqlite3'), access_flush_seconds=3600)
+    backend.set('general', 'key', {'value': 1})
+    statements = _statements(backend)
+
+    for _ in range(50):
+        assert backend.get('general', 'key') == {'value': 1}
+    assert not [sql for sql in statements if sql.startswith('UPDATE')]
+
+    assert backend.flush_access_times() == 1
+    assert len([sql for sql in statements if sql.startswith('UPDATE')]) == 1
+
+
+def test_eviction_uses_pending_access_times(tmp_path):
+    backend = SQLiteCacheBackend(str(tmp_path / 'cache.sqlite3'), max_entries_per_namespace=2,
+                                 access_flush_seconds=3600)
+    backend.set('general', 'old', 1)
+    backend.set('general', 'new', 2)
+    backend.get('general', 'old')  # последний доступ - только в памяти
+    backend.set('general', 'third', 3)
+
+    assert backend.get('general', 'old') == 1
+    assert backend.get('general', 'new') is None
+
+
+def test_cache_backend_requires_storage_methods():
+    class Incomplete(CacheBackend):
+        def get(self, namespace, key):
+            return None
+
+    with pytest.raises(TypeError):
+        Incomplete()
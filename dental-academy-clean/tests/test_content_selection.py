@@ -0,0 +1,105 @@
+"""Set-based content selection for daily plans: ranking and a constant query count"""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from extensions import db
+from models import (
+    BIGDomain, ContentDomainMapping, DiagnosticSession, IRTParameters, Lesson, Question, SpacedRepetitionItem,
+    User, UserProgress
+)
+from utils.content_selection import ContentDifficultyIndex, ContentSelector
+from utils.plan_instrumentation import instrument_plan_build
+
+
+def add_question(domain, difficulty):
+    question = Question(text=f'Question b={difficulty}', options=['a', 'b', 'c'], correct_answer_index=0,
+                        correct_answer_text='a', explanation='-', category='general', domain=domain.code,
+                        difficulty_level=2, big_domain_id=domain.id)
+    db.session.add(question)
+    db.session.flush()
+    if difficulty is not None:
+        db.session.add(IRTParameters(question_id=question.id, difficulty=difficulty, discrimination=1.0,
+                                     guessing=0.2))
+    return question.id
+
+
+def add_lesson(domain, title, difficulty, *relevance):
+    lesson = Lesson(title=title, difficulty=difficulty)
+    db.session.add(lesson)
+    db.session.flush()
+    for score in relevance:
+        db.session.add(ContentDomainMapping(lesson_id=lesson.id, domain_id=domain.id, relevance_score=score))
+    return lesson.id
+
+
+@pytest.fixture
+def content(app_ctx):
+    user = User(email='learner@example.org')
+    domains = [BIGDomain(name='Therapie', code='THER', weight_percentage=10.0),
+               BIGDomain(name='Parodontologie', code='PARO', weight_percentage=10.0)]
+    db.session.add_all([user, *domains])
+    db.session.flush()
+    ther, paro = domains
+    ids = {
+        'q_far': add_question(ther, -2.5),
+        'q_close': add_question(ther, 0.5),
+        'q_reviewed': add_question(ther, 0.4),
+        'q_mid': add_question(ther, 1.2),
+        'q_paro': add_question(paro, 0.0),
+        'l_done': add_lesson(ther, 'Done', 0.5, 0.9),
+        'l_relevant': add_lesson(ther, 'Relevant', 1.0, 0.8),
+        'l_close': add_lesson(ther, 'Close', 0.5, 0.6),
+        'l_far': add_lesson(ther, 'Far', 0.0, 0.6),
+        # Две привязки к домену - учитывается максимальная релевантность
+        'l_mapped_twice': add_lesson(ther, 'Mapped twice', 0.0, 0.1, 0.7),
+        'l_paro': add_lesson(paro, 'Paro', 0.5, 0.5),
+    }
+    db.session.add(UserProgress(user_id=user.id, lesson_id=ids['l_done'], completed=True))
+    db.session.add(SpacedRepetitionItem(user_id=user.id, question_id=ids['q_reviewed'],
+                                        next_review=datetime.now(timezone.utc) + timedelta(days=2),
+                                        last_review=datetime.now(timezone.utc) - timedelta(days=1)))
+    db.session.add(DiagnosticSession(user_id=user.id, session_type='diagnostic', status='completed',
+                                     current_ability=0.4, completed_at=datetime.now(timezone.utc)))
+    db.session.commit()
+    return user, ids
+
+
+def test_theory_skips_completed_lessons_and_ranks_by_relevance(content):
+    user, ids = content
+    selector = ContentSelector(user.id, ContentDifficultyIndex())
+
+    lessons = selector.select_theory('THER', 'medium', time_minutes=60)
+
+    assert [lesson['id'] for lesson in lessons] == [
+        ids['l_relevant'], ids['l_mapped_twice'], ids['l_close'], ids['l_far']
+    ]
+    assert selector.select_theory('UNKNOWN', 'medium', 60) == []
+
+
+def test_practice_prefers_items_near_ability_without_recent_reviews(content):
+    user, ids = content
+    selector = ContentSelector(user.id, ContentDifficultyIndex())
+
+    items = selector.select_practice('THER', 'medium', time_minutes=6)
+    assert [item['id'] for item in items] == [ids['q_close']]  # q_reviewed ближе, но повторялся вчера
+
+    hard = selector.select_practice('THER', 'hard', time_minutes=6)
+    assert [item['id'] for item in hard] == [ids['q_close'], ids['q_mid']]
+    assert hard[0]['irt_difficulty'] == 0.5 and hard[0]['difficulty'] == 65
+
+
+def test_query_count_does_not_grow_with_domains(content):
+    user, _ = content
+
+    def build(domains):
+        selector = ContentSelector(user.id, ContentDifficultyIndex())
+        with instrument_plan_build(user.id, 'test') as stats:
+            for domain in domains:
+                selector.select_theory(domain, 'medium', 30)
+                selector.select_practice(domain, 'medium', 9)
+        return stats.query_count
+
+    # Индекс (3 запроса) и контекст пользователя (3 запроса)
+    assert build(['THER']) == build(['THER', 'PARO']) == 6
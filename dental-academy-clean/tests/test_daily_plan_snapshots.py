@@ -0,0 +1,107 @@
+"""Daily plan snapshots: nightly precompute and invalidation on study session changes"""
+
+from datetime import date
+
+import pytest
+
+import utils.daily_learning_algorithm as daily_learning_algorithm
+from extensions import db
+from models import DailyPlanSnapshot, PersonalLearningPlan, StudySession, User
+from utils.daily_learning_algorithm import DailyLearningAlgorithm
+from utils.daily_plan_snapshots import (
+    ALL_SECTIONS, SECTION_SESSIONS, daily_plan_snapshots, get_daily_plan
+)
+
+
+class FakeIntegration:
+    def generate_adaptive_daily_plan(self, user_id, target_minutes):
+        return {
+            'success': True,
+            'target_minutes': target_minutes,
+            'estimated_time': {'new_content': 15},
+            'review_items': [],
+            'new_content': [{'id': 1, 'title': 'Lesson 1', 'type': 'lesson'}]
+        }
+
+
+@pytest.fixture
+def active_plan(app_ctx, monkeypatch):
+    monkeypatch.setattr(daily_learning_algorithm, 'get_irt_spaced_integration', FakeIntegration)
+    monkeypatch.setattr(DailyLearningAlgorithm, '_validate_learning_plan', lambda self, plan: {'valid': True})
+    user = User(email='learner@example.org')
+    db.session.add(user)
+    db.session.flush()
+    plan = PersonalLearningPlan(user_id=user.id, status='active')
+    db.session.add(plan)
+    db.session.commit()
+    return plan
+
+
+def test_precompute_does_not_create_study_sessions(active_plan):
+    totals = daily_plan_snapshots.precompute_all(processes=1)
+
+    assert totals['materialized'] == 1
+    assert DailyPlanSnapshot.query.filter_by(user_id=active_plan.user_id, plan_date=date.today()).count() == 1
+    assert StudySession.query.count() == 0
+    assert DailyPlanSnapshot.query.one().stale_sections == SECTION_SESSIONS
+
+
+def test_first_read_of_precomputed_plan_creates_study_sessions(active_plan):
+    daily_plan_snapshots.precompute_all(processes=1)
+
+    plan = get_daily_plan(active_plan.user_id)
+
+    sessions = StudySession.query.filter_by(learning_plan_id=active_plan.id, status='planned').all()
+    assert [session.session_type for session in sessions] == ['practice']
+    assert plan['study_session_ids'] == [sessions[0].id]
+    assert DailyPlanSnapshot.query.one().stale_sections is None
+
+    # Повторное чтение берет план из снимка и не дублирует сессии
+    get_daily_plan(active_plan.user_id)
+    assert StudySession.query.count() == 1
+
+
+def test_request_path_still_plans_sessions(active_plan):
+    plan = daily_plan_snapshots.materialize(active_plan.user_id)
+
+    assert plan['success']
+    assert StudySession.query.filter_by(learning_plan_id=active_plan.id, status='planned').count() == 1
+
+
+def test_starting_a_session_marks_snapshot_stale(active_plan):
+    daily_plan_snapshots.precompute_all(processes=1)
+    session = StudySession(learning_plan_id=active_plan.id, session_type='practice', status='planned')
+    db.session.add(session)
+    db.session.commit()
+
+    session.start_session()
+
+    snapshot = DailyPlanSnapshot.query.filter_by(user_id=active_plan.user_id).one()
+    assert snapshot.stale_sections == ALL_SECTIONS
+
+
+def test_completing_a_session_marks_completed_content_stale(active_plan):
+    daily_plan_snapshots.materialize(active_plan.user_id)
+    session = StudySession.query.filter_by(learning_plan_id=active_plan.id, status='planned').one()
+
+    # Как в /api/session/complete: статус меняется напрямую, без complete_session()
+    session.status = 'completed'
+    db.session.commit()
+
+    snapshot = DailyPlanSnapshot.query.filter_by(user_id=active_plan.user_id).one()
+    assert snapshot.stale_sections == 'insights,new_content,review'
+    assert StudySession.query.filter_by(status='planned').count() == 0
+
+    plan = get_daily_plan(active_plan.user_id)
+    assert plan['success']
+    assert DailyPlanSnapshot.query.one().stale_sections is None
+
+
+def test_unrelated_session_changes_keep_snapshot(active_plan):
+    daily_plan_snapshots.materialize(active_plan.user_id)
+    session = StudySession.query.filter_by(learning_plan_id=active_plan.id).one()
+
+    session.questions_answered = 3
+    db.session.commit()
+
+    assert DailyPlanSnapshot.query.one().stale_sections is None
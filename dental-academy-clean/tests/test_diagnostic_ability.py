@@ -0,0 +1,117 @@
+"""Incremental ability updates in DiagnosticSession.record_response"""
+
+import json
+
+import pytest
+from sqlalchemy import event
+
+from extensions import db
+from models import DiagnosticResponse, DiagnosticSession, IRTParameters, Question, User
+from utils.irt_engine import (
+    pack_irt_responses, pack_irt_state, safe_ability_estimation, unpack_irt_state, update_irt_state
+)
+
+ITEMS = [(-1.0, 1.2), (-0.5, 0.9), (0.0, 1.5), (0.4, 1.1), (0.8, 1.3), (1.2, 1.0), (-0.2, 0.8)]
+ANSWERS = [True, True, False, True, False, True, False]
+
+
+def response(difficulty, discrimination, is_correct, guessing=0.2):
+    return {'is_correct': is_correct,
+            'irt_params': {'difficulty': difficulty, 'discrimination': discrimination, 'guessing': guessing}}
+
+
+@pytest.fixture
+def session(app_ctx):
+    user = User(email='learner@example.org')
+    db.session.add(user)
+    db.session.flush()
+    question_ids = []
+    for index, (difficulty, discrimination) in enumerate(ITEMS):
+        question = Question(text=f'Q{index}', options=['a', 'b'], correct_answer_index=0, correct_answer_text='a',
+                            explanation='-', category='anatomy', domain='ANAT', difficulty_level=1)
+        db.session.add(question)
+        db.session.flush()
+        db.session.add(IRTParameters(question_id=question.id, difficulty=difficulty, discrimination=discrimination,
+                                     guessing=0.2))
+        question_ids.append(question.id)
+    diagnostic = DiagnosticSession(user_id=user.id, session_type='diagnostic', status='active')
+    db.session.add(diagnostic)
+    db.session.commit()
+    return diagnostic, question_ids
+
+
+def test_state_round_trip_and_invalid_items():
+    responses = [response(-1.0, 1.2, True), response(0.5, 0.9, False)]
+    state = pack_irt_state(*pack_irt_responses(responses))
+
+    columns = [column.tolist() for column in unpack_irt_state(state)]
+    assert columns == [[1.2, 0.9], [-1.0, 0.5], [0.2, 0.2], [1.0, 0.0]]
+    assert [column.size for column in unpack_irt_state(None)] == [0, 0, 0, 0]
+
+    # Невалидные параметры не добавляются в состояние
+    assert update_irt_state(state, {'difficulty': 0.0, 'discrimination': 9.0, 'guessing': 0.2}, True, 0.3)[0] == state
+    assert update_irt_state(None, None, True, 0.3) == (b'', 0.3, 1.0, False)
+
+
+def test_each_answer_matches_full_estimation(session):
+    diagnostic, question_ids = session
+    answered = []
+
+    for question_id, (difficulty, discrimination), is_correct in zip(question_ids, ITEMS, ANSWERS):
+        previous = diagnostic.current_ability
+        stored = diagnostic.record_response(question_id, 0 if is_correct else 1)
+        answered.append(response(difficulty, discrimination, is_correct))
+
+        ability, se, _ = safe_ability_estimation(answered, initial_ability=previous)
+        assert (diagnostic.current_ability, diagnostic.ability_se) == pytest.approx((ability, se), abs=1e-9)
+        assert (stored.ability_before, stored.ability_after, stored.se_after) == (previous, ability, se)
+
+    assert diagnostic.irt_state_responses == len(ITEMS)
+    assert unpack_irt_state(diagnostic.irt_state)[3].tolist() == [float(answer) for answer in ANSWERS]
+    # Тёплый старт сходится к той же оценке, что и расчет с нуля
+    assert diagnostic.current_ability == pytest.approx(safe_ability_estimation(answered)[0], abs=1e-3)
+    assert [entry['question_id'] for entry in diagnostic.get_ability_history()] == question_ids
+
+
+def test_later_answers_do_not_reload_earlier_responses(session):
+    diagnostic, question_ids = session
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    diagnostic.record_response(question_ids[0], 0)
+    event.listen(db.engine, 'before_cursor_execute', count)
+    try:
+        counts = []
+        for question_id in question_ids[1:]:
+            statements.clear()
+            diagnostic.record_response(question_id, 1)
+            counts.append(len(statements))
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count)
+
+    assert len(set(counts)) == 1
+    assert not any('FROM diagnostic_response' in statement for statement in statements)
+
+
+def test_responses_written_elsewhere_rebuild_the_state(session):
+    diagnostic, question_ids = session
+    # Ответы записаны в обход record_response: состояния нет
+    for question_id, is_correct in zip(question_ids[:3], ANSWERS[:3]):
+        db.session.add(DiagnosticResponse(session_id=diagnostic.id, question_id=question_id,
+                                          selected_answer='a' if is_correct else 'b', is_correct=is_correct))
+    diagnostic.questions_answered = 3
+    diagnostic.correct_answers = sum(ANSWERS[:3])
+    diagnostic.current_ability = 0.5
+    diagnostic.ability_history = json.dumps([{'ability': 0.5, 'se': 0.9, 'question_id': question_ids[2]}])
+    db.session.commit()
+
+    diagnostic.record_response(question_ids[3], 0)
+
+    answered = [response(*item, answer) for item, answer in zip(ITEMS[:4], ANSWERS[:4])]
+    assert diagnostic.irt_state_responses == 4 and unpack_irt_state(diagnostic.irt_state)[0].size == 4
+    assert diagnostic.current_ability == pytest.approx(safe_ability_estimation(answered, 0.5)[0], abs=1e-9)
+    # Старый JSON массив переводится в построчный формат при добавлении
+    assert not diagnostic.ability_history.startswith('[')
+    assert [entry['question_id'] for entry in diagnostic.get_ability_history()] == question_ids[2:4]
@@ -0,0 +1,82 @@
+"""Compiled bulk email templates: parity with the generators and per-recipient greetings"""
+
+import base64
+
+import pytest
+
+from extensions import db
+from models import User
+from routes.communication_routes import generate_email_template, generate_learning_map_welcome_email
+from utils.bulk_email_queue import BulkEmailQueue, FakeEmailProvider, Recipient
+import utils.email_templates as email_templates
+from utils.email_templates import AttachmentCache, CompiledEmailTemplate, EmailTemplateCompiler, compile_email_template
+
+UNIVERSAL = dict(main_title='Title', main_subtitle='Subtitle', intro_text='Intro', value_prop_title='Why',
+                 value_prop_items=['One', 'Two'], cta_text='Start', cta_url='https://example.org/start',
+                 motivation_title='Go', motivation_text='Now')
+
+
+@pytest.mark.parametrize('template_type, generator, context', [
+    ('learning_map_welcome', generate_learning_map_welcome_email, {'cta_url': 'https://example.org', 'has_gif': True}),
+    ('universal', generate_email_template, UNIVERSAL),
+])
+def test_compiled_template_matches_generator(template_type, generator, context):
+    template = compile_email_template(template_type, greeting_name='there', **context)
+
+    assert template.render({'greeting_name': 'Anna'}) == generator(greeting_name='Anna', **context)
+    assert template.render({}) == generator(greeting_name='there', **context)
+
+
+def test_slot_values_are_escaped_and_static_html_is_unchanged():
+    template = compile_email_template('learning_map_welcome', greeting_name='there')
+    html = template.render({'greeting_name': '<script>'})
+    assert '&lt;script&gt;' in html and '<script>' not in html
+
+    static = CompiledEmailTemplate('<p>Old campaign</p>')
+    assert static.is_static and static.render({'greeting_name': 'Anna'}) == '<p>Old campaign</p>'
+
+
+def test_generator_runs_once_per_campaign_parameters(monkeypatch):
+    calls = []
+
+    def generator(greeting_name, title):
+        calls.append(title)
+        return f'<h1>{title}</h1><p>Hi {greeting_name}</p>'
+
+    monkeypatch.setitem(email_templates._generators, 'test_counted', generator)
+    compiler = EmailTemplateCompiler(max_templates=2)
+    first = compiler.compile('test_counted', greeting_name='there', title='A')
+
+    assert compiler.compile('test_counted', greeting_name='there', title='A') is first
+    compiler.compile('test_counted', greeting_name='there', title='B')
+    assert calls == ['A', 'B'] and (compiler.hits, compiler.misses) == (1, 2)
+    assert first.render({'greeting_name': 'Anna'}) == '<h1>A</h1><p>Hi Anna</p>'
+
+
+def test_attachment_is_encoded_once_by_content():
+    cache = AttachmentCache(max_bytes=64)
+    content = b'GIF89a' * 4
+    encoded = cache.encode(content)
+
+    assert base64.b64decode(encoded) == content
+    assert cache.encode(bytes(content)) is encoded
+    cache.encode(b'x' * 60)  # вытесняет первое вложение по размеру
+    assert cache.encode(content) is not encoded
+
+
+def test_queue_fills_greeting_for_each_recipient(app_ctx):
+    sender = User(email='admin@example.org', username='admin', role='admin')
+    db.session.add(sender)
+    db.session.commit()
+    template = compile_email_template('learning_map_welcome', greeting_name='there')
+    queue = BulkEmailQueue(workers=1, rate=1000, batch_size=10, max_attempts=1, lease_seconds=60, enabled=False)
+    campaign = queue.create_campaign('Hello', template.skeleton, [
+        Recipient('anna@example.org', name='Anna de Vries'), Recipient('noname@example.org')
+    ], sender)
+    provider = FakeEmailProvider()
+
+    queue.run_campaign(campaign.id, provider=provider)
+
+    html = {email.to_email: email.html for email in provider.sent}
+    assert html['anna@example.org'] == generate_learning_map_welcome_email(greeting_name='Anna')
+    assert html['noname@example.org'] == generate_learning_map_welcome_email(greeting_name='there')
@@ -0,0 +1,108 @@
+"""English reading lessons: parsed once, reloaded on change, compiled to JSON"""
+
+import json
+import os
+
+import pytest
+
+from utils.english_lessons import LESSON_FORMAT_VERSION, LessonStore, convert_lesson_to_passage_format, validate_lesson
+
+LESSON_JS = """// Reading lesson
+export const lesson{num:03d} = {{
+  "id": "lesson_{num:03d}",
+  "title": "{title}",
+  "text": `Plaque forms on teeth.
+
+Brushing removes it.`,
+  "questions": [
+    {{
+      "question": "What removes plaque?",
+      "options": [
+        {{"id": "a", "text": "Brushing", "correct": true, "explanation": "Paragraph two"}},
+        {{"id": "b", "text": "Sugar", "correct": false}}
+      ]
+    }}
+  ]
+}};
+"""
+
+
+def write_lesson(directory, num, title='Plaque', body=None):
+    path = os.path.join(directory, f'lesson_{num:03d}.js')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(body if body is not None else LESSON_JS.format(num=num, title=title))
+    return path
+
+
+def bump_mtime(path):
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+@pytest.fixture
+def store(tmp_path):
+    lessons_dir = tmp_path / 'lessons'
+    lessons_dir.mkdir()
+    write_lesson(str(lessons_dir), 1)
+    write_lesson(str(lessons_dir), 2, title='Gingivitis')
+    (lessons_dir / 'index.js').write_text('export default [];')
+    return LessonStore(str(lessons_dir), str(tmp_path / 'compiled'))
+
+
+def test_lesson_is_parsed_once_until_the_file_changes(store):
+    lesson = store.get(1)
+
+    assert lesson['title'] == 'Plaque' and store.get(1) is lesson
+    assert store.lesson_numbers() == [1, 2] and store.get(3) is None
+    assert store.parses == 1
+
+    path = write_lesson(store.lessons_dir, 1, title='Plaque control')
+    bump_mtime(path)
+    assert store.get(1)['title'] == 'Plaque control' and store.parses == 2
+
+
+def test_passage_is_converted_once_per_lesson(store):
+    passage, questions = store.passage(1, passage_id=10)
+
+    assert (passage, questions) == convert_lesson_to_passage_format(store.get(1), 10)
+    assert questions[0]['correct_answer'] == 'a' and questions[0]['explanation'] == 'Paragraph two'
+    assert store.passage(1, passage_id=10)[1] is questions
+    assert store.passage(3, passage_id=10) == (None, [])
+
+
+def test_compiled_lessons_are_loaded_without_parsing(store):
+    write_lesson(store.lessons_dir, 3, body='export const lesson003 = {"id": "lesson_003", "questions": []};')
+
+    report = store.compile_all()
+
+    assert report == {1: [], 2: [], 3: ['missing title', 'missing text', 'no questions']}
+    assert not os.path.exists(store.compiled_path(3))
+    with open(store.compiled_path(1), encoding='utf-8') as f:
+        assert json.load(f)['format'] == LESSON_FORMAT_VERSION
+
+    fresh = LessonStore(store.lessons_dir, store.compiled_dir)
+    assert fresh.warm() == 3
+    assert (fresh.compiled_loads, fresh.parses) == (2, 1)
+    assert [summary['title'] for summary in fresh.summaries()] == ['Plaque', 'Gingivitis', 'Lesson 3']
+
+    # Исходник новее скомпилированного файла - урок разбирается заново
+    bump_mtime(store.source_path(2))
+    newer = LessonStore(store.lessons_dir, store.compiled_dir)
+    assert newer.get(2)['title'] == 'Gingivitis' and (newer.compiled_loads, newer.parses) == (0, 1)
+
+
+def test_validate_lesson_reports_broken_questions():
+    lesson = {'id': 'lesson_009', 'title': 'T', 'text': 'x', 'questions': [
+        {'question': 'Q', 'options': [{'id': 'a', 'text': 'A', 'correct': True},
+                                      {'id': 'a', 'text': 'B', 'correct': True}]},
+        {'options': [{'id': 'a', 'text': 'A'}]},
+    ]}
+
+    assert validate_lesson(lesson) == [
+        'question 1: option ids are missing or duplicated',
+        'question 1: 2 correct options (expected 1)',
+        'question 2: missing text',
+        'question 2: fewer than 2 options',
+        'question 2: 0 correct options (expected 1)',
+    ]
+    assert validate_lesson(None) == ['lesson is not an object']
@@ -0,0 +1,73 @@
+"""Flashcard progress: set-based session builder and the due-count badge"""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import event
+
+from extensions import db
+from models import MedicalTerm, User, UserTermProgress
+from utils.flashcard_helpers import get_due_count, get_progress_snapshot, get_session_terms
+
+
+@pytest.fixture
+def learner(app_ctx):
+    user = User(email='learner@example.org', profession='huisarts')
+    db.session.add(user)
+    db.session.flush()
+    terms = [MedicalTerm(term_nl=f'term {index}', definition_nl='-', term_en=f'term {index}',
+                         category='anatomy' if index < 6 else 'pharmacology') for index in range(8)]
+    db.session.add_all(terms)
+    db.session.flush()
+    now = datetime.now(timezone.utc)
+    # term 0-2 просрочены, 3-4 в будущем, 5-7 не изучались
+    for index, term in enumerate(terms[:5]):
+        offset = -timedelta(days=1) if index < 3 else timedelta(days=3)
+        db.session.add(UserTermProgress(user_id=user.id, term_id=term.id, next_review=now + offset,
+                                        mastery_level=index))
+    db.session.commit()
+    return user
+
+
+class QueryLog:
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, conn, cursor, statement, *args):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        event.listen(db.engine, 'before_cursor_execute', self)
+        return self.statements
+
+    def __exit__(self, *exc):
+        event.remove(db.engine, 'before_cursor_execute', self)
+
+
+def test_due_count_badge_runs_a_single_count(app, learner):
+    with app.test_request_context('/flashcards/api/due-count'):
+        with QueryLog() as statements:
+            assert get_due_count(learner) == 3
+    progress_queries = [sql for sql in statements if 'user_term_progress' in sql]
+    assert len(progress_queries) == 1
+    assert progress_queries[0].lstrip().upper().startswith('SELECT COUNT')
+
+
+def test_due_count_reuses_a_loaded_snapshot(app, learner):
+    with app.test_request_context('/flashcards/'):
+        get_progress_snapshot(learner)
+        with QueryLog() as statements:
+            assert get_due_count(learner) == 3
+    assert not [sql for sql in statements if 'user_term_progress' in sql]
+
+
+def test_session_terms_mix_new_and_due_before_studied(app, learner):
+    with app.test_request_context('/flashcards/'):
+        terms = get_session_terms(learner, 'anatomy', count=5)
+
+    names = [term.term_nl for term in terms]
+    # Новый термин и все просроченные, остаток добирается из изученных
+    assert names[0] == 'term 5'
+    assert set(names[1:4]) == {'term 0', 'term 1', 'term 2'}
+    assert names[4] in {'term 3', 'term 4'}
+    assert all(term.category == 'anatomy' for term in terms)
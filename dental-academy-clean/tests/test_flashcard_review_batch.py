@@ -0,0 +1,78 @@
+"""Batched flashcard reviews: a retried or duplicated batch is applied once"""
+
+import pytest
+
+import utils.flashcard_review_batch as flashcard_review_batch
+from extensions import db
+from models import DailyFlashcardProgress, FlashcardReviewBatch, MedicalTerm, User, UserTermProgress
+from utils.flashcard_review_batch import apply_review_batch
+
+
+@pytest.fixture
+def learner(app_ctx):
+    user = User(email='learner@example.org', username='learner', xp=0, level=1)
+    db.session.add(user)
+    db.session.add_all([MedicalTerm(term_nl=f'term {index}', definition_nl='-', term_en=f'term {index}',
+                                    category='anatomy') for index in range(2)])
+    db.session.commit()
+    return user
+
+
+def reviews():
+    term_ids = [term.id for term in MedicalTerm.query.order_by(MedicalTerm.id)]
+    return [
+        {'term_id': term_ids[0], 'quality': 4, 'time_spent': 6, 'reviewed_at': '2026-10-18T09:00:00Z'},
+        {'term_id': term_ids[1], 'quality': 3, 'time_spent': 9, 'reviewed_at': '2026-10-18T09:00:30Z'},
+    ]
+
+
+def progress_state(user_id):
+    db.session.expire_all()
+    return sorted(
+        (row.term_id, row.times_reviewed, row.repetitions, row.ease_factor, row.interval, row.next_review)
+        for row in UserTermProgress.query.filter_by(user_id=user_id)
+    )
+
+
+def test_retried_batch_is_not_applied_twice(client, learner):
+    with client.session_transaction() as s:
+        s['_user_id'] = str(learner.id)
+        s['_fresh'] = True
+    payload = {'batch_id': 'session-1', 'reviews': reviews()}
+
+    first = client.post('/flashcards/api/review-batch', json=payload).get_json()
+    state = progress_state(learner.id)
+    xp = db.session.get(User, learner.id).xp
+
+    retry = client.post('/flashcards/api/review-batch', json=payload).get_json()
+
+    assert (first['applied'], first['duplicate']) == (2, False)
+    assert retry['duplicate'] is True
+    assert retry['results'] == first['results']
+    assert progress_state(learner.id) == state
+    assert all(row[1] == 1 for row in state)
+    assert db.session.get(User, learner.id).xp == xp == first['xp_earned']
+    assert DailyFlashcardProgress.query.filter_by(user_id=learner.id).one().session_count == 1
+    assert FlashcardReviewBatch.query.count() == 1
+
+
+def test_concurrent_duplicate_batch_rolls_back(learner, monkeypatch):
+    first = apply_review_batch(learner, 'session-1', reviews())
+    state = progress_state(learner.id)
+
+    # Второй запрос не увидел квитанцию первого: повтор доходит до commit
+    stored_result = flashcard_review_batch._stored_result
+    lookups = []
+
+    def missed_first_lookup(user_id, batch_id):
+        lookups.append(batch_id)
+        return None if len(lookups) == 1 else stored_result(user_id, batch_id)
+
+    monkeypatch.setattr(flashcard_review_batch, '_stored_result', missed_first_lookup)
+    duplicate = apply_review_batch(learner, 'session-1', reviews())
+
+    assert len(lookups) == 2  # uq_flashcard_review_batch -> rollback -> сохраненный результат
+    assert duplicate == dict(first, duplicate=True)
+    assert progress_state(learner.id) == state
+    assert db.session.get(User, learner.id).xp == first['xp_earned']
+    assert DailyFlashcardProgress.query.filter_by(user_id=learner.id).one().session_count == 1
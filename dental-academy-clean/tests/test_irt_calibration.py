@@ -0,0 +1,81 @@
+"""Bulk IRT calibration: parameter recovery and the calibrate_bank upsert"""
+
+import numpy as np
+import pytest
+
+from extensions import db
+from models import BIGDomain, DiagnosticResponse, DiagnosticSession, IRTParameters, Question, User
+from utils.irt_calibration import IRTCalibrationService
+
+
+def simulate(a, b, c, n_persons, seed=3):
+    """Ответы 3PL: каждый респондент отвечает на все вопросы"""
+    rng = np.random.default_rng(seed)
+    theta = rng.normal(0.0, 1.0, n_persons)
+    p = c[None, :] + (1.0 - c[None, :]) / (1.0 + np.exp(-a[None, :] * (theta[:, None] - b[None, :])))
+    correct = (rng.random(p.shape) < p).astype(np.float64)
+    persons, items = np.divmod(np.arange(correct.size), a.size)
+    return items, persons, correct.ravel()
+
+
+def test_marginal_ml_recovers_item_parameters():
+    a = np.array([0.8, 1.0, 1.2, 1.5, 1.8, 1.0, 1.3, 0.9])
+    b = np.array([-1.5, -1.0, -0.5, 0.0, 0.3, 0.8, 1.2, 1.6])
+    c = np.full(a.size, 0.2)
+    items, persons, correct = simulate(a, b, c, n_persons=3000)
+
+    fit = IRTCalibrationService()._fit_marginal_ml(items, persons, correct, c.copy())
+
+    assert fit['converged']
+    assert np.abs(fit['difficulty'] - b).max() < 0.3
+    assert np.abs(fit['discrimination'] - a).max() < 0.45
+    assert np.corrcoef(fit['discrimination'], a)[0, 1] > 0.8
+    assert (fit['sample_size'] == 3000).all()
+    # EAP оценки сжаты к среднему, поэтому infit немного ниже 1
+    assert np.all((fit['infit'] > 0.7) & (fit['infit'] < 1.3))
+
+
+def test_calibrate_bank_upserts_fitted_and_default_parameters(app_ctx):
+    domain = BIGDomain(name='Anatomy', code='ANAT', weight_percentage=10.0)
+    user = User(email='learner@example.org')
+    db.session.add_all([domain, user])
+    db.session.flush()
+    questions = [
+        Question(text=f'Q{index}', options=['a', 'b', 'c', 'd'], correct_answer_index=0, correct_answer_text='a',
+                 explanation='-', category='anatomy', domain='ANAT', difficulty_level=1, big_domain_id=domain.id)
+        for index in range(4)
+    ]
+    db.session.add_all(questions)
+    db.session.flush()
+    # Q0 уже откалиброван (guessing сохраняется), Q3 без ответов
+    db.session.add(IRTParameters(question_id=questions[0].id, difficulty=2.0, discrimination=0.5, guessing=0.1))
+    rng = np.random.default_rng(5)
+    for _ in range(40):
+        session = DiagnosticSession(user_id=user.id, session_type='diagnostic', status='completed')
+        db.session.add(session)
+        db.session.flush()
+        for question, rate in zip(questions[:3], (0.8, 0.5, 0.3)):
+            is_correct = bool(rng.random() < rate)
+            db.session.add(DiagnosticResponse(session_id=session.id, question_id=question.id,
+                                              selected_answer='a' if is_correct else 'b', is_correct=is_correct))
+    db.session.commit()
+    ids = [question.id for question in questions]
+
+    report = IRTCalibrationService().calibrate_bank(domain_code='ANAT')
+
+    assert report['success'] and report['responses'] == 120
+    assert (report['calibrated'], report['defaults']) == (3, 1)
+    db.session.expire_all()
+    params = {row.question_id: row for row in IRTParameters.query.all()}
+    assert params[ids[0]].guessing == pytest.approx(0.1)
+    assert params[ids[0]].difficulty != 2.0 and params[ids[0]].calibration_sample_size == 40
+    assert params[ids[1]].guessing == pytest.approx(0.25)  # 1 / число вариантов
+    assert all(params[question_id].calibration_sample_size == 40 for question_id in ids[:3])
+    assert (params[ids[3]].difficulty, params[ids[3]].calibration_sample_size) == (0.0, 0)
+
+    # only_missing не трогает уже откалиброванные вопросы
+    before = {question_id: row.difficulty for question_id, row in params.items()}
+    report = IRTCalibrationService().calibrate_bank(domain_code='ANAT', only_missing=True)
+    db.session.expire_all()
+    assert (report['calibrated'], report['defaults']) == (0, 0)
+    assert {row.question_id: row.difficulty for row in IRTParameters.query.all()} == before
@@ -0,0 +1,103 @@
+"""Vectorized IRT ability estimation: scalar Newton-Raphson parity, batches and rescoring"""
+
+import math
+
+import pytest
+
+from extensions import db
+from models import DiagnosticResponse, DiagnosticSession, IRTParameters, Question, User
+from utils.irt_engine import (
+    batch_ability_estimation, rescore_diagnostic_sessions, safe_3pl_probability, safe_ability_estimation
+)
+
+
+def response(difficulty, is_correct, discrimination=1.2, guessing=0.2):
+    return {'is_correct': is_correct,
+            'irt_params': {'difficulty': difficulty, 'discrimination': discrimination, 'guessing': guessing}}
+
+
+def scalar_newton(responses, ability=0.0):
+    """Newton-Raphson по одному ответу за раз, как до векторизации"""
+    second = 0.0
+    for _ in range(50):
+        previous = ability
+        first = second = 0.0
+        for item in responses:
+            params = item['irt_params']
+            probability, _ = safe_3pl_probability(ability, params['difficulty'], params['discrimination'],
+                                                  params['guessing'])
+            if 0 < probability < 1:
+                first += params['discrimination'] * (item['is_correct'] - probability)
+                second -= params['discrimination'] ** 2 * probability * (1 - probability)
+        if abs(second) < 1e-10:
+            break
+        ability = max(-4.0, min(4.0, ability - first / second))
+        if abs(ability - previous) < 0.001:
+            break
+    se = 1.0 / math.sqrt(-second) if abs(second) > 1e-10 else 1.0
+    return ability, max(0.1, min(2.0, se))
+
+
+RESPONSE_SETS = [
+    [response(-1.0, True), response(0.0, True), response(1.0, False), response(0.5, False, 2.0, 0.0)],
+    [response(difficulty / 4, index % 3 != 0) for index, difficulty in enumerate(range(-8, 9))],
+    [response(0.0, True), response(1.0, True)],  # все верные - упор в ABILITY_MAX
+    [response(2.5, False, 0.8, 0.25)],
+]
+
+
+@pytest.mark.parametrize('responses', RESPONSE_SETS)
+def test_vectorized_mle_matches_scalar_newton(responses):
+    ability, se, is_valid = safe_ability_estimation(responses, initial_ability=0.3)
+
+    expected_ability, expected_se = scalar_newton(responses, 0.3)
+    assert is_valid
+    assert ability == pytest.approx(expected_ability, abs=1e-9)
+    assert se == pytest.approx(expected_se, abs=1e-9)
+
+
+def test_batch_estimation_matches_single_sessions():
+    # Разная длина, пустая сессия и сессия только с невалидными параметрами
+    response_sets = RESPONSE_SETS + [[], [response(0.0, True, discrimination=9.0)]]
+    initial = [0.0, 0.5, -0.5, 1.0, 0.7, -0.2]
+
+    results = batch_ability_estimation(response_sets, initial)
+
+    for responses, start, (ability, se, is_valid) in zip(RESPONSE_SETS, initial, results):
+        assert is_valid
+        assert (ability, se) == pytest.approx(safe_ability_estimation(responses, start)[:2], abs=1e-9)
+    assert results[4:] == [(0.7, 1.0, False), (-0.2, 1.0, False)]
+
+
+def test_rescore_updates_sessions_from_stored_responses(app_ctx):
+    user = User(email='learner@example.org')
+    db.session.add(user)
+    db.session.flush()
+    questions = []
+    for index, difficulty in enumerate([-1.0, 0.0, 1.0]):
+        question = Question(text=f'Q{index}', options=['a', 'b'], correct_answer_index=0, correct_answer_text='a',
+                            explanation='-', category='anatomy', domain='ANAT', difficulty_level=1)
+        db.session.add(question)
+        db.session.flush()
+        db.session.add(IRTParameters(question_id=question.id, difficulty=difficulty, discrimination=1.2,
+                                     guessing=0.2))
+        questions.append(question)
+    answered = DiagnosticSession(user_id=user.id, session_type='diagnostic', status='completed',
+                                 current_ability=0.0, irt_state=b'stale')
+    empty = DiagnosticSession(user_id=user.id, session_type='diagnostic', status='completed', current_ability=0.4)
+    db.session.add_all([answered, empty])
+    db.session.flush()
+    for question, is_correct in zip(questions, [True, True, False]):
+        db.session.add(DiagnosticResponse(session_id=answered.id, question_id=question.id,
+                                          selected_answer='a' if is_correct else 'b', is_correct=is_correct))
+    db.session.commit()
+
+    stats = rescore_diagnostic_sessions()
+
+    assert stats == {'sessions': 2, 'rescored': 1, 'skipped': 1}
+    db.session.expire_all()
+    expected = safe_ability_estimation([response(-1.0, True), response(0.0, True), response(1.0, False)])
+    answered = db.session.get(DiagnosticSession, answered.id)
+    assert (answered.current_ability, answered.ability_se) == pytest.approx(expected[:2])
+    assert answered.irt_state is None
+    assert db.session.get(DiagnosticSession, empty.id).current_ability == 0.4
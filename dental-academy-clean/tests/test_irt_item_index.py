@@ -0,0 +1,80 @@
+"""Item information index: shared questions without profession and max-information search"""
+
+import numpy as np
+import pytest
+
+from extensions import db
+from models import BIGDomain, IRTParameters, Question
+from utils.irt_item_index import DomainBucket, ItemInformationIndex, item_information
+
+
+def add_question(domain, profession, a, b, c=0.2):
+    question = Question(text='Q', options=['a', 'b'], correct_answer_index=0, correct_answer_text='a',
+                        explanation='-', category='anatomy', domain=domain.code, difficulty_level=1,
+                        big_domain_id=domain.id, profession=profession)
+    db.session.add(question)
+    db.session.flush()
+    db.session.add(IRTParameters(question_id=question.id, discrimination=a, difficulty=b, guessing=c))
+    return question.id
+
+
+@pytest.fixture
+def questions(app_ctx):
+    domain = BIGDomain(name='Anatomy', code='ANAT', weight_percentage=10.0)
+    db.session.add(domain)
+    db.session.flush()
+    ids = {
+        'huisarts': add_question(domain, 'huisarts', 1.0, -1.0),
+        'shared': add_question(domain, None, 1.5, 0.1),
+        'tandarts': add_question(domain, 'tandarts', 2.0, 0.0),
+    }
+    db.session.commit()
+    return ids
+
+
+def test_questions_without_profession_are_shared(questions):
+    index = ItemInformationIndex()
+
+    assert index.available_count('huisarts', 'ANAT') == 2
+    assert index.available_count('tandarts', 'ANAT') == 2
+    assert index.available_count(None, 'ANAT') == 1
+    assert index.select_max_information('huisarts', 'ANAT', 0.0)[0] == questions['shared']
+    assert index.select_max_information('huisarts', 'ANAT', 0.0, {questions['shared']})[0] == questions['huisarts']
+
+
+def test_shared_question_updates_reach_every_profession(questions):
+    index = ItemInformationIndex()
+    index.available_count('huisarts', 'ANAT')
+    index.available_count('tandarts', 'ANAT')
+
+    # После калибровки общий вопрос становится почти неинформативным
+    index.upsert_items([(questions['shared'], 0.3, 3.5, 0.2)])
+    assert index.select_max_information('huisarts', 'ANAT', 0.0)[0] == questions['huisarts']
+    assert index.select_max_information('tandarts', 'ANAT', 0.0)[0] == questions['tandarts']
+
+    index.remove_items([questions['shared']])
+    assert index.available_count('huisarts', 'ANAT') == 1
+    assert index.available_count('tandarts', 'ANAT') == 1
+
+    # Перестроение одной профессии не теряет общий вопрос у другой
+    index.build('tandarts')
+    assert index.available_count('tandarts', 'ANAT') == 2
+    assert index.available_count('huisarts', 'ANAT') == 1
+
+
+def test_max_information_matches_full_scan():
+    rng = np.random.default_rng(7)
+    rows = list(zip(range(1, 401), rng.uniform(0.3, 2.5, 400), rng.normal(0.0, 1.5, 400), rng.uniform(0.0, 0.3, 400)))
+    # Бакет без базы данных: индекс считается загруженным и не перестраивается
+    index = ItemInformationIndex(window=4, refresh_interval_seconds=float('inf'))
+    index._buckets[('huisarts', 'ANAT')] = DomainBucket.from_rows(rows)
+    index._loaded_at['huisarts'] = 0.0
+    ids, a, b, c = (np.array(column) for column in zip(*rows))
+    excluded = set(range(1, 401, 7))
+
+    for theta in (-3.0, -0.4, 0.0, 1.3, 3.5):
+        info = item_information(theta, a, b, c)
+        info[np.isin(ids, list(excluded))] = -1.0
+        question_id, best = index.select_max_information('huisarts', 'ANAT', theta, excluded)
+        assert best == pytest.approx(info.max())
+        assert question_id == ids[int(np.argmax(info))]
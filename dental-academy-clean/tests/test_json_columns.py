@@ -0,0 +1,103 @@
+"""Mutable JSON columns: decoded once per row, stored as TEXT, top-level changes tracked"""
+
+from datetime import date
+from decimal import Decimal
+
+import numpy as np
+import pytest
+from sqlalchemy import text
+
+from extensions import db
+from models import DiagnosticSession, PersonalLearningPlan, User
+from utils.json_columns import dumps_json, loads_json
+
+
+@pytest.fixture
+def plan(app_ctx):
+    user = User(email='learner@example.org')
+    db.session.add(user)
+    db.session.flush()
+    plan = PersonalLearningPlan(user_id=user.id, status='active')
+    plan.set_weak_domains(['THER', 'PARO'])
+    plan.set_study_schedule({'weekly_schedule': {'monday': ['THER']}})
+    db.session.add(plan)
+    db.session.commit()
+    return plan
+
+
+def reload(instance):
+    db.session.expire_all()
+    return db.session.get(type(instance), instance.id)
+
+
+def raw_value(table, column, row_id):
+    return db.session.execute(text(f'SELECT {column} FROM {table} WHERE id = :id'), {'id': row_id}).scalar()
+
+
+def test_values_are_stored_as_json_text(plan):
+    assert loads_json(raw_value('personal_learning_plan', 'weak_domains', plan.id)) == ['THER', 'PARO']
+
+    plan = reload(plan)
+    assert plan.get_weak_domains() == ['THER', 'PARO']
+    assert plan.get_study_schedule() == {'weekly_schedule': {'monday': ['THER']}}
+    assert plan.get_strong_domains() == [] and plan.domain_analysis is None
+
+
+def test_top_level_changes_are_tracked(plan):
+    plan.weak_domains.append('ANAT')
+    plan.study_schedule['hours'] = 6
+    db.session.commit()
+
+    plan = reload(plan)
+    assert plan.get_weak_domains() == ['THER', 'PARO', 'ANAT']
+    assert plan.get_study_schedule()['hours'] == 6
+
+
+def test_nested_changes_need_assign_json(plan):
+    schedule = plan.get_study_schedule()
+    schedule['weekly_schedule']['monday'].append('PARO')
+    db.session.commit()
+    assert reload(plan).get_study_schedule()['weekly_schedule']['monday'] == ['THER']
+
+    plan = reload(plan)
+    schedule = plan.get_study_schedule()
+    schedule['weekly_schedule']['monday'].append('PARO')
+    plan.set_study_schedule(schedule)  # тот же объект, но колонка помечена измененной
+    db.session.commit()
+    assert reload(plan).get_study_schedule()['weekly_schedule']['monday'] == ['THER', 'PARO']
+
+
+def test_invalid_or_unexpected_json_loads_as_null(plan):
+    db.session.execute(text("UPDATE personal_learning_plan SET weak_domains = 'not json', "
+                            "study_schedule = '[1, 2]' WHERE id = :id"), {'id': plan.id})
+    db.session.commit()
+
+    plan = reload(plan)
+    assert plan.weak_domains is None and plan.get_weak_domains() == []
+    assert plan.study_schedule is None and plan.get_study_schedule() == {}
+
+
+def test_session_data_round_trip(app_ctx):
+    user = User(email='learner@example.org')
+    db.session.add(user)
+    db.session.flush()
+    session = DiagnosticSession(user_id=user.id, session_type='diagnostic')
+    session.set_session_data({'domain_scores': {'THER': 0.5}, 'response_history': []})
+    db.session.add(session)
+    db.session.commit()
+
+    session = reload(session)
+    # Вложенное изменение сохраняется вместе с изменением верхнего уровня
+    session.session_data['response_history'].append(1)
+    session.session_data['questions'] = 3
+    db.session.commit()
+
+    assert reload(session).get_session_data()['questions'] == 3
+    assert reload(session).get_session_data()['response_history'] == [1]
+
+
+def test_dumps_handles_dates_decimals_and_numpy():
+    value = {'day': date(2026, 10, 18), 'score': Decimal('1.5'), 'theta': np.float64(0.25), 'n': np.int64(3)}
+
+    assert loads_json(dumps_json(value)) == {'day': '2026-10-18', 'score': 1.5, 'theta': 0.25, 'n': 3}
+    assert loads_json(dumps_json({'big': 2 ** 70})) == {'big': 2 ** 70}
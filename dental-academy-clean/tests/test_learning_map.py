@@ -0,0 +1,77 @@
+"""Learning map page stays within its SQL query budget"""
+
+import pytest
+
+from extensions import db
+from models import (
+    ContentCategory, ContentSubcategory, ContentTopic, LearningPath, Lesson, Module, Subject, User
+)
+from routes.learning_map_routes import LEARNING_MAP_QUERY_BUDGET
+from utils.content_tree import content_tree
+import utils.plan_instrumentation as plan_instrumentation
+from utils.plan_instrumentation import register_plan_hook
+
+
+@pytest.fixture
+def admin(app_ctx):
+    user = User(email='admin@example.org', username='admin', role='admin', profession='tandarts',
+                study_country='NL', university_name='ACTA')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+@pytest.fixture
+def learning_map_builds(monkeypatch):
+    """Query counts of learning map builds; the hook is dropped with the patched list after the test"""
+    monkeypatch.setattr(plan_instrumentation, '_hooks', list(plan_instrumentation._hooks))
+    builds = []
+    register_plan_hook(lambda stats: stats.label == 'learning_map' and builds.append(stats.query_count))
+    return builds
+
+
+def _seed_tree(paths=2, subjects=3, modules=3, lessons=4):
+    for path_index in range(paths):
+        path = LearningPath(name=f'Path {path_index}', exam_component='THEORETICAL',
+                            exam_weight=10 + path_index, exam_type='multiple_choice', is_active=True)
+        db.session.add(path)
+        db.session.flush()
+        for subject_index in range(subjects):
+            subject = Subject(name=f'Subject {path_index}.{subject_index}', learning_path_id=path.id)
+            db.session.add(subject)
+            db.session.flush()
+            for module_index in range(modules):
+                module = Module(title=f'Module {subject_index}.{module_index}', subject_id=subject.id)
+                db.session.add(module)
+                db.session.flush()
+                db.session.add_all([
+                    Lesson(title=f'Lesson {module_index}.{lesson_index}', module_id=module.id)
+                    for lesson_index in range(lessons)
+                ])
+
+    category = ContentCategory(name='Anatomy', slug='anatomy')
+    db.session.add(category)
+    db.session.flush()
+    subcategory = ContentSubcategory(name='Head', slug='head', category_id=category.id)
+    db.session.add(subcategory)
+    db.session.flush()
+    db.session.add(ContentTopic(name='Teeth', slug='teeth', subcategory_id=subcategory.id))
+    db.session.commit()
+
+
+def test_learning_map_query_budget(app_ctx, admin, learning_map_builds):
+    _seed_tree()
+    content_tree.invalidate()
+
+    client = app_ctx.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(admin.id)
+        session['_fresh'] = True
+
+    # Первый запрос строит дерево контента, второй - из кэша процесса
+    for _ in range(2):
+        response = client.get('/en/learning-map/')
+        assert response.status_code == 200
+
+    assert len(learning_map_builds) == 2
+    assert max(learning_map_builds) <= LEARNING_MAP_QUERY_BUDGET, learning_map_builds
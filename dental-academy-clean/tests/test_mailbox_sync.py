@@ -0,0 +1,163 @@
+"""Incremental IMAP and POP3 sync against local in-memory server stubs"""
+
+from email.message import EmailMessage
+
+from extensions import db
+from models import IncomingEmail, MailboxSyncState
+from utils.mailbox_sync import MailboxSyncEngine
+
+
+def _message(number: int) -> bytes:
+    message = EmailMessage()
+    message['Message-ID'] = f'<msg-{number}@example.org>'
+    message['Subject'] = f'Message {number}'
+    message['From'] = 'Sender <sender@example.org>'
+    message['To'] = 'info@example.org'
+    message['Date'] = 'Mon, 06 Jan 2025 10:00:00 +0000'
+    message.set_content(f'Body {number}')
+    return message.as_bytes()
+
+
+class StubImap:
+    """Minimal imaplib.IMAP4 surface used by the sync engine"""
+
+    def __init__(self, uidvalidity: int, messages: dict):
+        self.uidvalidity = uidvalidity
+        self.messages = messages  # uid -> raw message
+        self.body_fetches = []
+
+    def select(self, folder, readonly=False):
+        return 'OK', [str(len(self.messages)).encode()]
+
+    def response(self, code):
+        return code, [str(self.uidvalidity).encode()]
+
+    def uid(self, command, *args):
+        if command == 'SEARCH':
+            low = int(args[1].split()[1].split(':')[0])
+            uids = [uid for uid in sorted(self.messages) if uid >= low] or sorted(self.messages)[-1:]
+            return 'OK', [' '.join(str(uid) for uid in uids).encode()]
+        uid_set, spec = args
+        uids = [int(uid) for uid in uid_set.split(',') if int(uid) in self.messages]
+        data = []
+        for uid in uids:
+            raw = self.messages[uid]
+            if 'HEADER.FIELDS' in spec:
+                literal = raw.split(b'\n\n', 1)[0] + b'\n\n'
+                data.append((f'{uid} (UID {uid} RFC822.SIZE {len(raw)} BODY[HEADER] {{{len(literal)}}}'.encode(), literal))
+            else:
+                self.body_fetches.append(uid)
+                data.append((f'{uid} (UID {uid} BODY[] {{{len(raw)}}}'.encode(), raw))
+            data.append(b')')
+        return 'OK', data
+
+
+class StubPop:
+    """Minimal poplib.POP3 surface used by the sync engine"""
+
+    def __init__(self, messages: dict):
+        self.messages = list(messages.items())  # [(uidl, raw message)], message number = position + 1
+        self.header_fetches = []
+
+    def uidl(self):
+        listing = [f'{number} {uidl}'.encode() for number, (uidl, _) in enumerate(self.messages, 1)]
+        return b'+OK', listing, 0
+
+    def top(self, number, lines):
+        uidl, raw = self.messages[number - 1]
+        self.header_fetches.append(uidl)
+        return b'+OK', raw.split(b'\n\n', 1)[0].split(b'\n'), len(raw)
+
+    def retr(self, number):
+        raw = self.messages[number - 1][1]
+        return b'+OK', raw.split(b'\n'), len(raw)
+
+
+class StubClient:
+    server = None
+    pop_server = None
+
+    def __init__(self, config):
+        self.imap_connection = None
+        self.pop_connection = None
+
+    def connect_imap(self):
+        self.imap_connection = StubClient.server
+        return True
+
+    def connect_pop(self):
+        self.pop_connection = StubClient.pop_server
+        return True
+
+    def disconnect(self):
+        pass
+
+
+CONFIG = {'imap_host': 'imap.example.org'}
+POP_CONFIG = {'pop_host': 'pop.example.org'}
+
+
+def test_headers_then_bodies(app_ctx):
+    StubClient.server = StubImap(1, {uid: _message(uid) for uid in (3, 5, 8)})
+    engine = MailboxSyncEngine(client_factory=StubClient)
+
+    result = engine.sync_account('info', CONFIG)
+
+    assert result.error is None
+    assert (result.new_messages, result.bodies_loaded) == (3, 3)
+    assert MailboxSyncState.query.filter_by(account='info').one().last_uid == 8
+
+    # Nothing new: no headers, no body fetches
+    StubClient.server.body_fetches.clear()
+    result = engine.sync_account('info', CONFIG)
+    assert (result.new_messages, result.bodies_loaded) == (0, 0)
+    assert StubClient.server.body_fetches == []
+
+
+def test_uidvalidity_reset_loads_pending_bodies_by_new_uid(app_ctx):
+    StubClient.server = StubImap(1, {uid: _message(uid) for uid in (3, 5)})
+    engine = MailboxSyncEngine(client_factory=StubClient, bodies_per_run=0)
+    engine.sync_account('info', CONFIG)
+    assert IncomingEmail.query.filter_by(body_loaded=False).count() == 2
+
+    # Server renumbered the folder: same messages under new UIDs
+    StubClient.server = StubImap(2, {10: _message(3), 11: _message(5), 12: _message(7)})
+    engine.bodies_per_run = 100
+    result = engine.sync_account('info', CONFIG)
+
+    assert result.uidvalidity_reset
+    assert result.new_messages == 1
+    assert result.bodies_loaded == 3
+    assert sorted(StubClient.server.body_fetches) == [10, 11, 12]
+    rows = {row.message_id: row for row in IncomingEmail.query.all()}
+    moved = rows['<msg-3@example.org>']
+    assert (moved.remote_uid, moved.uidvalidity, moved.body_loaded) == ('10', 2, True)
+    assert 'Body 3' in moved.text_content
+    assert db.session.query(IncomingEmail).filter(IncomingEmail.uidvalidity != 2).count() == 0
+
+
+def test_pop_duplicates_by_message_id_are_not_fetched_again(app_ctx):
+    # Сообщение 3 уже получено через IMAP другого ящика
+    StubClient.server = StubImap(1, {3: _message(3)})
+    engine = MailboxSyncEngine(client_factory=StubClient)
+    engine.sync_account('info', CONFIG)
+
+    StubClient.pop_server = StubPop({'u3': _message(3), 'u4': _message(4), 'u4-copy': _message(4)})
+    result = engine.sync_account('support', POP_CONFIG)
+
+    assert (result.protocol, result.error, result.new_messages) == ('pop3', None, 1)
+    assert sorted(StubClient.pop_server.header_fetches) == ['u3', 'u4', 'u4-copy']
+    state = MailboxSyncState.query.filter_by(account='support', folder='POP3').one()
+    assert sorted(state.skipped_uids) == ['u3', 'u4-copy']
+
+    # Повторная синхронизация не запрашивает заголовки дубликатов
+    StubClient.pop_server.header_fetches.clear()
+    result = engine.sync_account('support', POP_CONFIG)
+    assert result.new_messages == 0 and StubClient.pop_server.header_fetches == []
+
+    # UIDL, удаленные с сервера, убираются из состояния
+    StubClient.pop_server = StubPop({'u4': _message(4), 'u4-copy': _message(4)})
+    engine.sync_account('support', POP_CONFIG)
+    assert StubClient.pop_server.header_fetches == []
+    db.session.expire_all()
+    assert MailboxSyncState.query.filter_by(account='support', folder='POP3').one().skipped_uids == ['u4-copy']
@@ -0,0 +1,24 @@
+"""Profession map fragments: one per map unless the builder is localized"""
+
+from utils.profession_maps import ProfessionMapRegistry
+
+
+def test_unlocalized_maps_share_one_fragment(app_ctx):
+    registry = ProfessionMapRegistry()
+    calls = []
+    registry.register('tandheelkunde', lambda lang: calls.append(lang) or {'paths': []})
+
+    for lang in ('en', 'nl', 'zz1', 'zz2'):
+        registry.user_data('tandheelkunde', lang, user_id=1)
+
+    assert calls == [None]
+    assert registry.get_stats()['fragments'] == 1
+
+
+def test_localized_maps_are_built_per_language(app_ctx):
+    registry = ProfessionMapRegistry()
+    registry.register('farmacie', lambda lang: {'title': f'map-{lang}'}, localized=True)
+
+    assert registry.user_data('farmacie', 'en', user_id=1) == {'title': 'map-en'}
+    assert registry.user_data('farmacie', 'nl', user_id=1) == {'title': 'map-nl'}
+    assert registry.builds == 2
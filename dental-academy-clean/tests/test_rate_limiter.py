@@ -0,0 +1,81 @@
+"""Rate limiter store selection and behaviour when the shared store fails"""
+
+import logging
+import sqlite3
+
+import pytest
+
+from utils.rate_limiter import RateLimiter, RateLimitStore, configured_worker_count, create_rate_limit_store
+
+
+class FailingStore(RateLimitStore):
+    name = 'sqlite'
+
+    def hit(self, key, bucket, limit, window_size, now):
+        raise sqlite3.OperationalError('database is locked')
+
+    def peek(self, key, window_size, now):
+        raise sqlite3.OperationalError('database is locked')
+
+    def reset(self, key):
+        raise sqlite3.OperationalError('database is locked')
+
+    def get_stats(self):
+        return {}
+
+
+def test_store_interface_is_abstract():
+    class HitOnlyStore(RateLimitStore):
+        def hit(self, key, bucket, limit, window_size, now):
+            return True, 1
+
+    with pytest.raises(TypeError):
+        HitOnlyStore()
+
+
+def test_default_store_is_memory_without_redis(monkeypatch):
+    monkeypatch.delenv('RATE_LIMIT_STORAGE', raising=False)
+    monkeypatch.delenv('REDIS_URL', raising=False)
+    assert create_rate_limit_store().name == 'memory'
+
+
+def test_sqlite_requires_explicit_path(monkeypatch, tmp_path):
+    monkeypatch.setenv('RATE_LIMIT_STORAGE', 'sqlite')
+    monkeypatch.delenv('RATE_LIMIT_PATH', raising=False)
+    assert create_rate_limit_store().name == 'memory'
+
+    monkeypatch.setenv('RATE_LIMIT_PATH', str(tmp_path / 'limits.sqlite3'))
+    assert create_rate_limit_store().name == 'sqlite'
+
+
+def test_store_errors_fall_back_to_process_limits():
+    limiter = RateLimiter(store=FailingStore())
+    results = [limiter.check_rate_limit('10.0.0.1', requests_per_minute=5) for _ in range(8)]
+    assert results.count(True) == 5
+    assert results[-1] is False
+
+
+@pytest.mark.parametrize('argv, environ, expected', [
+    (['pytest'], {}, 1),
+    (['/usr/bin/gunicorn', '--workers', '3', 'app:app'], {'WEB_CONCURRENCY': '2'}, 3),
+    (['gunicorn', '-w4', 'app:app'], {}, 4),
+    (['gunicorn', 'app:app'], {'GUNICORN_CMD_ARGS': '--bind 0.0.0.0:80 --workers=5'}, 5),
+    (['gunicorn', 'app:app'], {'WEB_CONCURRENCY': '2'}, 2),
+])
+def test_configured_worker_count(argv, environ, expected):
+    assert configured_worker_count(argv, environ) == expected
+
+
+def test_memory_store_with_several_workers_logs_a_warning(monkeypatch, caplog):
+    monkeypatch.delenv('RATE_LIMIT_STORAGE', raising=False)
+    monkeypatch.delenv('REDIS_URL', raising=False)
+    monkeypatch.delenv('GUNICORN_CMD_ARGS', raising=False)
+    monkeypatch.setenv('WEB_CONCURRENCY', '1')
+    with caplog.at_level(logging.WARNING, logger='utils.rate_limiter'):
+        create_rate_limit_store()
+    assert not caplog.records
+
+    monkeypatch.setenv('WEB_CONCURRENCY', '2')
+    with caplog.at_level(logging.WARNING, logger='utils.rate_limiter'):
+        assert create_rate_limit_store().name == 'memory'
+    assert 'each worker allows the full limit' in caplog.text
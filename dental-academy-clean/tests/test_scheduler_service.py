@@ -0,0 +1,106 @@
+"""Reassessment scheduler: vectorized factors vs the per-plan rules, reminder claims"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from extensions import db
+from models import PersonalLearningPlan, StudySession, User
+from utils.scheduler_service import reference_interval, reference_plan_factors, scheduler
+
+
+def every(count, step, minutes=30):
+    """`count` сессий с шагом `step` назад от текущего момента"""
+    return [(step * index, minutes) for index in range(1, count + 1)]
+
+
+# (plan fields, sessions as (age, actual_duration))
+EDGE_CASES = {
+    'no_planned_hours': (dict(study_hours_per_week=0.0), every(6, timedelta(days=2))),
+    'no_planned_hours_no_sessions': (dict(study_hours_per_week=0.0), []),
+    'fewer_than_five_sessions': (dict(), every(4, timedelta(days=3))),
+    'no_exam_date': (dict(exam_date=None), every(8, timedelta(days=4), minutes=90)),
+    'zero_target': (dict(target_ability=0.0, current_ability=0.4), every(5, timedelta(days=1))),
+    'negative_target': (dict(target_ability=-0.5, current_ability=-1.0), every(5, timedelta(days=1))),
+    'gaps_under_a_day': (dict(), every(7, timedelta(hours=5))),
+    'mixed_sub_day_gaps': (dict(), every(6, timedelta(hours=30)) + [(timedelta(hours=31), 10), (None, 45)]),
+    'sessions_outside_windows': (dict(), every(6, timedelta(days=20), minutes=600)),
+}
+
+
+def make_plan(user_id, now, fields, sessions):
+    values = dict(user_id=user_id, status='active', current_ability=0.3, target_ability=0.5,
+                  study_hours_per_week=5.0, exam_date=(now + timedelta(days=45)).date(), weak_domains=['a', 'b', 'c'])
+    values.update(fields)
+    plan = PersonalLearningPlan(**values)
+    db.session.add(plan)
+    db.session.flush()
+    for age, duration in sessions:
+        db.session.add(StudySession(learning_plan_id=plan.id, session_type='practice', status='completed',
+                                    completed_at=now - age if age is not None else None,
+                                    actual_duration=duration))
+    return plan
+
+
+def expected_factors(plan, sessions, now):
+    rows = [(now - age, duration) for age, duration in sessions
+            if age is not None and age <= timedelta(days=90)]
+    return reference_plan_factors(plan.current_ability, plan.target_ability, plan.study_hours_per_week,
+                                  len(plan.get_weak_domains()), plan.exam_date, rows, now)
+
+
+@pytest.fixture
+def plans(app_ctx):
+    now = datetime.now()
+    plans = {}
+    for name, (fields, sessions) in EDGE_CASES.items():
+        user = User(email=f'{name}@example.org')
+        db.session.add(user)
+        db.session.flush()
+        plans[name] = make_plan(user.id, now, fields, sessions)
+    db.session.commit()
+    return now, plans
+
+
+@pytest.mark.parametrize('name', sorted(EDGE_CASES))
+def test_single_plan_factors_match_per_plan_rules(plans, name):
+    now, by_name = plans
+    plan = by_name[name]
+
+    columns = scheduler.load_plan_columns(plans=[plan], now=now)
+    factors = scheduler._calculate_factors(columns, now.date().toordinal())
+
+    expected = expected_factors(plan, EDGE_CASES[name][1], now)
+    assert {key: float(value[0]) for key, value in factors.items()} == pytest.approx(expected)
+    assert int(scheduler._intervals(factors)[0]) == reference_interval(expected)
+
+
+def test_batch_factors_match_per_plan_rules(plans):
+    now, by_name = plans
+
+    # Все активные планы тремя запросами, без объектов плана
+    columns = scheduler.load_plan_columns(now=now)
+    scores = scheduler.score_plans(columns, now.date())
+
+    assert len(columns) == len(EDGE_CASES)
+    for index, plan_id in enumerate(columns.plan_id.tolist()):
+        name = next(name for name, plan in by_name.items() if plan.id == plan_id)
+        expected = expected_factors(by_name[name], EDGE_CASES[name][1], now)
+        assert scores.interval[index] == reference_interval(expected), name
+
+
+def test_reminders_are_claimed_once(app_ctx):
+    user = User(email='learner@example.org')
+    db.session.add(user)
+    db.session.flush()
+    plans = [PersonalLearningPlan(user_id=user.id, status='active') for _ in range(3)]
+    plans[2].diagnostic_reminder_sent = True
+    db.session.add_all(plans)
+    db.session.commit()
+    ids = [plan.id for plan in plans]
+
+    assert sorted(scheduler.mark_reminders_sent(ids[:2])) == ids[:2]
+    # Повторный (или параллельный) запуск не получает уже отмеченные планы
+    assert scheduler.mark_reminders_sent(ids) == []
+    assert scheduler.mark_reminders_sent([]) == []
+    assert all(db.session.get(PersonalLearningPlan, plan_id).diagnostic_reminder_sent for plan_id in ids)
@@ -0,0 +1,59 @@
+"""Compiled security matcher: same verdicts as the per-pattern loop"""
+
+import pytest
+
+from utils.security import (
+    _classify_request, _pattern_loop_is_suspicious, benchmark_security_matcher, is_critical_exploit,
+    is_known_scanner, is_legitimate_bot, is_suspicious_request
+)
+
+BROWSER = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 Chrome/120.0 Safari/537.36'
+GOOGLEBOT = 'Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)'
+SCANNER = 'Mozilla/5.0 zgrab/0.x l9scan/2.0'
+
+PATHS = [
+    '/nl/learning-map', '/dashboard', '/static/js/app.js', '/robots.txt', '/sitemap-3.xml',
+    '/wp-login.php', '/index.PHP', '/page.php?id=1', '/.env', '/.git/config', '/API/GraphQL',
+    '/search?q=UNION+SELECT+1', '/comment?text=<Script>alert(1)', '/go?to=javascript:void(0)',
+    '/img?src=x onerror=alert(1)', '/static/../.env', '/backup.zip', '/nl/exec-summary',
+]
+USER_AGENTS = [BROWSER, GOOGLEBOT, SCANNER, 'sqlmap/1.7', 'Go-http-client/1.1', '', '   ', None]
+
+
+@pytest.mark.parametrize('user_agent', USER_AGENTS)
+def test_compiled_matcher_matches_pattern_loop(user_agent):
+    _classify_request.cache_clear()
+
+    mismatches = [path for path in PATHS
+                  if is_suspicious_request(path, user_agent) != _pattern_loop_is_suspicious(path, user_agent)]
+    assert not mismatches
+
+
+def test_bots_scanners_and_critical_exploits():
+    assert is_legitimate_bot(GOOGLEBOT) and not is_legitimate_bot(BROWSER) and not is_legitimate_bot(None)
+    assert is_known_scanner(SCANNER) and is_known_scanner('SQLMAP/1.7')
+    # Легитимный бот не считается сканером, даже если строка содержит имя сканера
+    assert not is_known_scanner('Googlebot nmap-compatible')
+
+    assert is_suspicious_request('/dashboard', SCANNER)
+    assert not is_suspicious_request('/dashboard', GOOGLEBOT)
+    assert is_suspicious_request('/wp-admin/', GOOGLEBOT)
+    assert is_critical_exploit('/.env') and is_critical_exploit('/shell.php')
+    assert not is_critical_exploit('/wp-admin/') and not is_critical_exploit('')
+
+
+def test_verdicts_are_cached_per_path_and_user_agent():
+    _classify_request.cache_clear()
+
+    for _ in range(3):
+        is_suspicious_request('/wp-login.php', SCANNER)
+    is_suspicious_request('/wp-login.php', BROWSER)
+
+    info = _classify_request.cache_info()
+    assert (info.hits, info.misses) == (2, 2)
+
+
+def test_benchmark_reports_no_mismatches():
+    report = benchmark_security_matcher(iterations=400)
+
+    assert report['iterations'] == 400 and report['mismatches'] == 0
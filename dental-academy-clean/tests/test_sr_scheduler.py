@@ -0,0 +1,87 @@
+"""Spaced repetition: shared item loader and stored next-day queues"""
+
+from datetime import datetime, timedelta, timezone
+
+from extensions import db
+from models import User, Question, SpacedRepetitionItem, ReviewQueueSnapshot
+from utils.spaced_repetition_system import SpacedRepetitionSystem
+from utils.sr_scheduler import sr_scheduler
+
+
+def _question(number: int, domain: str = 'PERIO') -> Question:
+    return Question(text=f'Question {number}', options=['a', 'b'], correct_answer_index=0,
+                    correct_answer_text='a', explanation='-', category='test', domain=domain,
+                    difficulty_level=1)
+
+
+def _seed(items: int = 6):
+    user = User(email='learner@example.org')
+    questions = [_question(number) for number in range(items)]
+    db.session.add_all([user, *questions])
+    db.session.flush()
+    due = datetime.now(timezone.utc) - timedelta(days=1)
+    db.session.add_all([
+        SpacedRepetitionItem(user_id=user.id, question_id=question.id, domain=question.domain,
+                             next_review=due - timedelta(days=index))
+        for index, question in enumerate(questions)
+    ])
+    db.session.commit()
+    return user, questions
+
+
+def test_review_is_persisted_with_question_domain(app_ctx):
+    user = User(email='learner@example.org')
+    question = _question(1, domain='ENDO')
+    db.session.add_all([user, question])
+    db.session.commit()
+    user_id, question_id = user.id, question.id
+
+    schedule = SpacedRepetitionSystem().calculate_review_schedule(question_id, user_id, quality=5)
+    db.session.expunge_all()
+
+    item = SpacedRepetitionItem.query.filter_by(user_id=user_id, question_id=question_id).one()
+    assert item.domain == 'ENDO'
+    assert (item.repetitions, item.interval, item.quality, item.total_reviews) == (1, 1, 5, 1)
+    assert schedule['repetitions'] == 1
+
+    SpacedRepetitionSystem().calculate_review_schedule(question_id, user_id, quality=4)
+    assert SpacedRepetitionItem.query.filter_by(user_id=user_id).count() == 1
+    assert SpacedRepetitionItem.query.one().repetitions == 2
+
+
+def test_schedule_all_stores_queues_used_by_rank_due(app_ctx):
+    user, questions = _seed()
+    now = datetime.now(timezone.utc)
+
+    queues = sr_scheduler.schedule_all(minutes=9, due_before=now)
+
+    assert len(queues[user.id]) == 3
+    assert sr_scheduler.scheduled_queue(user.id, now.date()) == queues[user.id]
+    # Только элементы сохраненной очереди, пока они не повторены
+    ranked = sr_scheduler.rank_due(user.id, now=now)
+    assert sorted(ranked.queue.question_ids.tolist()) == sorted(queues[user.id])
+
+    # Пересчет заменяет очереди дня
+    sr_scheduler.schedule_all(minutes=3, due_before=now)
+    assert ReviewQueueSnapshot.query.count() == 1
+    assert len(sr_scheduler.scheduled_queue(user.id, now.date())) == 1
+
+
+def test_rank_due_falls_back_when_stored_queue_is_done(app_ctx):
+    user, questions = _seed(4)
+    now = datetime.now(timezone.utc)
+    queued = sr_scheduler.schedule_all(minutes=3, due_before=now)[user.id]
+
+    item = SpacedRepetitionItem.query.filter_by(question_id=queued[0]).one()
+    item.next_review = now + timedelta(days=3)
+    db.session.commit()
+
+    ranked = sr_scheduler.rank_due(user.id, now=now)
+    assert len(ranked.queue) == 3
+    assert queued[0] not in ranked.queue.question_ids.tolist()
+
+
+def test_dry_run_does_not_store(app_ctx):
+    _seed(2)
+    assert sr_scheduler.schedule_all(persist=False)
+    assert ReviewQueueSnapshot.query.count() == 0
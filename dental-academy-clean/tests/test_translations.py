@@ -0,0 +1,61 @@
+"""Compiled translation catalogs: parity with the layered lookup and cache freshness"""
+
+import marshal
+import os
+
+import pytest
+
+import translations.catalog as catalog
+from translations import get_translation
+from translations.catalog import (
+    LANGUAGES, TranslationCatalogs, compile_language, load_domain_source, load_source, read_catalog, write_catalog
+)
+
+
+def layered_lookup(key, lang):
+    """Поиск по исходным словарям: домен языка, язык, затем nl и en"""
+    chain = [lang] if lang == 'nl' else [lang, 'nl'] if lang == 'en' else [lang, 'nl', 'en']
+    for code in chain:
+        for layer in (load_domain_source(code), load_source(code)):
+            if layer.get(key) is not None:
+                return layer[key]
+    return key
+
+
+@pytest.mark.parametrize('lang', LANGUAGES)
+def test_compiled_catalog_matches_layered_lookup(lang):
+    keys = set()
+    for code in LANGUAGES:
+        keys |= set(load_source(code)) | set(load_domain_source(code))
+
+    compiled = compile_language(lang)
+
+    mismatches = [key for key in keys if compiled.get(key, key) != layered_lookup(key, lang)]
+    assert not mismatches
+
+
+def test_unknown_language_and_key_fall_back():
+    assert get_translation('no_such_key_anywhere', 'nl') == 'no_such_key_anywhere'
+    key = next(iter(load_source('nl')))
+    assert get_translation(key, 'xx') == get_translation(key, 'nl')
+
+
+def test_catalog_file_is_reused_until_sources_change(tmp_path, monkeypatch):
+    monkeypatch.setattr(catalog, 'CATALOG_DIR', str(tmp_path))
+    path = write_catalog('ru', {'greeting': 'Привет'})
+    assert read_catalog('ru') == {'greeting': 'Привет'}
+
+    # Исходник языка новее каталога - каталог устарел
+    source_mtime = os.path.getmtime(catalog._source_path('ru'))
+    os.utime(path, (source_mtime - 10, source_mtime - 10))
+    assert read_catalog('ru') is None
+
+    # Каталог другой версии формата не используется
+    with open(path, 'wb') as f:
+        marshal.dump((catalog.CATALOG_FORMAT_VERSION + 1, {'greeting': 'old'}), f)
+    assert read_catalog('ru') is None
+
+    # Загрузчик пересобирает и сохраняет каталог
+    loaded = TranslationCatalogs().get('ru')
+    assert loaded == compile_language('ru')
+    assert read_catalog('ru') == loaded
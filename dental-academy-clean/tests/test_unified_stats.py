@@ -0,0 +1,93 @@
+"""Unified user stats: bulk variant, shared cache backend and invalidation"""
+
+import pytest
+
+import utils.unified_stats as unified_stats
+from extensions import db
+from models import LearningPath, Lesson, Module, Subject, User, UserProgress
+from utils.cache_manager import SQLiteCacheBackend, cache_manager
+from utils.unified_stats import (
+    bump_stats_version, clear_stats_cache, get_unified_user_stats, get_unified_user_stats_bulk
+)
+
+
+@pytest.fixture
+def lessons(app_ctx):
+    path = LearningPath(name='Path', exam_component='THEORETICAL', exam_weight=10,
+                        exam_type='multiple_choice', is_active=True)
+    db.session.add(path)
+    db.session.flush()
+    subject = Subject(name='Subject', learning_path_id=path.id)
+    db.session.add(subject)
+    db.session.flush()
+    module = Module(title='Module', subject_id=subject.id)
+    db.session.add(module)
+    db.session.flush()
+    lessons = [Lesson(title=f'Lesson {index}', module_id=module.id) for index in range(4)]
+    db.session.add_all(lessons)
+    db.session.commit()
+    clear_stats_cache()
+    yield lessons
+    clear_stats_cache()
+
+
+def add_user(email, completed_lessons=()):
+    user = User(email=email)
+    db.session.add(user)
+    db.session.flush()
+    db.session.add_all([UserProgress(user_id=user.id, lesson_id=lesson.id, completed=True)
+                        for lesson in completed_lessons])
+    db.session.commit()
+    return user
+
+
+def test_bulk_stats_match_single_user_stats(lessons):
+    first = add_user('first@example.org', lessons[:1])
+    second = add_user('second@example.org', lessons[:3])
+
+    bulk = get_unified_user_stats_bulk([first.id, second.id, first.id])
+
+    assert set(bulk) == {first.id, second.id}
+    assert bulk[first.id]['completed_lessons'] == 1
+    assert bulk[second.id]['overall_progress'] == 75
+    clear_stats_cache()
+    assert get_unified_user_stats(second.id) == bulk[second.id]
+
+
+def test_invalidation_by_another_worker_is_seen(lessons, tmp_path, monkeypatch):
+    path = str(tmp_path / 'cache.sqlite3')
+    monkeypatch.setattr(cache_manager, 'backend', SQLiteCacheBackend(path))
+    user = add_user('learner@example.org', lessons[:1])
+    assert get_unified_user_stats_bulk([user.id])[user.id]['completed_lessons'] == 1
+
+    db.session.add(UserProgress(user_id=user.id, lesson_id=lessons[1].id, completed=True))
+    db.session.commit()
+    assert get_unified_user_stats_bulk([user.id])[user.id]['completed_lessons'] == 1  # из кэша
+
+    # Другой воркер отметил прогресс: его версия этому процессу не видна, удаление - видно
+    other_worker = SQLiteCacheBackend(path)
+    other_worker.delete(unified_stats.STATS_NAMESPACE, str(user.id))
+    assert get_unified_user_stats_bulk([user.id])[user.id]['completed_lessons'] == 2
+
+
+def test_process_versions_are_bounded(monkeypatch):
+    monkeypatch.setattr(unified_stats, 'STATS_CACHE_MAX_USERS', 3)
+    monkeypatch.setattr(unified_stats, '_stats_versions', unified_stats.OrderedDict())
+    for user_id in range(10):
+        bump_stats_version(user_id)
+    assert list(unified_stats._stats_versions) == [7, 8, 9]
+
+
+def test_admin_users_list_shows_progress(lessons, client):
+    admin = User(email='admin@example.org', username='admin', role='admin')
+    db.session.add(admin)
+    db.session.commit()
+    add_user('learner@example.org', lessons[:2])
+
+    with client.session_transaction() as session:
+        session['_user_id'] = str(admin.id)
+        session['_fresh'] = True
+    response = client.get('/admin/users/list')
+
+    assert response.status_code == 200
+    assert b'2 / 4 lessons' in response.data
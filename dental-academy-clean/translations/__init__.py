@@ -3,29 +3,35 @@ Translation system for Mentora
 Professional medical terminology in 9 languages
 """
 
-from .nl import translations as nl_translations
-from .en import translations as en_translations
-from .ru import translations as ru_translations
-from .uk import translations as uk_translations
-from .tr import translations as tr_translations
-from .ar import translations as ar_translations
-from .es import translations as es_translations
-from .pt import translations as pt_translations
-from .fa import translations as fa_translations
-from .domain_diagnostic_translations import DOMAIN_DIAGNOSTIC_TRANSLATIONS
-
-# Combine all translations
-translations = {
-    'nl': nl_translations,
-    'en': en_translations,
-    'ru': ru_translations,
-    'uk': uk_translations,
-    'tr': tr_translations,
-    'ar': ar_translations,
-    'es': es_translations,
-    'pt': pt_translations,
-    'fa': fa_translations,
-}
+from collections.abc import Mapping
+
+from .catalog import catalogs, load_source, LANGUAGES
+
+
+class _SourceTranslations(Mapping):
+    """
+    Исходные словари по языкам (модуль языка импортируется при первом обращении)
+    
+    Рантайм-поиск идет через скомпилированные каталоги (translations.catalog),
+    этот объект оставлен для кода, которому нужны исходные словари.
+    """
+    
+    def __getitem__(self, lang):
+        if lang not in LANGUAGES:
+            raise KeyError(lang)
+        return load_source(lang)
+    
+    def __iter__(self):
+        return iter(LANGUAGES)
+    
+    def __len__(self):
+        return len(LANGUAGES)
+
+
+translations = _SourceTranslations()
+
+# Загруженные каталоги: быстрый путь get_translation
+_loaded_catalogs = catalogs.loaded()
 
 # Default language (Dutch)
 DEFAULT_LANGUAGE = 'nl'
@@ -63,6 +69,9 @@ def get_translation(key, lang=DEFAULT_LANGUAGE, **kwargs):
     """
     Get translation for key in specified language
     
+    Fallback (язык -> nl -> en) разрешен при компиляции каталога,
+    поэтому поиск - одно обращение к плоскому dict.
+    
     Args:
         key (str): Translation key
         lang (str): Language code
@@ -71,43 +80,12 @@ def get_translation(key, lang=DEFAULT_LANGUAGE, **kwargs):
     Returns:
         str: Translated string
     """
-    if lang not in translations:
-        lang = DEFAULT_LANGUAGE
-    
-    # First check in domain diagnostic translations
-    if lang in DOMAIN_DIAGNOSTIC_TRANSLATIONS:
-        translation_value = DOMAIN_DIAGNOSTIC_TRANSLATIONS[lang].get(key)
-        if translation_value is not None:
-            # Apply formatting if parameters provided
-            if kwargs:
-                try:
-                    return translation_value.format(**kwargs)
-                except (KeyError, ValueError) as e:
-                    print(f"Warning: Formatting error for key '{key}' in lang '{lang}': {e}")
-                    return translation_value
-            return translation_value
-    
-    # Then check in main translations
-    translation_value = translations[lang].get(key)
+    catalog = _loaded_catalogs.get(lang)
+    if catalog is None:
+        catalog = catalogs.get(lang)
+    translation_value = catalog.get(key)
     
-    # If not found and not default language, try fallback languages
-    if translation_value is None and lang != DEFAULT_LANGUAGE:
-        # First try default language (Dutch)
-        if DEFAULT_LANGUAGE in DOMAIN_DIAGNOSTIC_TRANSLATIONS:
-            translation_value = DOMAIN_DIAGNOSTIC_TRANSLATIONS[DEFAULT_LANGUAGE].get(key)
-        
-        if translation_value is None:
-            translation_value = translations[DEFAULT_LANGUAGE].get(key)
-        
-        # If still not found, try English as secondary fallback
-        if translation_value is None and 'en' in translations and lang != 'en':
-            if 'en' in DOMAIN_DIAGNOSTIC_TRANSLATIONS:
-                translation_value = DOMAIN_DIAGNOSTIC_TRANSLATIONS['en'].get(key)
-            
-            if translation_value is None:
-                translation_value = translations['en'].get(key)
-    
-    # If still not found, return the key
+    # If not found, return the key
     if translation_value is None:
         return key
     
@@ -126,7 +104,7 @@ t = get_translation
 
 def get_available_languages():
     """Get list of available languages"""
-    return list(translations.keys())
+    return list(LANGUAGES)
 
 def get_language_names():
     """Get dictionary with language names"""
@@ -165,6 +143,13 @@ def validate_translation_completeness():
     
     return incomplete_languages
 
+def __getattr__(name):
+    # Доменные переводы импортируются только по требованию
+    if name == 'DOMAIN_DIAGNOSTIC_TRANSLATIONS':
+        from .domain_diagnostic_translations import DOMAIN_DIAGNOSTIC_TRANSLATIONS
+        return DOMAIN_DIAGNOSTIC_TRANSLATIONS
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 __all__ = [
     'translations',
     'DEFAULT_LANGUAGE',
@@ -0,0 +1,7 @@
+"""Compile or check translation catalogs: python -m translations compile|check"""
+
+import sys
+
+from .catalog import main
+
+sys.exit(main(sys.argv))
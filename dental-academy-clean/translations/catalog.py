@@ -0,0 +1,262 @@
+"""
+Compiled translation catalogs
+Скомпилированные плоские каталоги переводов
+
+Для каждого языка исходные словари (domain_diagnostic_translations + модуль
+языка) и цепочка fallback (язык -> nl -> en) сливаются в один плоский dict
+на этапе сборки и сохраняются через marshal в translations/compiled/<lang>.marshal.
+В рантайме язык загружается при первом обращении, а поиск перевода -
+одно обращение к dict.
+
+Сборка:
+    python -m translations compile
+    python -m translations check
+"""
+
+import ast
+import importlib
+import logging
+import marshal
+import os
+import sys
+import threading
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Версия формата; меняется при изменении правил компиляции
+CATALOG_FORMAT_VERSION = 1
+
+DEFAULT_LANGUAGE = 'nl'
+SECONDARY_FALLBACK_LANGUAGE = 'en'
+LANGUAGES = ['nl', 'en', 'ru', 'uk', 'tr', 'ar', 'es', 'pt', 'fa']
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+DOMAIN_MODULE = 'domain_diagnostic_translations'
+CATALOG_DIR = os.environ.get('TRANSLATIONS_CATALOG_DIR', os.path.join(PACKAGE_DIR, 'compiled'))
+
+
+def _source_path(module_name: str) -> str:
+    return os.path.join(PACKAGE_DIR, f'{module_name}.py')
+
+
+def _catalog_path(lang: str) -> str:
+    return os.path.join(CATALOG_DIR, f'{lang}.marshal')
+
+
+def fallback_chain(lang: str) -> List[str]:
+    """Порядок поиска перевода: язык, затем nl, затем en"""
+    chain = [lang]
+    if lang != DEFAULT_LANGUAGE:
+        chain.append(DEFAULT_LANGUAGE)
+        if lang != SECONDARY_FALLBACK_LANGUAGE:
+            chain.append(SECONDARY_FALLBACK_LANGUAGE)
+    return chain
+
+
+def _source_files(lang: str) -> List[str]:
+    return [_source_path(DOMAIN_MODULE)] + [_source_path(code) for code in fallback_chain(lang)]
+
+
+# ----------------------------------------------------------------------
+# Исходные словари
+# ----------------------------------------------------------------------
+
+def load_source(lang: str) -> Dict[str, str]:
+    """Исходный словарь языка (импортирует только модуль этого языка)"""
+    module = importlib.import_module(f'{__package__}.{lang}')
+    return module.translations
+
+
+def load_domain_source(lang: str) -> Dict[str, str]:
+    """Исходные переводы доменной диагностики для языка"""
+    module = importlib.import_module(f'{__package__}.{DOMAIN_MODULE}')
+    return module.DOMAIN_DIAGNOSTIC_TRANSLATIONS.get(lang, {})
+
+
+def compile_language(lang: str) -> Dict[str, str]:
+    """
+    Собрать плоский каталог языка с уже разрешенным fallback
+
+    Приоритет (как в прежнем get_translation): доменные переводы языка,
+    основной словарь языка, затем то же для nl и en.
+    """
+    catalog: Dict[str, str] = {}
+    # Слои накладываются от низшего приоритета к высшему
+    for code in reversed(fallback_chain(lang)):
+        for layer in (load_source(code), load_domain_source(code)):
+            for key, value in layer.items():
+                if value is not None:
+                    catalog[sys.intern(key)] = value
+    return catalog
+
+
+def write_catalog(lang: str, catalog: Dict[str, str]) -> str:
+    """Сохранить каталог атомарно (marshal)"""
+    os.makedirs(CATALOG_DIR, exist_ok=True)
+    path = _catalog_path(lang)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        marshal.dump((CATALOG_FORMAT_VERSION, catalog), f)
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_catalog(lang: str) -> Optional[Dict[str, str]]:
+    """Прочитать скомпилированный каталог, если он свежее исходников"""
+    path = _catalog_path(lang)
+    try:
+        compiled_mtime = os.path.getmtime(path)
+        if any(os.path.getmtime(source) > compiled_mtime for source in _source_files(lang)):
+            return None
+        with open(path, 'rb') as f:
+            version, catalog = marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+
+    if version != CATALOG_FORMAT_VERSION:
+        return None
+    return {sys.intern(key): value for key, value in catalog.items()}
+
+
+def compile_all(languages: Optional[List[str]] = None) -> Dict[str, int]:
+    """Скомпилировать каталоги; возвращает количество ключей по языкам"""
+    result = {}
+    for lang in languages or LANGUAGES:
+        catalog = compile_language(lang)
+        write_catalog(lang, catalog)
+        result[lang] = len(catalog)
+    return result
+
+
+# ----------------------------------------------------------------------
+# Рантайм
+# ----------------------------------------------------------------------
+
+class TranslationCatalogs:
+    """Ленивая загрузка каталогов по языкам"""
+
+    def __init__(self):
+        self._catalogs: Dict[str, Dict[str, str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, lang: str) -> Dict[str, str]:
+        """Плоский каталог языка (неизвестный язык -> язык по умолчанию)"""
+        catalog = self._catalogs.get(lang)
+        if catalog is not None:
+            return catalog
+        if lang not in LANGUAGES:
+            return self.get(DEFAULT_LANGUAGE)
+
+        with self._lock:
+            catalog = self._catalogs.get(lang)
+            if catalog is None:
+                catalog = read_catalog(lang)
+                if catalog is None:
+                    catalog = compile_language(lang)
+                    try:
+                        write_catalog(lang, catalog)
+                    except OSError as e:
+                        # Read-only деплой - работаем с каталогом в памяти
+                        logger.warning(f"Could not write translation catalog for '{lang}': {e}")
+                self._catalogs[lang] = catalog
+        return catalog
+
+    def loaded(self) -> Dict[str, Dict[str, str]]:
+        """Уже загруженные каталоги (для быстрого пути без вызова get)"""
+        return self._catalogs
+
+    def loaded_languages(self) -> List[str]:
+        return list(self._catalogs)
+
+    def reset(self):
+        with self._lock:
+            self._catalogs.clear()
+
+
+catalogs = TranslationCatalogs()
+
+
+# ----------------------------------------------------------------------
+# Проверка исходников
+# ----------------------------------------------------------------------
+
+def _dict_literal_duplicates(node: ast.Dict) -> List[str]:
+    seen, duplicates = set(), []
+    for key in node.keys:
+        if isinstance(key, ast.Constant) and isinstance(key.value, str):
+            if key.value in seen:
+                duplicates.append(key.value)
+            seen.add(key.value)
+    return duplicates
+
+
+def find_duplicate_keys(module_name: str) -> Dict[str, List[str]]:
+    """
+    Дублирующиеся ключи в dict-литералах модуля (Python молча оставляет последний)
+
+    Returns:
+        {имя словаря: [ключи]}; для доменных переводов имя - код языка
+    """
+    with open(_source_path(module_name), encoding='utf-8') as f:
+        tree = ast.parse(f.read())
+
+    result: Dict[str, List[str]] = {}
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Assign) or not isinstance(node.value, ast.Dict):
+            continue
+        name = node.targets[0].id if isinstance(node.targets[0], ast.Name) else '?'
+        duplicates = _dict_literal_duplicates(node.value)
+        if duplicates:
+            result[name] = duplicates
+        for key, value in zip(node.value.keys, node.value.values):
+            if isinstance(key, ast.Constant) and isinstance(value, ast.Dict):
+                nested = _dict_literal_duplicates(value)
+                if nested:
+                    result[f'{name}[{key.value}]'] = nested
+    return result
+
+
+def check_catalogs() -> Dict[str, Dict]:
+    """
+    Отчет по исходникам: отсутствующие/лишние ключи относительно языка
+    по умолчанию и дубликаты ключей в dict-литералах
+    """
+    base_keys = set(load_source(DEFAULT_LANGUAGE)) | set(load_domain_source(DEFAULT_LANGUAGE))
+    report = {}
+    for lang in LANGUAGES:
+        keys = set(load_source(lang)) | set(load_domain_source(lang))
+        report[lang] = {
+            'keys': len(keys),
+            'missing': sorted(base_keys - keys),
+            'extra': sorted(keys - base_keys),
+            'duplicates': find_duplicate_keys(lang).get('translations', [])
+        }
+    for name, duplicates in find_duplicate_keys(DOMAIN_MODULE).items():
+        lang = name[name.find('[') + 1:-1] if '[' in name else None
+        if lang in report:
+            report[lang]['duplicates'] = report[lang]['duplicates'] + duplicates
+    return report
+
+
+def main(argv: List[str]) -> int:
+    """Точка входа `python -m translations compile|check`"""
+    command = argv[1] if len(argv) > 1 else 'compile'
+    if command == 'compile':
+        for lang, size in compile_all().items():
+            print(f"{lang}: {size} keys -> {_catalog_path(lang)}")
+        return 0
+    if command == 'check':
+        problems = 0
+        for lang, info in check_catalogs().items():
+            print(f"{lang}: {info['keys']} keys, {len(info['missing'])} missing, "
+                  f"{len(info['extra'])} extra, {len(info['duplicates'])} duplicates")
+            for key in info['missing']:
+                print(f"  missing: {key}")
+            for key in sorted(set(info['duplicates'])):
+                print(f"  duplicate: {key} (x{info['duplicates'].count(key) + 1})")
+            problems += len(info['duplicates'])
+        return 1 if problems else 0
+    print(f"Unknown command: {command} (use 'compile' or 'check')")
+    return 2
+
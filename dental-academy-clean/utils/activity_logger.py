@@ -7,6 +7,7 @@ from flask import request, current_app, session
 from datetime import datetime, timezone
 from extensions import db
 from utils.analytics import parse_user_agent, get_client_ip
+from utils.activity_queue import enqueue_activity
 
 logger = logging.getLogger(__name__)
 
@@ -37,6 +38,9 @@ def log_user_activity(action_type='page_view', action_description=None, metadata
     """
     Log user activity to database
     
+    Запись ставится в write-behind очередь (utils.activity_queue) и
+    сохраняется фоновым потоком пачкой вместе с другими событиями.
+    
     Args:
         action_type: Type of action (page_view, login, logout, action, etc.)
         action_description: Human-readable description of the action
@@ -73,34 +77,27 @@ def log_user_activity(action_type='page_view', action_description=None, metadata
             if path_parts:
                 page_title = path_parts[-1].replace('-', ' ').replace('_', ' ').title()
         
-        # Create activity log entry
-        activity_log = UserActivityLog(
-            user_id=current_user.id,
-            action_type=action_type,
-            page_url=path,
-            page_title=page_title or action_description,
-            action_description=action_description,
-            ip_address=ip_address,
-            user_agent=user_agent,
-            referrer=request.referrer,
-            session_id=session_id,
-            browser=parsed_ua.get('browser'),
-            os=parsed_ua.get('os'),
-            device_type=parsed_ua.get('device_type'),
-            timestamp=datetime.now(timezone.utc),
-            action_metadata=metadata  # Use action_metadata (metadata is reserved in SQLAlchemy)
-        )
-        
-        db.session.add(activity_log)
-        db.session.commit()
+        # Queue activity log entry
+        enqueue_activity({
+            'user_id': current_user.id,
+            'action_type': action_type,
+            'page_url': path,
+            'page_title': page_title or action_description,
+            'action_description': action_description,
+            'ip_address': ip_address,
+            'user_agent': user_agent,
+            'referrer': request.referrer,
+            'session_id': session_id,
+            'browser': parsed_ua.get('browser'),
+            'os': parsed_ua.get('os'),
+            'device_type': parsed_ua.get('device_type'),
+            'timestamp': datetime.now(timezone.utc),
+            'action_metadata': metadata  # Use action_metadata (metadata is reserved in SQLAlchemy)
+        })
         
     except Exception as e:
         # Don't fail the request if logging fails
         logger.error(f"Error logging user activity: {str(e)}")
-        try:
-            db.session.rollback()
-        except:
-            pass
 
 def get_user_activity_summary(user_id, days=7):
     """
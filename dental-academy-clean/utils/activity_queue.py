@@ -0,0 +1,395 @@
+"""
+Activity Queue - write-behind pipeline for per-request activity tracking
+
+Обработчики запросов только кладут легковесные записи (dict) в ограниченную
+очередь процесса, а фоновый поток пишет их в БД пачками - по размеру пачки
+или по интервалу. Обновления User.last_login схлопываются по пользователю,
+обновления UserSession - по session_id.
+
+Если пачка не записалась, она повторяется по одной записи: в БД попадают все
+корректные записи, а отвергнутые считаются в failed и последние из них
+хранятся в rejected (см. get_stats) для разбора.
+"""
+
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+# Типы записей очереди
+RECORD_ACTIVITY = 'activity'
+RECORD_PAGE_VIEW = 'page_view'
+
+# Сколько последних отвергнутых записей хранить для разбора
+REJECTED_KEEP = 100
+
+
+class ActivityWriteQueue:
+    """Ограниченная очередь активности с фоновой пакетной записью"""
+
+    def __init__(self, max_size: int = 10000, batch_size: int = 500,
+                 flush_interval: float = 2.0, enabled: bool = True):
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enabled = enabled
+
+        self._queue: queue.Queue = queue.Queue(maxsize=max_size)
+        self._last_seen: Dict[int, datetime] = {}
+        self._sessions: Dict[str, Dict] = {}
+        self._pending_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+
+        self._app = None
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+
+        # Метрики
+        self.enqueued = 0
+        self.dropped = 0
+        self.flushed = 0
+        self.failed = 0
+        self.flushes = 0
+        self.coalesced = 0
+        self.last_flush_at: Optional[datetime] = None
+        self.last_flush_duration = 0.0
+        self.last_error: Optional[str] = None
+        self.rejected: deque = deque(maxlen=REJECTED_KEEP)
+
+        logger.info(f"Activity write queue initialized: max_size={max_size}, "
+                    f"batch_size={batch_size}, flush_interval={flush_interval}s, enabled={enabled}")
+
+    # ------------------------------------------------------------------
+    # Жизненный цикл
+    # ------------------------------------------------------------------
+
+    def init_app(self, app):
+        """Привязать очередь к приложению (поток стартует при первой записи)"""
+        self._app = app
+        if app.config.get('TESTING'):
+            self.enabled = False
+        app.extensions['activity_queue'] = self
+        atexit.register(self.shutdown)
+
+    def _ensure_worker(self):
+        # После fork (gunicorn --preload) поток родителя в дочернем процессе не существует
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._pending_lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name='activity-write-queue', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Activity queue flush failed: {e}")
+
+    def shutdown(self):
+        """Остановить поток и записать оставшиеся события"""
+        self._stopped.set()
+        self._wakeup.set()
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"Activity queue final flush failed: {e}")
+
+    # ------------------------------------------------------------------
+    # Запись в очередь (поток запроса)
+    # ------------------------------------------------------------------
+
+    def enqueue(self, kind: str, payload: Dict) -> bool:
+        """
+        Поставить запись в очередь без блокировки
+
+        Returns:
+            False если очередь переполнена и запись отброшена
+        """
+        if not self.enabled or self._app is None:
+            self._write_batch([(kind, payload)])
+            return True
+
+        try:
+            self._queue.put_nowait((kind, payload))
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+        self.enqueued += 1
+        self._ensure_worker()
+        if self._queue.qsize() >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    def touch_user(self, user_id: int, seen_at: Optional[datetime] = None):
+        """Запомнить время последней активности пользователя (схлопывается по user_id)"""
+        seen_at = seen_at or datetime.now(timezone.utc)
+        with self._pending_lock:
+            if user_id in self._last_seen:
+                self.coalesced += 1
+            self._last_seen[user_id] = seen_at
+        if not self.enabled or self._app is None:
+            self.flush()
+        else:
+            self._ensure_worker()
+
+    def touch_session(self, session_data: Dict):
+        """
+        Запомнить активность аналитической сессии (схлопывается по session_id)
+
+        Args:
+            session_data: Поля UserSession; обязательны session_id и last_activity
+        """
+        with self._pending_lock:
+            pending = self._sessions.get(session_data['session_id'])
+            if pending is None:
+                self._sessions[session_data['session_id']] = dict(session_data, visits=1)
+            else:
+                self.coalesced += 1
+                pending['last_activity'] = max(pending['last_activity'], session_data['last_activity'])
+                pending['visits'] += 1
+        if not self.enabled or self._app is None:
+            self.flush()
+        else:
+            self._ensure_worker()
+
+    # ------------------------------------------------------------------
+    # Запись в БД (фоновый поток)
+    # ------------------------------------------------------------------
+
+    def _drain(self) -> List:
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def flush(self) -> int:
+        """Записать накопленные события; возвращает количество записанных"""
+        with self._flush_lock:
+            if self._app is not None and self.enabled:
+                with self._app.app_context():
+                    return self._flush_all()
+            return self._flush_all()
+
+    def _flush_all(self) -> int:
+        written = 0
+        started = time.perf_counter()
+
+        with self._pending_lock:
+            last_seen, self._last_seen = self._last_seen, {}
+            sessions, self._sessions = self._sessions, {}
+
+        try:
+            if last_seen or sessions:
+                self._write_touches(last_seen, sessions)
+        except Exception as e:
+            self._record_error(e)
+
+        while True:
+            batch = self._drain()
+            if not batch:
+                break
+            written += self._write_batch(batch)
+
+        self.flushes += 1
+        self.last_flush_at = datetime.now(timezone.utc)
+        self.last_flush_duration = time.perf_counter() - started
+        return written
+
+    def _write_touches(self, last_seen: Dict[int, datetime], sessions: Dict[str, Dict]):
+        from models import User, UserSession
+
+        try:
+            if last_seen:
+                db.session.bulk_update_mappings(
+                    User, [{'id': user_id, 'last_login': seen_at} for user_id, seen_at in last_seen.items()]
+                )
+
+            if sessions:
+                existing = dict(db.session.query(UserSession.session_id, UserSession.id).filter(
+                    UserSession.session_id.in_(list(sessions))
+                ).all())
+
+                new_rows, updates = [], []
+                for session_id, data in sessions.items():
+                    visits = data.pop('visits')
+                    if session_id in existing:
+                        updates.append({
+                            'id': existing[session_id],
+                            'last_activity': data['last_activity'],
+                            'total_visits': UserSession.total_visits + visits
+                        })
+                    else:
+                        # Первый визит сессии создает запись, как в get_or_create_session
+                        new_rows.append(dict(data, started_at=data.get('started_at', data['last_activity']),
+                                             total_visits=visits - 1, is_active=True))
+
+                if new_rows:
+                    db.session.bulk_insert_mappings(UserSession, new_rows)
+                for row in updates:
+                    db.session.query(UserSession).filter(UserSession.id == row['id']).update(
+                        {'last_activity': row['last_activity'], 'total_visits': row['total_visits']},
+                        synchronize_session=False
+                    )
+
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    def _insert(self, batch: List):
+        from models import UserActivityLog, WebsiteVisit, PageView
+
+        activities = [payload for kind, payload in batch if kind == RECORD_ACTIVITY]
+        page_views = [payload for kind, payload in batch if kind == RECORD_PAGE_VIEW]
+
+        if activities:
+            db.session.bulk_insert_mappings(UserActivityLog, activities)
+
+        if page_views:
+            # return_defaults заполняет id визитов для внешнего ключа PageView;
+            # копии - чтобы повтор после отката не получил id отмененной вставки
+            visits = [dict(payload['visit']) for payload in page_views]
+            db.session.bulk_insert_mappings(WebsiteVisit, visits, return_defaults=True)
+            db.session.bulk_insert_mappings(PageView, [
+                dict(payload['page_view'], visit_id=visit['id'])
+                for payload, visit in zip(page_views, visits)
+            ])
+
+    def _write_batch(self, batch: List) -> int:
+        try:
+            self._insert(batch)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            if len(batch) == 1:
+                self._reject(batch[0], e)
+                return 0
+            logger.warning(f"Activity batch of {len(batch)} records failed ({e}), retrying one by one")
+            return self._write_rows(batch)
+
+        self.flushed += len(batch)
+        return len(batch)
+
+    def _write_rows(self, batch: List) -> int:
+        """Повтор неудачной пачки по одной записи: отвергаются только ошибочные"""
+        written = 0
+        for record in batch:
+            try:
+                self._insert([record])
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                self._reject(record, e)
+            else:
+                written += 1
+
+        self.flushed += written
+        return written
+
+    def _reject(self, record, error: Exception):
+        kind, payload = record
+        self.failed += 1
+        self.rejected.append({
+            'kind': kind,
+            'payload': payload,
+            'error': str(error),
+            'rejected_at': datetime.now(timezone.utc).isoformat()
+        })
+        self._record_error(error)
+
+    def _record_error(self, error: Exception):
+        self.last_error = f"{datetime.now(timezone.utc).isoformat()}: {error}"
+        logger.error(f"Activity queue write error: {error}")
+
+    # ------------------------------------------------------------------
+    # Метрики
+    # ------------------------------------------------------------------
+
+    def get_stats(self) -> Dict:
+        """Метрики очереди для мониторинга"""
+        with self._pending_lock:
+            pending_users = len(self._last_seen)
+            pending_sessions = len(self._sessions)
+
+        return {
+            'enabled': self.enabled,
+            'worker_alive': bool(self._thread and self._thread.is_alive()),
+            'queue_depth': self._queue.qsize(),
+            'max_size': self.max_size,
+            'batch_size': self.batch_size,
+            'flush_interval': self.flush_interval,
+            'enqueued': self.enqueued,
+            'dropped': self.dropped,
+            'flushed': self.flushed,
+            'failed': self.failed,
+            'rejected_kept': len(self.rejected),
+            'flushes': self.flushes,
+            'coalesced': self.coalesced,
+            'pending_last_login_updates': pending_users,
+            'pending_session_updates': pending_sessions,
+            'last_flush_at': self.last_flush_at.isoformat() if self.last_flush_at else None,
+            'last_flush_duration_ms': round(self.last_flush_duration * 1000, 2),
+            'last_error': self.last_error
+        }
+
+
+# Глобальный экземпляр очереди
+activity_queue = ActivityWriteQueue(
+    max_size=int(os.environ.get('ACTIVITY_QUEUE_MAX_SIZE', 10000)),
+    batch_size=int(os.environ.get('ACTIVITY_QUEUE_BATCH_SIZE', 500)),
+    flush_interval=float(os.environ.get('ACTIVITY_QUEUE_FLUSH_INTERVAL', 2.0)),
+    enabled=os.environ.get('ACTIVITY_QUEUE_ENABLED', 'true').lower() == 'true'
+)
+
+
+def init_activity_queue(app):
+    """Подключить write-behind очередь к приложению"""
+    activity_queue.init_app(app)
+    return activity_queue
+
+
+def enqueue_activity(record: Dict) -> bool:
+    """Поставить запись UserActivityLog в очередь"""
+    return activity_queue.enqueue(RECORD_ACTIVITY, record)
+
+
+def enqueue_page_view(visit: Dict, page_view: Dict) -> bool:
+    """Поставить пару WebsiteVisit + PageView в очередь"""
+    return activity_queue.enqueue(RECORD_PAGE_VIEW, {'visit': visit, 'page_view': page_view})
+
+
+def touch_user_last_login(user_id: int, seen_at: Optional[datetime] = None):
+    """Схлопнутое обновление User.last_login"""
+    activity_queue.touch_user(user_id, seen_at)
+
+
+def touch_analytics_session(session_data: Dict):
+    """Схлопнутое обновление/создание UserSession"""
+    activity_queue.touch_session(session_data)
+
+
+def get_activity_queue_stats() -> Dict:
+    """Метрики очереди активности"""
+    return activity_queue.get_stats()
@@ -66,12 +66,7 @@ def parse_user_agent(user_agent):
 
 def get_or_create_session():
     """Get or create user session"""
-    session_id = session.get('analytics_session_id')
-    
-    if not session_id:
-        # Generate new session ID
-        session_id = secrets.token_urlsafe(32)
-        session['analytics_session_id'] = session_id
+    session_id = get_analytics_session_id()
     
     # Get or create session in database
     user_session = UserSession.query.filter_by(session_id=session_id).first()
@@ -104,54 +99,76 @@ def get_or_create_session():
     
     return user_session
 
-def track_page_view(page_url, page_title=None, time_on_page=None, scroll_depth=None):
-    """Track a page view"""
+def get_analytics_session_id():
+    """Get (or assign) analytics session ID for the current browser session"""
+    session_id = session.get('analytics_session_id')
+    if not session_id:
+        session_id = secrets.token_urlsafe(32)
+        session['analytics_session_id'] = session_id
+    return session_id
+
+def track_page_view(page_url, page_title=None, time_on_page=None, scroll_depth=None, sample_weight=1.0):
+    """
+    Track a page view
+    
+    Визит, просмотр страницы и обновление UserSession не пишутся в запросе:
+    они уходят в write-behind очередь utils.activity_queue.
+    
+    sample_weight - вес просмотра при выборочном трекинге (1 / доля выборки),
+    учитывается во всех агрегатах вместо простого COUNT.
+    """
     try:
-        # Get or create session
-        user_session = get_or_create_session()
+        from utils.activity_queue import enqueue_page_view, touch_analytics_session
+        
+        session_id = get_analytics_session_id()
+        user_id = session.get('user_id') if session.get('user_id') else None
         
         # Get client info
         ip_address = get_client_ip()
         user_agent = request.headers.get('User-Agent', '')
         referrer = request.headers.get('Referer', '')
         parsed_ua = parse_user_agent(user_agent)
+        now = datetime.utcnow()
+        
+        touch_analytics_session({
+            'session_id': session_id,
+            'user_id': user_id,
+            'ip_address': ip_address,
+            'user_agent': user_agent,
+            'browser': parsed_ua['browser'],
+            'os': parsed_ua['os'],
+            'device_type': parsed_ua['device_type'],
+            'last_activity': now
+        })
+        
+        visit = {
+            'ip_address': ip_address,
+            'user_agent': user_agent,
+            'referrer': referrer,
+            'page_url': page_url,
+            'page_title': page_title,
+            'session_id': session_id,
+            'user_id': user_id,
+            'browser': parsed_ua['browser'],
+            'os': parsed_ua['os'],
+            'device_type': parsed_ua['device_type'],
+            'sample_weight': sample_weight,
+            'created_at': now
+        }
         
-        # Create visit record
-        visit = WebsiteVisit(
-            ip_address=ip_address,
-            user_agent=user_agent,
-            referrer=referrer,
-            page_url=page_url,
-            page_title=page_title,
-            session_id=user_session.session_id,
-            user_id=user_session.user_id,
-            browser=parsed_ua['browser'],
-            os=parsed_ua['os'],
-            device_type=parsed_ua['device_type'],
-            created_at=datetime.utcnow()
-        )
-        
-        db.session.add(visit)
-        db.session.flush()  # Get the visit ID
-        
-        # Create page view record
-        page_view = PageView(
-            visit_id=visit.id,
-            page_url=page_url,
-            page_title=page_title,
-            time_on_page=time_on_page,
-            scroll_depth=scroll_depth,
-            created_at=datetime.utcnow()
-        )
-        
-        db.session.add(page_view)
-        db.session.commit()
+        enqueue_page_view(visit, {
+            'page_url': page_url,
+            'page_title': page_title,
+            'time_on_page': time_on_page,
+            'scroll_depth': scroll_depth,
+            'sample_weight': sample_weight,
+            'created_at': now
+        })
         
         return visit
         
     except Exception as e:
         current_app.logger.error(f"Error tracking page view: {str(e)}")
-        db.session.rollback()
         return None
 
 def get_analytics_data(days=30):
@@ -160,19 +177,23 @@ def get_analytics_data(days=30):
         end_date = datetime.utcnow()
         start_date = end_date - timedelta(days=days)
         
-        # Basic stats
-        total_visits = WebsiteVisit.query.filter(
+        # Basic stats (weighted: sampled views count as 1 / sampling rate)
+        total_visits = round(db.session.query(
+            db.func.coalesce(db.func.sum(WebsiteVisit.sample_weight), 0)
+        ).filter(
             WebsiteVisit.created_at >= start_date
-        ).count()
+        ).scalar())
         
         unique_visitors = db.session.query(WebsiteVisit.ip_address).filter(
             WebsiteVisit.created_at >= start_date
         ).distinct().count()
         
         # Page views
-        total_page_views = PageView.query.filter(
+        total_page_views = round(db.session.query(
+            db.func.coalesce(db.func.sum(PageView.sample_weight), 0)
+        ).filter(
             PageView.created_at >= start_date
-        ).count()
+        ).scalar())
         
         # Active sessions
         active_sessions = UserSession.query.filter(
@@ -183,7 +204,7 @@ def get_analytics_data(days=30):
         # Top pages
         top_pages = db.session.query(
             WebsiteVisit.page_url,
-            db.func.count(WebsiteVisit.id).label('views')
+            db.func.sum(WebsiteVisit.sample_weight).label('views')
         ).filter(
             WebsiteVisit.created_at >= start_date
         ).group_by(WebsiteVisit.page_url).order_by(
@@ -193,7 +214,7 @@ def get_analytics_data(days=30):
         # Browser stats
         browser_stats = db.session.query(
             WebsiteVisit.browser,
-            db.func.count(WebsiteVisit.id).label('count')
+            db.func.sum(WebsiteVisit.sample_weight).label('count')
         ).filter(
             WebsiteVisit.created_at >= start_date
         ).group_by(WebsiteVisit.browser).order_by(
@@ -203,7 +224,7 @@ def get_analytics_data(days=30):
         # OS stats
         os_stats = db.session.query(
             WebsiteVisit.os,
-            db.func.count(WebsiteVisit.id).label('count')
+            db.func.sum(WebsiteVisit.sample_weight).label('count')
         ).filter(
             WebsiteVisit.created_at >= start_date
         ).group_by(WebsiteVisit.os).order_by(
@@ -213,7 +234,7 @@ def get_analytics_data(days=30):
         # Device stats
         device_stats = db.session.query(
             WebsiteVisit.device_type,
-            db.func.count(WebsiteVisit.id).label('count')
+            db.func.sum(WebsiteVisit.sample_weight).label('count')
         ).filter(
             WebsiteVisit.created_at >= start_date
         ).group_by(WebsiteVisit.device_type).order_by(
@@ -223,7 +244,7 @@ def get_analytics_data(days=30):
         # Daily visits
         daily_visits = db.session.query(
             db.func.date(WebsiteVisit.created_at).label('date'),
-            db.func.count(WebsiteVisit.id).label('visits')
+            db.func.sum(WebsiteVisit.sample_weight).label('visits')
         ).filter(
             WebsiteVisit.created_at >= start_date
         ).group_by(
@@ -238,17 +259,115 @@ def get_analytics_data(days=30):
             'unique_visitors': unique_visitors,
             'total_page_views': total_page_views,
             'active_sessions': active_sessions,
-            'top_pages': [{'url': page[0], 'views': page[1]} for page in top_pages],
-            'browser_stats': [{'browser': browser[0], 'count': browser[1]} for browser in browser_stats],
-            'os_stats': [{'os': os[0], 'count': os[1]} for os in os_stats],
-            'device_stats': [{'device': device[0], 'count': device[1]} for device in device_stats],
-            'daily_visits': [{'date': visit[0].isoformat(), 'visits': visit[1]} for visit in daily_visits]
+            'top_pages': [{'url': page[0], 'views': round(page[1])} for page in top_pages],
+            'browser_stats': [{'browser': browser[0], 'count': round(browser[1])} for browser in browser_stats],
+            'os_stats': [{'os': os[0], 'count': round(os[1])} for os in os_stats],
+            'device_stats': [{'device': device[0], 'count': round(device[1])} for device in device_stats],
+            'daily_visits': [{'date': visit[0].isoformat(), 'visits': round(visit[1])} for visit in daily_visits]
         }
         
     except Exception as e:
         current_app.logger.error(f"Error getting analytics data: {str(e)}")
         return None
 
+def _weighted_sessions(keys, start_date):
+    """
+    Оценка числа сессий по группам keys с учетом выборки
+    
+    Сессия попадает в выборку, если записан хотя бы один ее просмотр, поэтому
+    она весит как ее самый частый (наименее разреженный) просмотр -
+    MIN(sample_weight); без выборки это обычный COUNT(DISTINCT session_id).
+    """
+    per_session = db.session.query(
+        *keys,
+        db.func.min(WebsiteVisit.sample_weight).label('weight')
+    ).filter(
+        WebsiteVisit.created_at >= start_date,
+        WebsiteVisit.session_id.isnot(None)
+    ).group_by(*keys, WebsiteVisit.session_id).subquery()
+    
+    group_columns = [per_session.c[key.key] for key in keys]
+    rows = db.session.query(
+        *group_columns,
+        db.func.sum(per_session.c.weight)
+    ).group_by(*group_columns).all()
+    return {tuple(row[:-1]): row[-1] or 0.0 for row in rows}
+
+def rollup_traffic_analytics(days=30):
+    """
+    Пересчитать трафиковые поля DeviceAnalytics и CountryAnalytics
+    
+    Просмотры считаются как SUM(sample_weight), поэтому страницы с выборочным
+    трекингом (ANALYTICS_SAMPLE_RATES) дают несмещенную оценку полного трафика.
+    Сессии оцениваются так же (_weighted_sessions), иначе avg_pages_per_session
+    делил бы взвешенные просмотры на число попавших в выборку сессий.
+    """
+    from models import DeviceAnalytics, CountryAnalytics
+    
+    try:
+        start_date = datetime.utcnow() - timedelta(days=days)
+        
+        device_keys = (WebsiteVisit.device_type, WebsiteVisit.browser, WebsiteVisit.os)
+        device_sessions = _weighted_sessions(device_keys, start_date)
+        device_rows = db.session.query(
+            *device_keys,
+            db.func.sum(WebsiteVisit.sample_weight),
+            db.func.count(db.distinct(WebsiteVisit.user_id))
+        ).filter(
+            WebsiteVisit.created_at >= start_date
+        ).group_by(*device_keys).all()
+        
+        existing_devices = {
+            (row.device_category, row.browser, row.os): row
+            for row in DeviceAnalytics.query.all()
+        }
+        
+        for device_type, browser, os_name, weighted_views, users in device_rows:
+            sessions = device_sessions.get((device_type, browser, os_name), 0.0)
+            key = (device_type or 'unknown', browser or 'Unknown', os_name or 'Unknown')
+            device = existing_devices.get(key)
+            if device is None:
+                device = DeviceAnalytics(device_category=key[0], browser=key[1], os=key[2])
+                db.session.add(device)
+                existing_devices[key] = device
+            device.page_views_count = round(weighted_views or 0)
+            device.sessions_count = round(sessions)
+            device.users_count = users
+            device.avg_pages_per_session = (weighted_views or 0) / sessions if sessions else 0.0
+        
+        country_sessions = _weighted_sessions((WebsiteVisit.country,), start_date)
+        country_rows = db.session.query(
+            WebsiteVisit.country,
+            db.func.sum(WebsiteVisit.sample_weight)
+        ).filter(
+            WebsiteVisit.created_at >= start_date,
+            WebsiteVisit.country.isnot(None)
+        ).group_by(WebsiteVisit.country).all()
+        
+        countries = {row.country_name: row for row in CountryAnalytics.query.all()}
+        updated_countries = 0
+        for country, weighted_views in country_rows:
+            sessions = country_sessions.get((country,), 0.0)
+            # country_code обязателен - обновляем только существующие страны
+            country_analytics = countries.get(country)
+            if country_analytics is None or not sessions:
+                continue
+            country_analytics.avg_pages_per_session = (weighted_views or 0) / sessions
+            updated_countries += 1
+        
+        db.session.commit()
+        
+        return {
+            'devices': len(device_rows),
+            'countries': updated_countries,
+            'period_days': days
+        }
+        
+    except Exception as e:
+        current_app.logger.error(f"Error rolling up traffic analytics: {str(e)}")
+        db.session.rollback()
+        return None
+
 def get_recent_visits(limit=50):
     """Get recent visits with details"""
     try:
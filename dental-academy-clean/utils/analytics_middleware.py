@@ -1,13 +1,136 @@
 # utils/analytics_middleware.py - Middleware for automatic analytics tracking
 
-from flask import request, session, current_app, g
+from flask import request, session, current_app, g, template_rendered
 from utils.analytics import track_page_view, get_or_create_session
 from extensions import db
+import html
+import random
 import time
 import json
 
+# Paths that are never tracked
+SKIP_PATHS = [
+    '/static/',
+    '/favicon.ico',
+    '/robots.txt',
+    '/sitemap.xml',
+    '/admin/analytics',  # Avoid tracking analytics page itself
+    '/api/analytics',    # Avoid tracking API calls
+    '/analytics/track-event',  # Analytics endpoint - not a real page view
+]
+
+# Explicit page titles keyed by full endpoint name (request.endpoint, e.g. 'learning_map_bp.learning_map')
+ENDPOINT_TITLES = {}
+
+
+def page_title(title):
+    """
+    Decorator: explicit analytics page title for a view
+    
+    The title is stored on the view function (functools.wraps keeps it through
+    login_required and similar decorators) and looked up via app.view_functions,
+    so views with the same name in different blueprints do not collide.
+    
+    Usage:
+        @bp.route('/learning-map')
+        @login_required
+        @page_title('Learning Map')
+        def learning_map(): ...
+    """
+    def decorator(view_func):
+        view_func._analytics_page_title = title
+        return view_func
+    return decorator
+
+
+def register_page_title(endpoint, title):
+    """Explicit analytics page title for an endpoint whose view cannot be decorated"""
+    ENDPOINT_TITLES[endpoint] = title
+
+
+def set_page_title(title):
+    """Set analytics page title for the current request (from a view)"""
+    g.analytics_page_title = title
+
+
+def parse_sample_rates(value):
+    """
+    Parse "prefix:rate" pairs into a list sorted by prefix length (longest first)
+    
+    Accepts a string ("/learning-map:0.1,/admin:0.25") or a dict.
+    """
+    if not value:
+        return []
+    if isinstance(value, str):
+        pairs = []
+        for item in value.split(','):
+            if ':' not in item:
+                continue
+            prefix, rate = item.rsplit(':', 1)
+            pairs.append((prefix.strip(), rate.strip()))
+        value = dict(pairs)
+    rates = []
+    for prefix, rate in value.items():
+        try:
+            rate = float(rate)
+        except (TypeError, ValueError):
+            continue
+        rates.append((prefix, min(1.0, max(0.0, rate))))
+    return sorted(rates, key=lambda item: len(item[0]), reverse=True)
+
+
+def get_sample_rate(path, sample_rates):
+    """Sampling rate for the longest matching path prefix (1.0 if none)"""
+    for prefix, rate in sample_rates:
+        if path.startswith(prefix):
+            return rate
+    return 1.0
+
+
+def _resolve_page_title(app):
+    """Page title from the view, the endpoint registry or the rendered template context"""
+    title = g.get('analytics_page_title')
+    if title:
+        return title
+    
+    endpoint = request.endpoint
+    if endpoint:
+        title = ENDPOINT_TITLES.get(endpoint)
+        if title:
+            return title
+        view_func = app.view_functions.get(endpoint)
+        title = getattr(view_func, '_analytics_page_title', None)
+        if title:
+            return title
+    
+    return g.get('analytics_template_title')
+
+
 def init_analytics_middleware(app):
     """Initialize analytics middleware"""
+    sample_rates = parse_sample_rates(app.config.get('ANALYTICS_SAMPLE_RATES'))
+    app.extensions['analytics_sample_rates'] = sample_rates
+    
+    def remember_template_title(sender, template, context, **extra):
+        """
+        Take page title from the template instead of parsing the rendered body
+        
+        Uses the `page_title`/`title` context variable, otherwise renders only
+        the template's own {% block title %}.
+        """
+        title = context.get('page_title') or context.get('title')
+        if not (isinstance(title, str) and title):
+            title = None
+            block = template.blocks.get('title')
+            if block is not None:
+                try:
+                    title = html.unescape(''.join(block(template.new_context(context)))).strip()
+                except Exception:
+                    title = None
+        if title:
+            g.analytics_template_title = title[:200]
+    
+    template_rendered.connect(remember_template_title, app, weak=False)
     
     @app.before_request
     def before_request():
@@ -16,39 +139,19 @@ def init_analytics_middleware(app):
     
     @app.after_request
     def after_request(response):
-        """Track page view after request"""
+        """Track page view after request (response body is never read)"""
         try:
-            # Skip tracking for certain paths
-            skip_paths = [
-                '/static/',
-                '/favicon.ico',
-                '/robots.txt',
-                '/sitemap.xml',
-                '/admin/analytics',  # Avoid tracking analytics page itself
-                '/api/analytics',    # Avoid tracking API calls
-                '/analytics/track-event',  # Analytics endpoint - not a real page view
-            ]
-            
-            if any(request.path.startswith(path) for path in skip_paths):
+            if any(request.path.startswith(path) for path in SKIP_PATHS):
                 return response
             
             # Skip tracking for non-GET requests (except important ones)
             if request.method != 'GET' and request.path not in ['/auth/login', '/auth/register']:
                 return response
             
-            # Get page title from response or use path
-            page_title = None
-            if hasattr(response, 'data') and response.data:
-                try:
-                    # Try to extract title from HTML
-                    content = response.data.decode('utf-8')
-                    if '<title>' in content:
-                        start = content.find('<title>') + 7
-                        end = content.find('</title>', start)
-                        if end > start:
-                            page_title = content[start:end].strip()
-                except:
-                    pass
+            # Sampling: tracked views carry weight 1/rate for rollups
+            rate = get_sample_rate(request.path, sample_rates)
+            if rate <= 0.0 or (rate < 1.0 and random.random() >= rate):
+                return response
             
             # Calculate time on page (if available from JavaScript)
             time_on_page = None
@@ -58,8 +161,9 @@ def init_analytics_middleware(app):
             # Track the page view
             track_page_view(
                 page_url=request.url,
-                page_title=page_title or request.path,
-                time_on_page=time_on_page
+                page_title=_resolve_page_title(app) or request.path,
+                time_on_page=time_on_page,
+                sample_weight=1.0 / rate
             )
             
         except Exception as e:
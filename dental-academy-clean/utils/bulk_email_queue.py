@@ -0,0 +1,670 @@
+"""
+Bulk Email Queue - persistent background delivery of email campaigns
+
+Массовая рассылка не отправляется внутри HTTP запроса. Запрос создает
+CommunicationCampaign и по строке CommunicationHistory (status='queued') на
+каждого получателя, после чего фоновый диспетчер:
+
+- забирает получателей порциями (status='sending', claimed_at; в PostgreSQL
+  с FOR UPDATE SKIP LOCKED, поэтому несколько процессов не отправят письмо дважды);
+- отправляет пул потоков, соблюдая лимит провайдера через token bucket
+  (один токен на API запрос) и batch API провайдера, если он есть;
+- записывает результаты одним bulk UPDATE и обновляет счетчики кампании.
+
+После падения процесса получатели, зависшие в 'sending' дольше lease,
+возвращаются в очередь (`flask resume-email-campaigns` или кнопка resume).
+
+Доставка at-least-once: если процесс упал после ответа провайдера, но до
+bulk UPDATE, письмо будет отправлено повторно после истечения lease. Чтобы
+провайдер отбросил такой дубль, каждое письмо несет idempotency key
+(campaign-<id>/recipient-<history_id>), который уходит в заголовке
+Idempotency-Key. Resend хранит ключи 24 часа; для batch API ключ считается
+по составу пакета, поэтому повтор пакета другого состава может дублировать
+письма - при недопустимости дублей ставьте BULK_EMAIL_BATCH_SIZE=1.
+Провайдер 'fake' ничего не отправляет и используется в тестах и при
+MAIL_SUPPRESS_SEND.
+"""
+
+import atexit
+import hashlib
+import logging
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import requests
+from flask import current_app
+from sqlalchemy import func, insert, update
+
+from extensions import db
+from models import CommunicationCampaign, CommunicationHistory
+from utils.email_templates import CompiledEmailTemplate, recipient_slot_values
+
+logger = logging.getLogger(__name__)
+
+# Статусы получателя (CommunicationHistory.status)
+STATUS_QUEUED = 'queued'
+STATUS_SENDING = 'sending'
+STATUS_SENT = 'sent'
+STATUS_FAILED = 'failed'
+
+# Статусы кампании, которые диспетчер доводит до конца
+ACTIVE_CAMPAIGN_STATUSES = ('queued', 'sending')
+
+RESEND_API_URL = 'https://api.resend.com'
+
+
+# ----------------------------------------------------------------------
+# Rate limiting
+# ----------------------------------------------------------------------
+
+class TokenBucket:
+    """Token bucket: rate токенов в секунду, запас до capacity"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1.0, rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        if now > self._updated:
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+    def try_acquire(self, tokens: float = 1.0) -> float:
+        """Взять токены; возвращает 0 при успехе, иначе сколько секунд подождать"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    def acquire(self, tokens: float = 1.0):
+        """Блокироваться ровно до появления токенов"""
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        """Провайдер вернул 429 - не выдавать токены seconds секунд"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens = min(self._tokens, 0.0) - seconds * self.rate
+            self._updated = now
+
+
+# ----------------------------------------------------------------------
+# Providers
+# ----------------------------------------------------------------------
+
+@dataclass
+class OutgoingEmail:
+    """Письмо для провайдера (без ORM объектов - передается в рабочие потоки)"""
+    history_id: int
+    to_email: str
+    subject: str
+    html: str
+    from_email: str
+    attachments: Optional[List[Dict]] = None
+    idempotency_key: Optional[str] = None
+
+
+def idempotency_key(campaign_id: int, history_id: int) -> str:
+    """Ключ, стабильный между повторными попытками доставки одного получателя"""
+    return f'campaign-{campaign_id}/recipient-{history_id}'
+
+
+def batch_idempotency_key(emails: Sequence[OutgoingEmail]) -> Optional[str]:
+    """Ключ пакета: тот же набор получателей дает тот же ключ"""
+    keys = [email.idempotency_key for email in emails]
+    if not all(keys):
+        return None
+    return 'batch-' + hashlib.sha1('\n'.join(sorted(keys)).encode('utf-8')).hexdigest()
+
+
+@dataclass
+class SendResult:
+    ok: bool
+    external_id: Optional[str] = None
+    error: Optional[str] = None
+    retry_after: Optional[float] = None  # 429: письмо вернется в очередь без попытки
+
+
+class EmailProvider(ABC):
+    """Интерфейс провайдера: send() и, если max_batch_size > 1, send_batch()"""
+    name = 'base'
+    max_batch_size = 1
+
+    @abstractmethod
+    def send(self, email: OutgoingEmail) -> SendResult:
+        """Отправить одно письмо"""
+
+    def send_batch(self, emails: Sequence[OutgoingEmail]) -> List[SendResult]:
+        return [self.send(email) for email in emails]
+
+
+class ResendProvider(EmailProvider):
+    """Resend API: /emails и /emails/batch (до 100 писем, без вложений)"""
+    name = 'resend'
+    max_batch_size = 100
+
+    def __init__(self, api_key: str, timeout: float = 30):
+        self.api_key = api_key
+        self.timeout = timeout
+        self._session = requests.Session()
+        self._session.headers.update({
+            'Authorization': f'Bearer {api_key}',
+            'Content-Type': 'application/json'
+        })
+
+    @staticmethod
+    def _payload(email: OutgoingEmail) -> Dict:
+        payload = {
+            'from': email.from_email,
+            'to': [email.to_email],
+            'subject': email.subject,
+            'html': email.html,
+            'click_tracking': False,
+            'open_tracking': False
+        }
+        if email.attachments:
+            payload['attachments'] = [
+                {key: value for key, value in attachment.items() if key in ('filename', 'content', 'cid') and value}
+                for attachment in email.attachments
+            ]
+        return payload
+
+    @staticmethod
+    def _headers(key: Optional[str]) -> Optional[Dict]:
+        return {'Idempotency-Key': key} if key else None
+
+    @staticmethod
+    def _failure(response) -> SendResult:
+        if response.status_code == 429:
+            try:
+                retry_after = float(response.headers.get('Retry-After', 1))
+            except ValueError:
+                retry_after = 1.0
+            return SendResult(False, error='rate limited', retry_after=retry_after)
+        return SendResult(False, error=f'{response.status_code}: {response.text[:300]}')
+
+    def send(self, email: OutgoingEmail) -> SendResult:
+        try:
+            response = self._session.post(f'{RESEND_API_URL}/emails', json=self._payload(email),
+                                          headers=self._headers(email.idempotency_key), timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            return SendResult(False, error=str(e))
+        if response.status_code == 200:
+            return SendResult(True, external_id=response.json().get('id'))
+        return self._failure(response)
+
+    def send_batch(self, emails: Sequence[OutgoingEmail]) -> List[SendResult]:
+        try:
+            response = self._session.post(
+                f'{RESEND_API_URL}/emails/batch',
+                json=[self._payload(email) for email in emails],
+                headers=self._headers(batch_idempotency_key(emails)),
+                timeout=self.timeout
+            )
+        except requests.exceptions.RequestException as e:
+            return [SendResult(False, error=str(e)) for _ in emails]
+        if response.status_code != 200:
+            # Пакет принимается или отклоняется целиком
+            failure = self._failure(response)
+            return [failure for _ in emails]
+        data = response.json().get('data') or []
+        return [
+            SendResult(True, external_id=(data[index] or {}).get('id') if index < len(data) else None)
+            for index in range(len(emails))
+        ]
+
+
+class FakeEmailProvider(EmailProvider):
+    """
+    Локальный провайдер для тестов и MAIL_SUPPRESS_SEND: запоминает письма
+
+    Как и Resend, повтор с уже принятым idempotency key не отправляет письмо
+    второй раз, а возвращает исходный результат.
+    """
+    name = 'fake'
+
+    def __init__(self, max_batch_size: int = 100, fail_emails: Iterable[str] = (),
+                 rate_limit_every: int = 0):
+        self.max_batch_size = max_batch_size
+        self.fail_emails = {email.lower() for email in fail_emails}
+        self.rate_limit_every = rate_limit_every
+        self.sent: List[OutgoingEmail] = []
+        self.requests = 0
+        self.batch_sizes: List[int] = []
+        self._accepted: Dict[str, SendResult] = {}
+        self._lock = threading.Lock()
+
+    def _request(self, size: int) -> Optional[SendResult]:
+        with self._lock:
+            self.requests += 1
+            self.batch_sizes.append(size)
+            if self.rate_limit_every and self.requests % self.rate_limit_every == 0:
+                return SendResult(False, error='rate limited', retry_after=0.01)
+        return None
+
+    def _deliver(self, email: OutgoingEmail) -> SendResult:
+        if email.to_email.lower() in self.fail_emails:
+            return SendResult(False, error='rejected by fake provider')
+        with self._lock:
+            if email.idempotency_key in self._accepted:
+                return self._accepted[email.idempotency_key]
+            self.sent.append(email)
+            result = SendResult(True, external_id=f'fake-{len(self.sent)}')
+            if email.idempotency_key:
+                self._accepted[email.idempotency_key] = result
+            return result
+
+    def send(self, email: OutgoingEmail) -> SendResult:
+        return self._request(1) or self._deliver(email)
+
+    def send_batch(self, emails: Sequence[OutgoingEmail]) -> List[SendResult]:
+        limited = self._request(len(emails))
+        if limited:
+            return [limited for _ in emails]
+        return [self._deliver(email) for email in emails]
+
+
+def get_email_provider(app) -> EmailProvider:
+    """Провайдер по конфигурации: BULK_EMAIL_PROVIDER=resend|fake (MAIL_SUPPRESS_SEND -> fake)"""
+    name = app.config.get('BULK_EMAIL_PROVIDER') or os.environ.get('BULK_EMAIL_PROVIDER', 'resend')
+    if name == 'fake' or app.config.get('MAIL_SUPPRESS_SEND') or app.config.get('TESTING'):
+        return FakeEmailProvider()
+    api_key = app.config.get('RESEND_API_KEY')
+    if not api_key:
+        raise RuntimeError('RESEND_API_KEY not configured')
+    return ResendProvider(api_key)
+
+
+# ----------------------------------------------------------------------
+# Queue
+# ----------------------------------------------------------------------
+
+@dataclass
+class Recipient:
+    email: str
+    recipient_type: str = 'custom'  # user, contact, custom
+    recipient_id: int = 0
+    name: Optional[str] = None
+
+
+@dataclass
+class DeliveryStats:
+    """Результат одного прохода диспетчера по кампании"""
+    campaign_id: int
+    sent: int = 0
+    failed: int = 0
+    requeued: int = 0
+    requests: int = 0
+    seconds: float = 0.0
+    status: Optional[str] = None
+    errors: List[str] = field(default_factory=list)
+
+    def to_dict(self) -> Dict:
+        return {
+            'campaign_id': self.campaign_id,
+            'sent': self.sent,
+            'failed': self.failed,
+            'requeued': self.requeued,
+            'requests': self.requests,
+            'seconds': round(self.seconds, 2),
+            'status': self.status
+        }
+
+
+class BulkEmailQueue:
+    """Персистентная очередь массовых рассылок с пулом отправителей"""
+
+    def __init__(self, workers: int = 4, rate: float = 2.0, batch_size: int = 100,
+                 max_attempts: int = 3, lease_seconds: int = 300, enabled: bool = True):
+        self.workers = workers
+        self.rate = rate
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.enabled = enabled
+
+        self.bucket = TokenBucket(rate)
+        self.provider: Optional[EmailProvider] = None
+
+        self._app = None
+        self._running: Dict[int, threading.Thread] = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+        logger.info(f"Bulk email queue initialized: workers={workers}, rate={rate}/s, "
+                    f"batch_size={batch_size}, enabled={enabled}")
+
+    # ------------------------------------------------------------------
+    # Жизненный цикл
+    # ------------------------------------------------------------------
+
+    def init_app(self, app):
+        """Привязать очередь к приложению (в TESTING отправка синхронная)"""
+        self._app = app
+        if app.config.get('TESTING'):
+            self.enabled = False
+        app.extensions['bulk_email_queue'] = self
+        atexit.register(self._stopped.set)
+
+    def get_provider(self) -> EmailProvider:
+        if self.provider is None:
+            self.provider = get_email_provider(self._app or current_app)
+        return self.provider
+
+    # ------------------------------------------------------------------
+    # Постановка в очередь (поток запроса)
+    # ------------------------------------------------------------------
+
+    def create_campaign(self, subject: str, skeleton: str, recipients: Iterable[Recipient], sender,
+                        email_type: str = 'bulk', target_type: str = 'custom',
+                        attachments: Optional[List[Dict]] = None, name: Optional[str] = None,
+                        template_used: Optional[str] = None) -> CommunicationCampaign:
+        """
+        Сохранить кампанию и получателей (status='queued') одной транзакцией
+
+        Args:
+            skeleton: Скелет шаблона (CompiledEmailTemplate.skeleton) или готовый HTML
+            recipients: Получатели; дубликаты email отбрасываются
+            sender: Пользователь-отправитель (current_user)
+        """
+        unique = {}
+        for recipient in recipients:
+            email = (recipient.email or '').strip()
+            if email and email.lower() not in unique:
+                recipient.email = email
+                unique[email.lower()] = recipient
+
+        now = datetime.utcnow()
+        campaign = CommunicationCampaign(
+            name=name or f'{subject[:200]} ({now:%Y-%m-%d %H:%M})',
+            email_type=email_type,
+            subject=subject,
+            message=skeleton,
+            target_type=target_type,
+            status='queued',
+            total_recipients=len(unique),
+            sent_count=0,
+            failed_count=0,
+            attachments=attachments,
+            created_by=sender.id
+        )
+        db.session.add(campaign)
+        db.session.flush()
+
+        sender_name = getattr(sender, 'username', None) or getattr(sender, 'email', None)
+        db.session.execute(insert(CommunicationHistory), [
+            {
+                'campaign_id': campaign.id,
+                'recipient_type': recipient.recipient_type,
+                'recipient_id': recipient.recipient_id or 0,
+                'recipient_email': recipient.email,
+                'recipient_name': recipient.name,
+                'sender_id': sender.id,
+                'sender_name': sender_name,
+                'subject': subject,
+                'message': '',  # Скелет HTML хранится один раз в кампании
+                'email_type': email_type,
+                'template_used': template_used,
+                'status': STATUS_QUEUED,
+                'attempts': 0,
+                'sent_at': None
+            }
+            for recipient in unique.values()
+        ])
+        db.session.commit()
+        logger.info(f"Campaign {campaign.id} queued for {len(unique)} recipients")
+        return campaign
+
+    def start(self, campaign_id: int) -> bool:
+        """
+        Запустить доставку в фоне (в TESTING / без приложения - синхронно)
+
+        Returns:
+            False если кампания уже доставляется этим процессом
+        """
+        if not self.enabled or self._app is None:
+            self.run_campaign(campaign_id)
+            return True
+
+        with self._lock:
+            thread = self._running.get(campaign_id)
+            if thread is not None and thread.is_alive():
+                return False
+            thread = threading.Thread(
+                target=self._run_in_app, args=(campaign_id,),
+                name=f'bulk-email-{campaign_id}', daemon=True
+            )
+            self._running[campaign_id] = thread
+            thread.start()
+        return True
+
+    def _run_in_app(self, campaign_id: int):
+        with self._app.app_context():
+            try:
+                self.run_campaign(campaign_id)
+            except Exception as e:
+                logger.error(f"Campaign {campaign_id} delivery crashed: {e}", exc_info=True)
+                db.session.rollback()
+            finally:
+                db.session.remove()
+                with self._lock:
+                    self._running.pop(campaign_id, None)
+
+    # ------------------------------------------------------------------
+    # Диспетчер
+    # ------------------------------------------------------------------
+
+    def release_stale(self, campaign_id: Optional[int] = None) -> int:
+        """Вернуть в очередь получателей, зависших в 'sending' (процесс упал)"""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.lease_seconds)
+        statement = update(CommunicationHistory).where(
+            CommunicationHistory.status == STATUS_SENDING,
+            CommunicationHistory.claimed_at < cutoff
+        )
+        if campaign_id is not None:
+            statement = statement.where(CommunicationHistory.campaign_id == campaign_id)
+        released = db.session.execute(
+            statement.values(status=STATUS_QUEUED, claimed_at=None)
+        ).rowcount or 0
+        db.session.commit()
+        if released:
+            logger.warning(f"Released {released} stale bulk email deliveries")
+        return released
+
+    def _claim(self, campaign_id: int, limit: int) -> List[CommunicationHistory]:
+        rows = CommunicationHistory.query.filter_by(
+            campaign_id=campaign_id, status=STATUS_QUEUED
+        ).order_by(CommunicationHistory.id).limit(limit).with_for_update(skip_locked=True).all()
+        now = datetime.utcnow()
+        for row in rows:
+            row.status = STATUS_SENDING
+            row.claimed_at = now
+        db.session.commit()
+        return rows
+
+    def _chunks(self, emails: List[OutgoingEmail], provider: EmailProvider) -> List[List[OutgoingEmail]]:
+        # Batch API не принимает вложения - такие письма уходят по одному
+        size = 1 if any(email.attachments for email in emails) else max(1, min(self.batch_size, provider.max_batch_size))
+        return [emails[start:start + size] for start in range(0, len(emails), size)]
+
+    def _deliver(self, provider: EmailProvider, chunk: List[OutgoingEmail]) -> List[SendResult]:
+        """Рабочий поток: один токен на API запрос, без доступа к БД"""
+        self.bucket.acquire()
+        try:
+            results = provider.send_batch(chunk) if len(chunk) > 1 else [provider.send(chunk[0])]
+        except Exception as e:
+            results = [SendResult(False, error=str(e)) for _ in chunk]
+        retry_after = max((result.retry_after or 0 for result in results), default=0)
+        if retry_after:
+            self.bucket.pause(retry_after)
+        return results
+
+    def run_campaign(self, campaign_id: int, provider: Optional[EmailProvider] = None) -> DeliveryStats:
+        """Доставить всех ожидающих получателей кампании (возобновляемо)"""
+        stats = DeliveryStats(campaign_id)
+        campaign = db.session.get(CommunicationCampaign, campaign_id)
+        if campaign is None or campaign.status not in ACTIVE_CAMPAIGN_STATUSES:
+            stats.status = campaign.status if campaign else None
+            return stats
+
+        provider = provider or self.get_provider()
+        from_email = current_app.config.get('RESEND_FROM_EMAIL', 'Mentora <info@bigmentor.nl>')
+        template = CompiledEmailTemplate(campaign.message)
+        subject, attachments = campaign.subject, campaign.attachments
+        campaign.status = 'sending'
+        campaign.started_at = campaign.started_at or datetime.utcnow()
+        db.session.commit()
+        self.release_stale(campaign_id)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f'bulk-email-{campaign_id}') as pool:
+            while not self._stopped.is_set():
+                rows = self._claim(campaign_id, self.workers * self.batch_size)
+                if not rows:
+                    break
+                attempts = {row.id: (row.attempts or 0) for row in rows}
+                emails = [
+                    OutgoingEmail(row.id, row.recipient_email, subject,
+                                  template.render(recipient_slot_values(row.recipient_name)),
+                                  from_email, attachments, idempotency_key(campaign_id, row.id))
+                    for row in rows
+                ]
+                chunks = self._chunks(emails, provider)
+                stats.requests += len(chunks)
+
+                updates = []
+                sent = failed = 0
+                for chunk, results in zip(chunks, pool.map(lambda chunk: self._deliver(provider, chunk), chunks)):
+                    for email, result in zip(chunk, results):
+                        if result.ok:
+                            sent += 1
+                            updates.append({'id': email.history_id, 'status': STATUS_SENT,
+                                            'external_id': result.external_id, 'sent_at': datetime.utcnow(),
+                                            'attempts': attempts[email.history_id] + 1})
+                        elif result.retry_after:
+                            stats.requeued += 1
+                            updates.append({'id': email.history_id, 'status': STATUS_QUEUED, 'claimed_at': None})
+                        elif attempts[email.history_id] + 1 < self.max_attempts:
+                            stats.requeued += 1
+                            updates.append({'id': email.history_id, 'status': STATUS_QUEUED, 'claimed_at': None,
+                                            'attempts': attempts[email.history_id] + 1,
+                                            'extra_data': {'error': result.error}})
+                        else:
+                            failed += 1
+                            if len(stats.errors) < 10:
+                                stats.errors.append(f'{email.to_email}: {result.error}')
+                            updates.append({'id': email.history_id, 'status': STATUS_FAILED,
+                                            'attempts': attempts[email.history_id] + 1,
+                                            'extra_data': {'error': result.error}})
+
+                db.session.execute(update(CommunicationHistory), updates)
+                campaign = db.session.get(CommunicationCampaign, campaign_id)
+                campaign.sent_count = (campaign.sent_count or 0) + sent
+                campaign.failed_count = (campaign.failed_count or 0) + failed
+                db.session.commit()
+                stats.sent += sent
+                stats.failed += failed
+
+                if campaign.status not in ACTIVE_CAMPAIGN_STATUSES:
+                    break  # Кампания остановлена администратором
+
+        stats.seconds = time.perf_counter() - started
+        campaign = db.session.get(CommunicationCampaign, campaign_id)
+        if campaign.status in ACTIVE_CAMPAIGN_STATUSES and not self._pending(campaign_id):
+            campaign.status = 'completed' if campaign.sent_count else 'failed'
+            campaign.completed_at = datetime.utcnow()
+            db.session.commit()
+        stats.status = campaign.status
+        logger.info(f"Campaign {campaign_id}: {stats.sent} sent, {stats.failed} failed, "
+                    f"{stats.requeued} requeued in {stats.requests} requests ({stats.seconds:.1f}s)")
+        return stats
+
+    def _pending(self, campaign_id: int) -> int:
+        return CommunicationHistory.query.filter(
+            CommunicationHistory.campaign_id == campaign_id,
+            CommunicationHistory.status.in_((STATUS_QUEUED, STATUS_SENDING))
+        ).count()
+
+    def resume_pending(self) -> List[DeliveryStats]:
+        """Довести до конца все незавершенные кампании (после рестарта)"""
+        self.release_stale()
+        campaign_ids = [row[0] for row in db.session.query(CommunicationCampaign.id).filter(
+            CommunicationCampaign.status.in_(ACTIVE_CAMPAIGN_STATUSES)
+        ).order_by(CommunicationCampaign.id).all()]
+        return [self.run_campaign(campaign_id) for campaign_id in campaign_ids]
+
+    # ------------------------------------------------------------------
+    # Прогресс
+    # ------------------------------------------------------------------
+
+    def progress(self, campaign_id: int) -> Optional[Dict]:
+        """Живые счетчики кампании (один GROUP BY по получателям)"""
+        campaign = db.session.get(CommunicationCampaign, campaign_id, populate_existing=True)
+        if campaign is None:
+            return None
+        counts = dict(db.session.query(
+            CommunicationHistory.status, func.count(CommunicationHistory.id)
+        ).filter(CommunicationHistory.campaign_id == campaign_id).group_by(CommunicationHistory.status).all())
+        total = campaign.total_recipients or sum(counts.values())
+        done = counts.get(STATUS_SENT, 0) + counts.get(STATUS_FAILED, 0)
+        with self._lock:
+            thread = self._running.get(campaign_id)
+            running = thread is not None and thread.is_alive()
+        return {
+            'campaign_id': campaign_id,
+            'status': campaign.status,
+            'total': total,
+            'queued': counts.get(STATUS_QUEUED, 0),
+            'sending': counts.get(STATUS_SENDING, 0),
+            'sent': counts.get(STATUS_SENT, 0),
+            'failed': counts.get(STATUS_FAILED, 0),
+            'percent': round(done / total * 100, 1) if total else 100.0,
+            'running_here': running,
+            'started_at': campaign.started_at.isoformat() if campaign.started_at else None,
+            'completed_at': campaign.completed_at.isoformat() if campaign.completed_at else None
+        }
+
+
+# Глобальный экземпляр очереди
+bulk_email_queue = BulkEmailQueue(
+    workers=int(os.environ.get('BULK_EMAIL_WORKERS', 4)),
+    rate=float(os.environ.get('BULK_EMAIL_RATE', 2.0)),
+    batch_size=int(os.environ.get('BULK_EMAIL_BATCH_SIZE', 100)),
+    max_attempts=int(os.environ.get('BULK_EMAIL_MAX_ATTEMPTS', 3)),
+    enabled=os.environ.get('BULK_EMAIL_QUEUE_ENABLED', 'true').lower() == 'true'
+)
+
+
+def init_bulk_email_queue(app):
+    """Подключить очередь массовых рассылок к приложению"""
+    bulk_email_queue.init_app(app)
+    return bulk_email_queue
+
+
+def enqueue_bulk_email(subject: str, skeleton: str, recipients: Iterable[Recipient], sender, **kwargs) -> CommunicationCampaign:
+    """Создать кампанию и запустить фоновую доставку"""
+    campaign = bulk_email_queue.create_campaign(subject, skeleton, recipients, sender, **kwargs)
+    bulk_email_queue.start(campaign.id)
+    return campaign
+
+
+def get_campaign_progress(campaign_id: int) -> Optional[Dict]:
+    """Счетчики доставки кампании"""
+    return bulk_email_queue.progress(campaign_id)
@@ -4,6 +4,10 @@ Cache Manager for IRT System
 """
 
 import logging
+import os
+from abc import ABC, abstractmethod
+import sqlite3
+import tempfile
 import time
 import json
 import hashlib
@@ -24,6 +28,9 @@ from extensions import db
 
 logger = logging.getLogger(__name__)
 
+# Время последнего доступа в SQLiteCacheBackend пишется пачками не чаще раза в N секунд
+ACCESS_FLUSH_SECONDS = float(os.environ.get('IRT_CACHE_ACCESS_FLUSH_SECONDS', 5))
+
 
 class CacheLevel(Enum):
     """Уровни кэширования"""
@@ -53,6 +60,7 @@ class LRUCache:
         self.cache: OrderedDict[str, CacheEntry] = OrderedDict()
         self.lock = threading.RLock()
         self.total_memory = 0
+        self.evictions = 0
         
         logger.info(f"LRU Cache initialized: max_size={max_size}, max_memory={max_memory_mb}MB")
     
@@ -179,6 +187,7 @@ class LRUCache:
                 'total_memory_mb': total_memory_mb,
                 'max_size': self.max_size,
                 'max_memory_mb': self.max_memory_bytes / 1024 / 1024,
+                'evictions': self.evictions,
                 'popular_entries': [
                     {
                         'key': entry.key,
@@ -215,163 +224,555 @@ class LRUCache:
             # Удаляем самую старую запись (LRU)
             oldest_key = next(iter(self.cache))
             self._remove_entry(oldest_key)
+            self.evictions += 1
+
+
+@dataclass
+class NamespaceStats:
+    """Счетчики кэша для одного пространства имен"""
+    hits: int = 0
+    misses: int = 0
+    sets: int = 0
+    evictions: int = 0
+    invalidations: int = 0
+    
+    def to_dict(self) -> Dict:
+        lookups = self.hits + self.misses
+        data = asdict(self)
+        data['hit_rate'] = round(self.hits / lookups, 3) if lookups else 0.0
+        return data
+
+
+class CacheBackend(ABC):
+    """
+    Базовый класс хранилища кэша
+    
+    Значения - простые JSON-совместимые снимки строк (dict/list/int), а не ORM объекты,
+    поэтому их можно хранить вне процесса и безопасно отдавать в любой session.
+    """
+    
+    name = 'base'
+    
+    def __init__(self):
+        self.stats: Dict[str, NamespaceStats] = {}
+        self.stats_lock = threading.Lock()
+    
+    def _count(self, namespace: str, field_name: str, amount: int = 1):
+        with self.stats_lock:
+            stats = self.stats.setdefault(namespace, NamespaceStats())
+            setattr(stats, field_name, getattr(stats, field_name) + amount)
+    
+    @abstractmethod
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        """Значение или None (промах / истек TTL)"""
+    
+    @abstractmethod
+    def set(self, namespace: str, key: str, value: Any, ttl_seconds: int = 3600) -> bool:
+        """Сохранить значение на ttl_seconds"""
+    
+    @abstractmethod
+    def delete(self, namespace: str, key: str) -> bool:
+        """Удалить ключ; True если он был"""
+    
+    @abstractmethod
+    def delete_prefix(self, namespace: str, prefix: str) -> int:
+        """Удалить ключи с префиксом; количество удаленных"""
+    
+    @abstractmethod
+    def clear(self, namespace: Optional[str] = None):
+        """Очистить пространство имен (None - все)"""
+    
+    def get_namespace_stats(self) -> Dict[str, Dict]:
+        with self.stats_lock:
+            return {namespace: stats.to_dict() for namespace, stats in self.stats.items()}
+    
+    def get_stats(self) -> Dict:
+        return {'backend': self.name, 'namespaces': self.get_namespace_stats()}
+
+
+class InvalidationLog:
+    """
+    Журнал инвалидаций в общем SQLite файле
+    
+    Каждый воркер записывает инвалидации в журнал и периодически применяет
+    чужие записи к своему локальному кэшу.
+    """
+    
+    def __init__(self, path: str, poll_interval_seconds: float = 1.0, retention_seconds: int = 3600):
+        self.path = path
+        self.poll_interval_seconds = poll_interval_seconds
+        self.retention_seconds = retention_seconds
+        self.local = threading.local()
+        self.last_seen_id = 0
+        self.last_poll = 0.0
+        self.lock = threading.Lock()
+        
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_invalidations ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, namespace TEXT NOT NULL, "
+                "prefix TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            row = conn.execute("SELECT COALESCE(MAX(id), 0) FROM cache_invalidations").fetchone()
+            self.last_seen_id = row[0]
+    
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self.local.conn = conn
+        return conn
+    
+    def publish(self, namespace: str, prefix: str):
+        """Записать инвалидацию (prefix == полный ключ для одиночного удаления)"""
+        now = time.time()
+        conn = self._connect()
+        cursor = conn.execute(
+            "INSERT INTO cache_invalidations (namespace, prefix, created_at) VALUES (?, ?, ?)",
+            (namespace, prefix, now)
+        )
+        conn.execute("DELETE FROM cache_invalidations WHERE created_at < ?", (now - self.retention_seconds,))
+        with self.lock:
+            # Собственные инвалидации уже применены локально
+            self.last_seen_id = max(self.last_seen_id, cursor.lastrowid)
+    
+    def poll(self) -> List[Tuple[str, str]]:
+        """Получить новые инвалидации других воркеров (не чаще poll_interval_seconds)"""
+        now = time.monotonic()
+        with self.lock:
+            if now - self.last_poll < self.poll_interval_seconds:
+                return []
+            self.last_poll = now
+            last_seen_id = self.last_seen_id
+        
+        rows = self._connect().execute(
+            "SELECT id, namespace, prefix FROM cache_invalidations WHERE id > ? ORDER BY id",
+            (last_seen_id,)
+        ).fetchall()
+        if not rows:
+            return []
+        
+        with self.lock:
+            self.last_seen_id = max(self.last_seen_id, rows[-1][0])
+        return [(namespace, prefix) for _, namespace, prefix in rows]
+
+
+class LocalCacheBackend(CacheBackend):
+    """In-process LRU по пространствам имен с опциональной межпроцессной инвалидацией"""
+    
+    name = 'local'
+    
+    def __init__(self, limits: Optional[Dict[str, Tuple[int, int]]] = None,
+                 invalidation_log: Optional[InvalidationLog] = None):
+        super().__init__()
+        self.limits = limits or {}
+        self.caches: Dict[str, LRUCache] = {}
+        self.caches_lock = threading.Lock()
+        self.invalidation_log = invalidation_log
+    
+    def _cache(self, namespace: str) -> LRUCache:
+        cache = self.caches.get(namespace)
+        if cache is None:
+            with self.caches_lock:
+                cache = self.caches.get(namespace)
+                if cache is None:
+                    max_size, max_memory_mb = self.limits.get(namespace, (1000, 50))
+                    cache = LRUCache(max_size=max_size, max_memory_mb=max_memory_mb)
+                    self.caches[namespace] = cache
+        return cache
+    
+    def _apply_remote_invalidations(self):
+        if not self.invalidation_log:
+            return
+        try:
+            for namespace, prefix in self.invalidation_log.poll():
+                self._delete_prefix_local(namespace, prefix)
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to poll cache invalidations: {e}")
+    
+    def _publish(self, namespace: str, prefix: str):
+        if not self.invalidation_log:
+            return
+        try:
+            self.invalidation_log.publish(namespace, prefix)
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to publish cache invalidation: {e}")
+    
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        self._apply_remote_invalidations()
+        value = self._cache(namespace).get(key)
+        self._count(namespace, 'hits' if value is not None else 'misses')
+        return value
+    
+    def set(self, namespace: str, key: str, value: Any, ttl_seconds: int = 3600) -> bool:
+        cache = self._cache(namespace)
+        evictions_before = cache.evictions
+        result = cache.set(key, value, ttl_seconds=ttl_seconds)
+        self._count(namespace, 'sets')
+        if cache.evictions > evictions_before:
+            self._count(namespace, 'evictions', cache.evictions - evictions_before)
+        return result
+    
+    def delete(self, namespace: str, key: str) -> bool:
+        deleted = self._cache(namespace).delete(key)
+        self._count(namespace, 'invalidations')
+        self._publish(namespace, key)
+        return deleted
+    
+    def _delete_prefix_local(self, namespace: str, prefix: str) -> int:
+        cache = self._cache(namespace)
+        with cache.lock:
+            keys = [key for key in cache.cache.keys() if key.startswith(prefix)]
+            for key in keys:
+                cache.delete(key)
+        return len(keys)
+    
+    def delete_prefix(self, namespace: str, prefix: str) -> int:
+        deleted = self._delete_prefix_local(namespace, prefix)
+        self._count(namespace, 'invalidations')
+        self._publish(namespace, prefix)
+        return deleted
+    
+    def clear(self, namespace: Optional[str] = None):
+        namespaces = [namespace] if namespace else list(self.caches)
+        for name in namespaces:
+            self._cache(name).clear()
+            self._publish(name, '')
+    
+    def get_stats(self) -> Dict:
+        stats = super().get_stats()
+        stats['caches'] = {namespace: cache.get_stats() for namespace, cache in self.caches.items()}
+        stats['cross_worker_invalidation'] = self.invalidation_log is not None
+        return stats
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """
+    Общее для всех воркеров хранилище в SQLite файле
+    
+    Локальная замена внешнего кэша (Redis/Memcached): все gunicorn воркеры видят
+    одни и те же записи, поэтому прогрев и инвалидация общие.
+    
+    Чтение не пишет в базу: время доступа (для вытеснения LRU) копится в
+    памяти и записывается одним executemany раз в access_flush_seconds или
+    перед вытеснением.
+    """
+    
+    name = 'sqlite'
+    
+    def __init__(self, path: str, max_entries_per_namespace: int = 5000,
+                 access_flush_seconds: float = ACCESS_FLUSH_SECONDS):
+        super().__init__()
+        self.path = path
+        self.max_entries_per_namespace = max_entries_per_namespace
+        self.access_flush_seconds = access_flush_seconds
+        self.local = threading.local()
+        self._pending_access: Dict[Tuple[str, str], float] = {}
+        self._access_lock = threading.Lock()
+        self._access_flushed_at = time.monotonic()
+        
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache_entries ("
+            "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+            "expires_at REAL NOT NULL, last_access REAL NOT NULL, "
+            "PRIMARY KEY (namespace, key))"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_cache_entries_access ON cache_entries (namespace, last_access)"
+        )
+    
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+    
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        now = time.time()
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT value, expires_at FROM cache_entries WHERE namespace = ? AND key = ?",
+            (namespace, key)
+        ).fetchone()
+        
+        if row is None or row[1] < now:
+            if row is not None:
+                conn.execute("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (namespace, key))
+            self._count(namespace, 'misses')
+            return None
+        
+        self._touch(namespace, key, now)
+        self._count(namespace, 'hits')
+        return json.loads(row[0])
+    
+    def _touch(self, namespace: str, key: str, now: float):
+        with self._access_lock:
+            self._pending_access[(namespace, key)] = now
+            if time.monotonic() - self._access_flushed_at < self.access_flush_seconds:
+                return
+        self.flush_access_times()
+    
+    def flush_access_times(self) -> int:
+        """Записать накопленные времена доступа одним executemany"""
+        with self._access_lock:
+            pending, self._pending_access = self._pending_access, {}
+            self._access_flushed_at = time.monotonic()
+        if pending:
+            self._connect().executemany(
+                "UPDATE cache_entries SET last_access = ? WHERE namespace = ? AND key = ?",
+                [(accessed_at, namespace, key) for (namespace, key), accessed_at in pending.items()]
+            )
+        return len(pending)
+    
+    def set(self, namespace: str, key: str, value: Any, ttl_seconds: int = 3600) -> bool:
+        now = time.time()
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache_entries (namespace, key, value, expires_at, last_access) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (namespace, key, json.dumps(value, default=str), now + ttl_seconds, now)
+        )
+        self._count(namespace, 'sets')
+        
+        count = conn.execute("SELECT COUNT(*) FROM cache_entries WHERE namespace = ?", (namespace,)).fetchone()[0]
+        overflow = count - self.max_entries_per_namespace
+        if overflow > 0:
+            self.flush_access_times()
+            conn.execute(
+                "DELETE FROM cache_entries WHERE rowid IN ("
+                "SELECT rowid FROM cache_entries WHERE namespace = ? ORDER BY last_access LIMIT ?)",
+                (namespace, overflow)
+            )
+            self._count(namespace, 'evictions', overflow)
+        return True
+    
+    def delete(self, namespace: str, key: str) -> bool:
+        cursor = self._connect().execute(
+            "DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (namespace, key)
+        )
+        self._count(namespace, 'invalidations')
+        return cursor.rowcount > 0
+    
+    def delete_prefix(self, namespace: str, prefix: str) -> int:
+        escaped = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        cursor = self._connect().execute(
+            "DELETE FROM cache_entries WHERE namespace = ? AND key LIKE ? ESCAPE '\\'",
+            (namespace, escaped + '%')
+        )
+        self._count(namespace, 'invalidations')
+        return cursor.rowcount
+    
+    def clear(self, namespace: Optional[str] = None):
+        conn = self._connect()
+        if namespace:
+            conn.execute("DELETE FROM cache_entries WHERE namespace = ?", (namespace,))
+        else:
+            conn.execute("DELETE FROM cache_entries")
+    
+    def get_stats(self) -> Dict:
+        stats = super().get_stats()
+        rows = self._connect().execute(
+            "SELECT namespace, COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM cache_entries GROUP BY namespace"
+        ).fetchall()
+        stats['entries'] = {namespace: {'count': count, 'bytes': size} for namespace, count, size in rows}
+        stats['path'] = self.path
+        return stats
+
+
+# Лимиты (max_size, max_memory_mb) локального кэша по пространствам имен
+NAMESPACE_LIMITS = {
+    'general': (2000, 200),
+    'questions': (500, 50),
+    'irt_params': (1000, 50),
+    'sessions': (300, 30),
+    'plans': (200, 20),
+    'user_stats': (5000, 50),  # utils.unified_stats
+}
+
+
+def create_cache_backend() -> CacheBackend:
+    """
+    Создать хранилище кэша по переменным окружения
+    
+    IRT_CACHE_BACKEND: 'local' (по умолчанию) или 'sqlite'
+    IRT_CACHE_PATH: путь к SQLite файлу для 'sqlite'
+    IRT_CACHE_INVALIDATION_PATH: путь к журналу инвалидаций для 'local' (несколько воркеров)
+    """
+    backend_name = os.environ.get('IRT_CACHE_BACKEND', 'local').lower()
+    
+    try:
+        if backend_name == 'sqlite':
+            path = os.environ.get('IRT_CACHE_PATH') or os.path.join(tempfile.gettempdir(), 'mentora_irt_cache.sqlite3')
+            return SQLiteCacheBackend(path)
+        
+        invalidation_path = os.environ.get('IRT_CACHE_INVALIDATION_PATH')
+        invalidation_log = InvalidationLog(invalidation_path) if invalidation_path else None
+        return LocalCacheBackend(NAMESPACE_LIMITS, invalidation_log=invalidation_log)
+    except sqlite3.Error as e:
+        logger.error(f"Failed to initialize {backend_name} cache backend, falling back to local: {e}")
+        return LocalCacheBackend(NAMESPACE_LIMITS)
+
+
+def question_snapshot(question: Question) -> Dict:
+    """Снимок строки вопроса вместе с IRT параметрами и кодом домена"""
+    irt_params = question.irt_parameters
+    return {
+        'id': question.id,
+        'text': question.text,
+        'options': question.options,
+        'correct_answer_index': question.correct_answer_index,
+        'correct_answer_text': question.correct_answer_text,
+        'explanation': question.explanation,
+        'category': question.category,
+        'domain': question.domain,
+        'difficulty_level': question.difficulty_level,
+        'image_url': question.image_url,
+        'question_type': question.question_type,
+        'profession': question.profession,
+        'big_domain_id': question.big_domain_id,
+        'big_domain_code': question.big_domain.code if question.big_domain else None,
+        'irt_parameters': irt_parameters_snapshot(irt_params) if irt_params else None,
+    }
+
+
+def irt_parameters_snapshot(params: IRTParameters) -> Dict:
+    """Снимок строки IRT параметров"""
+    return {
+        'id': params.id,
+        'question_id': params.question_id,
+        'difficulty': params.difficulty,
+        'discrimination': params.discrimination,
+        'guessing': params.guessing,
+        'calibration_sample_size': params.calibration_sample_size,
+    }
 
 
 class IRTCacheManager:
-    """Менеджер кэширования для IRT системы"""
+    """
+    Менеджер кэширования для IRT системы
+    
+    В кэше хранятся только снимки строк и списки ID. ORM объекты, которые
+    возвращают методы get_question/get_domain_questions/get_user_sessions/
+    get_learning_plan, загружаются в текущей session и никогда не кэшируются.
+    """
+    
+    NAMESPACES = ('general', 'questions', 'irt_params', 'sessions', 'plans')
     
-    def __init__(self, cache_level: CacheLevel = CacheLevel.BASIC):
+    def __init__(self, cache_level: CacheLevel = CacheLevel.BASIC, backend: Optional[CacheBackend] = None):
         self.cache_level = cache_level
-        self.lru_cache = LRUCache(max_size=2000, max_memory_mb=200)
+        self.backend = backend or create_cache_backend()
         
-        # Специализированные кэши
-        self.question_cache = LRUCache(max_size=500, max_memory_mb=50)
-        self.irt_params_cache = LRUCache(max_size=1000, max_memory_mb=50)
-        self.session_cache = LRUCache(max_size=300, max_memory_mb=30)
-        self.plan_cache = LRUCache(max_size=200, max_memory_mb=20)
-        
-        logger.info(f"IRT Cache Manager initialized with level: {cache_level.value}")
+        logger.info(f"IRT Cache Manager initialized with level: {cache_level.value}, backend: {self.backend.name}")
     
-    def get_question(self, question_id: int) -> Optional[Question]:
+    def get_question_snapshot(self, question_id: int) -> Optional[Dict]:
         """
-        Получить вопрос из кэша
+        Получить снимок вопроса (dict) из кэша
         
         Args:
             question_id: ID вопроса
             
         Returns:
-            Вопрос или None
+            Снимок вопроса или None
         """
-        if self.cache_level == CacheLevel.NONE:
-            return None
-        
         cache_key = f"question:{question_id}"
-        cached_question_id = self.question_cache.get(cache_key)
-        
-        if cached_question_id:
-            # Кэшируем только ID, загружаем объект заново
-            logger.debug(f"Cache hit for question {question_id}, reloading from database")
-            fresh_question = Question.query.options(
-                db.joinedload(Question.irt_parameters),
-                db.joinedload(Question.big_domain)
-            ).get(question_id)
-            
-            if fresh_question:
-                return fresh_question
-            else:
-                # Вопрос больше не существует, удаляем из кэша
-                self.question_cache.delete(cache_key)
+        if self.cache_level != CacheLevel.NONE:
+            snapshot = self.backend.get('questions', cache_key)
+            if snapshot is not None:
+                return snapshot
         
-        # Загружаем из базы данных
         question = Question.query.options(
             db.joinedload(Question.irt_parameters),
             db.joinedload(Question.big_domain)
         ).get(question_id)
+        if not question:
+            return None
         
-        if question:
-            # Кэшируем только ID
-            self.question_cache.set(cache_key, question_id, ttl_seconds=1800)  # 30 минут
-        
-        return question
+        snapshot = question_snapshot(question)
+        if self.cache_level != CacheLevel.NONE:
+            self.backend.set('questions', cache_key, snapshot, ttl_seconds=1800)  # 30 минут
+        return snapshot
     
-    def get_irt_parameters(self, question_id: int) -> Optional[IRTParameters]:
+    def get_question(self, question_id: int) -> Optional[Question]:
         """
-        Получить IRT параметры из кэша
+        Получить вопрос (ORM объект текущей session)
+        
+        ORM объекты не кэшируются, поэтому хранилище не читается: вопрос берется
+        из identity map текущей session или загружается одним запросом. Чтение
+        без обращения к БД при попадании - get_question_snapshot.
         
         Args:
             question_id: ID вопроса
             
         Returns:
-            IRT параметры или None
+            Вопрос или None
         """
         if self.cache_level == CacheLevel.NONE:
             return None
         
-        cache_key = f"irt_params:{question_id}"
-        cached_params_id = self.irt_params_cache.get(cache_key)
+        return db.session.get(Question, question_id, options=[
+            db.joinedload(Question.irt_parameters),
+            db.joinedload(Question.big_domain)
+        ])
+    
+    def get_irt_parameters(self, question_id: int) -> Optional[Dict]:
+        """
+        Получить снимок IRT параметров из кэша
         
-        if cached_params_id:
-            # Кэшируем только ID, загружаем объект заново
-            logger.debug(f"Cache hit for IRT params {question_id}, reloading from database")
-            fresh_params = IRTParameters.query.filter_by(question_id=question_id).first()
+        Args:
+            question_id: ID вопроса
             
-            if fresh_params:
-                return fresh_params
-            else:
-                # Параметры больше не существуют, удаляем из кэша
-                self.irt_params_cache.delete(cache_key)
+        Returns:
+            dict с id, question_id, difficulty, discrimination, guessing или None
+        """
+        if self.cache_level == CacheLevel.NONE:
+            return None
+        
+        cache_key = f"irt_params:{question_id}"
+        snapshot = self.backend.get('irt_params', cache_key)
+        if snapshot is not None:
+            return snapshot
         
-        # Загружаем из базы данных
         params = IRTParameters.query.filter_by(question_id=question_id).first()
-        if params:
-            # Кэшируем только ID
-            self.irt_params_cache.set(cache_key, params.id, ttl_seconds=3600)  # 1 час
+        if not params:
+            return None
         
-        return params
+        snapshot = irt_parameters_snapshot(params)
+        self.backend.set('irt_params', cache_key, snapshot, ttl_seconds=3600)  # 1 час
+        return snapshot
     
-    def get_domain_questions(self, domain_code: str, difficulty_range: Optional[Tuple[float, float]] = None) -> List[Question]:
+    def get_domain_question_ids(self, domain_code: str, difficulty_range: Optional[Tuple[float, float]] = None) -> List[int]:
         """
-        Получить вопросы домена из кэша
+        Получить ID вопросов домена из кэша
         
         Args:
             domain_code: Код домена
             difficulty_range: Диапазон сложности
             
         Returns:
-            Список вопросов
+            Список ID вопросов
         """
-        if self.cache_level == CacheLevel.NONE:
-            return []
-        
-        # Создаем ключ кэша
         if difficulty_range:
             min_diff, max_diff = difficulty_range
             cache_key = f"domain_questions:{domain_code}:{min_diff:.2f}-{max_diff:.2f}"
         else:
             cache_key = f"domain_questions:{domain_code}"
         
-        cached_question_ids = self.question_cache.get(cache_key)
+        if self.cache_level != CacheLevel.NONE:
+            cached_question_ids = self.backend.get('questions', cache_key)
+            if cached_question_ids is not None:
+                return cached_question_ids
         
-        if cached_question_ids:
-            # Кэшируем только ID, загружаем объекты заново
-            logger.info(f"Cache hit for domain {domain_code}, reloading {len(cached_question_ids)} questions from database")
-            
-            try:
-                # Загружаем свежие объекты из базы данных по ID
-                fresh_questions = Question.query.options(
-                    db.joinedload(Question.irt_parameters),
-                    db.joinedload(Question.big_domain)
-                ).filter(Question.id.in_(cached_question_ids)).all()
-                
-                logger.info(f"Successfully loaded {len(fresh_questions)} fresh questions from database")
-                
-                # Проверяем, что все вопросы загружены
-                if len(fresh_questions) != len(cached_question_ids):
-                    logger.warning(f"Some questions missing: expected {len(cached_question_ids)}, got {len(fresh_questions)}")
-                    # Обновляем кэш с актуальными ID
-                    actual_ids = [q.id for q in fresh_questions]
-                    self.question_cache.set(cache_key, actual_ids, ttl_seconds=900)
-                
-                return fresh_questions
-                
-            except Exception as e:
-                logger.error(f"Error reloading questions for domain {domain_code}: {e}")
-                logger.error(f"Error type: {type(e)}")
-                import traceback
-                logger.error(f"Full traceback: {traceback.format_exc()}")
-                # Очищаем поврежденный кэш
-                self.question_cache.delete(cache_key)
-                logger.info(f"Cleared damaged cache for domain {domain_code}")
-        
-        # Загружаем из базы данных напрямую (ИСПРАВЛЕНИЕ РЕКУРСИИ)
-        # from extensions import db  # Уже импортировано в начале файла
-        
-        # Прямой запрос к базе данных без использования IRTEngine
+        # Прямой запрос к базе данных без использования IRTEngine (ИСПРАВЛЕНИЕ РЕКУРСИИ)
         domain = BIGDomain.query.filter_by(code=domain_code).first()
         if not domain:
             return []
         
-        query = Question.query.filter_by(big_domain_id=domain.id)
+        query = db.session.query(Question.id).filter(Question.big_domain_id == domain.id)
         
         if difficulty_range:
             min_diff, max_diff = difficulty_range
@@ -380,19 +781,45 @@ class IRTCacheManager:
                 IRTParameters.difficulty <= max_diff
             )
         
-        questions = query.limit(100).all()
+        question_ids = [row[0] for row in query.limit(100).all()]
         
-        if questions:
-            # Кэшируем только ID вопросов
-            question_ids = [q.id for q in questions]
-            self.question_cache.set(cache_key, question_ids, ttl_seconds=900)  # 15 минут
+        if question_ids and self.cache_level != CacheLevel.NONE:
+            self.backend.set('questions', cache_key, question_ids, ttl_seconds=900)  # 15 минут
             logger.info(f"Cached {len(question_ids)} question IDs for domain {domain_code}")
         
-        return questions
+        return question_ids
+    
+    def get_domain_questions(self, domain_code: str, difficulty_range: Optional[Tuple[float, float]] = None) -> List[Question]:
+        """
+        Получить вопросы домена (ORM объекты текущей session)
+        
+        Args:
+            domain_code: Код домена
+            difficulty_range: Диапазон сложности
+            
+        Returns:
+            Список вопросов
+        """
+        if self.cache_level == CacheLevel.NONE:
+            return []
+        
+        question_ids = self.get_domain_question_ids(domain_code, difficulty_range)
+        if not question_ids:
+            return []
+        
+        try:
+            return Question.query.options(
+                db.joinedload(Question.irt_parameters),
+                db.joinedload(Question.big_domain)
+            ).filter(Question.id.in_(question_ids)).all()
+        except Exception as e:
+            logger.error(f"Error loading questions for domain {domain_code}: {e}")
+            self.invalidate_domain_cache(domain_code)
+            return []
     
     def get_user_sessions(self, user_id: int, status: str = None) -> List[DiagnosticSession]:
         """
-        Получить сессии пользователя из кэша
+        Получить сессии пользователя (ID из кэша, объекты из текущей session)
         
         Args:
             user_id: ID пользователя
@@ -405,26 +832,25 @@ class IRTCacheManager:
             return []
         
         cache_key = f"user_sessions:{user_id}:{status or 'all'}"
-        cached_sessions = self.session_cache.get(cache_key)
-        
-        if cached_sessions:
-            return cached_sessions
+        session_ids = self.backend.get('sessions', cache_key)
         
-        # Загружаем из базы данных
-        query = DiagnosticSession.query.filter(DiagnosticSession.user_id == user_id)
-        if status:
-            query = query.filter(DiagnosticSession.status == status)
+        if session_ids is None:
+            query = db.session.query(DiagnosticSession.id).filter(DiagnosticSession.user_id == user_id)
+            if status:
+                query = query.filter(DiagnosticSession.status == status)
+            session_ids = [row[0] for row in query.order_by(DiagnosticSession.started_at.desc()).limit(50).all()]
+            self.backend.set('sessions', cache_key, session_ids, ttl_seconds=300)  # 5 минут
         
-        sessions = query.order_by(DiagnosticSession.created_at.desc()).limit(50).all()
-        
-        if sessions:
-            self.session_cache.set(cache_key, sessions, ttl_seconds=300)  # 5 минут
+        if not session_ids:
+            return []
         
-        return sessions
+        sessions = DiagnosticSession.query.filter(DiagnosticSession.id.in_(session_ids)).all()
+        order = {session_id: position for position, session_id in enumerate(session_ids)}
+        return sorted(sessions, key=lambda s: order.get(s.id, len(order)))
     
     def get_learning_plan(self, user_id: int) -> Optional[PersonalLearningPlan]:
         """
-        Получить план обучения из кэша
+        Получить план обучения (ID из кэша, объект из текущей session)
         
         Args:
             user_id: ID пользователя
@@ -436,78 +862,65 @@ class IRTCacheManager:
             return None
         
         cache_key = f"learning_plan:{user_id}"
-        cached_plan = self.plan_cache.get(cache_key)
+        plan_id = self.backend.get('plans', cache_key)
         
-        if cached_plan:
-            return cached_plan
+        if plan_id is not None:
+            plan = PersonalLearningPlan.query.get(plan_id)
+            if plan:
+                return plan
+            self.backend.delete('plans', cache_key)
         
-        # Загружаем из базы данных
         plan = PersonalLearningPlan.query.filter_by(user_id=user_id).first()
         if plan:
-            self.plan_cache.set(cache_key, plan, ttl_seconds=600)  # 10 минут
+            self.backend.set('plans', cache_key, plan.id, ttl_seconds=600)  # 10 минут
         
         return plan
     
     def invalidate_question_cache(self, question_id: int):
-        """Инвалидировать кэш вопроса"""
-        cache_key = f"question:{question_id}"
-        self.question_cache.delete(cache_key)
+        """Инвалидировать кэш вопроса (во всех воркерах)"""
+        self.backend.delete('questions', f"question:{question_id}")
         
         # Инвалидируем связанные кэши
-        self.irt_params_cache.delete(f"irt_params:{question_id}")
+        self.backend.delete('irt_params', f"irt_params:{question_id}")
         
         logger.debug(f"Invalidated cache for question {question_id}")
     
     def invalidate_user_cache(self, user_id: int):
-        """Инвалидировать кэш пользователя"""
-        # Удаляем все кэши, связанные с пользователем
-        for cache in [self.session_cache, self.plan_cache]:
-            keys_to_delete = []
-            for key in cache.cache.keys():
-                if f":{user_id}:" in key or key.endswith(f":{user_id}"):
-                    keys_to_delete.append(key)
-            
-            for key in keys_to_delete:
-                cache.delete(key)
+        """Инвалидировать кэш пользователя (во всех воркерах)"""
+        self.backend.delete_prefix('sessions', f"user_sessions:{user_id}:")
+        self.backend.delete('plans', f"learning_plan:{user_id}")
         
         logger.debug(f"Invalidated cache for user {user_id}")
     
     def invalidate_domain_cache(self, domain_code: str):
-        """Инвалидировать кэш домена"""
-        keys_to_delete = []
-        for key in self.question_cache.cache.keys():
-            if key.startswith(f"domain_questions:{domain_code}"):
-                keys_to_delete.append(key)
-        
-        for key in keys_to_delete:
-            self.question_cache.delete(key)
+        """Инвалидировать кэш домена (во всех воркерах)"""
+        self.backend.delete('questions', f"domain_questions:{domain_code}")
+        self.backend.delete_prefix('questions', f"domain_questions:{domain_code}:")
         
         logger.debug(f"Invalidated cache for domain {domain_code}")
     
+    def clear_namespace(self, namespace: str):
+        """Очистить одно пространство имен"""
+        self.backend.clear(namespace)
+        logger.info(f"Cache namespace cleared: {namespace}")
+    
     def get_cache_stats(self) -> Dict:
         """
         Получить статистику всех кэшей
         
         Returns:
-            Объединенная статистика
+            Объединенная статистика со счетчиками hit/miss/eviction по пространствам имен
         """
         return {
             'cache_level': self.cache_level.value,
-            'general_cache': self.lru_cache.get_stats(),
-            'question_cache': self.question_cache.get_stats(),
-            'irt_params_cache': self.irt_params_cache.get_stats(),
-            'session_cache': self.session_cache.get_stats(),
-            'plan_cache': self.plan_cache.get_stats(),
+            'backend': self.backend.get_stats(),
+            'namespaces': self.backend.get_namespace_stats(),
             'timestamp': datetime.now(timezone.utc).isoformat()
         }
     
     def clear_all_caches(self):
         """Очистить все кэши"""
-        self.lru_cache.clear()
-        self.question_cache.clear()
-        self.irt_params_cache.clear()
-        self.session_cache.clear()
-        self.plan_cache.clear()
+        self.backend.clear()
         
         logger.info("All caches cleared")
 
@@ -521,8 +934,13 @@ def get_cached_question(question_id: int) -> Optional[Question]:
     return cache_manager.get_question(question_id)
 
 
-def get_cached_irt_parameters(question_id: int) -> Optional[IRTParameters]:
-    """Получить IRT параметры из кэша"""
+def get_cached_question_snapshot(question_id: int) -> Optional[Dict]:
+    """Получить снимок вопроса из кэша"""
+    return cache_manager.get_question_snapshot(question_id)
+
+
+def get_cached_irt_parameters(question_id: int) -> Optional[Dict]:
+    """Получить снимок IRT параметров из кэша"""
     return cache_manager.get_irt_parameters(question_id)
 
 
@@ -536,6 +954,11 @@ def invalidate_question_cache(question_id: int):
     cache_manager.invalidate_question_cache(question_id)
 
 
+def invalidate_domain_cache(domain_code: str):
+    """Инвалидировать кэш домена"""
+    cache_manager.invalidate_domain_cache(domain_code)
+
+
 def invalidate_user_cache(user_id: int):
     """Инвалидировать кэш пользователя"""
     cache_manager.invalidate_user_cache(user_id)
@@ -543,4 +966,4 @@ def invalidate_user_cache(user_id: int):
 
 def get_cache_stats() -> Dict:
     """Получить статистику кэширования"""
-    return cache_manager.get_cache_stats() 
\ No newline at end of file
+    return cache_manager.get_cache_stats()
@@ -29,8 +29,9 @@ class CalendarPlanIntegration:
             Словарь с детальным планом
         """
         try:
-            # Генерируем план через DailyLearningAlgorithm
-            plan_result = self.algorithm.generate_daily_plan(user_id, target_minutes)
+            # План из снимка (DailyLearningAlgorithm пересчитывает его только при изменениях)
+            from utils.daily_plan_snapshots import get_daily_plan
+            plan_result = get_daily_plan(user_id, target_minutes)
             
             if not plan_result.get('success'):
                 return {
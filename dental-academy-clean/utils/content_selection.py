@@ -0,0 +1,397 @@
+"""
+Content Selection Engine
+Выбор теории и практики для ежедневного плана без запросов на каждый урок/вопрос
+
+- ContentDifficultyIndex: общий для процесса индекс по доменам - массивы
+  (question_id, IRT difficulty, difficulty_level) и (lesson_id, relevance,
+  difficulty) плюс короткие данные для отображения. Строится двумя-тремя
+  запросами и обновляется по TTL.
+- UserSelectionContext: пройденные уроки, недавние повторения SR и
+  способность пользователя - загружаются один раз на построение плана.
+- ContentSelector: ранжирование по массивам numpy; количество запросов
+  не зависит от числа доменов и выбранных элементов.
+"""
+
+import logging
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Set
+
+import numpy as np
+
+from extensions import db
+from models import (
+    Question, IRTParameters, BIGDomain, Lesson, ContentDomainMapping,
+    UserProgress, SpacedRepetitionItem, DiagnosticSession, DiagnosticResponse
+)
+from utils.domain_mapping import map_old_to_new_domain, get_domain_name
+
+logger = logging.getLogger(__name__)
+
+LESSON_DURATION_MINUTES = 15
+QUESTION_DURATION_MINUTES = 3
+RECENT_REVIEW_DAYS = 3
+
+TARGET_DIFFICULTY = {'easy': 0.0, 'medium': 0.5, 'hard': 1.0}
+
+# Границы IRT difficulty -> проценты (как в DailyLearningAlgorithm._get_question_difficulty)
+_IRT_BOUNDS = np.array([-2.0, -1.0, 0.0, 1.0, 2.0])
+_IRT_PERCENT = np.array([20, 35, 50, 65, 80, 95])
+_LEVEL_BOUNDS = np.array([1.0, 2.0, 3.0, 4.0])
+_LEVEL_PERCENT = np.array([25, 40, 55, 70, 85])
+
+
+def difficulty_percent(irt_difficulty: np.ndarray, difficulty_level: np.ndarray) -> np.ndarray:
+    """Сложность в процентах: по IRT difficulty, иначе по difficulty_level, иначе 50"""
+    irt_difficulty = np.asarray(irt_difficulty, dtype=np.float64)
+    difficulty_level = np.asarray(difficulty_level, dtype=np.float64)
+    by_irt = _IRT_PERCENT[np.searchsorted(_IRT_BOUNDS, np.nan_to_num(irt_difficulty), side='left')]
+    by_level = _LEVEL_PERCENT[np.searchsorted(_LEVEL_BOUNDS, np.nan_to_num(difficulty_level), side='left')]
+    return np.where(~np.isnan(irt_difficulty), by_irt,
+                    np.where(~np.isnan(difficulty_level), by_level, 50)).astype(int)
+
+
+def _question_title(text: str) -> str:
+    title = text or ''
+    if title.startswith('KLINISCHE CASUS:'):
+        title = title.replace('KLINISCHE CASUS:', '').strip()
+        if len(title) > 60:
+            title = title[:60] + '...'
+    elif len(title) > 50:
+        title = title[:50] + '...'
+    return title
+
+
+@dataclass
+class QuestionPool:
+    """Вопросы домена в порядке ID"""
+    ids: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=np.int64))
+    irt_difficulty: np.ndarray = field(default_factory=lambda: np.empty(0))  # NaN - нет IRT
+    difficulty_level: np.ndarray = field(default_factory=lambda: np.empty(0))
+    display: List[Dict] = field(default_factory=list)
+
+    def __len__(self):
+        return len(self.ids)
+
+
+@dataclass
+class LessonPool:
+    """Уроки, привязанные к домену через ContentDomainMapping"""
+    ids: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=np.int64))
+    relevance: np.ndarray = field(default_factory=lambda: np.empty(0))
+    difficulty: np.ndarray = field(default_factory=lambda: np.empty(0))
+    titles: List[str] = field(default_factory=list)
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def _question_pool(rows: List) -> QuestionPool:
+    if not rows:
+        return QuestionPool()
+    rows = sorted(rows, key=lambda row: row[0])
+    return QuestionPool(
+        ids=np.array([row[0] for row in rows], dtype=np.int64),
+        irt_difficulty=np.array([np.nan if row[1] is None else row[1] for row in rows], dtype=np.float64),
+        difficulty_level=np.array([np.nan if row[2] is None else row[2] for row in rows], dtype=np.float64),
+        display=[row[3] for row in rows]
+    )
+
+
+class ContentDifficultyIndex:
+    """Индекс контента по доменам (общий для процесса)"""
+
+    def __init__(self, refresh_interval_seconds: int = 900):
+        self.refresh_interval_seconds = refresh_interval_seconds
+        self.lock = threading.RLock()
+        self._loaded_at: Optional[float] = None
+        self._domain_ids: Dict[str, int] = {}
+        self._questions_by_domain_id: Dict[int, QuestionPool] = {}
+        self._questions_by_domain_code: Dict[str, QuestionPool] = {}
+        self._lessons_by_domain_id: Dict[int, LessonPool] = {}
+
+    def build(self):
+        """Построить индекс (3 запроса)"""
+        domain_ids = {code: domain_id for domain_id, code in db.session.query(BIGDomain.id, BIGDomain.code).all()}
+
+        by_domain_id: Dict[int, List] = {}
+        by_domain_code: Dict[str, List] = {}
+        for question_id, big_domain_id, domain, level, text, options, irt_difficulty in db.session.query(
+            Question.id, Question.big_domain_id, Question.domain, Question.difficulty_level,
+            Question.text, Question.options, IRTParameters.difficulty
+        ).outerjoin(IRTParameters, IRTParameters.question_id == Question.id).all():
+            text = text or ''
+            row = (question_id, irt_difficulty, level, {
+                'title': _question_title(text),
+                'question_text': text[:100] + '...' if len(text) > 100 else text,
+                'options': options[:2] if options else []
+            })
+            if big_domain_id is not None:
+                by_domain_id.setdefault(big_domain_id, []).append(row)
+            if domain:
+                by_domain_code.setdefault(domain, []).append(row)
+
+        lessons: Dict[int, Dict[int, tuple]] = {}
+        for domain_id, lesson_id, relevance, difficulty, title in db.session.query(
+            ContentDomainMapping.domain_id, Lesson.id, ContentDomainMapping.relevance_score,
+            Lesson.difficulty, Lesson.title
+        ).join(Lesson, Lesson.id == ContentDomainMapping.lesson_id).all():
+            domain_lessons = lessons.setdefault(domain_id, {})
+            relevance = relevance if relevance is not None else 0.5
+            # Урок, привязанный к домену несколько раз, берется с максимальной релевантностью
+            if lesson_id not in domain_lessons or domain_lessons[lesson_id][0] < relevance:
+                domain_lessons[lesson_id] = (relevance, difficulty or 0.0, title)
+
+        lesson_pools = {}
+        for domain_id, domain_lessons in lessons.items():
+            ordered = sorted(domain_lessons.items())
+            lesson_pools[domain_id] = LessonPool(
+                ids=np.array([lesson_id for lesson_id, _ in ordered], dtype=np.int64),
+                relevance=np.array([value[0] for _, value in ordered], dtype=np.float64),
+                difficulty=np.array([value[1] for _, value in ordered], dtype=np.float64),
+                titles=[value[2] for _, value in ordered]
+            )
+
+        with self.lock:
+            self._domain_ids = domain_ids
+            self._questions_by_domain_id = {key: _question_pool(rows) for key, rows in by_domain_id.items()}
+            self._questions_by_domain_code = {key: _question_pool(rows) for key, rows in by_domain_code.items()}
+            self._lessons_by_domain_id = lesson_pools
+            self._loaded_at = time.monotonic()
+
+        logger.info(f"Content difficulty index built: {len(domain_ids)} domains, "
+                    f"{sum(len(p) for p in self._questions_by_domain_id.values())} questions, "
+                    f"{sum(len(p) for p in lesson_pools.values())} lesson mappings")
+
+    def _ensure_loaded(self):
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.refresh_interval_seconds:
+            self.build()
+
+    def invalidate(self):
+        """Сбросить индекс - перестроится при следующем обращении"""
+        with self.lock:
+            self._loaded_at = None
+
+    def domain_id(self, code: str) -> Optional[int]:
+        self._ensure_loaded()
+        return self._domain_ids.get(code)
+
+    def questions(self, domain: str) -> QuestionPool:
+        """Вопросы домена: по big_domain_id (с маппингом кода), иначе по строковому полю domain"""
+        self._ensure_loaded()
+        domain_id = self._domain_ids.get(map_old_to_new_domain(domain))
+        if domain_id is None:
+            return QuestionPool()
+        pool = self._questions_by_domain_id.get(domain_id)
+        if pool is None or len(pool) == 0:
+            pool = self._questions_by_domain_code.get(domain, QuestionPool())
+        return pool
+
+    def lessons(self, domain: str) -> LessonPool:
+        self._ensure_loaded()
+        domain_id = self._domain_ids.get(domain)
+        if domain_id is None:
+            return LessonPool()
+        return self._lessons_by_domain_id.get(domain_id, LessonPool())
+
+
+# Глобальный индекс
+content_index = ContentDifficultyIndex()
+
+
+class UserSelectionContext:
+    """Состояние пользователя для выбора контента (загружается один раз)"""
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self._completed_lessons: Optional[np.ndarray] = None
+        self._recent_reviews: Optional[np.ndarray] = None
+        self._ability: Optional[float] = None
+
+    @property
+    def completed_lesson_ids(self) -> np.ndarray:
+        if self._completed_lessons is None:
+            rows = db.session.query(UserProgress.lesson_id).filter(
+                UserProgress.user_id == self.user_id,
+                UserProgress.completed == True,
+                UserProgress.lesson_id.isnot(None)
+            ).all()
+            self._completed_lessons = np.array([row[0] for row in rows], dtype=np.int64)
+        return self._completed_lessons
+
+    @property
+    def recent_review_ids(self) -> np.ndarray:
+        """Вопросы, повторенные за последние RECENT_REVIEW_DAYS дней"""
+        if self._recent_reviews is None:
+            since = datetime.now(timezone.utc) - timedelta(days=RECENT_REVIEW_DAYS)
+            rows = db.session.query(SpacedRepetitionItem.question_id).filter(
+                SpacedRepetitionItem.user_id == self.user_id,
+                SpacedRepetitionItem.last_review >= since
+            ).all()
+            self._recent_reviews = np.array([row[0] for row in rows], dtype=np.int64)
+        return self._recent_reviews
+
+    @property
+    def ability(self) -> float:
+        """Theta из последней завершенной диагностики, иначе оценка по ответам"""
+        if self._ability is None:
+            self._ability = self._load_ability()
+        return self._ability
+
+    def _load_ability(self) -> float:
+        row = db.session.query(DiagnosticSession.current_ability).filter(
+            DiagnosticSession.user_id == self.user_id,
+            DiagnosticSession.status == 'completed'
+        ).order_by(DiagnosticSession.completed_at.desc()).first()
+        if row is not None:
+            return row[0] or 0.0
+
+        rows = db.session.query(
+            DiagnosticResponse.is_correct,
+            IRTParameters.discrimination,
+            IRTParameters.difficulty,
+            IRTParameters.guessing
+        ).join(IRTParameters, IRTParameters.question_id == DiagnosticResponse.question_id).filter(
+            DiagnosticResponse.user_id == self.user_id
+        ).all()
+        rows = [row for row in rows if None not in row]
+        if not rows:
+            return 0.0
+
+        try:
+            from utils.irt_engine import estimate_ability_from_arrays
+            u, a, b, c = (np.array(column, dtype=np.float64) for column in zip(*rows))
+            ability, _, _ = estimate_ability_from_arrays(a, b, c, u)
+            return float(ability)
+        except Exception as e:
+            logger.warning(f"Не удалось оценить способность пользователя: {e}")
+            return 0.0
+
+
+class ContentSelector:
+    """Выбор теории и практики для одного построения плана"""
+
+    def __init__(self, user_id: int, index: ContentDifficultyIndex = None):
+        self.user_id = user_id
+        self.index = index or content_index
+        self.context = UserSelectionContext(user_id)
+
+    def select_theory(self, domain: str, difficulty: str, time_minutes: int) -> List[Dict]:
+        """Непройденные уроки домена: релевантность по убыванию, затем близость к целевой сложности"""
+        if self.index.domain_id(domain) is None:
+            return []
+        pool = self.index.lessons(domain)
+
+        selected = []
+        max_lessons = max(0, time_minutes // LESSON_DURATION_MINUTES)
+        if len(pool) and max_lessons:
+            available = ~np.isin(pool.ids, self.context.completed_lesson_ids)
+            candidates = np.flatnonzero(available)
+            if len(candidates):
+                distance = np.abs(pool.difficulty[candidates] - TARGET_DIFFICULTY.get(difficulty, 0.5))
+                order = np.lexsort((distance, -pool.relevance[candidates]))
+                for position in candidates[order[:max_lessons]]:
+                    selected.append({
+                        'type': 'lesson',
+                        'id': int(pool.ids[position]),
+                        'title': pool.titles[position],
+                        'duration': LESSON_DURATION_MINUTES,
+                        'difficulty': float(pool.difficulty[position])
+                    })
+
+        # Если нет доступных уроков, создаем рекомендацию
+        if not selected:
+            selected.append({
+                'type': 'recommendation',
+                'id': 0,
+                'title': f'Изучите основы {get_domain_name(map_old_to_new_domain(domain))}',
+                'duration': 15,
+                'difficulty': 'medium',
+                'message': 'Рекомендуется пройти диагностику для получения персонализированного контента'
+            })
+        return selected
+
+    def _pick_question_positions(self, pool: QuestionPool, difficulty: str, max_items: int) -> List[int]:
+        theta = self.context.ability
+        has_irt = ~np.isnan(pool.irt_difficulty)
+        with_irt = np.flatnonzero(has_irt)
+        without_irt = np.flatnonzero(~has_irt)
+
+        if not len(with_irt):
+            return random.sample(range(len(pool)), min(max_items, len(pool)))
+
+        b = pool.irt_difficulty[with_irt]
+        ranked = with_irt[np.argsort(np.abs(b - theta), kind='stable')]
+        if difficulty == 'easy':
+            ranked = ranked[pool.irt_difficulty[ranked] <= theta]
+        elif difficulty == 'hard':
+            ranked = ranked[pool.irt_difficulty[ranked] > theta]
+        picked = ranked[:max_items].tolist()
+
+        # Не хватает - добираем случайными вопросами с IRT, затем без IRT
+        if len(picked) < max_items:
+            remaining = np.setdiff1d(with_irt, picked).tolist()
+            picked.extend(random.sample(remaining, min(max_items - len(picked), len(remaining))))
+        if len(picked) < max_items and len(without_irt):
+            remaining = without_irt.tolist()
+            picked.extend(random.sample(remaining, min(max_items - len(picked), len(remaining))))
+        return picked
+
+    def select_practice(self, domain: str, difficulty: str, time_minutes: int) -> List[Dict]:
+        """Вопросы домена по близости IRT сложности к theta пользователя"""
+        pool = self.index.questions(domain)
+        if not len(pool):
+            if self.index.domain_id(map_old_to_new_domain(domain)) is None:
+                logger.warning(f"Домен {domain} (маппинг: {map_old_to_new_domain(domain)}) не найден в базе данных")
+            else:
+                logger.warning(f"Не найдено вопросов для домена {domain}")
+            return []
+
+        max_items = min(len(pool), time_minutes // QUESTION_DURATION_MINUTES)
+        picked = self._pick_question_positions(pool, difficulty, max_items)
+
+        # Исключаем недавно решенные вопросы
+        recent = self.context.recent_review_ids
+        final = [position for position in picked if not np.isin(pool.ids[position], recent)]
+        if not final and picked:
+            final = random.sample(picked, min(3, len(picked)))
+
+        theta = self.context.ability
+        positions = np.array(final, dtype=np.int64)
+        percents = difficulty_percent(pool.irt_difficulty[positions], pool.difficulty_level[positions])
+        irt_values = pool.irt_difficulty[positions]
+        # Время на вопрос растет с удаленностью сложности от theta
+        times = np.where(np.isnan(irt_values), 3,
+                         np.clip((3 + np.abs(np.nan_to_num(irt_values) - theta) * 2).astype(int), 2, 8))
+
+        items = []
+        for position, percent, irt_value, estimated_time in zip(final, percents, irt_values, times):
+            display = pool.display[position]
+            items.append({
+                'id': int(pool.ids[position]),
+                'type': 'question',
+                'title': display['title'],
+                'question_text': display['question_text'],
+                'domain': domain,
+                'difficulty': int(percent),
+                'estimated_time': int(estimated_time),
+                'options': display['options'],
+                'irt_difficulty': None if np.isnan(irt_value) else float(irt_value)
+            })
+
+        # Если нет выбранных элементов, создаем рекомендацию
+        if not items:
+            items.append({
+                'id': 0,
+                'type': 'recommendation',
+                'title': f'Практика по {get_domain_name(map_old_to_new_domain(domain))}',
+                'question_text': f'Рекомендуется пройти диагностику для получения персонализированных практических заданий по теме {get_domain_name(map_old_to_new_domain(domain))}',
+                'domain': domain,
+                'difficulty': 'medium',
+                'estimated_time': 5,
+                'message': 'Пройти диагностику для получения персонализированного контента'
+            })
+        return items
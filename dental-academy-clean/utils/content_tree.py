@@ -0,0 +1,415 @@
+"""
+Content Tree
+Статическое дерево контента для карты обучения
+
+Иерархия ContentCategory -> ContentSubcategory -> ContentTopic и
+Subject -> Module с количеством уроков одинакова для всех пользователей.
+Она собирается тремя запросами (дерево категорий одним JOIN, предметы с
+модулями одним JOIN, количество уроков одним GROUP BY) и кэшируется в
+процессе. Кэш сбрасывается после commit, который изменил узлы дерева,
+пути обучения или уроки (например, правки в админке), и по TTL - на
+случай изменений из других процессов.
+
+Прогресс пользователя загружается одним агрегированным запросом
+(завершенные уроки по модулям и темам) и накладывается на копию дерева.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from itertools import chain
+from typing import Dict, List, Optional
+
+from flask import url_for
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+from werkzeug.routing import BuildError
+
+from extensions import db
+from models import (
+    ContentCategory, ContentSubcategory, ContentTopic, LearningPath, Lesson, Module, Subject, UserProgress
+)
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TREE_TTL = int(os.environ.get('CONTENT_TREE_TTL', 600))
+
+# Изменения этих моделей делают дерево устаревшим
+TREE_MODELS = (ContentCategory, ContentSubcategory, ContentTopic, LearningPath, Subject, Module, Lesson)
+
+
+@dataclass
+class ContentTree:
+    """Снимок дерева контента (только чтение - для пользователя строятся копии)"""
+    categories: List[Dict]
+    subjects: List[Dict]
+    version: int
+    built_at: float = field(default_factory=time.monotonic)
+    _urls: Dict[str, Dict] = field(default_factory=dict, repr=False)
+
+    def urls(self, lang: str) -> Dict:
+        """URL категорий, подкатегорий и тем для языка (строятся один раз на снимок)"""
+        urls = self._urls.get(lang)
+        if urls is None:
+            urls = {}
+            for category in self.categories:
+                urls[('category', category['id'])] = _content_url(
+                    'content_nav.view_category', lang=lang, category_slug=category['slug'])
+                for subcategory in category['subcategories']:
+                    urls[('subcategory', subcategory['id'])] = _content_url(
+                        'content_nav.view_subcategory', lang=lang,
+                        category_slug=category['slug'], subcategory_slug=subcategory['slug'])
+                    for topic in subcategory['topics']:
+                        urls[('topic', topic['id'])] = _content_url(
+                            'content_nav.view_topic', lang=lang, category_slug=category['slug'],
+                            subcategory_slug=subcategory['slug'], topic_slug=topic['slug'])
+            self._urls[lang] = urls
+        return urls
+
+
+def _content_url(endpoint: str, **values) -> str:
+    """URL навигации по контенту; '#' пока блюпринт content_nav отключен"""
+    try:
+        return url_for(endpoint, **values)
+    except BuildError:
+        return '#'
+
+
+def _load_lesson_counts():
+    """Количество уроков по модулям и по темам одним запросом"""
+    by_module: Dict[int, int] = defaultdict(int)
+    by_topic: Dict[int, int] = defaultdict(int)
+    for module_id, topic_id, count in db.session.query(
+        Lesson.module_id, Lesson.topic_id, func.count(Lesson.id)
+    ).group_by(Lesson.module_id, Lesson.topic_id).all():
+        if module_id is not None:
+            by_module[module_id] += count
+        if topic_id is not None:
+            by_topic[topic_id] += count
+    return by_module, by_topic
+
+
+def _load_categories(lessons_by_topic: Dict[int, int]) -> List[Dict]:
+    """Категории -> подкатегории -> темы одним запросом с LEFT JOIN"""
+    rows = db.session.query(
+        ContentCategory.id, ContentCategory.name, ContentCategory.slug, ContentCategory.icon,
+        ContentSubcategory.id, ContentSubcategory.name, ContentSubcategory.slug,
+        ContentTopic.id, ContentTopic.name, ContentTopic.slug
+    ).outerjoin(
+        ContentSubcategory, ContentSubcategory.category_id == ContentCategory.id
+    ).outerjoin(
+        ContentTopic, ContentTopic.subcategory_id == ContentSubcategory.id
+    ).order_by(
+        ContentCategory.order, ContentCategory.id,
+        ContentSubcategory.order, ContentSubcategory.id,
+        ContentTopic.order, ContentTopic.id
+    ).all()
+
+    categories: List[Dict] = []
+    category_index: Dict[int, Dict] = {}
+    subcategory_index: Dict[int, Dict] = {}
+    for (category_id, category_name, category_slug, category_icon,
+         subcategory_id, subcategory_name, subcategory_slug,
+         topic_id, topic_name, topic_slug) in rows:
+        category = category_index.get(category_id)
+        if category is None:
+            category = {
+                'id': category_id,
+                'name': category_name,
+                'slug': category_slug,
+                'icon': category_icon or 'bi-book',
+                'subcategories': []
+            }
+            category_index[category_id] = category
+            categories.append(category)
+        if subcategory_id is None:
+            continue
+
+        subcategory = subcategory_index.get(subcategory_id)
+        if subcategory is None:
+            subcategory = {
+                'id': subcategory_id,
+                'name': subcategory_name,
+                'slug': subcategory_slug,
+                'topics': []
+            }
+            subcategory_index[subcategory_id] = subcategory
+            category['subcategories'].append(subcategory)
+        if topic_id is None:
+            continue
+
+        subcategory['topics'].append({
+            'id': topic_id,
+            'name': topic_name,
+            'slug': topic_slug,
+            'lessons_count': lessons_by_topic.get(topic_id, 0)
+        })
+    return categories
+
+
+def _load_subjects(lessons_by_module: Dict[int, int]) -> List[Dict]:
+    """Предметы с модулями одним запросом с LEFT JOIN"""
+    rows = db.session.query(
+        Subject.id, Subject.name, Subject.description, Subject.icon, Subject.learning_path_id,
+        Module.id, Module.title, Module.description, Module.icon, Module.order,
+        Module.is_premium, Module.is_final_test
+    ).outerjoin(
+        Module, Module.subject_id == Subject.id
+    ).order_by(Subject.id, Module.order, Module.id).all()
+
+    subjects: List[Dict] = []
+    subject_index: Dict[int, Dict] = {}
+    for (subject_id, subject_name, subject_description, subject_icon, learning_path_id,
+         module_id, title, description, icon, order, is_premium, is_final_test) in rows:
+        subject = subject_index.get(subject_id)
+        if subject is None:
+            subject = {
+                'id': subject_id,
+                'name': subject_name,
+                'description': subject_description or '',
+                'icon': subject_icon or 'folder2-open',
+                'learning_path_id': learning_path_id,
+                'modules': []
+            }
+            subject_index[subject_id] = subject
+            subjects.append(subject)
+        if module_id is None:
+            continue
+
+        subject['modules'].append({
+            'id': module_id,
+            'title': title,
+            'description': description or '',
+            'icon': icon or 'file-earmark-text',
+            'order': order,
+            'is_premium': bool(is_premium),
+            'is_final_test': bool(is_final_test),
+            'total_lessons': lessons_by_module.get(module_id, 0)
+        })
+    return subjects
+
+
+def build_content_tree(version: int = 0) -> ContentTree:
+    """Собрать дерево контента (три запроса)"""
+    lessons_by_module, lessons_by_topic = _load_lesson_counts()
+    return ContentTree(
+        categories=_load_categories(lessons_by_topic),
+        subjects=_load_subjects(lessons_by_module),
+        version=version
+    )
+
+
+@dataclass
+class UserContentProgress:
+    """Завершенные уроки пользователя по модулям и темам"""
+    by_module: Dict[int, int] = field(default_factory=dict)
+    by_topic: Dict[int, int] = field(default_factory=dict)
+
+
+def load_user_progress(user_id: int) -> UserContentProgress:
+    """Прогресс пользователя одним агрегированным запросом"""
+    progress = UserContentProgress(defaultdict(int), defaultdict(int))
+    for module_id, topic_id, completed in db.session.query(
+        Lesson.module_id, Lesson.topic_id, func.count(UserProgress.id)
+    ).join(
+        UserProgress, UserProgress.lesson_id == Lesson.id
+    ).filter(
+        UserProgress.user_id == user_id,
+        UserProgress.completed == True
+    ).group_by(Lesson.module_id, Lesson.topic_id).all():
+        if module_id is not None:
+            progress.by_module[module_id] += completed
+        if topic_id is not None:
+            progress.by_topic[topic_id] += completed
+    return progress
+
+
+def _percent(completed: int, total: int) -> int:
+    return round(completed / total * 100) if total else 0
+
+
+def overlay_subject_progress(subjects: List[Dict], progress: Optional[UserContentProgress]) -> List[Dict]:
+    """
+    Наложить прогресс пользователя на предметы и модули (на месте)
+
+    Прогресс модуля - доля завершенных уроков (как get_module_stats_unified),
+    прогресс предмета - средний прогресс его модулей.
+    """
+    by_module = progress.by_module if progress else {}
+    for subject in subjects:
+        modules = subject['modules']
+        for module in modules:
+            completed = by_module.get(module['id'], 0)
+            module['progress'] = _percent(completed, module['total_lessons'])
+            module['completed_lessons'] = completed
+        subject['progress'] = round(sum(m['progress'] for m in modules) / len(modules)) if modules else 0
+    return subjects
+
+
+class ContentTreeCache:
+    """Дерево контента в процессе; версия увеличивается при invalidate()"""
+
+    def __init__(self, ttl: int = CONTENT_TREE_TTL):
+        self.ttl = ttl
+        self._tree: Optional[ContentTree] = None
+        self._version = 0
+        self._lock = threading.Lock()
+        self.builds = 0
+
+    def _fresh(self, tree: Optional[ContentTree]) -> bool:
+        return (
+            tree is not None
+            and tree.version == self._version
+            and time.monotonic() - tree.built_at < self.ttl
+        )
+
+    def get(self) -> ContentTree:
+        tree = self._tree
+        if not self._fresh(tree):
+            with self._lock:
+                tree = self._tree
+                if not self._fresh(tree):
+                    tree = build_content_tree(self._version)
+                    self._tree = tree
+                    self.builds += 1
+                    logger.info(f"Content tree built: {len(tree.categories)} categories, "
+                                f"{len(tree.subjects)} subjects (version {tree.version})")
+        return tree
+
+    def invalidate(self):
+        with self._lock:
+            self._version += 1
+            self._tree = None
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def get_stats(self) -> Dict:
+        tree = self._tree
+        return {
+            'version': self._version,
+            'builds': self.builds,
+            'cached': tree is not None,
+            'age_seconds': round(time.monotonic() - tree.built_at, 1) if tree else None
+        }
+
+    # Представления для пользователя: копии узлов с прогрессом
+
+    def user_categories(self, lang: str, progress: Optional[UserContentProgress] = None) -> List[Dict]:
+        """Категории с URL для языка и прогрессом по темам"""
+        tree = self.get()
+        urls = tree.urls(lang)
+        by_topic = progress.by_topic if progress else {}
+
+        categories = []
+        for category in tree.categories:
+            subcategories = []
+            category_total = category_completed = 0
+            for subcategory in category['subcategories']:
+                topics = []
+                subcategory_total = subcategory_completed = 0
+                for topic in subcategory['topics']:
+                    completed = by_topic.get(topic['id'], 0)
+                    topics.append({
+                        **topic,
+                        'completed_lessons': completed,
+                        'progress': _percent(completed, topic['lessons_count']),
+                        'url': urls[('topic', topic['id'])]
+                    })
+                    subcategory_total += topic['lessons_count']
+                    subcategory_completed += completed
+                subcategories.append({
+                    'id': subcategory['id'],
+                    'name': subcategory['name'],
+                    'slug': subcategory['slug'],
+                    'topics': topics,
+                    'topics_count': len(topics),
+                    'lessons_count': subcategory_total,
+                    'completed_lessons': subcategory_completed,
+                    'progress': _percent(subcategory_completed, subcategory_total),
+                    'url': urls[('subcategory', subcategory['id'])]
+                })
+                category_total += subcategory_total
+                category_completed += subcategory_completed
+            categories.append({
+                'id': category['id'],
+                'name': category['name'],
+                'slug': category['slug'],
+                'icon': category['icon'],
+                'subcategories': subcategories,
+                'subcategories_count': len(subcategories),
+                'lessons_count': category_total,
+                'completed_lessons': category_completed,
+                'progress': _percent(category_completed, category_total),
+                'url': urls[('category', category['id'])]
+            })
+        return categories
+
+    def user_subjects(self, progress: Optional[UserContentProgress] = None,
+                      learning_path_id: Optional[int] = None) -> List[Dict]:
+        """Предметы с модулями и прогрессом (как get_module_stats_unified)"""
+        subjects = [
+            {**subject, 'modules': [dict(module) for module in subject['modules']]}
+            for subject in self.get().subjects
+            if learning_path_id is None or subject['learning_path_id'] == learning_path_id
+        ]
+        return overlay_subject_progress(subjects, progress)
+
+
+# Глобальный экземпляр
+content_tree = ContentTreeCache()
+
+
+# Сброс кэша после commit, изменившего дерево
+
+def _track_content_changes(session, flush_context):
+    changed = chain(
+        session.new,
+        session.deleted,
+        (obj for obj in session.dirty if session.is_modified(obj, include_collections=False))
+    )
+    if any(isinstance(obj, TREE_MODELS) for obj in changed):
+        session.info['content_tree_changed'] = True
+
+
+def _invalidate_after_commit(session):
+    if session.info.pop('content_tree_changed', False):
+        content_tree.invalidate()
+        logger.info("Content tree invalidated after commit")
+
+
+def _discard_after_rollback(session):
+    session.info.pop('content_tree_changed', None)
+
+
+_listeners_lock = threading.Lock()
+_listeners_installed = False
+
+
+def _install_listeners():
+    global _listeners_installed
+    with _listeners_lock:
+        if not _listeners_installed:
+            event.listen(Session, 'after_flush', _track_content_changes)
+            event.listen(Session, 'after_commit', _invalidate_after_commit)
+            event.listen(Session, 'after_rollback', _discard_after_rollback)
+            _listeners_installed = True
+
+
+def init_content_tree(app):
+    """Подключить сброс кэша дерева контента к commit'ам"""
+    _install_listeners()
+
+
+def get_user_content_categories(lang: str, user_id: Optional[int] = None) -> List[Dict]:
+    progress = load_user_progress(user_id) if user_id is not None else None
+    return content_tree.user_categories(lang, progress)
+
+
+def invalidate_content_tree():
+    """Пересобрать дерево при следующем запросе (после массовых изменений вне ORM)"""
+    content_tree.invalidate()
@@ -24,6 +24,8 @@ from utils.irt_engine import IRTEngine
 from utils.irt_spaced_integration import get_irt_spaced_integration
 from utils.domain_mapping import convert_abilities_to_new_format, convert_abilities_to_old_format, map_old_to_new_domain, get_domain_name
 from utils.diagnostic_data_manager import DiagnosticDataManager
+from utils.content_selection import ContentSelector
+from utils.plan_instrumentation import instrument_plan_build
 
 logger = logging.getLogger(__name__)
 
@@ -51,6 +53,14 @@ class DailyLearningAlgorithm:
         self.WEAKNESS_WEIGHT = 0.3
         
         self._overdue_reviews = []
+        self._selector: Optional[ContentSelector] = None
+        self._persist_sessions = True
+    
+    def _content_selector(self, user_id: int) -> ContentSelector:
+        """Селектор контента текущего построения плана (состояние пользователя грузится один раз)"""
+        if self._selector is None or self._selector.user_id != user_id:
+            self._selector = ContentSelector(user_id)
+        return self._selector
     
     def _validate_learning_plan(self, plan: PersonalLearningPlan) -> Dict:
         """
@@ -99,17 +109,27 @@ class DailyLearningAlgorithm:
             'weak_domains': weak_domains
         }
     
-    def generate_daily_plan(self, user_id: int, target_minutes: int = 30) -> Dict:
+    def generate_daily_plan(self, user_id: int, target_minutes: int = 30,
+                            persist_sessions: bool = True) -> Dict:
         """
         Генерирует ежедневный план обучения с интеграцией IRT + Spaced Repetition
         
         Args:
             user_id: ID пользователя
             target_minutes: целевое время обучения в минутах
+            persist_sessions: Создавать запланированные StudySession (False - только расчет,
+                например ночной пересчет снимков)
             
         Returns:
             Словарь с ежедневным планом
         """
+        # Новый план - новое состояние пользователя для выбора контента
+        self._selector = None
+        self._persist_sessions = persist_sessions
+        with instrument_plan_build(user_id, 'daily_plan'):
+            return self._generate_daily_plan(user_id, target_minutes)
+    
+    def _generate_daily_plan(self, user_id: int, target_minutes: int) -> Dict:
         try:
             # Получаем данные пользователя
             user = User.query.get(user_id)
@@ -128,18 +148,8 @@ class DailyLearningAlgorithm:
             today_start = datetime.combine(today, datetime.min.time()).replace(tzinfo=timezone.utc)
             
             # Удаляем старые незавершенные StudySession из предыдущих дней
-            if active_plan:
-                old_planned_sessions = StudySession.query.filter(
-                    StudySession.learning_plan_id == active_plan.id,
-                    StudySession.status == 'planned',
-                    StudySession.started_at < today_start
-                ).all()
-                
-                if old_planned_sessions:
-                    logger.info(f"User {user_id}: Removing {len(old_planned_sessions)} old planned sessions from previous days")
-                    for old_session in old_planned_sessions:
-                        db.session.delete(old_session)
-                    db.session.commit()
+            if active_plan and self._persist_sessions:
+                self._remove_old_planned_sessions(active_plan, today_start)
             
             # ПРОВЕРКА ПРОСРОЧЕННОЙ ПЕРЕОЦЕНКИ (ПЕРВЫЙ ПРИОРИТЕТ)
             if active_plan and active_plan.next_diagnostic_date:
@@ -659,59 +669,8 @@ class DailyLearningAlgorithm:
             return 'medium'
     
     def _select_theory_content(self, domain: str, difficulty: str, time_minutes: int, user_id: int) -> List[Dict]:
-        """Select theory content for domain using ContentDomainMapping"""
-        # Get domain
-        big_domain = BIGDomain.query.filter_by(code=domain).first()
-        if not big_domain:
-            return []
-        
-        # Get mapped content
-        mappings = ContentDomainMapping.query.filter_by(
-            domain_id=big_domain.id
-        ).all()
-        
-        available_lessons = []
-        for mapping in mappings:
-            if mapping.lesson_id:
-                lesson = Lesson.query.get(mapping.lesson_id)
-                if lesson and not self._is_lesson_completed(lesson.id, user_id):
-                    available_lessons.append(lesson)
-        
-        # Sort by relevance score and difficulty
-        available_lessons.sort(key=lambda l: (
-            mapping.relevance_score if mapping else 0.5,
-            abs(l.difficulty - self._get_target_difficulty(difficulty))
-        ), reverse=True)
-        
-        # Select lessons that fit in time
-        selected_lessons = []
-        total_time = 0
-        
-        for lesson in available_lessons:
-            # Используем фиксированное время для урока (15 минут)
-            lesson_duration = 15
-            if total_time + lesson_duration <= time_minutes:
-                selected_lessons.append({
-                    'type': 'lesson',
-                    'id': lesson.id,
-                    'title': lesson.title,
-                    'duration': lesson_duration,
-                    'difficulty': lesson.difficulty
-                })
-                total_time += lesson_duration
-        
-        # Если нет доступных уроков, создаем рекомендацию
-        if not selected_lessons:
-            selected_lessons.append({
-                'type': 'recommendation',
-                'id': 0,
-                'title': f'Изучите основы {get_domain_name(map_old_to_new_domain(domain))}',
-                'duration': 15,
-                'difficulty': 'medium',
-                'message': 'Рекомендуется пройти диагностику для получения персонализированного контента'
-            })
-        
-        return selected_lessons
+        """Select theory content for domain using ContentDomainMapping (see utils.content_selection)"""
+        return self._content_selector(user_id).select_theory(domain, difficulty, time_minutes)
 
     def _is_lesson_completed(self, lesson_id: int, user_id: int) -> bool:
         """Check if lesson is completed by user"""
@@ -736,6 +695,9 @@ class DailyLearningAlgorithm:
         """
         Выбирает практический контент для домена с учетом IRT сложности и уровня знаний пользователя.
         
+        Вопросы берутся из индекса сложности по доменам, способность пользователя
+        и недавние повторения загружаются один раз на план (см. utils.content_selection).
+        
         Args:
             domain: Код домена (например, 'THER')
             difficulty: Уровень сложности ('easy', 'medium', 'hard')
@@ -746,175 +708,7 @@ class DailyLearningAlgorithm:
             Список словарей с информацией о вопросах
         """
         try:
-            # 1. Получаем текущую способность пользователя (theta)
-            user_ability = 0.0  # По умолчанию средний уровень
-            
-            # Пытаемся получить способность из последней диагностической сессии
-            last_session = DiagnosticSession.query.filter_by(
-                user_id=user_id,
-                status='completed'
-            ).order_by(DiagnosticSession.completed_at.desc()).first()
-            
-            if last_session:
-                user_ability = last_session.current_ability or 0.0
-            else:
-                # Если нет диагностики, пытаемся оценить по ответам на вопросы
-                responses = DiagnosticResponse.query.filter_by(user_id=user_id).all()
-                if responses:
-                    try:
-                        user_ability, _ = self.irt_engine.estimate_ability([
-                            {
-                                'question_id': r.question_id,
-                                'is_correct': r.is_correct,
-                                'irt_params': r.question.irt_parameters.get_parameters() if r.question.irt_parameters else None
-                            }
-                            for r in responses if r.question and r.question.irt_parameters
-                        ])
-                    except Exception as e:
-                        logger.warning(f"Не удалось оценить способность пользователя: {e}")
-                        user_ability = 0.0
-
-            # 2. Находим домен по коду (с маппингом старых кодов)
-            from utils.domain_mapping import map_old_to_new_domain
-            mapped_domain = map_old_to_new_domain(domain)
-            big_domain = BIGDomain.query.filter_by(code=mapped_domain).first()
-            if not big_domain:
-                logger.warning(f"Домен {domain} (маппинг: {mapped_domain}) не найден в базе данных")
-                return []
-
-            # 3. Находим вопросы для домена
-            questions_in_domain = Question.query.filter(
-                Question.big_domain_id == big_domain.id
-            ).all()
-            
-            # Если нет вопросов по big_domain_id, ищем по строковому полю domain
-            if not questions_in_domain:
-                questions_in_domain = Question.query.filter(
-                    Question.domain == domain
-                ).all()
-            
-            if not questions_in_domain:
-                logger.warning(f"Не найдено вопросов для домена {domain}")
-                return []
-
-            # 4. Фильтруем вопросы с IRT параметрами
-            questions_with_irt = []
-            questions_without_irt = []
-            
-            for question in questions_in_domain:
-                if question.irt_parameters and question.irt_parameters.difficulty is not None:
-                    questions_with_irt.append(question)
-                else:
-                    questions_without_irt.append(question)
-
-            # 5. Выбираем вопросы с учетом сложности и времени
-            selected_items = []
-            max_items = min(len(questions_in_domain), time_minutes // 3)  # 3 минуты на вопрос
-            
-            if questions_with_irt:
-                # Сортируем вопросы по близости IRT сложности к способности пользователя
-                sorted_questions = sorted(
-                    questions_with_irt,
-                    key=lambda q: abs(q.irt_parameters.difficulty - user_ability)
-                )
-                
-                # Выбираем вопросы в зависимости от требуемой сложности
-                if difficulty == 'easy':
-                    # Выбираем вопросы с IRT сложностью ниже способности пользователя
-                    selected_questions = [
-                        q for q in sorted_questions 
-                        if q.irt_parameters.difficulty <= user_ability
-                    ][:max_items]
-                elif difficulty == 'hard':
-                    # Выбираем вопросы с IRT сложностью выше способности пользователя
-                    selected_questions = [
-                        q for q in sorted_questions 
-                        if q.irt_parameters.difficulty > user_ability
-                    ][:max_items]
-                else:  # medium
-                    # Выбираем вопросы с IRT сложностью близкой к способности пользователя
-                    selected_questions = sorted_questions[:max_items]
-                
-                # Если не хватает вопросов с IRT, добавляем остальные
-                if len(selected_questions) < max_items:
-                    remaining_irt = [q for q in questions_with_irt if q not in selected_questions]
-                    if remaining_irt:
-                        additional_needed = max_items - len(selected_questions)
-                        selected_questions.extend(random.sample(remaining_irt, min(additional_needed, len(remaining_irt))))
-                
-                # Добавляем вопросы без IRT параметров, если нужно
-                if len(selected_questions) < max_items and questions_without_irt:
-                    additional_needed = max_items - len(selected_questions)
-                    selected_questions.extend(random.sample(questions_without_irt, min(additional_needed, len(questions_without_irt))))
-                    
-            else:
-                # Если нет вопросов с IRT, используем все доступные
-                selected_questions = random.sample(questions_in_domain, min(max_items, len(questions_in_domain)))
-
-            # 6. Исключаем недавно решенные вопросы
-            recent_question_ids = set([
-                item.question_id for item in SpacedRepetitionItem.query.filter(
-                and_(
-                    SpacedRepetitionItem.user_id == user_id,
-                    SpacedRepetitionItem.last_review >= datetime.now(timezone.utc) - timedelta(days=3)
-                )
-                ).all()
-            ])
-            
-            final_questions = [
-                q for q in selected_questions 
-                if q.id not in recent_question_ids
-            ]
-            
-            # Если все вопросы недавно решались, берем случайные
-            if not final_questions and selected_questions:
-                final_questions = random.sample(selected_questions, min(3, len(selected_questions)))
-
-            # 7. Формируем результат
-            for question in final_questions:
-                # Извлекаем название из текста вопроса
-                title = question.text
-                if title.startswith('KLINISCHE CASUS:'):
-                    title = title.replace('KLINISCHE CASUS:', '').strip()
-                    if len(title) > 60:
-                        title = title[:60] + '...'
-                elif len(title) > 50:
-                    title = title[:50] + '...'
-                
-                # Оцениваем время на основе сложности
-                if question.irt_parameters and question.irt_parameters.difficulty is not None:
-                    irt_diff = abs(question.irt_parameters.difficulty - user_ability)
-                    estimated_time = max(2, min(8, int(3 + irt_diff * 2)))
-                else:
-                    estimated_time = 3
-                
-                selected_items.append({
-                    'id': question.id,
-                    'type': 'question',
-                    'title': title,
-                    'question_text': question.text[:100] + '...' if len(question.text) > 100 else question.text,
-                    'domain': domain,
-                    'difficulty': self._get_question_difficulty(question),
-                    'estimated_time': estimated_time,
-                    'options': question.options[:2] if question.options else [],
-                    'irt_difficulty': question.irt_parameters.difficulty if question.irt_parameters else None
-                })
-            
-            # Если нет выбранных элементов, создаем рекомендацию
-            if not selected_items:
-                selected_items.append({
-                    'id': 0,
-                    'type': 'recommendation',
-                    'title': f'Практика по {get_domain_name(map_old_to_new_domain(domain))}',
-                    'question_text': f'Рекомендуется пройти диагностику для получения персонализированных практических заданий по теме {get_domain_name(map_old_to_new_domain(domain))}',
-                    'domain': domain,
-                    'difficulty': 'medium',
-                    'estimated_time': 5,
-                    'message': 'Пройти диагностику для получения персонализированного контента'
-                })
-            
-            return selected_items
-            
+            return self._content_selector(user_id).select_practice(domain, difficulty, time_minutes)
         except Exception as e:
             logger.error(f"Ошибка при выборе практического контента для домена {domain}: {e}")
             # Возвращаем рекомендацию вместо резервного контента
@@ -1698,6 +1492,36 @@ class DailyLearningAlgorithm:
                 'message': 'Ошибка при форматировании существующего плана'
             }
     
+    def _build_review_section(self, review_items: List) -> Optional[Dict]:
+        """Секция повторений интегрированного плана (None если повторять нечего)"""
+        if not review_items:
+            return None
+        
+        review_section = {
+            'type': 'review',
+            'title': 'Повторение',
+            'description': f'{len(review_items)} элементов готовых к повторению',
+            'items': []
+        }
+        
+        for item in review_items:
+            review_section['items'].append({
+                'id': item.question_id,
+                'type': 'question',
+                'title': f'Вопрос #{item.question_id}',
+                'domain': item.domain,
+                'difficulty': self._get_difficulty_level(item.irt_difficulty),
+                'confidence': f"{item.confidence_level:.1%}",
+                'estimated_time': 3,  # 3 минуты на повторение
+                'irt_insights': {
+                    'difficulty': item.irt_difficulty,
+                    'user_ability': item.user_ability,
+                    'learning_rate': item.learning_rate
+                }
+            })
+        
+        return review_section
+    
     def _format_integrated_plan(self, integrated_plan: Dict, user: User, 
                               active_plan: PersonalLearningPlan, reassessment_warning: bool) -> Dict:
         """Форматирует интегрированный план для совместимости с существующим API"""
@@ -1717,31 +1541,8 @@ class DailyLearningAlgorithm:
             }
             
             # Добавляем секцию повторений
-            review_items = integrated_plan.get('review_items', [])
-            if review_items:
-                review_section = {
-                    'type': 'review',
-                    'title': 'Повторение',
-                    'description': f'{len(review_items)} элементов готовых к повторению',
-                    'items': []
-                }
-                
-                for item in review_items:
-                    review_section['items'].append({
-                        'id': item.question_id,
-                        'type': 'question',
-                        'title': f'Вопрос #{item.question_id}',
-                        'domain': item.domain,
-                        'difficulty': self._get_difficulty_level(item.irt_difficulty),
-                        'confidence': f"{item.confidence_level:.1%}",
-                        'estimated_time': 3,  # 3 минуты на повторение
-                        'irt_insights': {
-                            'difficulty': item.irt_difficulty,
-                            'user_ability': item.user_ability,
-                            'learning_rate': item.learning_rate
-                        }
-                    })
-                
+            review_section = self._build_review_section(integrated_plan.get('review_items', []))
+            if review_section:
                 formatted_plan['sections'].append(review_section)
             
             # Добавляем секцию нового контента
@@ -1771,7 +1572,7 @@ class DailyLearningAlgorithm:
                 formatted_plan['reassessment_message'] = 'Рекомендуется пройти повторную диагностику'
             
             # Создаем StudySession записи
-            if active_plan:
+            if active_plan and self._persist_sessions:
                 study_sessions = self._create_integrated_study_sessions(
                     formatted_plan, user, active_plan
                 )
@@ -1787,6 +1588,47 @@ class DailyLearningAlgorithm:
                 'message': 'Ошибка при форматировании плана'
             }
     
+    def _remove_old_planned_sessions(self, active_plan: PersonalLearningPlan, today_start: datetime):
+        """Удаляет незавершенные запланированные StudySession предыдущих дней"""
+        old_planned_sessions = StudySession.query.filter(
+            StudySession.learning_plan_id == active_plan.id,
+            StudySession.status == 'planned',
+            StudySession.started_at < today_start
+        ).all()
+        
+        if old_planned_sessions:
+            logger.info(f"User {active_plan.user_id}: Removing {len(old_planned_sessions)} old planned sessions from previous days")
+            for old_session in old_planned_sessions:
+                db.session.delete(old_session)
+            db.session.commit()
+    
+    def persist_plan_sessions(self, user_id: int, formatted_plan: Dict) -> List[StudySession]:
+        """
+        Создает запланированные StudySession для уже рассчитанного интегрированного плана
+        
+        Используется для снимков ночного пересчета (persist_sessions=False): сессии
+        создаются при первом показе плана, без повторного расчета.
+        
+        Returns:
+            Сессии на сегодня (существующие, если план уже был сохранен)
+        """
+        active_plan = PersonalLearningPlan.query.filter_by(user_id=user_id, status='active').first()
+        if not active_plan:
+            return []
+        
+        today_start = datetime.combine(datetime.now().date(), datetime.min.time()).replace(tzinfo=timezone.utc)
+        self._remove_old_planned_sessions(active_plan, today_start)
+        
+        today_planned_sessions = StudySession.query.filter(
+            StudySession.learning_plan_id == active_plan.id,
+            StudySession.status == 'planned',
+            StudySession.started_at >= today_start
+        ).all()
+        if today_planned_sessions:
+            return today_planned_sessions
+        
+        return self._create_integrated_study_sessions(formatted_plan, db.session.get(User, user_id), active_plan)
+    
     def _create_integrated_study_sessions(self, formatted_plan: Dict, user: User, 
                                         active_plan: PersonalLearningPlan) -> List[StudySession]:
         """Создает StudySession записи для интегрированного плана"""
@@ -1839,6 +1681,11 @@ def generate_from_personal_plan(personal_plan: PersonalLearningPlan, target_minu
     """
     Generate daily plan using existing PersonalLearningPlan
     """
+    with instrument_plan_build(getattr(personal_plan, 'user_id', None), 'personal_plan'):
+        return _generate_from_personal_plan(personal_plan, target_minutes)
+
+
+def _generate_from_personal_plan(personal_plan: PersonalLearningPlan, target_minutes: int) -> Dict:
     try:
         # ВАЛИДАЦИЯ: Проверяем наличие необходимых данных в плане
         if not personal_plan:
@@ -0,0 +1,404 @@
+"""
+Daily Plan Snapshots
+Материализованные ежедневные планы обучения
+
+DailyLearningAlgorithm.generate_daily_plan считается один раз на пользователя
+и день; результат хранится сжатым снимком (DailyPlanSnapshot) и отдается из
+него при каждом открытии dashboard / learning map.
+
+Пересчет:
+- смена дня или смена PersonalLearningPlan (новая диагностика, сдвиг даты
+  переоценки) - полный пересчет при следующем чтении;
+- начало учебной сессии (StudySession переходит в 'in_progress') - весь план;
+- завершение учебной сессии - секции 'review', 'insights' и 'new_content'
+  (пройденные теория и практика); ответ на повторение - только 'review'.
+
+Изменения StudySession отслеживаются слушателем flush'а (init_daily_plan_snapshots),
+поэтому инвалидация срабатывает в любом коде, который меняет статус сессии.
+
+Ночной режим (flask precompute-daily-plans) считает планы всех активных
+пользователей в пуле процессов, не создавая запланированных StudySession;
+такой снимок помечается секцией 'sessions', и сессии создаются из него при
+первом показе плана.
+"""
+
+import json
+import logging
+import multiprocessing
+import threading
+import zlib
+from datetime import date, datetime, timezone
+from itertools import chain
+from typing import Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import event, inspect, select, update
+from sqlalchemy.orm import Session
+
+from extensions import db
+from models import DailyPlanSnapshot, PersonalLearningPlan, StudySession, User
+
+logger = logging.getLogger(__name__)
+
+SECTION_REVIEW = 'review'
+SECTION_INSIGHTS = 'insights'
+SECTION_NEW_CONTENT = 'new_content'
+# Не секция плана: снимок ночного пересчета, запланированные StudySession еще не созданы
+SECTION_SESSIONS = 'sessions'
+ALL_SECTIONS = '*'
+PARTIAL_SECTIONS = (SECTION_REVIEW, SECTION_INSIGHTS)
+COMPLETION_SECTIONS = (SECTION_REVIEW, SECTION_INSIGHTS, SECTION_NEW_CONTENT)
+
+
+def _encode_plan(plan: Dict) -> bytes:
+    plan = dict(plan)
+    # StudySession объекты в снимке заменяются их ID
+    sessions = plan.pop('study_sessions', None)
+    if sessions:
+        plan['study_session_ids'] = [getattr(s, 'id', s) for s in sessions]
+    return zlib.compress(json.dumps(plan, default=str, ensure_ascii=False).encode('utf-8'))
+
+
+def _decode_plan(payload: bytes) -> Dict:
+    return json.loads(zlib.decompress(payload).decode('utf-8'))
+
+
+def _parse_sections(value: Optional[str]) -> Set[str]:
+    return set(filter(None, (value or '').split(',')))
+
+
+def _merge_sections(value: Optional[str], sections: Optional[Iterable[str]]) -> str:
+    stale = _parse_sections(value)
+    stale |= set(sections) if sections is not None else {ALL_SECTIONS}
+    return ALL_SECTIONS if ALL_SECTIONS in stale else ','.join(sorted(stale))
+
+
+class DailyPlanSnapshotService:
+    """Чтение/пересчет снимков ежедневного плана"""
+
+    def _algorithm(self):
+        from utils.daily_learning_algorithm import DailyLearningAlgorithm
+        return DailyLearningAlgorithm()
+
+    def _plan_fingerprint(self, user_id: int) -> Optional[str]:
+        row = db.session.query(
+            PersonalLearningPlan.id,
+            PersonalLearningPlan.diagnostic_session_id,
+            PersonalLearningPlan.next_diagnostic_date
+        ).filter_by(user_id=user_id, status='active').first()
+        if row is None:
+            return None
+        return f'{row[0]}:{row[1]}:{row[2].isoformat() if row[2] else ""}'
+
+    # ------------------------------------------------------------------
+    # Чтение
+    # ------------------------------------------------------------------
+
+    def get_daily_plan(self, user_id: int, target_minutes: int = 30, force: bool = False) -> Dict:
+        """
+        Ежедневный план пользователя из снимка (с пересчетом при необходимости)
+
+        Args:
+            user_id: ID пользователя
+            target_minutes: Целевое время обучения
+            force: Пересчитать весь план независимо от снимка
+
+        Returns:
+            План в формате DailyLearningAlgorithm.generate_daily_plan
+        """
+        today = date.today()
+        snapshot = None if force else DailyPlanSnapshot.query.filter_by(
+            user_id=user_id, plan_date=today
+        ).first()
+
+        if snapshot is None or snapshot.target_minutes != target_minutes:
+            return self.materialize(user_id, target_minutes, snapshot=snapshot)
+
+        stale = _parse_sections(snapshot.stale_sections)
+        if ALL_SECTIONS in stale or snapshot.plan_fingerprint != self._plan_fingerprint(user_id):
+            return self.materialize(user_id, target_minutes, snapshot=snapshot)
+
+        plan = _decode_plan(snapshot.payload)
+        if SECTION_SESSIONS in stale:
+            if not isinstance(plan.get('sections'), list):
+                return self.materialize(user_id, target_minutes, snapshot=snapshot)
+            stale.discard(SECTION_SESSIONS)
+            plan = self._persist_sessions(user_id, snapshot, plan, stale)
+        if stale:
+            plan = self._refresh_sections(user_id, snapshot, plan, stale)
+        return plan
+
+    # ------------------------------------------------------------------
+    # Пересчет
+    # ------------------------------------------------------------------
+
+    def materialize(self, user_id: int, target_minutes: int = 30,
+                    snapshot: Optional[DailyPlanSnapshot] = None, commit: bool = True,
+                    persist_sessions: bool = True) -> Dict:
+        """
+        Полностью пересчитать план и сохранить снимок
+
+        Args:
+            persist_sessions: Создавать запланированные StudySession (False - только снимок)
+        """
+        plan = self._algorithm().generate_daily_plan(user_id, target_minutes, persist_sessions=persist_sessions)
+
+        # Ошибки (нет плана, просрочена переоценка) не кэшируются - они дешевые
+        if plan.get('success') is False:
+            if snapshot is not None:
+                db.session.delete(snapshot)
+                if commit:
+                    db.session.commit()
+            return plan
+
+        fingerprint = self._plan_fingerprint(user_id)
+        # Кодируем до добавления снимка: чтение id сессий может вызвать autoflush
+        payload = _encode_plan(plan)
+        if snapshot is None:
+            snapshot = DailyPlanSnapshot.query.filter_by(user_id=user_id, plan_date=date.today()).first()
+        if snapshot is None:
+            snapshot = DailyPlanSnapshot(user_id=user_id, plan_date=date.today())
+            db.session.add(snapshot)
+
+        snapshot.target_minutes = target_minutes
+        snapshot.payload = payload
+        snapshot.plan_fingerprint = fingerprint
+        snapshot.stale_sections = None if persist_sessions else SECTION_SESSIONS
+        snapshot.generated_at = datetime.now(timezone.utc)
+
+        try:
+            if commit:
+                db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error saving daily plan snapshot for user {user_id}: {e}")
+
+        return _decode_plan(snapshot.payload)
+
+    def _persist_sessions(self, user_id: int, snapshot: DailyPlanSnapshot, plan: Dict, stale: Set[str]) -> Dict:
+        """Создать StudySession для снимка ночного пересчета (первый показ плана)"""
+        sessions = self._algorithm().persist_plan_sessions(user_id, plan)
+        plan['study_session_ids'] = [session.id for session in sessions]
+        snapshot.payload = _encode_plan(plan)
+        snapshot.stale_sections = ','.join(sorted(stale)) or None
+        try:
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error saving study sessions of daily plan snapshot for user {user_id}: {e}")
+        return plan
+
+    def _refresh_sections(self, user_id: int, snapshot: DailyPlanSnapshot, plan: Dict, stale: Set[str]) -> Dict:
+        """Пересчитать только устаревшие секции интегрированного плана"""
+        # Частичный пересчет есть только для интегрированного формата (sections - список)
+        if not isinstance(plan.get('sections'), list) or not stale <= set(PARTIAL_SECTIONS):
+            return self.materialize(user_id, snapshot.target_minutes, snapshot=snapshot)
+
+        from utils.irt_spaced_integration import get_irt_spaced_integration
+        integration = get_irt_spaced_integration()
+        review_items, selected_reviews, review_time = integration.select_review_items(
+            user_id, snapshot.target_minutes
+        )
+
+        if SECTION_REVIEW in stale:
+            sections = [section for section in plan['sections'] if section.get('type') != 'review']
+            review_section = self._algorithm()._build_review_section(selected_reviews)
+            if review_section:
+                sections.insert(0, review_section)
+            plan['sections'] = sections
+            plan.setdefault('estimated_time', {})['review'] = review_time
+
+        if SECTION_INSIGHTS in stale:
+            abilities = integration._get_current_abilities(user_id)
+            plan['irt_insights'] = integration._generate_irt_insights(user_id, abilities)
+            plan['recommendations'] = integration._generate_learning_recommendations(
+                user_id, abilities, review_items
+            )
+
+        snapshot.payload = _encode_plan(plan)
+        snapshot.stale_sections = None
+        try:
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error refreshing daily plan snapshot for user {user_id}: {e}")
+        return plan
+
+    # ------------------------------------------------------------------
+    # Инвалидация (после событий)
+    # ------------------------------------------------------------------
+
+    def invalidate(self, user_id: int, sections: Optional[Iterable[str]] = None, commit: bool = True):
+        """
+        Пометить секции сегодняшнего снимка устаревшими
+
+        Args:
+            user_id: ID пользователя
+            sections: Секции (review, insights, new_content); None - весь план
+        """
+        snapshot = DailyPlanSnapshot.query.filter_by(user_id=user_id, plan_date=date.today()).first()
+        if snapshot is None:
+            return
+
+        snapshot.stale_sections = _merge_sections(snapshot.stale_sections, sections)
+
+        if commit:
+            try:
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Error invalidating daily plan snapshot for user {user_id}: {e}")
+
+    # ------------------------------------------------------------------
+    # Ночной пересчет
+    # ------------------------------------------------------------------
+
+    def get_active_user_ids(self) -> List[int]:
+        """Пользователи с активным планом обучения"""
+        rows = db.session.query(PersonalLearningPlan.user_id).join(
+            User, User.id == PersonalLearningPlan.user_id
+        ).filter(
+            PersonalLearningPlan.status == 'active',
+            User.is_active == True
+        ).distinct().all()
+        return [row[0] for row in rows]
+
+    def materialize_many(self, user_ids: Iterable[int], target_minutes: int = 30) -> Dict[str, int]:
+        """Пересчитать снимки планов для списка пользователей (в текущем процессе, без StudySession)"""
+        result = {'materialized': 0, 'skipped': 0, 'failed': 0}
+        for user_id in user_ids:
+            try:
+                plan = self.materialize(user_id, target_minutes, persist_sessions=False)
+                result['skipped' if plan.get('success') is False else 'materialized'] += 1
+            except Exception as e:
+                db.session.rollback()
+                result['failed'] += 1
+                logger.error(f"Error precomputing daily plan for user {user_id}: {e}")
+        return result
+
+    def precompute_all(self, processes: int = 4, chunk_size: int = 100,
+                       target_minutes: int = 30) -> Dict[str, int]:
+        """
+        Пересчитать планы всех активных пользователей на сегодня
+
+        Args:
+            processes: Размер пула процессов (1 - в текущем процессе)
+            chunk_size: Пользователей на задачу пула
+            target_minutes: Целевое время обучения
+        """
+        # Снимки прошлых дней больше не читаются
+        DailyPlanSnapshot.query.filter(DailyPlanSnapshot.plan_date < date.today()).delete(synchronize_session=False)
+        db.session.commit()
+
+        user_ids = self.get_active_user_ids()
+        chunks = [user_ids[i:i + chunk_size] for i in range(0, len(user_ids), chunk_size)]
+        totals = {'users': len(user_ids), 'materialized': 0, 'skipped': 0, 'failed': 0}
+
+        if processes <= 1 or len(chunks) <= 1:
+            results = [self.materialize_many(chunk, target_minutes) for chunk in chunks]
+        else:
+            with multiprocessing.Pool(processes=processes, initializer=_init_worker) as pool:
+                results = pool.map(_precompute_chunk, [(chunk, target_minutes) for chunk in chunks])
+
+        for result in results:
+            for key, value in result.items():
+                totals[key] += value
+        return totals
+
+
+# Глобальный экземпляр сервиса
+daily_plan_snapshots = DailyPlanSnapshotService()
+
+_worker_app = None
+
+
+def _init_worker():
+    """Инициализация процесса пула: свое приложение и свои соединения с БД"""
+    global _worker_app
+    from app import app
+    _worker_app = app
+    with app.app_context():
+        # Соединения, унаследованные от родителя при fork, не используются
+        db.engine.dispose()
+
+
+def _precompute_chunk(task):
+    user_ids, target_minutes = task
+    with _worker_app.app_context():
+        return daily_plan_snapshots.materialize_many(user_ids, target_minutes)
+
+
+# Инвалидация по изменениям StudySession (в той же транзакции, что и изменение)
+
+def _study_session_sections(obj) -> Optional[tuple]:
+    """Секции плана, устаревающие после изменения статуса сессии; () - не влияет"""
+    if not inspect(obj).attrs.status.history.has_changes():
+        return ()
+    if obj.status == 'in_progress':
+        return None
+    if obj.status == 'completed':
+        return COMPLETION_SECTIONS
+    return ()
+
+
+def _invalidate_on_study_session_changes(session, flush_context):
+    changes: Dict[int, Optional[Set[str]]] = {}
+    for obj in chain(session.new, session.dirty):
+        if not isinstance(obj, StudySession) or obj.learning_plan_id is None:
+            continue
+        sections = _study_session_sections(obj)
+        if sections == ():
+            continue
+        if obj.learning_plan_id in changes and changes[obj.learning_plan_id] is None:
+            continue
+        changes[obj.learning_plan_id] = None if sections is None else (
+            changes.get(obj.learning_plan_id, set()) | set(sections)
+        )
+    if not changes:
+        return
+
+    # Core запросы на соединении сессии: ORM flush внутри after_flush недопустим
+    connection = session.connection()
+    plan_users = dict(connection.execute(
+        select(PersonalLearningPlan.id, PersonalLearningPlan.user_id).where(PersonalLearningPlan.id.in_(list(changes)))
+    ).all())
+    snapshots = DailyPlanSnapshot.__table__
+    for plan_id, sections in changes.items():
+        user_id = plan_users.get(plan_id)
+        if user_id is None:
+            continue
+        row = connection.execute(
+            select(snapshots.c.id, snapshots.c.stale_sections).where(
+                snapshots.c.user_id == user_id, snapshots.c.plan_date == date.today()
+            )
+        ).first()
+        if row is not None:
+            connection.execute(
+                update(snapshots).where(snapshots.c.id == row.id)
+                .values(stale_sections=_merge_sections(row.stale_sections, sections))
+            )
+
+
+_listeners_lock = threading.Lock()
+_listeners_installed = False
+
+
+def init_daily_plan_snapshots(app):
+    """Подключить инвалидацию снимков к изменениям StudySession"""
+    global _listeners_installed
+    with _listeners_lock:
+        if not _listeners_installed:
+            event.listen(Session, 'after_flush', _invalidate_on_study_session_changes)
+            _listeners_installed = True
+
+
+def get_daily_plan(user_id: int, target_minutes: int = 30, force: bool = False) -> Dict:
+    """Ежедневный план из снимка"""
+    return daily_plan_snapshots.get_daily_plan(user_id, target_minutes, force)
+
+
+def invalidate_daily_plan(user_id: int, sections: Optional[Iterable[str]] = None, commit: bool = True):
+    """Пометить план пользователя (или его секции) устаревшим"""
+    try:
+        daily_plan_snapshots.invalidate(user_id, sections, commit)
+    except Exception as e:
+        logger.error(f"Error invalidating daily plan for user {user_id}: {e}")
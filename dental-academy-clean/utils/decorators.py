@@ -19,14 +19,7 @@ def admin_required(f):
     return decorated_function
 
 
-def rate_limit(requests_per_minute=60):
-    """Rate limiting decorator"""
-    def decorator(f):
-        @wraps(f)
-        def decorated_function(*args, **kwargs):
-            # Simple rate limiting - in production use Redis or similar
-            user_id = current_user.id if current_user.is_authenticated else request.remote_addr
-            # For now, just allow all requests
-            return f(*args, **kwargs)
-        return decorated_function
-    return decorator 
\ No newline at end of file
+def rate_limit(requests_per_minute=60, bucket='general'):
+    """Rate limiting decorator (shared sliding-window limiter, raises TooManyRequests)"""
+    from utils.rate_limiter import rate_limit as shared_rate_limit
+    return shared_rate_limit(requests_per_minute, bucket=bucket) 
\ No newline at end of file
@@ -311,7 +311,8 @@ class EmailClient:
             logger.error(f"Error parsing email: {str(e)}")
             return None
     
-    def _decode_header(self, header):
+    @staticmethod
+    def _decode_header(header):
         """Decode email header"""
         try:
             decoded_parts = decode_header(header)
@@ -330,7 +331,8 @@ class EmailClient:
         except:
             return str(header)
     
-    def _parse_email_address(self, address_string):
+    @staticmethod
+    def _parse_email_address(address_string):
         """Parse email address string into email and name"""
         try:
             # Try to parse with email.utils
@@ -0,0 +1,192 @@
+"""
+Email Template Compiler
+Шаблон письма рендерится один раз на кампанию в скелет с именованными слотами
+
+    template = compile_email_template('learning_map_welcome', greeting_name='there', cta_url=url)
+    template.render({'greeting_name': 'Anna'})   # подстановка, без повторного f-string рендера
+    campaign.message = template.skeleton          # скелет хранится в кампании
+
+Генераторы HTML (routes/communication_routes.py) регистрируются через
+register_email_template и вызываются с маркерами слотов вместо
+персональных полей. Скелет - обычная строка: литералы и слоты разделены
+SLOT_MARK, значение по умолчанию слота - после DEFAULT_MARK. Строка без
+маркеров (старые кампании) рендерится как есть.
+
+Вложения кодируются в base64 один раз и кешируются по sha256 содержимого.
+"""
+
+import base64
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from html import escape
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Управляющие символы, которых нет в HTML; в отличие от NUL допустимы в PostgreSQL TEXT
+SLOT_MARK = '\x1f'
+DEFAULT_MARK = '\x1e'
+
+# Персональные поля, заполняемые для каждого получателя
+GREETING_SLOT = 'greeting_name'
+
+MAX_COMPILED_TEMPLATES = 64
+MAX_CACHED_ATTACHMENT_BYTES = 32 * 1024 * 1024
+
+_generators: Dict[str, Callable[..., str]] = {}
+
+
+def register_email_template(template_type: str, generator: Callable[..., str]):
+    """Зарегистрировать генератор HTML для типа шаблона"""
+    _generators[template_type] = generator
+
+
+def slot(name: str, default: Optional[str] = '') -> str:
+    """Маркер слота для передачи в генератор вместо персонального значения"""
+    return f'{SLOT_MARK}{name}{DEFAULT_MARK}{default or ""}{SLOT_MARK}'
+
+
+class CompiledEmailTemplate:
+    """Скелет письма: литералы, чередующиеся с именованными слотами"""
+
+    __slots__ = ('skeleton', 'literals', 'slots', 'defaults', 'default_html')
+
+    def __init__(self, skeleton: str):
+        self.skeleton = skeleton
+        pieces = skeleton.split(SLOT_MARK)
+        self.literals: List[str] = pieces[0::2]
+        self.slots: List[str] = []
+        self.defaults: List[str] = []
+        for token in pieces[1::2]:
+            name, _, default = token.partition(DEFAULT_MARK)
+            self.slots.append(name)
+            self.defaults.append(escape(default))
+        self.default_html = self._join(self.defaults)
+
+    @property
+    def is_static(self) -> bool:
+        return not self.slots
+
+    def render(self, values: Optional[Dict[str, str]] = None) -> str:
+        """Подставить значения слотов (экранируются); пустые - значения по умолчанию"""
+        if not values:
+            return self.default_html
+        return self._join([
+            escape(values[name]) if values.get(name) else default
+            for name, default in zip(self.slots, self.defaults)
+        ])
+
+    def _join(self, slot_values: List[str]) -> str:
+        if not slot_values:
+            return self.literals[0]
+        parts = [self.literals[0]]
+        for value, literal in zip(slot_values, self.literals[1:]):
+            parts.append(value)
+            parts.append(literal)
+        return ''.join(parts)
+
+
+def recipient_slot_values(recipient_name: Optional[str]) -> Dict[str, str]:
+    """Значения персональных слотов для получателя (обращение - по имени)"""
+    name = (recipient_name or '').strip()
+    return {GREETING_SLOT: name.split()[0]} if name else {}
+
+
+class EmailTemplateCompiler:
+    """LRU кеш скомпилированных шаблонов (ключ - тип и параметры кампании)"""
+
+    def __init__(self, max_templates: int = MAX_COMPILED_TEMPLATES):
+        self.max_templates = max_templates
+        self._compiled: 'OrderedDict[tuple, CompiledEmailTemplate]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(template_type: str, greeting_name: Optional[str], context: Dict) -> tuple:
+        frozen = tuple(sorted(
+            (key, tuple(value) if isinstance(value, list) else value)
+            for key, value in context.items()
+        ))
+        return template_type, greeting_name, frozen
+
+    def compile(self, template_type: str, greeting_name: Optional[str] = None, **context) -> CompiledEmailTemplate:
+        """
+        Скомпилировать шаблон кампании (генератор вызывается один раз)
+
+        Args:
+            template_type: Зарегистрированный тип шаблона
+            greeting_name: Обращение по умолчанию для получателей без имени
+            **context: Остальные параметры генератора (одинаковые для всех получателей)
+        """
+        generator = _generators.get(template_type)
+        if generator is None:
+            raise KeyError(f'Unknown email template: {template_type}')
+
+        key = self._key(template_type, greeting_name, context)
+        with self._lock:
+            compiled = self._compiled.get(key)
+            if compiled is not None:
+                self._compiled.move_to_end(key)
+                self.hits += 1
+                return compiled
+
+        compiled = CompiledEmailTemplate(generator(greeting_name=slot(GREETING_SLOT, greeting_name), **context))
+        with self._lock:
+            self.misses += 1
+            self._compiled[key] = compiled
+            while len(self._compiled) > self.max_templates:
+                self._compiled.popitem(last=False)
+        return compiled
+
+    def clear(self):
+        with self._lock:
+            self._compiled.clear()
+
+
+class AttachmentCache:
+    """base64 вложений по sha256 содержимого (ограничен суммарным размером)"""
+
+    def __init__(self, max_bytes: int = MAX_CACHED_ATTACHMENT_BYTES):
+        self.max_bytes = max_bytes
+        self._encoded: 'OrderedDict[str, str]' = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def encode(self, content: bytes) -> str:
+        digest = hashlib.sha256(content).hexdigest()
+        with self._lock:
+            encoded = self._encoded.get(digest)
+            if encoded is not None:
+                self._encoded.move_to_end(digest)
+                return encoded
+
+        encoded = base64.b64encode(content).decode('ascii')
+        with self._lock:
+            if digest not in self._encoded:
+                self._encoded[digest] = encoded
+                self._size += len(encoded)
+            while self._size > self.max_bytes and len(self._encoded) > 1:
+                _, evicted = self._encoded.popitem(last=False)
+                self._size -= len(evicted)
+        return encoded
+
+
+# Глобальные экземпляры
+email_template_compiler = EmailTemplateCompiler()
+attachment_cache = AttachmentCache()
+
+
+def compile_email_template(template_type: str, greeting_name: Optional[str] = None, **context) -> CompiledEmailTemplate:
+    """Скомпилированный шаблон кампании"""
+    return email_template_compiler.compile(template_type, greeting_name, **context)
+
+
+def encode_attachment(content: bytes, filename: str, cid: Optional[str] = None) -> Dict:
+    """Вложение в формате Resend API (base64 из кеша по хешу содержимого)"""
+    attachment = {'filename': filename, 'content': attachment_cache.encode(content)}
+    if cid:
+        attachment['cid'] = cid
+    return attachment
@@ -0,0 +1,349 @@
+"""
+English reading lessons store
+Хранилище уроков чтения (static/js/lessons/lesson_NNN.js)
+
+Уроки разбираются из JS один раз и хранятся в памяти процесса; запись
+проверяется по mtime исходного файла, поэтому правка урока подхватывается
+без перезапуска. Результат convert_lesson_to_passage_format кешируется
+вместе с уроком.
+
+На этапе сборки уроки компилируются в JSON и проверяются, так что воркерам
+не нужно запускать Node.js, а ошибки разбора видны при деплое:
+    python -m utils.english_lessons compile
+    flask compile-english-lessons
+
+Возвращаемые словари общие для всех запросов - их нельзя изменять.
+"""
+
+import json
+import logging
+import os
+import re
+import subprocess
+import sys
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Версия формата скомпилированных файлов
+LESSON_FORMAT_VERSION = 1
+
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LESSONS_DIR = os.path.join(APP_ROOT, 'static', 'js', 'lessons')
+COMPILED_DIR = os.environ.get('ENGLISH_LESSONS_COMPILED_DIR', os.path.join(LESSONS_DIR, 'compiled'))
+
+LESSON_FILE_RE = re.compile(r'^lesson_(\d{3})\.js$')
+
+# Node.js: исполнить модуль урока и вывести экспортируемый объект как JSON
+NODE_PARSER = (
+    "const src = require('fs').readFileSync(process.argv[1], 'utf8');"
+    "const m = {exports: {}};"
+    "new Function('module', src.replace(/export\\s+const\\s+\\w+\\s*=\\s*/, 'module.exports = '))(m);"
+    "process.stdout.write(JSON.stringify(m.exports));"
+)
+
+
+def _parse_with_node(path: str) -> Optional[Dict]:
+    try:
+        result = subprocess.run(['node', '-e', NODE_PARSER, path], capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.warning(f"Node.js not available or failed: {e}")
+        return None
+    if result.returncode != 0 or not result.stdout.strip():
+        logger.warning(f"Node.js parsing failed for {path}: {result.stderr.strip()}")
+        return None
+    return json.loads(result.stdout)
+
+
+def _parse_with_regex(js_content: str) -> Optional[Dict]:
+    """Fallback without Node.js: rewrite template literals and quotes into JSON"""
+    js_content = re.sub(r'export\s+const\s+\w+\s*=\s*', '', js_content)
+
+    # Remove comments (simple approach)
+    js_content = re.sub(r'//.*?$', '', js_content, flags=re.MULTILINE)
+    js_content = re.sub(r'/\*.*?\*/', '', js_content, flags=re.DOTALL)
+
+    # Template literals and single-quoted strings -> JSON strings
+    js_content = re.sub(r'`([^`]*)`', lambda match: json.dumps(match.group(1)), js_content)
+    js_content = re.sub(r"'([^']*)'", lambda match: json.dumps(match.group(1)), js_content)
+
+    js_content = js_content.rstrip().rstrip(';').strip()
+    try:
+        return json.loads(js_content)
+    except json.JSONDecodeError as e:
+        logger.error(f"JSON decode error: {e}")
+        return None
+
+
+def parse_lesson_js(js_content: str, path: Optional[str] = None) -> Optional[Dict]:
+    """Parse JavaScript lesson object to Python dict - uses Node.js if available"""
+    if path:
+        try:
+            lesson_data = _parse_with_node(path)
+            if lesson_data:
+                return lesson_data
+        except json.JSONDecodeError as e:
+            logger.warning(f"Node.js output is not JSON for {path}: {e}")
+    return _parse_with_regex(js_content)
+
+
+def validate_lesson(lesson_data: Optional[Dict]) -> List[str]:
+    """Ошибки структуры урока (пустой список - урок корректен)"""
+    if not isinstance(lesson_data, dict):
+        return ['lesson is not an object']
+
+    errors = [f'missing {key}' for key in ('id', 'title', 'text') if not lesson_data.get(key)]
+    questions = lesson_data.get('questions')
+    if not isinstance(questions, list) or not questions:
+        return errors + ['no questions']
+
+    for idx, question in enumerate(questions, 1):
+        if not question.get('question'):
+            errors.append(f'question {idx}: missing text')
+        options = question.get('options') or []
+        option_ids = [option.get('id') for option in options]
+        if len(options) < 2:
+            errors.append(f'question {idx}: fewer than 2 options')
+        if len(set(option_ids)) != len(option_ids) or not all(option_ids):
+            errors.append(f'question {idx}: option ids are missing or duplicated')
+        correct = sum(1 for option in options if option.get('correct'))
+        if correct != 1:
+            errors.append(f'question {idx}: {correct} correct options (expected 1)')
+    return errors
+
+
+def convert_lesson_to_passage_format(lesson_data, passage_id):
+    """Convert new lesson format to old passage format for compatibility"""
+    if not lesson_data:
+        return None, []
+
+    # Convert passage info
+    passage_info = {
+        'id': passage_id,
+        'title': lesson_data.get('title', ''),
+        'text': lesson_data.get('text', ''),
+        'category': 'general',
+        'difficulty': 7.0,
+        'word_count': len(lesson_data.get('text', '').split()),
+        'image_url': lesson_data.get('imageUrl', '')
+    }
+
+    # Convert questions
+    questions_data = []
+    for idx, q in enumerate(lesson_data.get('questions', []), 1):
+        # Find correct answer option ID
+        correct_answer = None
+        options_dict = {}
+
+        for opt in q.get('options', []):
+            opt_id = opt.get('id', '')
+            opt_text = opt.get('text', '')
+            options_dict[opt_id] = opt_text
+            if opt.get('correct'):
+                correct_answer = opt_id
+
+        question_data = {
+            'id': idx,  # Use index as ID for compatibility
+            'question_number': idx,
+            'question_type': 'multiple_choice',  # All new questions are multiple choice
+            'question_text': q.get('question', ''),
+            'correct_answer': correct_answer or '',
+            'explanation': next((opt.get('explanation', '') for opt in q.get('options', []) if opt.get('correct')), ''),
+            'options': options_dict
+        }
+        questions_data.append(question_data)
+
+    return passage_info, questions_data
+
+
+@dataclass
+class _CachedLesson:
+    mtime_ns: int
+    data: Optional[Dict]
+    passages: Dict[int, Tuple[Optional[Dict], List[Dict]]] = field(default_factory=dict)
+
+
+class LessonStore:
+    """Разобранные уроки с проверкой по mtime исходного JS файла"""
+
+    def __init__(self, lessons_dir: str = LESSONS_DIR, compiled_dir: str = COMPILED_DIR):
+        self.lessons_dir = lessons_dir
+        self.compiled_dir = compiled_dir
+        self._lessons: Dict[int, _CachedLesson] = {}
+        self._lock = threading.Lock()
+        self.parses = 0
+        self.compiled_loads = 0
+
+    def init_app(self, app):
+        if app.static_folder:
+            lessons_dir = os.path.join(app.static_folder, 'js', 'lessons')
+            if os.path.isdir(lessons_dir):
+                self.lessons_dir = lessons_dir
+
+    def source_path(self, lesson_num: int) -> str:
+        return os.path.join(self.lessons_dir, f'lesson_{lesson_num:03d}.js')
+
+    def compiled_path(self, lesson_num: int) -> str:
+        return os.path.join(self.compiled_dir, f'lesson_{lesson_num:03d}.json')
+
+    def lesson_numbers(self) -> List[int]:
+        try:
+            names = os.listdir(self.lessons_dir)
+        except OSError:
+            return []
+        return sorted(int(match.group(1)) for match in map(LESSON_FILE_RE.match, names) if match)
+
+    def _read_compiled(self, lesson_num: int, source_mtime_ns: int) -> Optional[Dict]:
+        """Скомпилированный урок, если он не старше исходного файла"""
+        path = self.compiled_path(lesson_num)
+        try:
+            if os.stat(path).st_mtime_ns < source_mtime_ns:
+                return None
+            with open(path, 'r', encoding='utf-8') as f:
+                payload = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if payload.get('format') != LESSON_FORMAT_VERSION:
+            return None
+        return payload.get('lesson')
+
+    def _parse_source(self, lesson_num: int) -> Optional[Dict]:
+        path = self.source_path(lesson_num)
+        with open(path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        self.parses += 1
+        lesson_data = parse_lesson_js(content, path)
+        if lesson_data is None:
+            logger.error(f"Failed to parse lesson {lesson_num}")
+        return lesson_data
+
+    def _entry(self, lesson_num: int) -> Optional[_CachedLesson]:
+        try:
+            mtime_ns = os.stat(self.source_path(lesson_num)).st_mtime_ns
+        except OSError:
+            return None
+
+        entry = self._lessons.get(lesson_num)
+        if entry is not None and entry.mtime_ns == mtime_ns:
+            return entry
+
+        lesson_data = self._read_compiled(lesson_num, mtime_ns)
+        if lesson_data is not None:
+            self.compiled_loads += 1
+        else:
+            lesson_data = self._parse_source(lesson_num)
+
+        # Неудачный разбор тоже кешируется до изменения файла
+        entry = _CachedLesson(mtime_ns, lesson_data)
+        with self._lock:
+            self._lessons[lesson_num] = entry
+        return entry
+
+    def get(self, lesson_num: int) -> Optional[Dict]:
+        """Урок как dict или None, если файла нет или он не разбирается"""
+        entry = self._entry(lesson_num)
+        return entry.data if entry else None
+
+    def passage(self, lesson_num: int, passage_id: int) -> Tuple[Optional[Dict], List[Dict]]:
+        """convert_lesson_to_passage_format для урока (кешируется вместе с уроком)"""
+        entry = self._entry(lesson_num)
+        if entry is None or entry.data is None:
+            return None, []
+        converted = entry.passages.get(passage_id)
+        if converted is None:
+            converted = convert_lesson_to_passage_format(entry.data, passage_id)
+            entry.passages[passage_id] = converted
+        return converted
+
+    def summaries(self) -> List[Dict]:
+        """Краткие сведения обо всех уроках для списка"""
+        summaries = []
+        for lesson_num in self.lesson_numbers():
+            lesson_data = self.get(lesson_num)
+            if lesson_data:
+                summaries.append({
+                    'id': lesson_data.get('id', f'lesson_{lesson_num:03d}'),
+                    'title': lesson_data.get('title', f'Lesson {lesson_num}'),
+                    'index': lesson_num,
+                    'imageUrl': lesson_data.get('imageUrl')
+                })
+        return summaries
+
+    def warm(self) -> int:
+        """Загрузить все уроки (скомпилированные файлы или разбор JS)"""
+        return sum(1 for lesson_num in self.lesson_numbers() if self.get(lesson_num) is not None)
+
+    def compile_all(self) -> Dict[int, List[str]]:
+        """
+        Разобрать все уроки из JS, проверить и сохранить в JSON
+
+        Returns:
+            Ошибки по номерам уроков (пустой список - урок скомпилирован)
+        """
+        os.makedirs(self.compiled_dir, exist_ok=True)
+        report = {}
+        for lesson_num in self.lesson_numbers():
+            lesson_data = self._parse_source(lesson_num)
+            errors = validate_lesson(lesson_data) if lesson_data is not None else ['failed to parse']
+            report[lesson_num] = errors
+            if errors:
+                continue
+
+            path = self.compiled_path(lesson_num)
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'format': LESSON_FORMAT_VERSION, 'lesson': lesson_data}, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        with self._lock:
+            self._lessons.clear()
+        return report
+
+    def get_stats(self) -> Dict:
+        return {
+            'cached': len(self._lessons),
+            'parses': self.parses,
+            'compiled_loads': self.compiled_loads,
+            'lessons_dir': self.lessons_dir
+        }
+
+
+# Глобальный экземпляр
+english_lessons = LessonStore()
+
+
+def init_english_lessons(app):
+    """Указать каталог уроков приложения и загрузить уроки"""
+    english_lessons.init_app(app)
+    loaded = english_lessons.warm()
+    logger.info(f"English lessons loaded: {loaded} ({english_lessons.compiled_loads} precompiled)")
+
+
+def get_english_lesson(lesson_num: int) -> Optional[Dict]:
+    return english_lessons.get(lesson_num)
+
+
+def get_english_passage(lesson_num: int, passage_id: int) -> Tuple[Optional[Dict], List[Dict]]:
+    return english_lessons.passage(lesson_num, passage_id)
+
+
+def compile_english_lessons() -> Dict[int, List[str]]:
+    return english_lessons.compile_all()
+
+
+def main(argv: List[str]) -> int:
+    """Точка входа `python -m utils.english_lessons compile`"""
+    command = argv[1] if len(argv) > 1 else 'compile'
+    if command != 'compile':
+        print(f"Unknown command: {command} (use 'compile')")
+        return 2
+    report = compile_english_lessons()
+    for lesson_num, errors in report.items():
+        status = 'ok' if not errors else '; '.join(errors)
+        print(f"lesson_{lesson_num:03d}: {status}")
+    return 1 if any(report.values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
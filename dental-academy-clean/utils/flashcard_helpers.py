@@ -1,13 +1,107 @@
 """
 Helper functions for medical terminology flashcard system
+
+Progress of a user is read through FlashcardProgressSnapshot: all
+UserTermProgress rows of the user joined with their terms in one query
+(ix_user_term_progress_user_next_review), memoized for the request.
+Due reviews, mastery distribution and category progress are computed
+from that snapshot. The due-count badge uses the snapshot only when the
+request already loaded it; otherwise it runs a single COUNT query.
 """
 
+from collections import defaultdict
 from datetime import datetime, timezone, timedelta
-from sqlalchemy import func
+from flask import g, has_request_context
+from sqlalchemy import func, and_
 from models import MedicalTerm, UserTermProgress, db
 from utils.helpers import get_user_profession_code
 
 
+def _as_utc(value):
+    """Naive datetimes from the DB are treated as UTC (same as UserTermProgress.is_due)"""
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+class FlashcardProgressSnapshot:
+    """All term progress of one user, loaded with a single join"""
+
+    def __init__(self, user_id, now=None):
+        self.user_id = user_id
+        self.now = now or datetime.now(timezone.utc)
+        # (progress, term) ordered by next_review
+        self.rows = db.session.query(UserTermProgress, MedicalTerm).join(
+            MedicalTerm, UserTermProgress.term_id == MedicalTerm.id
+        ).filter(
+            UserTermProgress.user_id == user_id
+        ).order_by(UserTermProgress.next_review).all()
+        self.by_term_id = {progress.term_id: progress for progress, _ in self.rows}
+
+    def is_due(self, progress):
+        next_review = _as_utc(progress.next_review)
+        return next_review is not None and next_review <= self.now
+
+    def due_rows(self, categories=None):
+        """(progress, term) pairs due now, optionally limited to categories"""
+        return [
+            (progress, term) for progress, term in self.rows
+            if self.is_due(progress) and (not categories or term.category in categories)
+        ]
+
+    def due_count(self, categories=None):
+        return len(self.due_rows(categories))
+
+    def mastery_distribution(self):
+        distribution = {0: 0, 1: 0, 2: 0, 3: 0, 4: 0, 5: 0}
+        for progress, _ in self.rows:
+            distribution[min(progress.mastery_level or 0, 5)] += 1
+        return distribution
+
+    def category_rows(self, category):
+        return [(progress, term) for progress, term in self.rows if term.category == category]
+
+    def category_summaries(self):
+        """Per-category studied/learning/mastered/due counts"""
+        summaries = defaultdict(lambda: {'studied': 0, 'learning': 0, 'mastered': 0, 'due': 0})
+        for progress, term in self.rows:
+            summary = summaries[term.category]
+            summary['studied'] += 1
+            mastery = progress.mastery_level or 0
+            if mastery >= 4:
+                summary['mastered'] += 1
+            elif mastery > 0:
+                summary['learning'] += 1
+            if self.is_due(progress):
+                summary['due'] += 1
+        return dict(summaries)
+
+
+def _loaded_progress_snapshot(user_id):
+    """Snapshot already loaded by this request, without loading it"""
+    if not has_request_context():
+        return None
+    return g.get('_flashcard_snapshots', {}).get(user_id)
+
+
+def get_progress_snapshot(user):
+    """Progress snapshot of the user (memoized in flask.g for the request)"""
+    if not has_request_context():
+        return FlashcardProgressSnapshot(user.id)
+
+    snapshots = g.setdefault('_flashcard_snapshots', {})
+    snapshot = snapshots.get(user.id)
+    if snapshot is None:
+        snapshot = snapshots[user.id] = FlashcardProgressSnapshot(user.id)
+    return snapshot
+
+
+def invalidate_progress_snapshot(user_id):
+    """Drop the memoized snapshot after progress was written"""
+    if has_request_context():
+        g.get('_flashcard_snapshots', {}).pop(user_id, None)
+
+
 def get_session_terms(user, category, count=10):
     """
     Get optimal mix of terms for a study session
@@ -15,6 +109,9 @@ def get_session_terms(user, category, count=10):
     Returns 50% new terms + 50% due reviews
     Prioritizes by difficulty and frequency
     
+    Terms of the category and the user's progress for them come from one
+    outer join; new / due / not yet due terms are split in a single pass.
+    
     Args:
         user: Current user object
         category: Category name (e.g., 'anatomy')
@@ -24,57 +121,45 @@ def get_session_terms(user, category, count=10):
         list: MedicalTerm objects
     """
     try:
-        # Get all terms in category
-        all_category_terms = MedicalTerm.query.filter_by(category=category).all()
+        rows = db.session.query(MedicalTerm, UserTermProgress.next_review).outerjoin(
+            UserTermProgress,
+            and_(UserTermProgress.term_id == MedicalTerm.id, UserTermProgress.user_id == user.id)
+        ).filter(
+            MedicalTerm.category == category
+        ).order_by(MedicalTerm.id).all()
         
-        if not all_category_terms:
+        if not rows:
             return []
         
-        # Split terms into new and review
+        now = datetime.now(timezone.utc)
         new_terms = []
         review_terms = []
+        studied_terms = []
         
-        for term in all_category_terms:
-            progress = UserTermProgress.query.filter_by(
-                user_id=user.id,
-                term_id=term.id
-            ).first()
-            
-            if not progress:
+        for term, next_review in rows:
+            if next_review is None:
                 new_terms.append(term)
+            elif _as_utc(next_review) <= now:
+                review_terms.append(term)
             else:
-                try:
-                    # Check if term is due for review (with error handling for datetime issues)
-                    if progress.is_due:
-                        review_terms.append(term)
-                except Exception as is_due_error:
-                    print(f"Warning: Error checking is_due for progress {progress.id}: {is_due_error}")
-                    # If error checking is_due, treat as not due
-                    pass
+                studied_terms.append(term)
         
         # Sort by difficulty and frequency (prioritize harder, more common terms)
-        new_terms.sort(key=lambda t: (t.difficulty, t.frequency), reverse=True)
-        review_terms.sort(key=lambda t: t.difficulty, reverse=True)
+        new_terms.sort(key=lambda t: (t.difficulty or 0, t.frequency or 0), reverse=True)
+        review_terms.sort(key=lambda t: t.difficulty or 0, reverse=True)
         
         # Mix: 50% new, 50% review
         new_count = max(count // 2, 1)
         review_count = count - new_count
         
-        selected = []
-        selected.extend(new_terms[:new_count])
-        selected.extend(review_terms[:review_count])
+        selected = new_terms[:new_count] + review_terms[:review_count]
         
-        # If not enough terms, add more from either pool
+        # If not enough terms, add leftover new terms, then remaining studied terms
+        if len(selected) < count:
+            selected.extend(new_terms[new_count:new_count + count - len(selected)])
         if len(selected) < count:
-            remaining = count - len(selected)
-            # Add leftover new terms
-            selected.extend(new_terms[new_count:new_count + remaining])
-            # Add non-due review terms
-            non_due_reviews = [t for t in all_category_terms 
-                              if t not in selected 
-                              and any(p.user_id == user.id and p.term_id == t.id 
-                                     for p in t.user_progress)]
-            selected.extend(non_due_reviews[:remaining - len(selected) + new_count])
+            leftovers = review_terms[review_count:] + studied_terms
+            selected.extend(leftovers[:count - len(selected)])
         
         return selected[:count]
     
@@ -161,15 +246,7 @@ def get_mastery_distribution(user):
         dict: {0: count, 1: count, ..., 5: count}
     """
     try:
-        distribution = {0: 0, 1: 0, 2: 0, 3: 0, 4: 0, 5: 0}
-        
-        progress_items = UserTermProgress.query.filter_by(user_id=user.id).all()
-        
-        for progress in progress_items:
-            level = min(progress.mastery_level, 5)
-            distribution[level] += 1
-        
-        return distribution
+        return get_progress_snapshot(user).mastery_distribution()
     
     except Exception as e:
         print(f"Error getting mastery distribution: {e}")
@@ -195,9 +272,9 @@ def get_category_progress(user, category):
         }
     """
     try:
-        # Get all terms in category
-        all_terms = MedicalTerm.query.filter_by(category=category).all()
-        total = len(all_terms)
+        total = db.session.query(func.count(MedicalTerm.id)).filter(
+            MedicalTerm.category == category
+        ).scalar() or 0
         
         if total == 0:
             return None
@@ -209,23 +286,17 @@ def get_category_progress(user, category):
         total_correct = 0
         last_review = None
         
-        for term in all_terms:
-            progress = UserTermProgress.query.filter_by(
-                user_id=user.id,
-                term_id=term.id
-            ).first()
+        for progress, _ in get_progress_snapshot(user).category_rows(category):
+            studied += 1
+            if progress.mastery_level >= 4:
+                mastered += 1
+            
+            total_reviewed += progress.times_reviewed
+            total_correct += progress.times_correct
             
-            if progress:
-                studied += 1
-                if progress.mastery_level >= 4:
-                    mastered += 1
-                
-                total_reviewed += progress.times_reviewed
-                total_correct += progress.times_correct
-                
-                if progress.last_reviewed:
-                    if not last_review or progress.last_reviewed > last_review:
-                        last_review = progress.last_reviewed
+            if progress.last_reviewed:
+                if not last_review or progress.last_reviewed > last_review:
+                    last_review = progress.last_reviewed
         
         accuracy = (total_correct / total_reviewed * 100) if total_reviewed > 0 else 0
         
@@ -268,22 +339,13 @@ def get_due_reviews_by_category(user):
         }
     """
     try:
-        due_items = UserTermProgress.query.filter(
-            UserTermProgress.user_id == user.id,
-            UserTermProgress.next_review <= datetime.now(timezone.utc)
-        ).all()
-        
         due_by_category = {}
         
         allowed_categories = set(get_allowed_categories(user))
 
-        for progress in due_items:
-            term = progress.term
+        for progress, term in get_progress_snapshot(user).due_rows(allowed_categories):
             category = term.category
             
-            if allowed_categories and category not in allowed_categories:
-                continue
-            
             if category not in due_by_category:
                 due_by_category[category] = []
             
@@ -312,6 +374,35 @@ def get_due_reviews_by_category(user):
         return {}
 
 
+def get_due_count(user):
+    """
+    Count of terms due for review in the categories allowed for the user
+    
+    Args:
+        user: Current user object
+    
+    Returns:
+        int: Number of due terms
+    """
+    allowed_categories = get_allowed_categories(user)
+    snapshot = _loaded_progress_snapshot(user.id)
+    if snapshot is not None:
+        return snapshot.due_count(set(allowed_categories))
+
+    # Badge endpoint: one COUNT, the rows themselves are not needed
+    query = db.session.query(func.count(UserTermProgress.id)).filter(
+        UserTermProgress.user_id == user.id,
+        UserTermProgress.next_review <= datetime.now(timezone.utc)
+    )
+    if allowed_categories:
+        query = query.join(
+            MedicalTerm, UserTermProgress.term_id == MedicalTerm.id
+        ).filter(
+            MedicalTerm.category.in_(allowed_categories)
+        )
+    return query.scalar()
+
+
 def get_study_streak(user):
     """
     Calculate current study streak (consecutive days of activity)
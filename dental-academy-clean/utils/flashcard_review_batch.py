@@ -0,0 +1,245 @@
+"""
+Batched flashcard review submission
+
+A client (study page, offline/mobile app) sends a whole session at once:
+
+    {
+        "batch_id": "3f1c...",            // client-generated, unique per session upload
+        "reviews": [
+            {"term_id": 12, "quality": 3, "time_spent": 8, "reviewed_at": "2026-10-18T09:15:02Z"},
+            ...
+        ]
+    }
+
+All SM-2 updates, item mastery, XP and DailyFlashcardProgress are applied in
+one transaction with a constant number of queries. The accepted batch is
+recorded in FlashcardReviewBatch, so a retry with the same batch_id returns
+the stored result without applying the reviews again.
+"""
+
+import logging
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy.exc import IntegrityError
+
+from models import (
+    db, MedicalTerm, UserTermProgress, DailyFlashcardProgress, FlashcardReviewBatch
+)
+from utils.flashcard_helpers import (
+    calculate_flashcard_xp, get_allowed_categories, invalidate_progress_snapshot
+)
+from utils.mastery_helpers import update_item_mastery_batch
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH_REVIEWS = 200
+MAX_BATCH_ID_LENGTH = 64
+# Daily goal used by the session-complete endpoint
+DAILY_TERMS_CAP = 10
+
+# 4-point confidence rating -> SM-2 quality (same as /flashcards/review/<term_id>)
+QUALITY_MAPPING = {1: 0, 2: 2, 3: 3, 4: 5}
+
+
+class ReviewBatchError(ValueError):
+    """Invalid batch payload"""
+
+
+def _parse_reviewed_at(value, now: datetime) -> datetime:
+    if not value:
+        return now
+    try:
+        reviewed_at = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        raise ReviewBatchError(f'Invalid reviewed_at: {value}')
+    if reviewed_at.tzinfo is None:
+        reviewed_at = reviewed_at.replace(tzinfo=timezone.utc)
+    # Client clocks ahead of the server are clamped to now
+    return min(reviewed_at.astimezone(timezone.utc), now)
+
+
+def parse_reviews(payload: List[Dict], now: Optional[datetime] = None) -> List[Dict]:
+    """Validate and normalize the reviews of a batch (order is preserved)"""
+    now = now or datetime.now(timezone.utc)
+    if not isinstance(payload, list) or not payload:
+        raise ReviewBatchError('reviews must be a non-empty list')
+    if len(payload) > MAX_BATCH_REVIEWS:
+        raise ReviewBatchError(f'At most {MAX_BATCH_REVIEWS} reviews per batch')
+
+    reviews = []
+    for position, item in enumerate(payload):
+        if not isinstance(item, dict):
+            raise ReviewBatchError(f'Review #{position} must be an object')
+        try:
+            term_id = int(item['term_id'])
+            confidence = int(item.get('quality', 3))
+            time_spent = float(item.get('time_spent', 0) or 0)
+        except (KeyError, TypeError, ValueError):
+            raise ReviewBatchError(f'Review #{position} needs integer term_id and quality')
+        if confidence not in QUALITY_MAPPING:
+            raise ReviewBatchError(f'Review #{position}: confidence must be 1-4')
+        reviews.append({
+            'term_id': term_id,
+            'quality': QUALITY_MAPPING[confidence],
+            'time_spent': max(time_spent, 0.0),
+            'reviewed_at': _parse_reviewed_at(item.get('reviewed_at'), now)
+        })
+    return reviews
+
+
+def _stored_result(user_id: int, batch_id: str) -> Optional[Dict]:
+    receipt = FlashcardReviewBatch.query.filter_by(user_id=user_id, batch_id=batch_id).first()
+    if receipt is None:
+        return None
+    return dict(receipt.result or {}, duplicate=True)
+
+
+def apply_review_batch(user, batch_id: str, payload: List[Dict]) -> Dict:
+    """
+    Apply an ordered batch of flashcard reviews in one transaction
+
+    Args:
+        user: Current user object
+        batch_id: Client-generated idempotency key
+        payload: Reviews as sent by the client
+
+    Returns:
+        dict: {'success', 'batch_id', 'applied', 'rejected', 'xp_earned', 'results', 'duplicate'}
+
+    Raises:
+        ReviewBatchError: Invalid payload (nothing is applied)
+    """
+    batch_id = str(batch_id or '').strip()
+    if not batch_id or len(batch_id) > MAX_BATCH_ID_LENGTH:
+        raise ReviewBatchError(f'batch_id is required (max {MAX_BATCH_ID_LENGTH} characters)')
+
+    stored = _stored_result(user.id, batch_id)
+    if stored is not None:
+        return stored
+
+    now = datetime.now(timezone.utc)
+    reviews = parse_reviews(payload, now)
+    term_ids = {review['term_id'] for review in reviews}
+
+    allowed_categories = set(get_allowed_categories(user))
+    terms = {
+        term.id: term
+        for term in MedicalTerm.query.filter(MedicalTerm.id.in_(term_ids)).all()
+    }
+    progress_by_term = {
+        progress.term_id: progress
+        for progress in UserTermProgress.query.filter(
+            UserTermProgress.user_id == user.id,
+            UserTermProgress.term_id.in_(term_ids)
+        ).all()
+    }
+
+    results = []
+    mastery_results = []
+    total_xp = 0
+    # date -> aggregate for DailyFlashcardProgress
+    daily = OrderedDict()
+
+    for review in reviews:
+        term_id = review['term_id']
+        term = terms.get(term_id)
+        if term is None:
+            results.append({'term_id': term_id, 'status': 'rejected', 'error': 'Term not found'})
+            continue
+        if allowed_categories and term.category not in allowed_categories:
+            results.append({'term_id': term_id, 'status': 'rejected',
+                            'error': 'Term not available for your profession'})
+            continue
+
+        progress = progress_by_term.get(term_id)
+        if progress is None:
+            progress = progress_by_term[term_id] = UserTermProgress(user_id=user.id, term_id=term_id)
+            db.session.add(progress)
+
+        is_first_time = not progress.times_reviewed
+        progress.update_progress_sm2(review['quality'], review['reviewed_at'])
+
+        xp_earned = calculate_flashcard_xp(review['quality'], is_first_time)
+        total_xp += xp_earned
+        mastery_results.append((term_id, review['quality'] >= 3, review['reviewed_at']))
+
+        day = daily.setdefault(review['reviewed_at'].date(), {
+            'terms': set(), 'xp': 0, 'seconds': 0.0, 'last': review['reviewed_at']
+        })
+        day['terms'].add(term_id)
+        day['xp'] += xp_earned
+        day['seconds'] += review['time_spent']
+        day['last'] = max(day['last'], review['reviewed_at'])
+
+        results.append({
+            'term_id': term_id,
+            'status': 'applied',
+            'xp_earned': xp_earned,
+            'next_review': progress.next_review.isoformat(),
+            'mastery_level': progress.mastery_level,
+            'accuracy': round(progress.accuracy_rate, 1),
+            'times_reviewed': progress.times_reviewed,
+            'is_mastered': progress.mastery_level >= 4
+        })
+
+    update_item_mastery_batch(user.id, 'term', mastery_results)
+
+    # XP and level: one level per crossed 100 XP boundary, as in review_term
+    if total_xp and hasattr(user, 'xp'):
+        old_xp = user.xp or 0
+        user.xp = old_xp + total_xp
+        if hasattr(user, 'level'):
+            user.level = (user.level or 0) + (user.xp // 100 - old_xp // 100)
+
+    if daily:
+        existing = {
+            row.date: row
+            for row in DailyFlashcardProgress.query.filter(
+                DailyFlashcardProgress.user_id == user.id,
+                DailyFlashcardProgress.date.in_(list(daily))
+            ).all()
+        }
+        for day, aggregate in daily.items():
+            row = existing.get(day)
+            if row is None:
+                row = DailyFlashcardProgress(user_id=user.id, date=day)
+                db.session.add(row)
+            row.terms_studied = min((row.terms_studied or 0) + len(aggregate['terms']), DAILY_TERMS_CAP)
+            row.xp_earned = (row.xp_earned or 0) + aggregate['xp']
+            row.time_spent = (row.time_spent or 0.0) + aggregate['seconds'] / 60.0  # минуты
+            row.session_count = (row.session_count or 0) + 1
+            row.last_session = aggregate['last']
+
+    applied = sum(1 for result in results if result['status'] == 'applied')
+    response = {
+        'success': True,
+        'batch_id': batch_id,
+        'applied': applied,
+        'rejected': len(results) - applied,
+        'xp_earned': total_xp,
+        'results': results
+    }
+    db.session.add(FlashcardReviewBatch(
+        user_id=user.id,
+        batch_id=batch_id,
+        review_count=applied,
+        xp_earned=total_xp,
+        result=response
+    ))
+
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # The same batch was committed concurrently (client retry) - return its result
+        db.session.rollback()
+        stored = _stored_result(user.id, batch_id)
+        if stored is None:
+            raise
+        return stored
+
+    invalidate_progress_snapshot(user.id)
+    logger.info(f"User {user.id} review batch {batch_id}: {applied} applied, "
+                f"{response['rejected']} rejected, xp={total_xp}")
+    return dict(response, duplicate=False)
@@ -5,14 +5,18 @@ IRT Calibration Service
 """
 
 import math
+import time
 import numpy as np
 import logging
 from datetime import datetime, timezone
 from typing import Dict, Optional, List, Tuple
-from sqlalchemy import func
+from sqlalchemy import func, literal
 
 from models import Question, IRTParameters, DiagnosticResponse, TestAttempt, BIGDomain
 from extensions import db
+from utils.irt_item_index import item_index
+from utils.content_selection import content_index
+from utils.cache_manager import invalidate_question_cache
 
 logger = logging.getLogger(__name__)
 
@@ -67,6 +71,8 @@ class IRTCalibrationService:
             # Сохраняем в базу
             db.session.add(irt_params)
             db.session.commit()
+            item_index.upsert_parameters([irt_params])
+            invalidate_question_cache(question_id)
             
             logger.info(f"Question {question_id}: calibrated with {total_count} responses "
                        f"(difficulty={difficulty:.3f}, discrimination={discrimination:.3f}, guessing={guessing:.3f})")
@@ -237,6 +243,8 @@ class IRTCalibrationService:
         
         db.session.add(irt_params)
         db.session.commit()
+        item_index.upsert_parameters([irt_params])
+        invalidate_question_cache(question_id)
         
         logger.info(f"Question {question_id}: created default parameters")
         return irt_params
@@ -252,41 +260,343 @@ class IRTCalibrationService:
             Статистика калибровки
         """
         try:
-            # Получаем домен
+            # Совместная калибровка домена; записываются только вопросы без IRT параметров
+            report = self.calibrate_bank(domain_code=domain_code, only_missing=True)
+            if not report.get('success'):
+                return report
+            
+            return {
+                'success': report.get('success', False),
+                'domain': domain_code,
+                'total_questions': report.get('calibrated', 0) + report.get('defaults', 0),
+                'calibrated': report.get('calibrated', 0),
+                'defaults': report.get('defaults', 0),
+                'duration_seconds': report.get('duration_seconds')
+            }
+            
+        except Exception as e:
+            logger.error(f"Error batch calibrating domain {domain_code}: {str(e)}")
+            return {'success': False, 'error': str(e)}
+    
+    # ------------------------------------------------------------------
+    # Пакетная калибровка (marginal ML / EM по всей матрице ответов)
+    # ------------------------------------------------------------------
+    
+    def calibrate_bank(self, domain_code: Optional[str] = None, profession: Optional[str] = None,
+                       only_missing: bool = False, max_iterations: int = 100, tolerance: float = 1e-3,
+                       commit: bool = True) -> Dict:
+        """
+        Совместная калибровка difficulty и discrimination для домена/профессии/всего банка
+        
+        Все ответы загружаются одним запросом, параметры оцениваются методом
+        marginal maximum likelihood (EM Бока-Эйткина) векторно по всем вопросам,
+        guessing фиксируется (существующее значение или 1 / число вариантов).
+        
+        Args:
+            domain_code: Код домена (None - все домены)
+            profession: Код профессии (None - все профессии)
+            only_missing: Записывать параметры только для вопросов без IRT параметров
+            max_iterations: Максимум EM циклов
+            tolerance: Порог сходимости по изменению параметров
+            commit: Фиксировать ли изменения
+            
+        Returns:
+            Отчет: количество вопросов, сходимость, время и fit статистика по вопросам
+        """
+        started = time.perf_counter()
+        
+        question_query = db.session.query(Question.id, Question.options)
+        if domain_code:
             domain = BIGDomain.query.filter_by(code=domain_code).first()
             if not domain:
                 logger.error(f"Domain {domain_code} not found")
                 return {'success': False, 'error': 'Domain not found'}
+            question_query = question_query.filter(Question.big_domain_id == domain.id)
+        if profession:
+            question_query = question_query.filter(Question.profession == profession)
+        
+        question_options = {question_id: options for question_id, options in question_query.all()}
+        if not question_options:
+            return {'success': True, 'domain': domain_code, 'profession': profession, 'total_questions': 0,
+                    'calibrated': 0, 'defaults': 0, 'items': [], 'duration_seconds': 0.0}
+        
+        existing = {
+            row.question_id: row for row in db.session.query(
+                IRTParameters.id, IRTParameters.question_id, IRTParameters.guessing
+            ).filter(IRTParameters.question_id.in_(list(question_options))).all()
+        }
+        
+        item_ids, person_index, item_index_array, correct = self._load_response_matrix(list(question_options))
+        
+        # Вопросы с достаточным количеством ответов участвуют в совместной оценке
+        counts = np.bincount(item_index_array, minlength=len(item_ids)) if item_ids.size else np.empty(0, dtype=int)
+        fit_mask = counts >= self.min_responses_for_calibration
+        keep = fit_mask[item_index_array] if item_ids.size else np.empty(0, dtype=bool)
+        fit_ids = item_ids[fit_mask]
+        
+        report_items = []
+        fit = None
+        if fit_ids.size:
+            remap = np.full(item_ids.size, -1, dtype=np.int64)
+            remap[fit_mask] = np.arange(fit_ids.size)
+            _, persons = np.unique(person_index[keep], return_inverse=True)
             
-            # Получаем все вопросы домена без IRT параметров
-            questions_without_irt = db.session.query(Question).outerjoin(IRTParameters).filter(
-                Question.big_domain_id == domain.id,
-                IRTParameters.id.is_(None)
-            ).all()
+            guessing = np.array([
+                existing[qid].guessing if qid in existing and existing[qid].guessing is not None
+                else self._guessing_from_options(question_options.get(qid))
+                for qid in fit_ids.tolist()
+            ], dtype=np.float64)
+            guessing = np.clip(guessing, 0.0, 0.35)
             
-            logger.info(f"Found {len(questions_without_irt)} questions without IRT parameters in domain {domain_code}")
+            fit = self._fit_marginal_ml(
+                remap[item_index_array[keep]], persons, correct[keep], guessing,
+                max_iterations=max_iterations, tolerance=tolerance
+            )
+        
+        now = datetime.now(timezone.utc)
+        updates, inserts, touched = [], [], []
+        
+        if fit is not None:
+            for i, question_id in enumerate(fit_ids.tolist()):
+                if only_missing and question_id in existing:
+                    continue
+                values = {
+                    'question_id': question_id,
+                    'difficulty': float(fit['difficulty'][i]),
+                    'discrimination': float(fit['discrimination'][i]),
+                    'guessing': float(fit['guessing'][i]),
+                    'se_difficulty': float(fit['se_difficulty'][i]),
+                    'se_discrimination': float(fit['se_discrimination'][i]),
+                    'infit': float(fit['infit'][i]),
+                    'outfit': float(fit['outfit'][i]),
+                    'calibration_sample_size': int(fit['sample_size'][i]),
+                    'calibration_date': now
+                }
+                if question_id in existing:
+                    updates.append({'id': existing[question_id].id, **values})
+                else:
+                    inserts.append(values)
+                touched.append((question_id, values['discrimination'], values['difficulty'], values['guessing']))
+                report_items.append({key: value for key, value in values.items() if key != 'calibration_date'})
+        
+        # Вопросы без параметров и без достаточного количества ответов получают значения по умолчанию
+        fitted = set(fit_ids.tolist())
+        defaults = 0
+        for question_id in question_options:
+            if question_id in existing or question_id in fitted:
+                continue
+            inserts.append({
+                'question_id': question_id,
+                'difficulty': self.default_difficulty,
+                'discrimination': self.default_discrimination,
+                'guessing': self.default_guessing,
+                'calibration_sample_size': 0,
+                'calibration_date': now
+            })
+            touched.append((question_id, self.default_discrimination, self.default_difficulty, self.default_guessing))
+            defaults += 1
+        
+        if updates:
+            db.session.bulk_update_mappings(IRTParameters, updates)
+        if inserts:
+            db.session.bulk_insert_mappings(IRTParameters, inserts)
+        if commit:
+            db.session.commit()
+            item_index.upsert_items(touched)
+            content_index.invalidate()
+            for question_id, _, _, _ in touched:
+                invalidate_question_cache(question_id)
+        
+        duration = time.perf_counter() - started
+        logger.info(f"Bank calibration (domain={domain_code}, profession={profession}): "
+                    f"{len(report_items)} calibrated, {defaults} defaults, {duration:.2f}s")
+        
+        return {
+            'success': True,
+            'domain': domain_code,
+            'profession': profession,
+            'total_questions': len(question_options),
+            'responses': int(correct.size),
+            'calibrated': len(report_items),
+            'defaults': defaults,
+            'iterations': fit['iterations'] if fit else 0,
+            'converged': fit['converged'] if fit else True,
+            'log_likelihood': fit['log_likelihood'] if fit else None,
+            'duration_seconds': round(duration, 3),
+            'items': report_items
+        }
+    
+    def _load_response_matrix(self, question_ids: List[int]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Загрузить все ответы на вопросы одним запросом
+        
+        Респондент - диагностическая сессия или пара (пользователь, тест).
+        
+        Returns:
+            (item_ids, person_index, item_index, correct) - наблюдения в разреженном виде
+        """
+        diagnostic = db.session.query(
+            literal(0).label('source'),
+            DiagnosticResponse.session_id.label('respondent'),
+            literal(0).label('group_id'),
+            DiagnosticResponse.question_id.label('question_id'),
+            DiagnosticResponse.is_correct.label('is_correct')
+        ).filter(DiagnosticResponse.question_id.in_(question_ids))
+        
+        tests = db.session.query(
+            literal(1).label('source'),
+            TestAttempt.user_id.label('respondent'),
+            TestAttempt.test_id.label('group_id'),
+            TestAttempt.question_id.label('question_id'),
+            TestAttempt.is_correct.label('is_correct')
+        ).filter(TestAttempt.question_id.in_(question_ids), TestAttempt.is_correct.isnot(None))
+        
+        respondents: Dict[Tuple[int, int, int], int] = {}
+        items: Dict[int, int] = {}
+        person_index, item_positions, correct = [], [], []
+        
+        for source, respondent, group_id, question_id, is_correct in diagnostic.union_all(tests).yield_per(5000):
+            person_index.append(respondents.setdefault((source, respondent, group_id), len(respondents)))
+            item_positions.append(items.setdefault(question_id, len(items)))
+            correct.append(1.0 if is_correct else 0.0)
+        
+        item_ids = np.empty(len(items), dtype=np.int64)
+        for question_id, position in items.items():
+            item_ids[position] = question_id
+        
+        return (
+            item_ids,
+            np.asarray(person_index, dtype=np.int64),
+            np.asarray(item_positions, dtype=np.int64),
+            np.asarray(correct, dtype=np.float64)
+        )
+    
+    def _fit_marginal_ml(self, items: np.ndarray, persons: np.ndarray, correct: np.ndarray, guessing: np.ndarray,
+                         max_iterations: int = 100, tolerance: float = 1e-3, quadrature_points: int = 21) -> Dict:
+        """
+        EM оценка (a, b) при фиксированном c по разреженным наблюдениям
+        
+        E-шаг: апостериорное распределение каждого респондента на сетке квадратур N(0, 1).
+        M-шаг: один шаг Fisher scoring для всех вопросов сразу (2x2 система на вопрос).
+        """
+        n_items = guessing.size
+        n_persons = int(persons.max()) + 1
+        nodes = np.linspace(-4.0, 4.0, quadrature_points)
+        prior = np.exp(-0.5 * nodes ** 2)
+        prior /= prior.sum()
+        
+        # Начальные значения: логит доли правильных ответов
+        answered = np.bincount(items, minlength=n_items)
+        right = np.bincount(items, weights=correct, minlength=n_items)
+        rate = np.clip(right / np.maximum(answered, 1), 0.05, 0.95)
+        b = np.clip(-np.log(rate / (1.0 - rate)), -3.0, 3.0)
+        a = np.ones(n_items)
+        c = guessing
+        
+        converged = False
+        log_likelihood = None
+        iteration = 0
+        
+        for iteration in range(1, max_iterations + 1):
+            # E-шаг
+            p = self._3pl_grid(a, b, c, nodes)                       # (items, K)
+            log_p, log_q = np.log(p), np.log(1.0 - p)
+            obs_ll = np.where(correct[:, None] > 0.5, log_p[items], log_q[items])  # (obs, K)
+            person_ll = np.zeros((n_persons, nodes.size))
+            for k in range(nodes.size):
+                person_ll[:, k] = np.bincount(persons, weights=obs_ll[:, k], minlength=n_persons)
             
-            calibrated_count = 0
-            default_count = 0
+            person_ll += np.log(prior)[None, :]
+            shift = person_ll.max(axis=1, keepdims=True)
+            posterior = np.exp(person_ll - shift)
+            marginal = posterior.sum(axis=1, keepdims=True)
+            posterior /= marginal
+            log_likelihood = float((np.log(marginal) + shift).sum())
             
-            for question in questions_without_irt:
-                irt_params = self.calibrate_question_from_responses(question.id)
-                if irt_params and irt_params.calibration_sample_size > 0:
-                    calibrated_count += 1
-                else:
-                    default_count += 1
+            obs_post = posterior[persons]                            # (obs, K)
+            n_k = np.zeros((n_items, nodes.size))
+            r_k = np.zeros((n_items, nodes.size))
+            for k in range(nodes.size):
+                n_k[:, k] = np.bincount(items, weights=obs_post[:, k], minlength=n_items)
+                r_k[:, k] = np.bincount(items, weights=obs_post[:, k] * correct, minlength=n_items)
             
-            return {
-                'success': True,
-                'domain': domain_code,
-                'total_questions': len(questions_without_irt),
-                'calibrated': calibrated_count,
-                'defaults': default_count
-            }
+            # M-шаг (Fisher scoring)
+            step_a, step_b, info = self._fisher_scoring_step(a, b, c, nodes, n_k, r_k)
+            new_a = np.clip(a + np.clip(step_a, -0.5, 0.5), 0.3, 4.0)
+            new_b = np.clip(b + np.clip(step_b, -0.5, 0.5), -4.0, 4.0)
+            change = max(np.abs(new_a - a).max(), np.abs(new_b - b).max())
+            a, b = new_a, new_b
             
-        except Exception as e:
-            logger.error(f"Error batch calibrating domain {domain_code}: {str(e)}")
-            return {'success': False, 'error': str(e)}
+            if change < tolerance:
+                converged = True
+                break
+        
+        # Стандартные ошибки из обратной информационной матрицы
+        _, _, (i_aa, i_bb, i_ab) = self._fisher_scoring_step(a, b, c, nodes, n_k, r_k)
+        det = i_aa * i_bb - i_ab ** 2
+        with np.errstate(divide='ignore', invalid='ignore'):
+            se_a = np.where(det > 0, np.sqrt(np.abs(i_bb / det)), np.nan)
+            se_b = np.where(det > 0, np.sqrt(np.abs(i_aa / det)), np.nan)
+        
+        # Fit статистика по EAP оценкам респондентов
+        theta = posterior @ nodes
+        p_obs = c[items] + (1.0 - c[items]) / (1.0 + np.exp(-a[items] * (theta[persons] - b[items])))
+        variance = np.clip(p_obs * (1.0 - p_obs), 1e-9, None)
+        squared = (correct - p_obs) ** 2
+        infit = np.bincount(items, weights=squared, minlength=n_items) / np.maximum(
+            np.bincount(items, weights=variance, minlength=n_items), 1e-9)
+        outfit = np.bincount(items, weights=squared / variance, minlength=n_items) / np.maximum(answered, 1)
+        
+        return {
+            'difficulty': b,
+            'discrimination': a,
+            'guessing': c,
+            'se_difficulty': np.nan_to_num(se_b, nan=1.0),
+            'se_discrimination': np.nan_to_num(se_a, nan=1.0),
+            'infit': infit,
+            'outfit': outfit,
+            'sample_size': answered,
+            'iterations': iteration,
+            'converged': converged,
+            'log_likelihood': log_likelihood
+        }
+    
+    @staticmethod
+    def _3pl_grid(a: np.ndarray, b: np.ndarray, c: np.ndarray, nodes: np.ndarray) -> np.ndarray:
+        """Вероятности 3PL для всех вопросов на сетке квадратур"""
+        logistic = 1.0 / (1.0 + np.exp(-a[:, None] * (nodes[None, :] - b[:, None])))
+        return np.clip(c[:, None] + (1.0 - c[:, None]) * logistic, 1e-9, 1.0 - 1e-9)
+    
+    def _fisher_scoring_step(self, a: np.ndarray, b: np.ndarray, c: np.ndarray, nodes: np.ndarray,
+                             n_k: np.ndarray, r_k: np.ndarray):
+        """Шаг Fisher scoring для (a, b) всех вопросов по ожидаемым частотам"""
+        logistic = 1.0 / (1.0 + np.exp(-a[:, None] * (nodes[None, :] - b[:, None])))
+        p = np.clip(c[:, None] + (1.0 - c[:, None]) * logistic, 1e-9, 1.0 - 1e-9)
+        dp_dz = (1.0 - c[:, None]) * logistic * (1.0 - logistic)
+        pq = p * (1.0 - p)
+        
+        dz_da = nodes[None, :] - b[:, None]
+        dz_db = -a[:, None]
+        residual = (r_k - n_k * p) * dp_dz / pq
+        weight = n_k * dp_dz ** 2 / pq
+        
+        score_a = (residual * dz_da).sum(axis=1)
+        score_b = (residual * dz_db).sum(axis=1)
+        i_aa = (weight * dz_da ** 2).sum(axis=1)
+        i_bb = (weight * dz_db ** 2).sum(axis=1)
+        i_ab = (weight * dz_da * dz_db).sum(axis=1)
+        
+        det = i_aa * i_bb - i_ab ** 2
+        safe_det = np.where(np.abs(det) > 1e-12, det, np.inf)
+        step_a = (i_bb * score_a - i_ab * score_b) / safe_det
+        step_b = (i_aa * score_b - i_ab * score_a) / safe_det
+        return step_a, step_b, (i_aa, i_bb, i_ab)
+    
+    def _guessing_from_options(self, options) -> float:
+        """Параметр угадывания по количеству вариантов ответа (без случайной вариации)"""
+        if options and len(options) >= 2:
+            return 1.0 / len(options)
+        return self.default_guessing
     
     def get_calibration_statistics(self) -> Dict:
         """
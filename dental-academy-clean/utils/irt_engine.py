@@ -14,6 +14,7 @@ from utils.helpers import get_user_profession_code
 
 # Добавляем импорты для оптимизации
 from utils.cache_manager import get_cached_question, get_cached_irt_parameters, get_cached_domain_questions
+from utils.irt_item_index import item_index, select_max_information_question_id
 from utils.performance_optimizer import profile_function, performance_optimizer
 
 logger = logging.getLogger(__name__)
@@ -100,13 +101,230 @@ def safe_3pl_probability(ability: float, difficulty: float, discrimination: floa
         return guessing, False
 
 
-def safe_ability_estimation(responses: List[Dict], initial_ability: float = 0.0) -> Tuple[float, float, bool]:
+# Границы оценки способности и стандартной ошибки, общие для всех оценщиков
+ABILITY_MIN, ABILITY_MAX = -4.0, 4.0
+SE_MIN, SE_MAX = 0.1, 2.0
+
+# Сетка квадратур для EAP (априорное N(0, 1))
+EAP_QUADRATURE_POINTS = np.linspace(ABILITY_MIN, ABILITY_MAX, 61)
+EAP_PRIOR_WEIGHTS = np.exp(-0.5 * EAP_QUADRATURE_POINTS ** 2)
+
+
+def pack_irt_responses(responses: List[Dict]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Упаковать ответы в непрерывные массивы (a, b, c, u) за один проход
+    
+    Валидация параметров выполняется один раз на ответ, а не на каждой итерации.
+    
+    Args:
+        responses: Список ответов с IRT параметрами
+        
+    Returns:
+        (discrimination, difficulty, guessing, is_correct) - массивы float64 одинаковой длины
+    """
+    a, b, c, u = [], [], [], []
+    
+    for i, response in enumerate(responses):
+        irt_params = response.get('irt_params')
+        if not irt_params:
+            logger.warning(f"Response {i} missing IRT parameters")
+            continue
+        
+        try:
+            difficulty = irt_params['difficulty']
+            discrimination = irt_params['discrimination']
+            guessing = irt_params['guessing']
+        except KeyError:
+            logger.warning(f"Response {i} missing required IRT fields")
+            continue
+        
+        if difficulty is None or discrimination is None or guessing is None:
+            logger.warning(f"Response {i} missing required IRT fields")
+            continue
+        
+        is_valid, error_msg = validate_irt_parameters_for_calculation(difficulty, discrimination, guessing)
+        if not is_valid:
+            logger.warning(f"Response {i} has invalid IRT parameters: {error_msg}")
+            continue
+        
+        a.append(discrimination)
+        b.append(difficulty)
+        c.append(guessing)
+        u.append(1.0 if response.get('is_correct') else 0.0)
+    
+    return (
+        np.asarray(a, dtype=np.float64),
+        np.asarray(b, dtype=np.float64),
+        np.asarray(c, dtype=np.float64),
+        np.asarray(u, dtype=np.float64),
+    )
+
+
+# Упакованное состояние сессии: строки (a, b, c, u) little-endian float64, по одной на ответ
+IRT_STATE_DTYPE = np.dtype('<f8')
+IRT_STATE_COLUMNS = 4
+
+
+def pack_irt_state(a: np.ndarray, b: np.ndarray, c: np.ndarray, u: np.ndarray) -> bytes:
+    """Сериализовать массивы (a, b, c, u) в компактный blob для DiagnosticSession.irt_state"""
+    return np.column_stack((a, b, c, u)).astype(IRT_STATE_DTYPE).tobytes()
+
+
+def unpack_irt_state(state: Optional[bytes]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Обратное к pack_irt_state; пустое или отсутствующее состояние дает пустые массивы"""
+    rows = np.frombuffer(state or b'', dtype=IRT_STATE_DTYPE).reshape(-1, IRT_STATE_COLUMNS)
+    return rows[:, 0], rows[:, 1], rows[:, 2], rows[:, 3]
+
+
+def update_irt_state(state: Optional[bytes], irt_params: Optional[Dict], is_correct: bool,
+                     previous_ability: float = 0.0, method: str = 'mle') -> Tuple[bytes, float, float, bool]:
+    """
+    Добавить ответ в упакованное состояние и переоценить способность
+
+    Итерации Newton-Raphson стартуют с предыдущей оценки, поэтому после
+    одного нового ответа обычно хватает одного-двух шагов. Параметры без
+    валидации (или отсутствующие) не добавляются, как в pack_irt_responses.
+
+    Args:
+        state: Текущее состояние (pack_irt_state) или None
+        irt_params: difficulty/discrimination/guessing нового вопроса
+        is_correct: Верен ли ответ
+        previous_ability: Оценка до этого ответа (тёплый старт)
+        method: 'mle' или 'eap'
+
+    Returns:
+        (new_state, ability, standard_error, is_valid)
+    """
+    new_row = pack_irt_responses([{'is_correct': is_correct, 'irt_params': irt_params}])
+    if new_row[0].size:
+        state = (state or b'') + pack_irt_state(*new_row)
+    if not state:
+        return b'', previous_ability, 1.0, False
+
+    ability, standard_error, is_valid = estimate_ability_from_arrays(
+        *unpack_irt_state(state), initial_ability=previous_ability, method=method
+    )
+    return state, ability, standard_error, is_valid
+
+
+def _newton_ability_estimation(a: np.ndarray, b: np.ndarray, c: np.ndarray, u: np.ndarray,
+                               initial_ability: np.ndarray, mask: np.ndarray,
+                               max_iterations: int = 50, tolerance: float = 0.001) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    MLE Newton-Raphson по строкам матриц (сессия x ответ)
+    
+    Все аргументы - двумерные массивы одной формы, кроме initial_ability (по одной
+    оценке на строку). Ячейки, где mask == False, не участвуют в производных.
+    
+    Returns:
+        (ability, second_derivative) - массивы по одному значению на строку
+    """
+    ability = initial_ability.astype(np.float64).copy()
+    second_derivative = np.zeros_like(ability)
+    active = np.ones(ability.shape, dtype=bool)
+    
+    for _ in range(max_iterations):
+        theta = np.clip(ability, ABILITY_MIN, ABILITY_MAX)[:, None]
+        probability = c + (1.0 - c) / (1.0 + np.exp(-a * (theta - b)))
+        usable = mask & (probability > 0.0) & (probability < 1.0)
+        
+        first = np.where(usable, a * (u - probability), 0.0).sum(axis=1)
+        second = -np.where(usable, a ** 2 * probability * (1.0 - probability), 0.0).sum(axis=1)
+        second_derivative = np.where(active, second, second_derivative)
+        
+        # Строки с вырожденной второй производной останавливаются, как в скалярной версии
+        active &= np.abs(second) >= 1e-10
+        if not active.any():
+            break
+        
+        step = np.divide(first, second, out=np.zeros_like(first), where=active)
+        new_ability = np.clip(ability - step, ABILITY_MIN, ABILITY_MAX)
+        converged = np.abs(new_ability - ability) < tolerance
+        ability = np.where(active, new_ability, ability)
+        active &= ~converged
+        
+        if not active.any():
+            break
+    
+    return ability, second_derivative
+
+
+def _eap_ability_estimation(a: np.ndarray, b: np.ndarray, c: np.ndarray, u: np.ndarray,
+                            mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    EAP оценка по сетке квадратур для строк матриц (сессия x ответ)
+    
+    Returns:
+        (ability, posterior_sd) - массивы по одному значению на строку
+    """
+    theta = EAP_QUADRATURE_POINTS[None, None, :]
+    probability = c[..., None] + (1.0 - c[..., None]) / (1.0 + np.exp(-a[..., None] * (theta - b[..., None])))
+    probability = np.clip(probability, 1e-9, 1.0 - 1e-9)
+    
+    log_likelihood = np.where(
+        mask[..., None],
+        u[..., None] * np.log(probability) + (1.0 - u[..., None]) * np.log(1.0 - probability),
+        0.0
+    ).sum(axis=1)
+    log_likelihood -= log_likelihood.max(axis=1, keepdims=True)
+    
+    posterior = np.exp(log_likelihood) * EAP_PRIOR_WEIGHTS[None, :]
+    posterior /= posterior.sum(axis=1, keepdims=True)
+    
+    ability = (posterior * EAP_QUADRATURE_POINTS[None, :]).sum(axis=1)
+    variance = (posterior * (EAP_QUADRATURE_POINTS[None, :] - ability[:, None]) ** 2).sum(axis=1)
+    return ability, np.sqrt(variance)
+
+
+def estimate_ability_from_arrays(a: np.ndarray, b: np.ndarray, c: np.ndarray, u: np.ndarray,
+                                 initial_ability: float = 0.0, method: str = 'mle') -> Tuple[float, float, bool]:
+    """
+    Оценка способности по уже упакованным массивам (см. pack_irt_responses)
+    
+    Args:
+        a, b, c, u: discrimination, difficulty, guessing, is_correct
+        initial_ability: Начальная оценка способности
+        method: 'mle' (Newton-Raphson) или 'eap'
+        
+    Returns:
+        (ability, standard_error, is_valid)
+    """
+    if a.size == 0:
+        logger.warning("No valid responses for ability estimation")
+        return initial_ability, 1.0, False
+    
+    results = _estimate_padded(a[None, :], b[None, :], c[None, :], u[None, :],
+                               np.ones((1, a.size), dtype=bool),
+                               np.array([initial_ability], dtype=np.float64), method)
+    return results[0]
+
+
+def _estimate_padded(a: np.ndarray, b: np.ndarray, c: np.ndarray, u: np.ndarray, mask: np.ndarray,
+                     initial_abilities: np.ndarray, method: str) -> List[Tuple[float, float, bool]]:
+    """Общий путь одиночной и пакетной оценки для выровненных матриц"""
+    if method == 'eap':
+        ability, standard_error = _eap_ability_estimation(a, b, c, u, mask)
+    else:
+        ability, second_derivative = _newton_ability_estimation(a, b, c, u, initial_abilities, mask)
+        standard_error = np.ones_like(ability)
+        informative = np.abs(second_derivative) > 1e-10
+        standard_error[informative] = 1.0 / np.sqrt(-second_derivative[informative])
+    
+    standard_error = np.clip(standard_error, SE_MIN, SE_MAX)
+    return [(float(theta), float(se), True) for theta, se in zip(ability, standard_error)]
+
+
+def safe_ability_estimation(responses: List[Dict], initial_ability: float = 0.0,
+                            method: str = 'mle') -> Tuple[float, float, bool]:
     """
     Безопасная оценка способности с валидацией данных
     
+    Ответы упаковываются в массивы один раз, итерации выполняются векторно.
+    
     Args:
         responses: Список ответов с IRT параметрами
         initial_ability: Начальная оценка способности
+        method: 'mle' (Newton-Raphson) или 'eap'
         
     Returns:
         (ability, standard_error, is_valid)
@@ -116,99 +334,145 @@ def safe_ability_estimation(responses: List[Dict], initial_ability: float = 0.0)
             logger.warning("No responses provided for ability estimation")
             return initial_ability, 1.0, False
         
-        # Валидация ответов
-        valid_responses = []
-        for i, response in enumerate(responses):
-            if 'irt_params' not in response:
-                logger.warning(f"Response {i} missing IRT parameters")
-                continue
-            
-            irt_params = response['irt_params']
-            required_fields = ['difficulty', 'discrimination', 'guessing']
-            
-            if not all(field in irt_params for field in required_fields):
-                logger.warning(f"Response {i} missing required IRT fields")
-                continue
-            
-            # Валидация IRT параметров
-            is_valid, error_msg = validate_irt_parameters_for_calculation(
-                irt_params['difficulty'],
-                irt_params['discrimination'],
-                irt_params['guessing']
-            )
-            
-            if not is_valid:
-                logger.warning(f"Response {i} has invalid IRT parameters: {error_msg}")
-                continue
-            
-            valid_responses.append(response)
+        a, b, c, u = pack_irt_responses(responses)
+        return estimate_ability_from_arrays(a, b, c, u, initial_ability, method)
         
-        if not valid_responses:
-            logger.warning("No valid responses for ability estimation")
-            return initial_ability, 1.0, False
+    except Exception as e:
+        logger.error(f"Error in ability estimation: {e}")
+        return initial_ability, 1.0, False
+
+
+def batch_ability_estimation(response_sets: List[List[Dict]], initial_abilities: Optional[List[float]] = None,
+                             method: str = 'mle') -> List[Tuple[float, float, bool]]:
+    """
+    Пакетная оценка способности для множества сессий за один проход
+    
+    Ответы всех сессий выравниваются в матрицы (сессия x ответ) с маской,
+    так что итерации Newton-Raphson/EAP выполняются для всех сессий сразу.
+    
+    Args:
+        response_sets: Список списков ответов (по одному на сессию)
+        initial_abilities: Начальные оценки (по умолчанию 0.0)
+        method: 'mle' или 'eap'
         
-        # Используем только валидные ответы для оценки
-        ability = initial_ability
-        max_iterations = 50
-        tolerance = 0.001
+    Returns:
+        Список (ability, standard_error, is_valid) в порядке response_sets
+    """
+    if initial_abilities is None:
+        initial_abilities = [0.0] * len(response_sets)
+    
+    results: List[Tuple[float, float, bool]] = [
+        (initial, 1.0, False) for initial in initial_abilities
+    ]
+    
+    packed = []
+    for index, responses in enumerate(response_sets):
+        arrays = pack_irt_responses(responses or [])
+        if arrays[0].size:
+            packed.append((index, arrays))
+    
+    if not packed:
+        return results
+    
+    try:
+        width = max(arrays[0].size for _, arrays in packed)
+        shape = (len(packed), width)
+        a = np.ones(shape)
+        b = np.zeros(shape)
+        c = np.zeros(shape)
+        u = np.zeros(shape)
+        mask = np.zeros(shape, dtype=bool)
+        
+        for row, (_, (row_a, row_b, row_c, row_u)) in enumerate(packed):
+            n = row_a.size
+            a[row, :n] = row_a
+            b[row, :n] = row_b
+            c[row, :n] = row_c
+            u[row, :n] = row_u
+            mask[row, :n] = True
+        
+        starts = np.array([initial_abilities[index] for index, _ in packed], dtype=np.float64)
+        for (index, _), estimate in zip(packed, _estimate_padded(a, b, c, u, mask, starts, method)):
+            results[index] = estimate
+    except Exception as e:
+        logger.error(f"Error in batch ability estimation: {e}")
+    
+    return results
+
+
+def rescore_diagnostic_sessions(session_ids: Optional[List[int]] = None, status: str = 'completed',
+                                chunk_size: int = 1000, method: str = 'mle', commit: bool = True) -> Dict[str, int]:
+    """
+    Пересчитать current_ability/ability_se для диагностических сессий
+    
+    Предназначено для ночного пересчета после перекалибровки: ответы и IRT параметры
+    загружаются одним запросом на пачку сессий, оценка выполняется batch_ability_estimation.
+    
+    Args:
+        session_ids: Конкретные сессии (по умолчанию все со статусом status)
+        status: Статус сессий для пересчета, если session_ids не задан
+        chunk_size: Количество сессий на пачку
+        method: 'mle' или 'eap'
+        commit: Фиксировать ли изменения
         
-        for iteration in range(max_iterations):
-            prev_ability = ability
-            
-            # Расчет первой и второй производных логарифма правдоподобия
-            first_derivative = 0.0
-            second_derivative = 0.0
-            
-            for response in valid_responses:
-                irt_params = response['irt_params']
-                is_correct = response['is_correct']
-                
-                # Безопасный расчет вероятности
-                probability, prob_valid = safe_3pl_probability(
-                    ability,
-                    irt_params['difficulty'],
-                    irt_params['discrimination'],
-                    irt_params['guessing']
-                )
-                
-                if not prob_valid:
-                    continue
-                
-                # Расчет производных
-                if probability > 0 and probability < 1:
-                    first_derivative += irt_params['discrimination'] * (is_correct - probability)
-                    second_derivative -= irt_params['discrimination'] ** 2 * probability * (1 - probability)
-            
-            # Проверка сходимости
-            if abs(second_derivative) < 1e-10:
-                logger.warning("Second derivative too small, stopping iteration")
-                break
-            
-            # Обновление оценки способности
-            ability_change = first_derivative / second_derivative
-            ability -= ability_change
-            
-            # Ограничение ability
-            ability = max(-4.0, min(4.0, ability))
-            
-            # Проверка сходимости
-            if abs(ability - prev_ability) < tolerance:
-                break
+    Returns:
+        Статистика: sessions, rescored, skipped
+    """
+    stats = {'sessions': 0, 'rescored': 0, 'skipped': 0}
+    
+    id_query = db.session.query(DiagnosticSession.id)
+    if session_ids is not None:
+        id_query = id_query.filter(DiagnosticSession.id.in_(session_ids))
+    elif status:
+        id_query = id_query.filter(DiagnosticSession.status == status)
+    all_ids = [row[0] for row in id_query.order_by(DiagnosticSession.id).all()]
+    
+    for start in range(0, len(all_ids), chunk_size):
+        chunk_ids = all_ids[start:start + chunk_size]
+        
+        rows = db.session.query(
+            DiagnosticResponse.session_id,
+            DiagnosticResponse.is_correct,
+            IRTParameters.difficulty,
+            IRTParameters.discrimination,
+            IRTParameters.guessing
+        ).join(
+            IRTParameters, IRTParameters.question_id == DiagnosticResponse.question_id
+        ).filter(
+            DiagnosticResponse.session_id.in_(chunk_ids)
+        ).order_by(DiagnosticResponse.session_id, DiagnosticResponse.id).all()
+        
+        grouped: Dict[int, List[Dict]] = {session_id: [] for session_id in chunk_ids}
+        for session_id, is_correct, difficulty, discrimination, guessing in rows:
+            grouped[session_id].append({
+                'is_correct': is_correct,
+                'irt_params': {
+                    'difficulty': difficulty,
+                    'discrimination': discrimination,
+                    'guessing': guessing
+                }
+            })
         
-        # Расчет стандартной ошибки
-        if abs(second_derivative) > 1e-10:
-            standard_error = 1.0 / math.sqrt(-second_derivative)
-        else:
-            standard_error = 1.0
+        estimates = batch_ability_estimation([grouped[session_id] for session_id in chunk_ids], method=method)
         
-        # Ограничение стандартной ошибки
-        standard_error = max(0.1, min(2.0, standard_error))
+        updates = []
+        for session_id, (theta, se, is_valid) in zip(chunk_ids, estimates):
+            stats['sessions'] += 1
+            if not is_valid:
+                stats['skipped'] += 1
+                continue
+            # Упакованное состояние с прежними параметрами пересобирается при следующем ответе
+            updates.append({'id': session_id, 'current_ability': theta, 'ability_se': se, 'irt_state': None})
         
-        return ability, standard_error, True
+        if updates:
+            db.session.bulk_update_mappings(DiagnosticSession, updates)
+            stats['rescored'] += len(updates)
         
-    except Exception as e:
-        logger.error(f"Error in ability estimation: {e}")
-        return initial_ability, 1.0, False
+        if commit:
+            db.session.commit()
+    
+    logger.info(f"Rescored diagnostic sessions: {stats}")
+    return stats
 
 class IRTEngine:
     """IRT Engine for 3PL model adaptive testing with domain support"""
@@ -353,6 +617,19 @@ class IRTEngine:
         if answered_question_ids is None:
             answered_question_ids = set()
         
+        # Быстрый путь: индекс информации вопросов (без обхода ORM объектов)
+        user_profession = get_user_profession_code(self.user) if self.user else 'huisarts'
+        try:
+            question_id = select_max_information_question_id(
+                user_profession, domain_code, current_ability, answered_question_ids
+            )
+            if question_id is not None:
+                question = Question.query.get(question_id)
+                if question:
+                    return question
+        except Exception as e:
+            logger.warning(f"Item index lookup failed for domain {domain_code}: {e}")
+        
         try:
             # Используем оптимизированный запрос с прямым исключением отвеченных вопросов
             questions = self.get_domain_questions(domain_code)
@@ -737,14 +1014,22 @@ class IRTEngine:
         
         # ИСПРАВЛЕНИЕ: Получить только домены с доступными вопросами
         domains_with_questions = []
+        user_profession = get_user_profession_code(self.user) if self.user else 'huisarts'
         for domain_code in self.all_domains.keys():
-            # Проверить, есть ли доступные вопросы в домене
-            domain_questions = self.get_domain_questions(domain_code)
-            available_questions = [q for q in domain_questions if q.id not in answered_question_ids]
+            # Проверить, есть ли доступные вопросы в домене (сначала по индексу, без ORM)
+            available_count = 0
+            try:
+                available_count = item_index.available_count(user_profession, domain_code, answered_question_ids)
+            except Exception as e:
+                logger.warning(f"Item index count failed for domain {domain_code}: {e}")
+            
+            if not available_count:
+                domain_questions = self.get_domain_questions(domain_code)
+                available_count = len([q for q in domain_questions if q.id not in answered_question_ids])
             
-            if available_questions:  # Только домены с доступными вопросами
+            if available_count:  # Только домены с доступными вопросами
                 domains_with_questions.append(domain_code)
-                logger.debug(f"Domain {domain_code} has {len(available_questions)} available questions")
+                logger.debug(f"Domain {domain_code} has {available_count} available questions")
             else:
                 logger.debug(f"Domain {domain_code} has no available questions")
         
@@ -1543,7 +1828,11 @@ class IRTEngine:
         """
         if not self.session:
             return {'ability': 0.0, 'se': 1.0}
-        
+
+        # Ответ уже учтен инкрементально в DiagnosticSession.record_response
+        if getattr(response, 'ability_after', None) is not None and response.se_after is not None:
+            return {'ability': response.ability_after, 'se': response.se_after}
+
         try:
             # Получаем все ответы сессии с кэшированием
             responses = self._get_session_responses_optimized()
@@ -1609,26 +1898,18 @@ class IRTEngine:
                                 }
                             })
                     else:
-                        # Fallback: попробуем получить из кэша
+                        # Fallback: снимок параметров из кэша (dict, не ORM объект)
                         cached_params = get_cached_irt_parameters(response.question_id)
                         if cached_params:
-                            # Убеждаемся, что cached объект привязан к session
-                            try:
-                                # Проверяем, что объект в session
-                                _ = cached_params.id
-                            except Exception:
-                                # Получаем свежий объект из базы данных
-                                fresh_params = IRTParameters.query.get(cached_params.id)
-                                if fresh_params:
-                                    irt_responses.append({
-                                        'question_id': response.question_id,
-                                        'is_correct': response.is_correct,
-                                        'irt_params': {
-                                            'difficulty': fresh_params.difficulty,
-                                            'discrimination': fresh_params.discrimination,
-                                            'guessing': fresh_params.guessing
-                                        }
-                                    })
+                            irt_responses.append({
+                                'question_id': response.question_id,
+                                'is_correct': response.is_correct,
+                                'irt_params': {
+                                    'difficulty': cached_params['difficulty'],
+                                    'discrimination': cached_params['discrimination'],
+                                    'guessing': cached_params['guessing']
+                                }
+                            })
                 
                 except Exception as e:
                     logger.warning(f"Error processing response {response.id}: {e}")
@@ -0,0 +1,343 @@
+"""
+Item Information Index for IRT System
+Индекс информации вопросов для адаптивного выбора без обращения к ORM
+
+Для каждой пары (профессия, домен) хранятся массивы (question_id, a, b, c),
+отсортированные по сложности. Вопросы без профессии (profession IS NULL)
+общие: они входят в бакеты каждой профессии и в бакет None. Поиск вопроса с максимальной информацией Фишера
+при текущей theta начинается бинарным поиском по сложности и расширяет окно
+в обе стороны, пока верхняя граница информации оставшихся вопросов
+I <= a^2 * min(1/4, exp(-a|theta - b|)) не станет меньше найденного максимума.
+"""
+
+import bisect
+import logging
+import math
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from sqlalchemy import or_
+
+from extensions import db
+from models import Question, IRTParameters, BIGDomain
+
+logger = logging.getLogger(__name__)
+
+BucketKey = Tuple[Optional[str], str]
+
+
+def item_information(theta: float, a: np.ndarray, b: np.ndarray, c: np.ndarray) -> np.ndarray:
+    """Информация Фишера 3PL для массива вопросов при заданной theta"""
+    p = c + (1.0 - c) / (1.0 + np.exp(-a * (theta - b)))
+    q = 1.0 - p
+    with np.errstate(divide='ignore', invalid='ignore'):
+        info = a ** 2 * (p - c) ** 2 * q / (p * (1.0 - c) ** 2)
+    return np.where((p > c) & (p < 1.0), info, 0.0)
+
+
+def information_bound(distance: float, a_min: float, a_max: float) -> float:
+    """
+    Верхняя граница информации 3PL для вопросов на расстоянии |theta - b| >= distance
+    
+    I(theta) <= a^2 * L * (1 - L) <= a^2 * min(1/4, exp(-a * distance)),
+    максимум по a в [a_min, a_max] достигается на краях или в точках ln(4)/d и 2/d.
+    """
+    if distance <= 0:
+        return a_max ** 2 / 4.0
+    candidates = {a_min, a_max}
+    for critical in (math.log(4.0) / distance, 2.0 / distance):
+        candidates.add(min(a_max, max(a_min, critical)))
+    return max(a ** 2 * min(0.25, math.exp(-a * distance)) for a in candidates)
+
+
+@dataclass
+class DomainBucket:
+    """Отсортированные по сложности параметры вопросов домена"""
+    question_ids: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=np.int64))
+    a: np.ndarray = field(default_factory=lambda: np.empty(0))
+    b: np.ndarray = field(default_factory=lambda: np.empty(0))
+    c: np.ndarray = field(default_factory=lambda: np.empty(0))
+    difficulties: List[float] = field(default_factory=list)
+    a_min: float = 0.0
+    a_max: float = 0.0
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Tuple[int, float, float, float]]) -> 'DomainBucket':
+        rows = list(rows)
+        if not rows:
+            return cls()
+        ids, a, b, c = (np.asarray(column) for column in zip(*rows))
+        order = np.argsort(b.astype(np.float64), kind='stable')
+        a = a.astype(np.float64)[order]
+        b = b.astype(np.float64)[order]
+        return cls(
+            question_ids=ids.astype(np.int64)[order],
+            a=a,
+            b=b,
+            c=c.astype(np.float64)[order],
+            difficulties=b.tolist(),
+            a_min=float(a.min()),
+            a_max=float(a.max())
+        )
+
+    def rows(self) -> List[Tuple[int, float, float, float]]:
+        return list(zip(self.question_ids.tolist(), self.a.tolist(), self.b.tolist(), self.c.tolist()))
+
+    def __len__(self) -> int:
+        return len(self.difficulties)
+
+
+class ItemInformationIndex:
+    """Индекс (question_id, a, b, c) по профессиям и доменам"""
+
+    def __init__(self, window: int = 8, refresh_interval_seconds: int = 900):
+        self.window = window
+        self.refresh_interval_seconds = refresh_interval_seconds
+        self.lock = threading.RLock()
+        self._buckets: Dict[BucketKey, DomainBucket] = {}
+        # question_id -> бакеты вопроса (общий вопрос входит в бакет каждой профессии)
+        self._item_keys: Dict[int, Set[BucketKey]] = {}
+        self._loaded_at: Dict[Optional[str], float] = {}
+
+        logger.info(f"Item information index initialized: window={window}")
+
+    # ------------------------------------------------------------------
+    # Построение
+    # ------------------------------------------------------------------
+
+    def build(self, profession: Optional[str] = None):
+        """
+        Построить индекс для профессии одним запросом
+
+        Args:
+            profession: Код профессии (None - только вопросы без профессии)
+        """
+        profession_filter = Question.profession.is_(None)
+        if profession is not None:
+            profession_filter = or_(Question.profession == profession, profession_filter)
+
+        rows = db.session.query(
+            IRTParameters.question_id,
+            IRTParameters.discrimination,
+            IRTParameters.difficulty,
+            IRTParameters.guessing,
+            BIGDomain.code
+        ).join(
+            Question, Question.id == IRTParameters.question_id
+        ).join(
+            BIGDomain, BIGDomain.id == Question.big_domain_id
+        ).filter(
+            profession_filter,
+            IRTParameters.difficulty.isnot(None),
+            IRTParameters.discrimination.isnot(None)
+        ).all()
+
+        grouped: Dict[str, List[Tuple[int, float, float, float]]] = {}
+        for question_id, a, b, c, domain_code in rows:
+            if a <= 0:
+                continue
+            grouped.setdefault(domain_code, []).append((question_id, a, b, c if c is not None else 0.0))
+
+        with self.lock:
+            for key in [key for key in self._buckets if key[0] == profession]:
+                for question_id in self._buckets[key].question_ids.tolist():
+                    self._discard_key(question_id, key)
+                del self._buckets[key]
+
+            for domain_code, domain_rows in grouped.items():
+                key = (profession, domain_code)
+                self._buckets[key] = DomainBucket.from_rows(domain_rows)
+                for question_id, _, _, _ in domain_rows:
+                    self._item_keys.setdefault(question_id, set()).add(key)
+
+            self._loaded_at[profession] = time.monotonic()
+
+        logger.info(f"Item information index built for profession {profession}: "
+                    f"{len(rows)} items in {len(grouped)} domains")
+
+    def _discard_key(self, question_id: int, key: BucketKey):
+        keys = self._item_keys.get(question_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._item_keys[question_id]
+
+    def _bucket_keys(self, profession: Optional[str], domain_code: str) -> Set[BucketKey]:
+        """Загруженные бакеты, в которые входит вопрос профессии (None - во все)"""
+        if profession is None:
+            return {(loaded, domain_code) for loaded in self._loaded_at}
+        return {(profession, domain_code)} if profession in self._loaded_at else set()
+
+    def _ensure_loaded(self, profession: Optional[str]):
+        loaded_at = self._loaded_at.get(profession)
+        if loaded_at is None or time.monotonic() - loaded_at > self.refresh_interval_seconds:
+            self.build(profession)
+
+    # ------------------------------------------------------------------
+    # Инкрементальные обновления
+    # ------------------------------------------------------------------
+
+    def upsert_items(self, items: Iterable[Tuple[int, float, float, float]]):
+        """
+        Обновить параметры вопросов после калибровки
+
+        Args:
+            items: (question_id, discrimination, difficulty, guessing)
+        """
+        items = [item for item in items if item[1] and item[1] > 0 and item[2] is not None]
+        if not items:
+            return
+
+        with self.lock:
+            unknown_ids = [item[0] for item in items if item[0] not in self._item_keys]
+
+        # Профессия и домен нужны только для вопросов, которых еще нет в индексе
+        locations: Dict[int, Tuple[Optional[str], str]] = {}
+        if unknown_ids:
+            for question_id, profession, domain_code in db.session.query(
+                Question.id, Question.profession, BIGDomain.code
+            ).join(BIGDomain, BIGDomain.id == Question.big_domain_id).filter(Question.id.in_(unknown_ids)).all():
+                locations[question_id] = (profession, domain_code)
+
+        with self.lock:
+            changed: Dict[BucketKey, Dict[int, Tuple[int, float, float, float]]] = {}
+            for question_id, a, b, c in items:
+                keys = self._item_keys.get(question_id)
+                if not keys and question_id in locations:
+                    keys = self._bucket_keys(*locations[question_id])
+                # Профессия еще не загружена - вопрос попадет в индекс при построении
+                for key in keys or ():
+                    if key not in changed:
+                        changed[key] = {row[0]: row for row in self._buckets.get(key, DomainBucket()).rows()}
+                    changed[key][question_id] = (question_id, a, b, c if c is not None else 0.0)
+                    self._item_keys.setdefault(question_id, set()).add(key)
+
+            for key, rows in changed.items():
+                self._buckets[key] = DomainBucket.from_rows(rows.values())
+
+    def upsert_parameters(self, params_list: Iterable[IRTParameters]):
+        """Обновить индекс из объектов IRTParameters"""
+        self.upsert_items(
+            (params.question_id, params.discrimination, params.difficulty, params.guessing)
+            for params in params_list if params is not None
+        )
+
+    def remove_items(self, question_ids: Iterable[int]):
+        """Удалить вопросы из индекса"""
+        with self.lock:
+            changed: Dict[BucketKey, Set[int]] = {}
+            for question_id in question_ids:
+                for key in self._item_keys.pop(question_id, ()):
+                    changed.setdefault(key, set()).add(question_id)
+
+            for key, removed in changed.items():
+                rows = [row for row in self._buckets[key].rows() if row[0] not in removed]
+                self._buckets[key] = DomainBucket.from_rows(rows)
+
+    def invalidate(self, profession: Optional[str] = None):
+        """Сбросить индекс (профессии или полностью) - перестроится при следующем обращении"""
+        with self.lock:
+            if profession is None:
+                self._buckets.clear()
+                self._item_keys.clear()
+                self._loaded_at.clear()
+            else:
+                self._loaded_at.pop(profession, None)
+
+    # ------------------------------------------------------------------
+    # Поиск
+    # ------------------------------------------------------------------
+
+    def _get_bucket(self, profession: Optional[str], domain_code: str) -> DomainBucket:
+        self._ensure_loaded(profession)
+        with self.lock:
+            return self._buckets.get((profession, domain_code), DomainBucket())
+
+    def has_domain(self, profession: Optional[str], domain_code: str) -> bool:
+        """Есть ли в индексе вопросы с IRT параметрами для домена"""
+        return len(self._get_bucket(profession, domain_code)) > 0
+
+    def available_count(self, profession: Optional[str], domain_code: str,
+                        exclude_ids: Optional[Set[int]] = None) -> int:
+        """Количество вопросов домена, не входящих в exclude_ids"""
+        bucket = self._get_bucket(profession, domain_code)
+        if not exclude_ids:
+            return len(bucket)
+        return int(len(bucket) - np.isin(bucket.question_ids, list(exclude_ids)).sum())
+
+    def select_max_information(self, profession: Optional[str], domain_code: str, theta: float,
+                               exclude_ids: Optional[Set[int]] = None) -> Optional[Tuple[int, float]]:
+        """
+        Найти вопрос с максимальной информацией при theta
+
+        Args:
+            profession: Код профессии
+            domain_code: Код домена
+            theta: Текущая оценка способности
+            exclude_ids: ID уже отвеченных вопросов
+
+        Returns:
+            (question_id, information) или None
+        """
+        bucket = self._get_bucket(profession, domain_code)
+        size = len(bucket)
+        if size == 0:
+            return None
+
+        excluded = np.asarray(list(exclude_ids), dtype=np.int64) if exclude_ids else None
+        center = bisect.bisect_left(bucket.difficulties, theta)
+        lo = hi = center
+        best_id, best_info = None, -1.0
+
+        while lo > 0 or hi < size:
+            new_lo = max(0, lo - self.window)
+            new_hi = min(size, hi + self.window)
+
+            for start, stop in ((new_lo, lo), (hi, new_hi)):
+                if start >= stop:
+                    continue
+                ids = bucket.question_ids[start:stop]
+                info = item_information(theta, bucket.a[start:stop], bucket.b[start:stop], bucket.c[start:stop])
+                if excluded is not None:
+                    info = np.where(np.isin(ids, excluded), -1.0, info)
+                best = int(np.argmax(info))
+                if info[best] > best_info:
+                    best_id, best_info = int(ids[best]), float(info[best])
+
+            lo, hi = new_lo, new_hi
+
+            # Ближайшие непросмотренные вопросы не могут дать больше информации - выходим
+            nearest = min(
+                theta - bucket.difficulties[lo - 1] if lo > 0 else math.inf,
+                bucket.difficulties[hi] - theta if hi < size else math.inf
+            )
+            if best_id is not None and information_bound(nearest, bucket.a_min, bucket.a_max) <= best_info:
+                break
+
+        if best_id is None:
+            return None
+        return best_id, best_info
+
+    def get_stats(self) -> Dict:
+        """Статистика индекса"""
+        with self.lock:
+            return {
+                'professions': sorted(str(p) for p in self._loaded_at),
+                'buckets': len(self._buckets),
+                'items': len(self._item_keys),
+                'window': self.window
+            }
+
+
+# Глобальный экземпляр индекса
+item_index = ItemInformationIndex()
+
+
+def select_max_information_question_id(profession: Optional[str], domain_code: str, theta: float,
+                                       exclude_ids: Optional[Set[int]] = None) -> Optional[int]:
+    """Получить ID вопроса с максимальной информацией при theta"""
+    result = item_index.select_max_information(profession, domain_code, theta, exclude_ids)
+    return result[0] if result else None
@@ -21,6 +21,7 @@ from models import (
 from utils.irt_engine import IRTEngine
 from utils.simple_spaced_repetition import SimpleSpacedRepetition
 from utils.metrics import record_fallback_usage, record_error
+from utils import sr_scheduler as sr_scheduler_module
 
 logger = logging.getLogger(__name__)
 
@@ -64,9 +65,9 @@ class IRTSpacedIntegration:
         self.irt_engine = IRTEngine()
         self.srs = SimpleSpacedRepetition()
         
-        # Константы интеграции
-        self.IRT_WEIGHT = 0.6  # Вес IRT в финальном решении
-        self.SR_WEIGHT = 0.4   # Вес Spaced Repetition
+        # Константы интеграции (общие с векторным планировщиком utils.sr_scheduler)
+        self.IRT_WEIGHT = sr_scheduler_module.IRT_WEIGHT  # Вес IRT в финальном решении
+        self.SR_WEIGHT = sr_scheduler_module.SR_WEIGHT    # Вес Spaced Repetition
         
         # Пороги для адаптации
         self.HIGH_CONFIDENCE_THRESHOLD = 0.8
@@ -74,8 +75,8 @@ class IRTSpacedIntegration:
         self.ABILITY_CHANGE_THRESHOLD = 0.1
         
         # Множители для интервалов
-        self.EASY_QUESTION_MULTIPLIER = 1.2  # Увеличиваем интервал для легких вопросов
-        self.HARD_QUESTION_MULTIPLIER = 0.8  # Уменьшаем интервал для сложных вопросов
+        self.EASY_QUESTION_MULTIPLIER = sr_scheduler_module.EASY_QUESTION_MULTIPLIER  # Увеличиваем интервал для легких вопросов
+        self.HARD_QUESTION_MULTIPLIER = sr_scheduler_module.HARD_QUESTION_MULTIPLIER  # Уменьшаем интервал для сложных вопросов
         
     def create_integrated_item(self, question_id: int, user_id: int, 
                              user_ability: float = None) -> IRTSpacedItem:
@@ -239,6 +240,10 @@ class IRTSpacedIntegration:
             # Сохраняем в базу данных
             self._save_integrated_item(item)
             
+            # Секция повторений сегодняшнего плана устарела
+            from utils.daily_plan_snapshots import invalidate_daily_plan, SECTION_REVIEW
+            invalidate_daily_plan(item.user_id, [SECTION_REVIEW])
+            
             return {
                 'success': True,
                 'old_interval': old_interval,
@@ -272,41 +277,26 @@ class IRTSpacedIntegration:
             Список IRTSpacedItem для повторения
         """
         try:
-            # Получаем готовые к повторению элементы
-            query = SpacedRepetitionItem.query.filter_by(
-                user_id=user_id, is_active=True
-            ).filter(
-                SpacedRepetitionItem.next_review <= datetime.now(timezone.utc)
-            )
-            
-            if domain:
-                query = query.filter_by(domain=domain)
-            
-            sr_items = query.all()
-            
-            # Создаем интегрированные элементы
-            integrated_items = []
-            for sr_item in sr_items:
-                try:
-                    integrated_item = self.create_integrated_item(
-                        sr_item.question_id, user_id
-                    )
-                    integrated_items.append(integrated_item)
-                except Exception as e:
-                    logger.warning(f"Failed to create integrated item for question {sr_item.question_id}: {e}")
-                    continue
-            
-            # Сортируем по приоритету (IRT + SR)
-            integrated_items.sort(key=lambda x: self._calculate_priority_score(x), reverse=True)
-            
-            # Возвращаем топ элементы
-            return integrated_items[:max_items]
+            # Очередь, IRT параметры и способности загружаются пакетно,
+            # приоритеты считаются над массивами (см. utils.sr_scheduler)
+            return sr_scheduler_module.sr_scheduler.top_k_due(user_id, k=max_items, domain=domain)
             
         except Exception as e:
             logger.error(f"Error getting optimal review schedule: {e}")
             record_error("irt_spaced_integration", f"get_optimal_review_schedule failed: {e}")
             return []
     
+    def select_review_items(self, user_id: int, target_minutes: int = 30) -> Tuple[List[IRTSpacedItem], List[IRTSpacedItem], float]:
+        """
+        Готовые к повторению элементы и их доля в ежедневном плане
+        
+        Returns:
+            (все готовые элементы, выбранные на сегодня, время на повторения в минутах)
+        """
+        review_items = self.get_optimal_review_schedule(user_id, max_items=50)
+        review_time = min(target_minutes * 0.4, len(review_items) * 3)  # 40% на повторения
+        return review_items, review_items[:int(review_time / 3)], review_time  # 3 минуты на повторение
+    
     def generate_adaptive_daily_plan(self, user_id: int, target_minutes: int = 30) -> Dict:
         """
         Генерирует адаптивный ежедневный план с интеграцией IRT + SR
@@ -335,11 +325,8 @@ class IRTSpacedIntegration:
             # Получаем текущие способности
             current_abilities = self._get_current_abilities(user_id)
             
-            # Получаем готовые к повторению элементы
-            review_items = self.get_optimal_review_schedule(user_id, max_items=50)
-            
-            # Распределяем время
-            review_time = min(target_minutes * 0.4, len(review_items) * 3)  # 40% на повторения
+            # Получаем готовые к повторению элементы и распределяем время
+            review_items, selected_reviews, review_time = self.select_review_items(user_id, target_minutes)
             new_content_time = target_minutes - review_time
             
             # Формируем план
@@ -347,7 +334,7 @@ class IRTSpacedIntegration:
                 'user_id': user_id,
                 'target_minutes': target_minutes,
                 'current_abilities': current_abilities,
-                'review_items': review_items[:int(review_time / 3)],  # 3 минуты на повторение
+                'review_items': selected_reviews,
                 'new_content': self._select_new_content(user_id, current_abilities, new_content_time),
                 'estimated_time': {
                     'review': review_time,
@@ -375,16 +362,9 @@ class IRTSpacedIntegration:
     def _get_user_ability(self, user_id: int, domain: str) -> float:
         """Получает IRT способность пользователя для домена"""
         try:
-            # Получаем последнюю диагностическую сессию
-            session = DiagnosticSession.query.filter_by(
-                user_id=user_id
-            ).order_by(DiagnosticSession.id.desc()).first()
-            
-            if session and session.session_data:
-                domain_abilities = session.session_data.get('domain_abilities', {})
-                return domain_abilities.get(domain, 0.0)
-            
-            return 0.0
+            # Последняя диагностическая сессия (session_data хранится как JSON строка)
+            abilities = sr_scheduler_module.sr_scheduler.load_abilities([user_id])
+            return abilities.get(user_id, {}).get(domain, 0.0)
             
         except Exception as e:
             logger.warning(f"Error getting user ability: {e}")
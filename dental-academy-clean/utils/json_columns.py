@@ -0,0 +1,116 @@
+"""
+Mutable JSON columns
+JSON в текстовых колонках, который декодируется один раз при загрузке строки
+
+Раньше каждый get_* аксессор выполнял json.loads, а каждый set_* -
+safe_json_dumps. Тип JSONText хранит значение как TEXT (схема БД не
+меняется), декодирует его при загрузке строки и сериализует только при
+flush. JSONDict / JSONList отслеживают изменения верхнего уровня через
+sqlalchemy.ext.mutable; вложенные изменения фиксируются через assign_json
+или flag_modified.
+
+Если установлен orjson, он используется для кодирования и декодирования,
+иначе - стандартный json.
+"""
+
+import json
+import logging
+from datetime import date, datetime
+from decimal import Decimal
+
+from sqlalchemy.ext.mutable import MutableDict, MutableList
+from sqlalchemy.orm.attributes import flag_modified
+from sqlalchemy.types import Text, TypeDecorator
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+if orjson is not None:
+    ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def _json_default(obj):
+    """Типы, которые стандартный json не сериализует (как safe_json_dumps)"""
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if hasattr(obj, 'item'):
+        # numpy скаляры
+        return obj.item()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps_json(value) -> str:
+    """Сериализация в JSON строку (orjson при наличии)"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(value, default=_json_default, option=ORJSON_OPTIONS).decode('utf-8')
+        except TypeError:
+            # Например, целые вне 64 бит - отдаем стандартному json
+            pass
+    return json.dumps(value, default=_json_default, ensure_ascii=False)
+
+
+def loads_json(text):
+    """Десериализация JSON строки (orjson при наличии)"""
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+class JSONText(TypeDecorator):
+    """
+    JSON в колонке TEXT
+
+    Args:
+        container: Ожидаемый тип верхнего уровня (dict или list); поврежденные
+            значения или значения другого типа загружаются как NULL
+    """
+    impl = Text
+    cache_ok = True
+
+    def __init__(self, container=dict, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.container = container
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return dumps_json(value)
+
+    def process_result_value(self, value, dialect):
+        if not value:
+            return None
+        try:
+            decoded = loads_json(value)
+        except ValueError as e:
+            logger.warning(f"Invalid JSON in column, loading as NULL: {e}")
+            return None
+        if not isinstance(decoded, self.container):
+            logger.warning(f"Unexpected JSON type {type(decoded).__name__}, expected {self.container.__name__}")
+            return None
+        return decoded
+
+    def coerce_compared_value(self, op, value):
+        return self.impl.coerce_compared_value(op, value)
+
+
+# Типы колонок: изменения верхнего уровня (d[key] = v, lst.append(v)) помечают атрибут
+JSONDict = MutableDict.as_mutable(JSONText(dict))
+JSONList = MutableList.as_mutable(JSONText(list))
+
+
+def assign_json(instance, key: str, value):
+    """
+    Присвоить значение JSON колонке и пометить ее измененной
+
+    Нужен, когда меняются вложенные структуры или присваивается тот же
+    объект, который вернул геттер - иначе SQLAlchemy не увидит изменений.
+    """
+    setattr(instance, key, value)
+    flag_modified(instance, key)
@@ -0,0 +1,549 @@
+"""
+Incremental mailbox sync for the admin inbox
+
+Each configured mailbox (get_multiple_email_configs) keeps a MailboxSyncState
+row with the IMAP UIDVALIDITY and the last seen UID. A sync run:
+
+1. selects the folder read-only and compares UIDVALIDITY (a change resets the
+   position; already stored messages are kept, deduplicated by Message-ID and
+   moved to their new UID);
+2. searches `UID last+1:*` and fetches only the header fields of new
+   messages, creating IncomingEmail rows with body_loaded=False;
+3. fetches bodies of pending messages in one UID FETCH per chunk and stores
+   attachments as EmailAttachment blobs.
+
+POP3 accounts use UIDL instead of UIDs (TOP n 0 for headers, RETR for bodies).
+Mailboxes sync concurrently in a background worker; a body that was not yet
+fetched is loaded on demand when the message is opened.
+"""
+
+import email
+import email.policy
+import email.utils
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import update
+
+from extensions import db
+from models import IncomingEmail, EmailAttachment, MailboxSyncState
+from utils.email_client import EmailClient, get_multiple_email_configs
+from utils.json_columns import assign_json
+
+logger = logging.getLogger(__name__)
+
+POP3_FOLDER = 'POP3'
+HEADER_FIELDS = 'MESSAGE-ID SUBJECT FROM TO DATE CONTENT-TYPE'
+MAX_ATTACHMENT_BYTES = 10 * 1024 * 1024
+
+_FETCH_UID = re.compile(rb'UID (\d+)')
+_FETCH_SIZE = re.compile(rb'RFC822\.SIZE (\d+)')
+
+
+@dataclass
+class MailboxSyncResult:
+    """Outcome of one mailbox sync"""
+    account: str
+    protocol: Optional[str] = None
+    new_messages: int = 0
+    bodies_loaded: int = 0
+    attachments_stored: int = 0
+    uidvalidity_reset: bool = False
+    error: Optional[str] = None
+
+    def to_dict(self) -> Dict:
+        return {
+            'account': self.account,
+            'protocol': self.protocol,
+            'new_messages': self.new_messages,
+            'bodies_loaded': self.bodies_loaded,
+            'attachments_stored': self.attachments_stored,
+            'uidvalidity_reset': self.uidvalidity_reset,
+            'error': self.error
+        }
+
+
+@dataclass
+class ParsedBody:
+    text_content: Optional[str] = None
+    html_content: Optional[str] = None
+    attachments: List[Dict] = field(default_factory=list)
+
+
+# ----------------------------------------------------------------------
+# Parsing
+# ----------------------------------------------------------------------
+
+def _decode(value) -> str:
+    return EmailClient._decode_header(value or '')
+
+
+def parse_headers(raw: bytes, account: str, folder: str, uid: str,
+                  uidvalidity: Optional[int], size: int = 0) -> Dict:
+    """IncomingEmail fields from the raw header block"""
+    headers = email.message_from_bytes(raw, policy=email.policy.compat32)
+    sender_email, sender_name = EmailClient._parse_email_address(_decode(headers.get('From')))
+    try:
+        date_received = email.utils.parsedate_to_datetime(headers.get('Date', ''))
+        if date_received.tzinfo is not None:
+            date_received = date_received.astimezone(timezone.utc).replace(tzinfo=None)
+    except (TypeError, ValueError):
+        date_received = datetime.utcnow()
+    message_id = (headers.get('Message-ID') or '').strip() or \
+        f'<{account}.{folder}.{uidvalidity or 0}.{uid}@mentora.sync>'
+    content_type = (headers.get_content_type() or '').lower()
+    return {
+        'message_id': message_id[:255],
+        'subject': (_decode(headers.get('Subject')) or '(no subject)')[:500],
+        'sender_email': (sender_email or '')[:255],
+        'sender_name': sender_name[:255] if sender_name else None,
+        'recipient_email': (_decode(headers.get('To')) or '')[:255],
+        'source_account': account,
+        'date_received': date_received,
+        'size_bytes': size,
+        'has_attachments': content_type in ('multipart/mixed', 'multipart/related'),
+        'attachment_count': 0,
+        'folder': folder,
+        'remote_uid': uid,
+        'uidvalidity': uidvalidity,
+        'body_loaded': False
+    }
+
+
+def parse_body(raw: bytes) -> ParsedBody:
+    """Text/HTML parts and attachment payloads of a full message"""
+    message = email.message_from_bytes(raw)
+    body = ParsedBody()
+    for part in message.walk():
+        if part.is_multipart():
+            continue
+        disposition = part.get_content_disposition()
+        content_type = part.get_content_type()
+        filename = part.get_filename()
+        if disposition == 'attachment' or (filename and disposition != 'inline') or \
+                (disposition == 'inline' and filename and not content_type.startswith('text/')):
+            payload = part.get_payload(decode=True) or b''
+            body.attachments.append({
+                'filename': (_decode(filename) or 'attachment')[:255],
+                'content_type': content_type[:100],
+                'content': payload if len(payload) <= MAX_ATTACHMENT_BYTES else None,
+                'size_bytes': len(payload),
+                'content_id': (part.get('Content-ID') or '').strip('<> ')[:255] or None
+            })
+            continue
+        payload = part.get_payload(decode=True)
+        if payload is None:
+            continue
+        charset = part.get_content_charset() or 'utf-8'
+        try:
+            text = payload.decode(charset, errors='ignore')
+        except LookupError:
+            text = payload.decode('utf-8', errors='ignore')
+        if content_type == 'text/plain' and body.text_content is None:
+            body.text_content = text
+        elif content_type == 'text/html' and body.html_content is None:
+            body.html_content = text
+    return body
+
+
+def _fetch_literals(data) -> List[Tuple[bytes, bytes]]:
+    """
+    (metadata, literal) pairs of an imaplib FETCH response
+
+    Servers may put UID / RFC822.SIZE after the literal, in which case they
+    arrive in the bytes item following the tuple - both are kept in metadata.
+    """
+    data = list(data or [])
+    pairs = []
+    for index, item in enumerate(data):
+        if isinstance(item, tuple) and len(item) == 2:
+            tail = data[index + 1] if index + 1 < len(data) and isinstance(data[index + 1], bytes) else b''
+            pairs.append((item[0] + b' ' + tail, item[1]))
+    return pairs
+
+
+def _uid_sets(uids: List[int], chunk: int) -> List[str]:
+    return [','.join(str(uid) for uid in uids[start:start + chunk]) for start in range(0, len(uids), chunk)]
+
+
+# ----------------------------------------------------------------------
+# Engine
+# ----------------------------------------------------------------------
+
+class MailboxSyncEngine:
+    """UID-based incremental sync of several mailboxes"""
+
+    def __init__(self, max_workers: int = 2, initial_limit: int = 200, header_chunk: int = 200,
+                 body_chunk: int = 20, bodies_per_run: int = 100, folder: str = 'INBOX',
+                 client_factory: Callable[[Dict], EmailClient] = EmailClient):
+        self.max_workers = max_workers
+        self.initial_limit = initial_limit
+        self.header_chunk = header_chunk
+        self.body_chunk = body_chunk
+        self.bodies_per_run = bodies_per_run
+        self.folder = folder
+        self.client_factory = client_factory
+
+        self._app = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._done.set()
+        self.last_results: List[MailboxSyncResult] = []
+        self.last_run_at: Optional[datetime] = None
+
+    def init_app(self, app):
+        self._app = app
+        app.extensions['mailbox_sync'] = self
+
+    # ------------------------------------------------------------------
+    # Background worker
+    # ------------------------------------------------------------------
+
+    def trigger(self, wait: float = 0) -> bool:
+        """
+        Start a background sync of all mailboxes (no-op if one is running)
+
+        Args:
+            wait: Seconds to wait for completion
+
+        Returns:
+            True if the run finished within `wait`
+        """
+        with self._lock:
+            if self._done.is_set():
+                self._done.clear()
+                self._thread = threading.Thread(target=self._run_in_app, name='mailbox-sync', daemon=True)
+                self._thread.start()
+        return self._done.wait(wait) if wait else self._done.is_set()
+
+    @property
+    def running(self) -> bool:
+        return not self._done.is_set()
+
+    def _run_in_app(self):
+        try:
+            with self._app.app_context():
+                self.sync_all()
+        except Exception as e:
+            logger.error(f"Mailbox sync failed: {e}", exc_info=True)
+        finally:
+            self._done.set()
+
+    def sync_all(self, configs: Optional[Dict[str, Dict]] = None) -> List[MailboxSyncResult]:
+        """Sync every configured mailbox concurrently (one connection per mailbox)"""
+        configs = configs if configs is not None else get_multiple_email_configs()
+        app = self._app
+        if app is None:
+            from flask import current_app
+            app = current_app._get_current_object()
+
+        def run(item):
+            account, config = item
+            with app.app_context():
+                try:
+                    return self.sync_account(account, config)
+                finally:
+                    db.session.remove()
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(configs)))) as pool:
+            results = list(pool.map(run, configs.items()))
+        self.last_results = results
+        self.last_run_at = datetime.utcnow()
+        return results
+
+    # ------------------------------------------------------------------
+    # Single mailbox
+    # ------------------------------------------------------------------
+
+    def _state(self, account: str, folder: str) -> MailboxSyncState:
+        state = MailboxSyncState.query.filter_by(account=account, folder=folder).first()
+        if state is None:
+            state = MailboxSyncState(account=account, folder=folder, last_uid=0, synced_count=0)
+            db.session.add(state)
+            db.session.flush()
+        return state
+
+    def sync_account(self, account: str, config: Dict) -> MailboxSyncResult:
+        """Headers of new messages, then pending bodies; IMAP with POP3 fallback"""
+        result = MailboxSyncResult(account)
+        client = self.client_factory(config)
+        try:
+            if config.get('imap_host') and client.connect_imap():
+                result.protocol = 'imap'
+                self._sync_imap(client.imap_connection, account, result)
+            elif config.get('pop_host') and client.connect_pop():
+                result.protocol = 'pop3'
+                self._sync_pop(client.pop_connection, account, result)
+            else:
+                result.error = 'connection failed'
+        except Exception as e:
+            db.session.rollback()
+            result.error = str(e)
+            logger.error(f"Mailbox {account} sync failed: {e}", exc_info=True)
+        finally:
+            client.disconnect()
+
+        state = self._state(account, self.folder if result.protocol != 'pop3' else POP3_FOLDER)
+        state.last_error = result.error
+        state.last_synced_at = datetime.utcnow()
+        db.session.commit()
+        logger.info(f"Mailbox {account}: {result.new_messages} new, {result.bodies_loaded} bodies, "
+                    f"{result.attachments_stored} attachments ({result.protocol}, error={result.error})")
+        return result
+
+    def _store_headers(self, rows: List[Dict], skipped: Optional[List[str]] = None) -> int:
+        """
+        Insert new IncomingEmail rows (deduplicated by Message-ID in one query)
+
+        A message already stored for the same mailbox gets its server position
+        (UID, UIDVALIDITY) refreshed instead, so after a UIDVALIDITY reset its
+        pending body is fetched by the new UID. UIDs of rows dropped because the
+        message is stored elsewhere (or repeated in the batch) go to `skipped`.
+        """
+        if not rows:
+            return 0
+        message_ids = {row['message_id'] for row in rows}
+        existing = {
+            message_id: (email_id, account, folder, uid, uidvalidity)
+            for email_id, message_id, account, folder, uid, uidvalidity in db.session.query(
+                IncomingEmail.id, IncomingEmail.message_id, IncomingEmail.source_account,
+                IncomingEmail.folder, IncomingEmail.remote_uid, IncomingEmail.uidvalidity
+            ).filter(IncomingEmail.message_id.in_(message_ids)).all()
+        }
+        created = 0
+        moved = []
+        seen = set()
+        for row in rows:
+            if row['message_id'] in seen:
+                if skipped is not None:
+                    skipped.append(row['remote_uid'])
+                continue
+            seen.add(row['message_id'])
+            known = existing.get(row['message_id'])
+            if known is None:
+                db.session.add(IncomingEmail(**row))
+                created += 1
+            elif known[1:3] != (row['source_account'], row['folder']):
+                if skipped is not None:
+                    skipped.append(row['remote_uid'])
+            elif known[3:] != (row['remote_uid'], row['uidvalidity']):
+                moved.append({'id': known[0], 'remote_uid': row['remote_uid'], 'uidvalidity': row['uidvalidity']})
+        if moved:
+            db.session.execute(update(IncomingEmail), moved)
+        return created
+
+    def _apply_body(self, message: IncomingEmail, raw: bytes, result: MailboxSyncResult):
+        body = parse_body(raw)
+        message.text_content = body.text_content
+        message.html_content = body.html_content
+        message.size_bytes = message.size_bytes or len(raw)
+        message.has_attachments = bool(body.attachments)
+        message.attachment_count = len(body.attachments)
+        message.body_loaded = True
+        for attachment in body.attachments:
+            db.session.add(EmailAttachment(email_id=message.id, **attachment))
+        result.bodies_loaded += 1
+        result.attachments_stored += len(body.attachments)
+
+    def _pending_bodies(self, account: str, folder: str, limit: int,
+                        uidvalidity: Optional[int] = None) -> List[IncomingEmail]:
+        query = IncomingEmail.query.filter(
+            IncomingEmail.source_account == account,
+            IncomingEmail.folder == folder,
+            IncomingEmail.body_loaded == False
+        )
+        if uidvalidity is not None:
+            query = query.filter(IncomingEmail.uidvalidity == uidvalidity)
+        return query.order_by(IncomingEmail.date_received.desc()).limit(limit).all()
+
+    # IMAP --------------------------------------------------------------
+
+    def _sync_imap(self, connection, account: str, result: MailboxSyncResult):
+        folder = self.folder
+        status, _ = connection.select(folder, readonly=True)
+        if status != 'OK':
+            raise RuntimeError(f'Cannot select {folder}')
+        _, uidvalidity_data = connection.response('UIDVALIDITY')
+        uidvalidity = int(uidvalidity_data[0]) if uidvalidity_data and uidvalidity_data[0] else None
+
+        state = self._state(account, folder)
+        if state.uidvalidity != uidvalidity:
+            result.uidvalidity_reset = state.uidvalidity is not None
+            state.uidvalidity = uidvalidity
+            state.last_uid = 0
+
+        last_uid = state.last_uid or 0
+        status, data = connection.uid('SEARCH', None, f'UID {last_uid + 1}:*')
+        if status != 'OK':
+            raise RuntimeError('UID SEARCH failed')
+        # "n:*" always matches the highest UID, even when it is below n
+        uids = sorted(uid for uid in (int(value) for value in (data[0] or b'').split()) if uid > last_uid)
+        if not last_uid and len(uids) > self.initial_limit:
+            uids = uids[-self.initial_limit:]
+
+        for uid_set in _uid_sets(uids, self.header_chunk):
+            status, data = connection.uid(
+                'FETCH', uid_set, f'(UID RFC822.SIZE BODY.PEEK[HEADER.FIELDS ({HEADER_FIELDS})])'
+            )
+            if status != 'OK':
+                raise RuntimeError('UID FETCH (headers) failed')
+            rows = []
+            for meta, literal in _fetch_literals(data):
+                uid_match = _FETCH_UID.search(meta)
+                if not uid_match:
+                    continue
+                size_match = _FETCH_SIZE.search(meta)
+                rows.append(parse_headers(
+                    literal, account, folder, uid_match.group(1).decode(), uidvalidity,
+                    int(size_match.group(1)) if size_match else 0
+                ))
+            result.new_messages += self._store_headers(rows)
+            # Position advances per chunk, so an interrupted sync resumes where it stopped
+            state.last_uid = max(int(uid) for uid in uid_set.split(','))
+            state.synced_count = (state.synced_count or 0) + len(rows)
+            db.session.commit()
+
+        self._load_imap_bodies(connection, self._pending_bodies(account, folder, self.bodies_per_run, uidvalidity), result)
+
+    def _load_imap_bodies(self, connection, messages: List[IncomingEmail], result: MailboxSyncResult):
+        by_uid = {int(message.remote_uid): message for message in messages if message.remote_uid}
+        for uid_set in _uid_sets(sorted(by_uid), self.body_chunk):
+            status, data = connection.uid('FETCH', uid_set, '(UID BODY.PEEK[])')
+            if status != 'OK':
+                raise RuntimeError('UID FETCH (body) failed')
+            for meta, literal in _fetch_literals(data):
+                uid_match = _FETCH_UID.search(meta)
+                message = by_uid.get(int(uid_match.group(1))) if uid_match else None
+                if message is not None:
+                    self._apply_body(message, literal, result)
+            db.session.commit()
+
+    # POP3 --------------------------------------------------------------
+
+    def _uidl_map(self, connection) -> Dict[str, int]:
+        _, listing, _ = connection.uidl()
+        mapping = {}
+        for line in listing:
+            number, _, uidl = line.decode(errors='ignore').partition(' ')
+            if uidl:
+                mapping[uidl.strip()] = int(number)
+        return mapping
+
+    def _sync_pop(self, connection, account: str, result: MailboxSyncResult):
+        state = self._state(account, POP3_FOLDER)
+        uidls = self._uidl_map(connection)
+        known = {
+            uid for (uid,) in db.session.query(IncomingEmail.remote_uid).filter(
+                IncomingEmail.source_account == account,
+                IncomingEmail.folder == POP3_FOLDER
+            ).all()
+        }
+        # Duplicates by Message-ID have no row in this mailbox: their UIDLs are kept
+        # in the state so TOP is not repeated for them on every run
+        skipped = [uidl for uidl in state.skipped_uids or [] if uidl in uidls]
+        known.update(skipped)
+        new = sorted((number, uidl) for uidl, number in uidls.items() if uidl not in known)
+        if not known and len(new) > self.initial_limit:
+            new = new[-self.initial_limit:]
+
+        rows = []
+        for number, uidl in new:
+            _, lines, octets = connection.top(number, 0)
+            rows.append(parse_headers(b'\r\n'.join(lines), account, POP3_FOLDER, uidl, None, octets))
+            if len(rows) >= self.header_chunk:
+                result.new_messages += self._store_headers(rows, skipped)
+                assign_json(state, 'skipped_uids', skipped)
+                db.session.commit()
+                rows = []
+        result.new_messages += self._store_headers(rows, skipped)
+        # UIDLs gone from the server are dropped, so the list stays bounded
+        assign_json(state, 'skipped_uids', skipped)
+        state.synced_count = (state.synced_count or 0) + len(new)
+        db.session.commit()
+
+        for message in self._pending_bodies(account, POP3_FOLDER, self.bodies_per_run):
+            number = uidls.get(message.remote_uid)
+            if number is None:
+                continue
+            _, lines, _ = connection.retr(number)
+            self._apply_body(message, b'\r\n'.join(lines), result)
+        db.session.commit()
+
+    # ------------------------------------------------------------------
+    # On-demand body
+    # ------------------------------------------------------------------
+
+    def load_body(self, message: IncomingEmail, config: Optional[Dict] = None) -> bool:
+        """Fetch the body of one message now (inbox view before the worker got to it)"""
+        if message.body_loaded:
+            return True
+        config = config or get_multiple_email_configs().get(message.source_account)
+        if not config or not message.remote_uid:
+            return False
+        result = MailboxSyncResult(message.source_account)
+        client = self.client_factory(config)
+        try:
+            if message.folder == POP3_FOLDER:
+                if not client.connect_pop():
+                    return False
+                number = self._uidl_map(client.pop_connection).get(message.remote_uid)
+                if number is None:
+                    return False
+                _, lines, _ = client.pop_connection.retr(number)
+                self._apply_body(message, b'\r\n'.join(lines), result)
+                db.session.commit()
+            else:
+                if not client.connect_imap():
+                    return False
+                status, _ = client.imap_connection.select(message.folder or self.folder, readonly=True)
+                _, uidvalidity_data = client.imap_connection.response('UIDVALIDITY')
+                if status != 'OK' or not uidvalidity_data or int(uidvalidity_data[0]) != message.uidvalidity:
+                    return False
+                self._load_imap_bodies(client.imap_connection, [message], result)
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Loading body of email {message.id} failed: {e}")
+            return False
+        finally:
+            client.disconnect()
+        return message.body_loaded
+
+    def status(self) -> Dict:
+        return {
+            'running': self.running,
+            'last_run_at': self.last_run_at.isoformat() if self.last_run_at else None,
+            'results': [result.to_dict() for result in self.last_results],
+            'mailboxes': [
+                {
+                    'account': state.account,
+                    'folder': state.folder,
+                    'uidvalidity': state.uidvalidity,
+                    'last_uid': state.last_uid,
+                    'synced_count': state.synced_count,
+                    'last_synced_at': state.last_synced_at.isoformat() if state.last_synced_at else None,
+                    'last_error': state.last_error
+                }
+                for state in MailboxSyncState.query.order_by(MailboxSyncState.account).all()
+            ]
+        }
+
+
+# Global sync engine
+mailbox_sync = MailboxSyncEngine(
+    max_workers=int(os.environ.get('MAILBOX_SYNC_WORKERS', 2)),
+    initial_limit=int(os.environ.get('MAILBOX_SYNC_INITIAL_LIMIT', 200)),
+    bodies_per_run=int(os.environ.get('MAILBOX_SYNC_BODIES_PER_RUN', 100))
+)
+
+
+def init_mailbox_sync(app):
+    """Attach the mailbox sync engine to the application"""
+    mailbox_sync.init_app(app)
+    return mailbox_sync
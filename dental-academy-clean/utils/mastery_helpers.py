@@ -2,7 +2,7 @@ from __future__ import annotations
 
 import logging
 from datetime import datetime, date, timezone
-from typing import Iterable, Optional, Dict, Set
+from typing import Iterable, Optional, Dict, Set, Tuple
 
 from sqlalchemy import func
 from sqlalchemy.exc import SQLAlchemyError
@@ -20,6 +20,59 @@ def _normalize_session_reference(reference: Optional[str]) -> Optional[str]:
     return reference[:64]
 
 
+def _new_mastery(user_id: int, item_type: str, item_id: int) -> UserItemMastery:
+    return UserItemMastery(
+        user_id=user_id,
+        item_type=item_type,
+        item_id=item_id,
+        total_attempts=0,
+        total_correct=0,
+        consecutive_correct_sessions=0,
+        last_result=False
+    )
+
+
+def _apply_mastery_result(
+    mastery: UserItemMastery,
+    is_correct: bool,
+    session_reference: Optional[str],
+    session_date: date,
+    now: datetime,
+) -> None:
+    mastery.total_attempts = (mastery.total_attempts or 0) + 1
+    mastery.last_attempt_at = now
+
+    if is_correct:
+        mastery.total_correct = (mastery.total_correct or 0) + 1
+
+        # Determine if this is a new session (different day or reference)
+        is_new_session = (
+            mastery.last_session_date is not None
+            and mastery.last_session_date != session_date
+        )
+
+        if mastery.last_result and is_new_session:
+            mastery.consecutive_correct_sessions = (mastery.consecutive_correct_sessions or 0) + 1
+        elif mastery.last_result and not is_new_session:
+            # Same session, keep at least 1
+            mastery.consecutive_correct_sessions = max(mastery.consecutive_correct_sessions or 1, 1)
+        else:
+            mastery.consecutive_correct_sessions = 1
+
+        mastery.last_correct_at = now
+
+        if mastery.consecutive_correct_sessions >= 2:
+            mastery.mastered_at = mastery.mastered_at or now
+    else:
+        mastery.consecutive_correct_sessions = 0
+        mastery.mastered_at = None
+
+    mastery.last_result = is_correct
+    mastery.last_session_reference = session_reference
+    mastery.last_session_date = session_date
+    mastery.updated_at = now
+
+
 def update_item_mastery(
     user_id: int,
     item_type: str,
@@ -50,50 +103,11 @@ def update_item_mastery(
         ).first()
 
         if mastery is None:
-            mastery = UserItemMastery(
-                user_id=user_id,
-                item_type=item_type,
-                item_id=item_id,
-                total_attempts=0,
-                total_correct=0,
-                consecutive_correct_sessions=0,
-                last_result=False
-            )
+            mastery = _new_mastery(user_id, item_type, item_id)
             db.session.add(mastery)
             db.session.flush()
 
-        mastery.total_attempts = (mastery.total_attempts or 0) + 1
-        mastery.last_attempt_at = now
-
-        if is_correct:
-            mastery.total_correct = (mastery.total_correct or 0) + 1
-
-            # Determine if this is a new session (different day or reference)
-            is_new_session = (
-                mastery.last_session_date is not None
-                and mastery.last_session_date != session_date
-            )
-
-            if mastery.last_result and is_new_session:
-                mastery.consecutive_correct_sessions = (mastery.consecutive_correct_sessions or 0) + 1
-            elif mastery.last_result and not is_new_session:
-                # Same session, keep at least 1
-                mastery.consecutive_correct_sessions = max(mastery.consecutive_correct_sessions or 1, 1)
-            else:
-                mastery.consecutive_correct_sessions = 1
-
-            mastery.last_correct_at = now
-
-            if mastery.consecutive_correct_sessions >= 2:
-                mastery.mastered_at = mastery.mastered_at or now
-        else:
-            mastery.consecutive_correct_sessions = 0
-            mastery.mastered_at = None
-
-        mastery.last_result = is_correct
-        mastery.last_session_reference = session_reference
-        mastery.last_session_date = session_date
-        mastery.updated_at = now
+        _apply_mastery_result(mastery, is_correct, session_reference, session_date, now)
     except SQLAlchemyError as exc:
         logger.error(
             "Failed to update mastery for user=%s item=%s:%s (%s)",
@@ -106,6 +120,43 @@ def update_item_mastery(
         db.session.rollback()
 
 
+def update_item_mastery_batch(
+    user_id: int,
+    item_type: str,
+    results: Iterable[Tuple[int, bool, datetime]],
+) -> None:
+    """
+    Apply an ordered list of (item_id, is_correct, answered_at) results.
+
+    Existing mastery rows are loaded with one query; the same rules as
+    update_item_mastery apply, with the session date taken from answered_at.
+    Does not commit and does not catch errors - the caller owns the transaction.
+    """
+    results = list(results)
+    if not results:
+        return
+
+    item_ids = {item_id for item_id, _, _ in results}
+    masteries = {
+        mastery.item_id: mastery
+        for mastery in UserItemMastery.query.filter(
+            UserItemMastery.user_id == user_id,
+            UserItemMastery.item_type == item_type,
+            UserItemMastery.item_id.in_(item_ids)
+        ).all()
+    }
+
+    for item_id, is_correct, answered_at in results:
+        mastery = masteries.get(item_id)
+        if mastery is None:
+            mastery = masteries[item_id] = _new_mastery(user_id, item_type, item_id)
+            db.session.add(mastery)
+
+        session_date = answered_at.date()
+        session_reference = _normalize_session_reference(f'{item_type}-{session_date.isoformat()}')
+        _apply_mastery_result(mastery, is_correct, session_reference, session_date, answered_at)
+
+
 def get_mastery_statistics(
     user_id: int,
     item_type: str,
@@ -0,0 +1,141 @@
+"""
+Plan Build Instrumentation
+Количество SQL запросов и время построения ежедневного плана
+
+    with instrument_plan_build(user_id, 'daily_plan') as stats:
+        ...
+    # stats.query_count, stats.duration_ms
+
+По завершении вызываются зарегистрированные хуки (register_plan_hook);
+хук по умолчанию пишет строку в лог.
+
+Для страниц есть декоратор query_budget: превышение бюджета запросов
+пишется в лог, а в режиме TESTING (или при QUERY_BUDGET_STRICT) вызывает
+QueryBudgetExceeded, так что тесты ловят регрессии N+1.
+"""
+
+import contextvars
+import functools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PlanBuildStats:
+    """Метрики одного построения плана"""
+    user_id: Optional[int]
+    label: str
+    query_count: int = 0
+    duration_ms: float = 0.0
+    started_at: float = field(default_factory=time.perf_counter)
+
+    def to_dict(self):
+        return {
+            'user_id': self.user_id,
+            'label': self.label,
+            'query_count': self.query_count,
+            'duration_ms': round(self.duration_ms, 2)
+        }
+
+
+_active_stats: contextvars.ContextVar = contextvars.ContextVar('plan_build_stats', default=None)
+_hooks: List[Callable[[PlanBuildStats], None]] = []
+_listener_lock = threading.Lock()
+_listener_installed = False
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    stats = _active_stats.get()
+    if stats is not None:
+        stats.query_count += 1
+
+
+def _install_listener():
+    global _listener_installed
+    if _listener_installed:
+        return
+    with _listener_lock:
+        if not _listener_installed:
+            event.listen(Engine, 'before_cursor_execute', _count_query)
+            _listener_installed = True
+
+
+def register_plan_hook(hook: Callable[[PlanBuildStats], None]):
+    """Зарегистрировать обработчик метрик построения плана"""
+    _hooks.append(hook)
+
+
+def _log_hook(stats: PlanBuildStats):
+    logger.info(f"Plan build '{stats.label}' for user {stats.user_id}: "
+                f"{stats.query_count} queries, {stats.duration_ms:.1f} ms")
+
+
+register_plan_hook(_log_hook)
+
+
+@contextmanager
+def instrument_plan_build(user_id: Optional[int], label: str = 'daily_plan'):
+    """
+    Считать SQL запросы и время внутри блока
+
+    Вложенные блоки не создают новых метрик - считается внешний план.
+    """
+    if _active_stats.get() is not None:
+        yield _active_stats.get()
+        return
+
+    _install_listener()
+    stats = PlanBuildStats(user_id=user_id, label=label)
+    token = _active_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _active_stats.reset(token)
+        stats.duration_ms = (time.perf_counter() - stats.started_at) * 1000
+        for hook in list(_hooks):
+            try:
+                hook(stats)
+            except Exception as e:
+                logger.warning(f"Plan instrumentation hook failed: {e}")
+
+
+class QueryBudgetExceeded(RuntimeError):
+    """Страница выполнила больше SQL запросов, чем позволяет бюджет"""
+
+
+def query_budget(label: str, budget: int):
+    """
+    Декоратор view: считать SQL запросы и проверять бюджет
+
+    Args:
+        label: Имя для метрик и логов
+        budget: Максимальное количество запросов
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            from flask_login import current_user
+            user_id = getattr(current_user, 'id', None)
+            with instrument_plan_build(user_id, label) as stats:
+                result = view(*args, **kwargs)
+            if stats.query_count > budget:
+                message = f"{label}: {stats.query_count} queries exceeds budget of {budget}"
+                strict = has_app_context() and (
+                    current_app.config.get('TESTING') or current_app.config.get('QUERY_BUDGET_STRICT')
+                )
+                if strict:
+                    raise QueryBudgetExceeded(message)
+                logger.warning(message)
+            return result
+        return wrapper
+    return decorator
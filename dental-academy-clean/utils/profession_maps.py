@@ -0,0 +1,171 @@
+"""
+Profession Maps
+Реестр профессиональных карт обучения с предкомпилированными фрагментами
+
+Статическая часть карты (пути обучения, предметы и модули) одинакова для
+всех пользователей одной профессии. Она собирается один раз на профессию (и
+язык - только для карт, зарегистрированных с localized=True) и хранится как
+неизменяемый JSON (bytes) с ETag. На запрос фрагмент
+декодируется в свежую копию, и на нее накладываются только данные
+пользователя (прогресс).
+
+Фрагменты пересобираются по TTL и при смене версии дерева контента
+(commit, изменивший предметы, модули, уроки или пути обучения).
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Optional, Tuple
+
+from flask import make_response, request
+
+from utils.content_tree import content_tree
+from utils.json_columns import dumps_json, loads_json
+
+logger = logging.getLogger(__name__)
+
+PROFESSION_MAP_TTL = int(os.environ.get('PROFESSION_MAP_TTL', 3600))
+
+# Сборщик статической части: (lang) -> dict; наложение: (data, user_id) -> None
+Builder = Callable[[Optional[str]], Dict]
+Overlay = Callable[[Dict, int], None]
+
+
+@dataclass(frozen=True)
+class MapFragment:
+    """Сериализованная статическая часть карты"""
+    body: bytes
+    etag: str
+    version: int
+    built_at: float = field(default_factory=time.monotonic)
+
+    @classmethod
+    def build(cls, data: Dict, version: int) -> 'MapFragment':
+        body = dumps_json(data).encode('utf-8')
+        return cls(body=body, etag=hashlib.sha1(body).hexdigest(), version=version)
+
+    def data(self) -> Dict:
+        """Свежая изменяемая копия фрагмента"""
+        return loads_json(self.body)
+
+
+@dataclass(frozen=True)
+class _ProfessionMap:
+    builder: Builder
+    overlay: Optional[Overlay] = None
+    localized: bool = False
+
+
+class ProfessionMapRegistry:
+    """Зарегистрированные карты и кэш их фрагментов по (ключ, язык)"""
+
+    def __init__(self, ttl: int = PROFESSION_MAP_TTL):
+        self.ttl = ttl
+        self._maps: Dict[str, _ProfessionMap] = {}
+        self._fragments: Dict[Tuple[str, Optional[str]], MapFragment] = {}
+        self._lock = threading.Lock()
+        self.builds = 0
+
+    def register(self, profession: str, builder: Builder, overlay: Optional[Overlay] = None,
+                 localized: bool = False):
+        """
+        Зарегистрировать карту профессии
+
+        Args:
+            profession: Slug профессии (farmacie, tandheelkunde, ...)
+            builder: Собирает статическую часть для языка (без данных пользователя)
+            overlay: Накладывает данные пользователя на копию фрагмента
+            localized: Статическая часть зависит от языка (иначе один фрагмент на все языки,
+                builder получает None)
+        """
+        self._maps[profession] = _ProfessionMap(builder, overlay, localized)
+
+    def __contains__(self, profession: str) -> bool:
+        return profession in self._maps
+
+    def _fresh(self, fragment: Optional[MapFragment]) -> bool:
+        return (
+            fragment is not None
+            and fragment.version == content_tree.version
+            and time.monotonic() - fragment.built_at < self.ttl
+        )
+
+    def fragment(self, key: str, lang: Optional[str], builder: Builder) -> MapFragment:
+        """
+        Фрагмент из кэша; собирается builder(lang), если устарел
+
+        lang должен быть проверенным языком (g.lang), а не сырым сегментом URL;
+        None - фрагмент не зависит от языка.
+        """
+        cache_key = (key, lang)
+        fragment = self._fragments.get(cache_key)
+        if not self._fresh(fragment):
+            with self._lock:
+                fragment = self._fragments.get(cache_key)
+                if not self._fresh(fragment):
+                    version = content_tree.version
+                    fragment = MapFragment.build(builder(lang), version)
+                    self._fragments[cache_key] = fragment
+                    self.builds += 1
+                    logger.info(f"Profession map fragment built: {key}/{lang or '*'} "
+                                f"({len(fragment.body)} bytes, version {version})")
+        return fragment
+
+    def profession_fragment(self, profession: str, lang: str) -> MapFragment:
+        profession_map = self._maps[profession]
+        return self.fragment(f'profession:{profession}', lang if profession_map.localized else None,
+                             profession_map.builder)
+
+    def user_data(self, profession: str, lang: str, user_id: int) -> Dict:
+        """Карта профессии для пользователя: копия фрагмента + данные пользователя"""
+        data = self.profession_fragment(profession, lang).data()
+        overlay = self._maps[profession].overlay
+        if overlay is not None:
+            overlay(data, user_id)
+        return data
+
+    def invalidate(self):
+        with self._lock:
+            self._fragments.clear()
+
+    def get_stats(self) -> Dict:
+        return {
+            'registered': sorted(self._maps),
+            'fragments': len(self._fragments),
+            'builds': self.builds
+        }
+
+
+# Глобальный экземпляр
+profession_maps = ProfessionMapRegistry()
+
+
+def fragment_response(fragment: MapFragment, overlay: Optional[Dict] = None, key: str = 'progress'):
+    """
+    JSON ответ из фрагмента с ETag и условным 304
+
+    Данные пользователя (overlay) дописываются в объект верхнего уровня под
+    ключом key без повторной сериализации фрагмента; ETag учитывает и их.
+    """
+    body = fragment.body
+    etag = fragment.etag
+    if overlay is not None:
+        extra = dumps_json(overlay).encode('utf-8')
+        body = body[:-1] + (b',' if len(body) > 2 else b'') + dumps_json(key).encode('utf-8') + b':' + extra + b'}'
+        etag = hashlib.sha1(etag.encode('ascii') + extra).hexdigest()
+
+    response = make_response(body)
+    response.content_type = 'application/json'
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+def invalidate_profession_maps():
+    """Пересобрать фрагменты при следующем запросе"""
+    profession_maps.invalidate()
@@ -1,23 +1,365 @@
 """
 Rate Limiter Utility
 Provides rate limiting functionality for API endpoints
+
+All limits go through one RateLimiter backed by an approximate sliding-window
+counter: every (bucket, identifier) key keeps only the request counts of the
+current and previous fixed windows, and the previous count is weighted by how
+much of it still overlaps the sliding window. Memory per key is constant.
+
+Counters live in a store shared by all gunicorn workers (Redis) or per process:
+
+    RATE_LIMIT_STORAGE: 'redis' (default when REDIS_URL is set), 'memory'
+                        (default otherwise) or 'sqlite' (explicit opt-in)
+    RATE_LIMIT_PATH:    SQLite file for 'sqlite' (required)
+    REDIS_URL:          server for 'redis'
+
+If the store fails (Redis unreachable, SQLite lock timeout), the request is
+checked against per-process memory counters instead of being let through.
+The memory store with several gunicorn workers gives every worker its own
+full limit; a warning is logged at startup in that case.
 """
 
+import os
+import re
+import shlex
+import sqlite3
+import sys
 import time
-from collections import defaultdict, deque
-from threading import Lock
+from abc import ABC, abstractmethod
+from collections import OrderedDict, defaultdict
+from functools import wraps
+from threading import Lock, local
 import logging
 
+from flask_login import current_user
+from werkzeug.exceptions import TooManyRequests
+
 logger = logging.getLogger(__name__)
 
+# Keys are pruned once their windows are over; the memory store is also capped
+PRUNE_EVERY = 1000
+MAX_MEMORY_KEYS = 100000
+
+# SQLite busy timeout: a request waits at most this long for the write lock
+SQLITE_LOCK_TIMEOUT = float(os.environ.get('RATE_LIMIT_SQLITE_TIMEOUT', 0.25))
+
+
+def sliding_window_estimate(previous, current, window_size, now):
+    """Requests in the sliding window ending at now, estimated from two fixed windows"""
+    elapsed = (now % window_size) / window_size
+    return previous * (1.0 - elapsed) + current
+
+
+class RateLimitStore(ABC):
+    """Storage backend interface: atomic check-and-increment of window counters"""
+
+    name = 'base'
+
+    @abstractmethod
+    def hit(self, key, bucket, limit, window_size, now):
+        """
+        Count a request if the estimate stays within limit
+
+        Returns:
+            tuple: (allowed, estimated requests in the window including this one)
+        """
+
+    @abstractmethod
+    def peek(self, key, window_size, now):
+        """Estimated requests in the window without counting a new one"""
+
+    @abstractmethod
+    def reset(self, key):
+        """Drop the counters of a key; returns True if there were any"""
+
+    def prune(self, now):
+        """Drop keys whose windows are over; returns the number removed"""
+        return 0
+
+    @abstractmethod
+    def get_stats(self):
+        """Allowed/rejected counters per bucket"""
+
+
+class MemoryRateLimitStore(RateLimitStore):
+    """Per-process counters (development, single worker)"""
+
+    name = 'memory'
+
+    def __init__(self, max_keys=MAX_MEMORY_KEYS):
+        self.max_keys = max_keys
+        # key -> [window_size, window_id, current, previous]
+        self.windows = OrderedDict()
+        self.stats = defaultdict(lambda: {'allowed': 0, 'rejected': 0})
+        self.lock = Lock()
+
+    def _window(self, key, window_size, now):
+        window_id = int(now // window_size)
+        entry = self.windows.get(key)
+        if entry is None or entry[0] != window_size:
+            entry = [window_size, window_id, 0, 0]
+            self.windows[key] = entry
+        elif entry[1] != window_id:
+            entry[3] = entry[2] if entry[1] == window_id - 1 else 0
+            entry[1], entry[2] = window_id, 0
+        self.windows.move_to_end(key)
+        return entry
+
+    def hit(self, key, bucket, limit, window_size, now):
+        with self.lock:
+            entry = self._window(key, window_size, now)
+            estimate = sliding_window_estimate(entry[3], entry[2], window_size, now)
+            allowed = estimate < limit
+            if allowed:
+                entry[2] += 1
+                estimate += 1
+            self.stats[bucket]['allowed' if allowed else 'rejected'] += 1
+            while len(self.windows) > self.max_keys:
+                self.windows.popitem(last=False)
+            return allowed, estimate
+
+    def peek(self, key, window_size, now):
+        with self.lock:
+            entry = self._window(key, window_size, now)
+            return sliding_window_estimate(entry[3], entry[2], window_size, now)
+
+    def reset(self, key):
+        with self.lock:
+            return self.windows.pop(key, None) is not None
+
+    def prune(self, now):
+        with self.lock:
+            expired = [key for key, (window_size, window_id, _, _) in self.windows.items()
+                       if window_id < int(now // window_size) - 1]
+            for key in expired:
+                del self.windows[key]
+            return len(expired)
+
+    def get_stats(self):
+        with self.lock:
+            return {bucket: dict(counts) for bucket, counts in self.stats.items()}
+
+
+class SQLiteRateLimitStore(RateLimitStore):
+    """
+    Counters in a SQLite file shared by all workers on the host
+
+    Local stand-in for Redis on single-host deployments without it (opt-in):
+    check-and-increment runs in one IMMEDIATE transaction, so N workers
+    enforce the configured limit, not N times it. Every hit takes the
+    database write lock; under contention hits time out and fall back to
+    per-process counters.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path):
+        self.path = path
+        self.local = local()
+
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_limit_windows ("
+            "key TEXT PRIMARY KEY, window_size INTEGER NOT NULL, window_id INTEGER NOT NULL, "
+            "current INTEGER NOT NULL, previous INTEGER NOT NULL, expires_at REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_rate_limit_windows_expires ON rate_limit_windows (expires_at)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_limit_stats ("
+            "bucket TEXT PRIMARY KEY, allowed INTEGER NOT NULL DEFAULT 0, rejected INTEGER NOT NULL DEFAULT 0)"
+        )
+
+    def _connect(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=SQLITE_LOCK_TIMEOUT, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    @staticmethod
+    def _counts(row, window_size, window_id):
+        if row is None or row[0] != window_size:
+            return 0, 0
+        stored_window, current, previous = row[1], row[2], row[3]
+        if stored_window == window_id:
+            return current, previous
+        if stored_window == window_id - 1:
+            return 0, current
+        return 0, 0
+
+    def hit(self, key, bucket, limit, window_size, now):
+        window_id = int(now // window_size)
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT window_size, window_id, current, previous FROM rate_limit_windows WHERE key = ?",
+                (key,)
+            ).fetchone()
+            current, previous = self._counts(row, window_size, window_id)
+            estimate = sliding_window_estimate(previous, current, window_size, now)
+            allowed = estimate < limit
+            if allowed:
+                current += 1
+                estimate += 1
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_limit_windows "
+                "(key, window_size, window_id, current, previous, expires_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, window_size, window_id, current, previous, (window_id + 2) * window_size)
+            )
+            column = 'allowed' if allowed else 'rejected'
+            conn.execute(
+                f"INSERT INTO rate_limit_stats (bucket, {column}) VALUES (?, 1) "
+                f"ON CONFLICT(bucket) DO UPDATE SET {column} = {column} + 1",
+                (bucket,)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return allowed, estimate
+
+    def peek(self, key, window_size, now):
+        row = self._connect().execute(
+            "SELECT window_size, window_id, current, previous FROM rate_limit_windows WHERE key = ?",
+            (key,)
+        ).fetchone()
+        current, previous = self._counts(row, window_size, int(now // window_size))
+        return sliding_window_estimate(previous, current, window_size, now)
+
+    def reset(self, key):
+        cursor = self._connect().execute("DELETE FROM rate_limit_windows WHERE key = ?", (key,))
+        return cursor.rowcount > 0
+
+    def prune(self, now):
+        cursor = self._connect().execute("DELETE FROM rate_limit_windows WHERE expires_at <= ?", (now,))
+        return cursor.rowcount
+
+    def get_stats(self):
+        rows = self._connect().execute("SELECT bucket, allowed, rejected FROM rate_limit_stats").fetchall()
+        return {bucket: {'allowed': allowed, 'rejected': rejected} for bucket, allowed, rejected in rows}
+
+
+# KEYS: current window, previous window, stats hash; ARGV: limit, weight of previous, ttl, bucket
+REDIS_HIT_SCRIPT = """
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+local previous = tonumber(redis.call('GET', KEYS[2]) or '0')
+local estimate = previous * tonumber(ARGV[2]) + current
+if estimate >= tonumber(ARGV[1]) then
+    redis.call('HINCRBY', KEYS[3], ARGV[4] .. ':rejected', 1)
+    return {0, tostring(estimate)}
+end
+redis.call('INCR', KEYS[1])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('HINCRBY', KEYS[3], ARGV[4] .. ':allowed', 1)
+return {1, tostring(estimate + 1)}
+"""
+
+
+class RedisRateLimitStore(RateLimitStore):
+    """Counters in Redis (one key per fixed window, expired by TTL)"""
+
+    name = 'redis'
+    STATS_KEY = 'rate_limit:stats'
+
+    def __init__(self, url):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.hit_script = self.client.register_script(REDIS_HIT_SCRIPT)
+
+    @staticmethod
+    def _keys(key, window_size, now):
+        window_id = int(now // window_size)
+        return f'rate_limit:{key}:{window_size}:{window_id}', f'rate_limit:{key}:{window_size}:{window_id - 1}'
+
+    def hit(self, key, bucket, limit, window_size, now):
+        current_key, previous_key = self._keys(key, window_size, now)
+        weight = 1.0 - (now % window_size) / window_size
+        allowed, estimate = self.hit_script(
+            keys=[current_key, previous_key, self.STATS_KEY],
+            args=[limit, weight, window_size * 2, bucket]
+        )
+        return bool(allowed), float(estimate)
+
+    def peek(self, key, window_size, now):
+        current, previous = self.client.mget(self._keys(key, window_size, now))
+        return sliding_window_estimate(int(previous or 0), int(current or 0), window_size, now)
+
+    def reset(self, key):
+        keys = list(self.client.scan_iter(match=f'rate_limit:{key}:*'))
+        return bool(keys) and self.client.delete(*keys) > 0
+
+    def get_stats(self):
+        stats = defaultdict(lambda: {'allowed': 0, 'rejected': 0})
+        for field, value in self.client.hgetall(self.STATS_KEY).items():
+            bucket, _, outcome = field.decode().rpartition(':')
+            stats[bucket][outcome] = int(value)
+        return dict(stats)
+
+
+def configured_worker_count(argv=None, environ=None):
+    """
+    Number of gunicorn workers this process belongs to (1 outside gunicorn)
+
+    Same precedence as gunicorn: command line, GUNICORN_CMD_ARGS, WEB_CONCURRENCY.
+    Workers are forked from the master, so sys.argv holds its command line.
+    """
+    argv = sys.argv if argv is None else argv
+    environ = os.environ if environ is None else environ
+    sources = []
+    if argv and 'gunicorn' in os.path.basename(argv[0]):
+        sources.append(argv[1:])
+    sources.append(shlex.split(environ.get('GUNICORN_CMD_ARGS', '')))
+    for args in sources:
+        for index, arg in enumerate(args):
+            match = re.fullmatch(r'(?:-w|--workers)=?(\d*)', arg)
+            if match:
+                value = match.group(1) or (args[index + 1] if index + 1 < len(args) else '')
+                if value.isdigit():
+                    return int(value)
+    value = environ.get('WEB_CONCURRENCY', '')
+    return int(value) if value.isdigit() else 1
+
+
+def create_rate_limit_store():
+    """Create the counter store from environment variables (falls back to memory)"""
+    default = 'redis' if os.environ.get('REDIS_URL') else 'memory'
+    storage = os.environ.get('RATE_LIMIT_STORAGE', default).lower()
+
+    try:
+        if storage == 'redis':
+            return RedisRateLimitStore(os.environ['REDIS_URL'])
+        if storage == 'sqlite':
+            return SQLiteRateLimitStore(os.environ['RATE_LIMIT_PATH'])
+    except Exception as e:
+        logger.error(f"Failed to initialize {storage} rate limit storage, falling back to memory: {e}")
+
+    workers = configured_worker_count()
+    if workers > 1:
+        logger.warning(f"Rate limits use per-process memory counters with {workers} workers: "
+                       f"each worker allows the full limit. Set REDIS_URL or RATE_LIMIT_STORAGE=sqlite "
+                       f"with RATE_LIMIT_PATH to share them.")
+    return MemoryRateLimitStore()
+
+
 class RateLimiter:
     """Rate limiter implementation with sliding window"""
-    
-    def __init__(self, storage_type='memory'):
-        self.storage_type = storage_type
-        self.requests = defaultdict(deque)
+
+    def __init__(self, storage_type=None, store=None):
+        if store is None and storage_type == 'memory':
+            store = MemoryRateLimitStore()
+        self.store = store or create_rate_limit_store()
+        self.storage_type = self.store.name
+        # Per-process counters used while the shared store is failing
+        self.fallback = self.store if self.store.name == 'memory' else MemoryRateLimitStore()
         self.lock = Lock()
-        
+        self.hits_since_prune = 0
+
         # Default limits
         self.default_limits = {
             'start_diagnostic': 10,  # 10 requests per minute
@@ -27,162 +369,191 @@ class RateLimiter:
             'learning_map': 180,     # 180 requests per minute for learning-map APIs
             'statistics': 120        # 120 requests per minute for statistics APIs
         }
-    
-    def check_rate_limit(self, identifier, requests_per_minute=None, window_size=60):
+
+    def _limit(self, bucket, requests_per_minute):
+        if requests_per_minute is not None:
+            return requests_per_minute
+        return self.default_limits.get(bucket, self.default_limits['general'])
+
+    @staticmethod
+    def _key(bucket, identifier):
+        return f'{bucket}:{identifier}'
+
+    def _maybe_prune(self, now):
+        with self.lock:
+            self.hits_since_prune += 1
+            if self.hits_since_prune < PRUNE_EVERY:
+                return
+            self.hits_since_prune = 0
+        self.store.prune(now)
+
+    def check_rate_limit(self, identifier, requests_per_minute=None, window_size=60, bucket='general'):
         """
         Check if request is within rate limit
-        
+
         Args:
             identifier: User ID or IP address
             requests_per_minute: Maximum requests per minute
             window_size: Time window in seconds
-            
+            bucket: Limit group; counters are kept per (bucket, identifier)
+
         Returns:
             bool: True if request is allowed, False if rate limit exceeded
         """
+        limit = self._limit(bucket, requests_per_minute)
+        key = self._key(bucket, identifier)
+        now = time.time()
         try:
-            with self.lock:
-                current_time = time.time()
-                
-                # Get request history for this identifier
-                request_history = self.requests[identifier]
-                
-                # Remove old requests outside the window
-                while request_history and current_time - request_history[0] > window_size:
-                    request_history.popleft()
-                
-                # Check if limit exceeded
-                if len(request_history) >= requests_per_minute:
-                    logger.warning(f"Rate limit exceeded for {identifier}: {len(request_history)} requests")
-                    return False
-                
-                # Add current request
-                request_history.append(current_time)
-                
-                logger.debug(f"Rate limit check passed for {identifier}: {len(request_history)}/{requests_per_minute}")
-                return True
-                
+            allowed, estimate = self.store.hit(key, bucket, limit, window_size, now)
+            self._maybe_prune(now)
         except Exception as e:
-            logger.error(f"Error in rate limit check: {str(e)}")
-            # Allow request on error to prevent blocking
-            return True
-    
-    def get_remaining_requests(self, identifier, requests_per_minute, window_size=60):
+            logger.error(f"Error in rate limit check, using per-process counters: {str(e)}")
+            allowed, estimate = self.fallback.hit(key, bucket, limit, window_size, now)
+
+        if not allowed:
+            logger.warning(f"Rate limit exceeded for {identifier} ({bucket}): ~{estimate:.0f} requests")
+            return False
+
+        logger.debug(f"Rate limit check passed for {identifier} ({bucket}): ~{estimate:.0f}/{limit}")
+        return True
+
+    def get_remaining_requests(self, identifier, requests_per_minute=None, window_size=60, bucket='general'):
         """
         Get remaining requests for identifier
-        
+
         Args:
             identifier: User ID or IP address
             requests_per_minute: Maximum requests per minute
             window_size: Time window in seconds
-            
+            bucket: Limit group
+
         Returns:
             int: Number of remaining requests
         """
+        limit = self._limit(bucket, requests_per_minute)
         try:
-            with self.lock:
-                current_time = time.time()
-                request_history = self.requests[identifier]
-                
-                # Remove old requests
-                while request_history and current_time - request_history[0] > window_size:
-                    request_history.popleft()
-                
-                return max(0, requests_per_minute - len(request_history))
-                
+            estimate = self.store.peek(self._key(bucket, identifier), window_size, time.time())
+            return max(0, int(limit - estimate))
+
         except Exception as e:
             logger.error(f"Error getting remaining requests: {str(e)}")
-            return requests_per_minute
-    
-    def reset_limits(self, identifier):
+            return limit
+
+    def reset_limits(self, identifier, bucket='general'):
         """
         Reset rate limits for identifier
-        
+
         Args:
             identifier: User ID or IP address
+            bucket: Limit group
         """
         try:
-            with self.lock:
-                if identifier in self.requests:
-                    del self.requests[identifier]
-                    logger.info(f"Reset rate limits for {identifier}")
+            if self.store.reset(self._key(bucket, identifier)):
+                logger.info(f"Reset rate limits for {identifier} ({bucket})")
         except Exception as e:
             logger.error(f"Error resetting rate limits: {str(e)}")
-    
-    def get_limit_info(self, identifier, requests_per_minute, window_size=60):
+
+    def get_limit_info(self, identifier, requests_per_minute=None, window_size=60, bucket='general'):
         """
         Get detailed rate limit information
-        
+
         Args:
             identifier: User ID or IP address
             requests_per_minute: Maximum requests per minute
             window_size: Time window in seconds
-            
+            bucket: Limit group
+
         Returns:
             dict: Rate limit information
         """
+        limit = self._limit(bucket, requests_per_minute)
         try:
-            with self.lock:
-                current_time = time.time()
-                request_history = self.requests[identifier]
-                
-                # Remove old requests
-                while request_history and current_time - request_history[0] > window_size:
-                    request_history.popleft()
-                
-                remaining = max(0, requests_per_minute - len(request_history))
-                reset_time = None
-                
-                if request_history:
-                    oldest_request = request_history[0]
-                    reset_time = oldest_request + window_size
-                
-                return {
-                    'remaining': remaining,
-                    'limit': requests_per_minute,
-                    'reset_time': reset_time,
-                    'window_size': window_size
-                }
-                
+            now = time.time()
+            estimate = self.store.peek(self._key(bucket, identifier), window_size, now)
+
+            return {
+                'remaining': max(0, int(limit - estimate)),
+                'limit': limit,
+                'reset_time': (int(now // window_size) + 1) * window_size if estimate else None,
+                'window_size': window_size
+            }
+
         except Exception as e:
             logger.error(f"Error getting limit info: {str(e)}")
             return {
-                'remaining': requests_per_minute,
-                'limit': requests_per_minute,
+                'remaining': limit,
+                'limit': limit,
                 'reset_time': None,
                 'window_size': window_size
             }
-    
-    def cleanup_old_entries(self, max_age=3600):
+
+    def cleanup_old_entries(self, max_age=None):
         """
-        Clean up old rate limit entries
-        
+        Clean up rate limit entries whose windows are over
+
         Args:
-            max_age: Maximum age in seconds for entries to keep
+            max_age: Unused; a key expires two windows after its last request
         """
         try:
-            with self.lock:
-                current_time = time.time()
-                identifiers_to_remove = []
-                
-                for identifier, request_history in self.requests.items():
-                    # Remove old requests
-                    while request_history and current_time - request_history[0] > max_age:
-                        request_history.popleft()
-                    
-                    # Remove empty histories
-                    if not request_history:
-                        identifiers_to_remove.append(identifier)
-                
-                # Remove empty entries
-                for identifier in identifiers_to_remove:
-                    del self.requests[identifier]
-                
-                if identifiers_to_remove:
-                    logger.info(f"Cleaned up {len(identifiers_to_remove)} old rate limit entries")
-                    
+            removed = self.store.prune(time.time())
+            if removed:
+                logger.info(f"Cleaned up {removed} old rate limit entries")
         except Exception as e:
             logger.error(f"Error cleaning up old entries: {str(e)}")
 
+    def get_stats(self):
+        """
+        Allowed/rejected requests per bucket (shared across workers for redis/sqlite)
+
+        Returns:
+            dict: Storage name and per-bucket counters with rejection rate
+        """
+        try:
+            buckets = self.store.get_stats()
+        except Exception as e:
+            logger.error(f"Error getting rate limit stats: {str(e)}")
+            buckets = {}
+        for counts in buckets.values():
+            total = counts['allowed'] + counts['rejected']
+            counts['rejection_rate'] = round(counts['rejected'] / total, 4) if total else 0.0
+        return {'storage': self.storage_type, 'buckets': buckets}
+
 # Global rate limiter instance
-rate_limiter = RateLimiter() 
\ No newline at end of file
+rate_limiter = RateLimiter()
+
+
+def default_identifier():
+    """Authenticated user ID, otherwise the client IP behind the proxy"""
+    if current_user and current_user.is_authenticated:
+        return current_user.id
+    from utils.security import get_real_ip
+    return get_real_ip()
+
+
+def rate_limit(requests_per_minute=None, bucket='general', key_func=None, on_limit=None, window_size=60):
+    """
+    Rate limiting decorator
+
+    Args:
+        requests_per_minute: Limit (defaults to the bucket's default limit)
+        window_size: Window in seconds the limit applies to
+        bucket: Limit group shared by all endpoints using it
+        key_func: Identifier for the caller (default: user ID or client IP)
+        on_limit: Response factory when limited; raises TooManyRequests if not set
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            identifier = (key_func or default_identifier)()
+            if not rate_limiter.check_rate_limit(identifier, requests_per_minute, window_size, bucket):
+                if on_limit is not None:
+                    return on_limit()
+                raise TooManyRequests('Rate limit exceeded')
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+
+def get_rate_limit_stats():
+    """Per-bucket rejection statistics of the global rate limiter"""
+    return rate_limiter.get_stats()
@@ -7,8 +7,8 @@ import re
 import logging
 import os
 from flask import request, current_app, abort
-from functools import wraps
-from collections import defaultdict
+from functools import lru_cache
+from collections import defaultdict, deque
 from datetime import datetime, timedelta
 import time
 
@@ -145,14 +145,25 @@ SUSPICIOUS_PATTERNS = [
     r'eval\(',
 ]
 
-# Track suspicious IPs
-suspicious_ips = defaultdict(list)
+# Эксплойты, недопустимые даже для легитимных ботов
+CRITICAL_EXPLOIT_PATTERNS = [
+    r'/\.env', r'/\.git', r'\.php$', r'/\.aws', r'/\.ssh',
+    r'/\.htaccess', r'/shell\.php', r'/c99\.php', r'/r57\.php'
+]
+
+KNOWN_SCANNERS = [
+    'l9scan', 'leakix', 'sqlmap', 'nikto', 'nmap',
+    'masscan', 'zap', 'burp', 'w3af', 'acunetix',
+    'nessus', 'openvas'
+]
+
+# Track suspicious IPs (per-IP deques ordered by time, expired from the left)
+suspicious_ips = defaultdict(deque)
 BLOCK_THRESHOLD = 10  # Block after 10 suspicious requests
 BLOCK_DURATION = 3600  # Block for 1 hour
 SCANNER_BLOCK_THRESHOLD = 3  # Block known scanners after 3 requests
 
-# API rate limiting (for /api endpoints)
-api_rate_limits = defaultdict(list)
+# API rate limiting (for /api endpoints, counted in the shared rate limiter store)
 API_RATE_LIMIT = 10  # Max 10 requests per minute to /api
 API_RATE_WINDOW = 60  # 1 minute window
 
@@ -172,12 +183,31 @@ LEGITIMATE_BOTS = [
     'go-http-client',  # Render health checks
 ]
 
+
+def _compile_any(patterns):
+    """Combine patterns into one alternation so a string is scanned in a single pass"""
+    return re.compile('|'.join(f'(?:{pattern})' for pattern in patterns), re.IGNORECASE)
+
+
+def _compile_substrings(substrings):
+    return _compile_any(re.escape(substring) for substring in substrings)
+
+
+_suspicious_path_re = _compile_any(SUSPICIOUS_PATTERNS)
+_critical_exploit_re = _compile_any(CRITICAL_EXPLOIT_PATTERNS)
+_legitimate_bot_re = _compile_substrings(LEGITIMATE_BOTS)
+_known_scanner_re = _compile_substrings(KNOWN_SCANNERS)
+
+# Verdicts are cached per (path, user agent): scanners repeat the same probes
+MATCH_CACHE_SIZE = int(os.environ.get('SECURITY_MATCH_CACHE_SIZE', 4096))
+
 # Whitelist for SEO and public paths that should always be accessible
 SEO_WHITELIST_PATHS = [
     '/robots.txt',
     '/sitemap.xml',
     '/sitemap_index.xml',
     '/sitemap-index.xml',
+    '/sitemap-',  # sitemap shards (/sitemap-<n>.xml)
     '/sitemap.txt',
     '/sitemap.html',
     '/news-sitemap.xml',
@@ -199,12 +229,7 @@ def is_legitimate_bot(user_agent=None):
     if not user_agent:
         return False
     
-    ua_lower = user_agent.lower()
-    for bot in LEGITIMATE_BOTS:
-        if bot in ua_lower:
-            return True
-    
-    return False
+    return _legitimate_bot_re.search(user_agent) is not None
 
 def is_seo_path(path):
     """
@@ -243,17 +268,19 @@ def is_known_scanner(user_agent=None):
     if is_legitimate_bot(user_agent):
         return False
     
-    known_scanners = [
-        'l9scan', 'leakix', 'sqlmap', 'nikto', 'nmap',
-        'masscan', 'zap', 'burp', 'w3af', 'acunetix', 
-        'nessus', 'openvas'
-    ]
-    ua_lower = user_agent.lower()
-    for scanner in known_scanners:
-        if scanner in ua_lower:
-            return True
+    return _known_scanner_re.search(user_agent) is not None
+
+def is_critical_exploit(path):
+    """
+    Check if path is an exploit probe that even legitimate bots must not request
     
-    return False
+    Args:
+        path: Request path
+        
+    Returns:
+        bool: True if critical exploit path, False otherwise
+    """
+    return bool(path) and _critical_exploit_re.search(path) is not None
 
 def is_suspicious_request(path, user_agent=None):
     """
@@ -269,48 +296,25 @@ def is_suspicious_request(path, user_agent=None):
     if not path:
         return False
     
-    # Never flag static files as suspicious
-    if path.startswith('/static/'):
-        return False
-    
-    # Never block SEO/public paths
-    if is_seo_path(path):
+    return _classify_request(path, user_agent or '')
+
+@lru_cache(maxsize=MATCH_CACHE_SIZE)
+def _classify_request(path, user_agent):
+    """Single-pass verdict for is_suspicious_request, cached per (path, user agent)"""
+    # Never flag static files or SEO/public paths as suspicious
+    if path.startswith('/static/') or is_seo_path(path):
         return False
     
-    path_lower = path.lower()
-    
-    # Check against suspicious patterns
-    for pattern in SUSPICIOUS_PATTERNS:
-        if re.search(pattern, path_lower, re.IGNORECASE):
-            return True
-    
-    # If legitimate bot, only block if path is clearly malicious
-    if is_legitimate_bot(user_agent):
-        # Legitimate bots can access normal paths, only block obvious exploits
-        return False
+    # Suspicious paths are flagged for every user agent, including empty ones
+    if _suspicious_path_re.search(path):
+        return True
     
-    # Check for empty User-Agent - suspicious, but allow for SEO paths
-    if not user_agent or user_agent.strip() == '':
-        # Empty UA on suspicious paths is bad, but on normal paths might be OK
-        # Only flag if path itself is suspicious
-        for pattern in SUSPICIOUS_PATTERNS:
-            if re.search(pattern, path_lower, re.IGNORECASE):
-                return True
+    # Legitimate bots and empty user agents are fine on normal paths
+    if not user_agent.strip() or is_legitimate_bot(user_agent):
         return False
     
-    # Check for suspicious user agents (including scanners)
-    if user_agent:
-        suspicious_agents = [
-            'sqlmap', 'nikto', 'nmap', 'masscan', 'zap',
-            'burp', 'w3af', 'acunetix', 'nessus', 'openvas',
-            'l9scan', 'leakix'  # Known security scanners
-        ]
-        ua_lower = user_agent.lower()
-        for agent in suspicious_agents:
-            if agent in ua_lower:
-                return True
-    
-    return False
+    # Known security scanners
+    return _known_scanner_re.search(user_agent) is not None
 
 def log_suspicious_request(path, ip, user_agent, reason='suspicious_pattern'):
     """
@@ -338,25 +342,23 @@ def log_suspicious_request(path, ip, user_agent, reason='suspicious_pattern'):
     threshold = SCANNER_BLOCK_THRESHOLD if is_scanner else BLOCK_THRESHOLD
     
     # Track suspicious IP
-    suspicious_ips[ip].append({
+    now = datetime.now()
+    entries = suspicious_ips[ip]
+    entries.append({
         'path': path,
         'user_agent': user_agent,
         'reason': reason,
-        'timestamp': datetime.now(),
+        'timestamp': now,
         'is_scanner': is_scanner
     })
     
     # Clean old entries (older than 1 hour)
-    cutoff = datetime.now() - timedelta(seconds=BLOCK_DURATION)
-    suspicious_ips[ip] = [
-        entry for entry in suspicious_ips[ip]
-        if entry['timestamp'] > cutoff
-    ]
+    _expire_entries(entries, now - timedelta(seconds=BLOCK_DURATION))
     
     # Check if IP should be blocked
-    if len(suspicious_ips[ip]) >= threshold:
+    if len(entries) >= threshold:
         scanner_msg = " (known scanner)" if is_scanner else ""
-        block_msg = f"🔒 IP {ip} blocked due to {len(suspicious_ips[ip])} suspicious requests{scanner_msg}"
+        block_msg = f"🔒 IP {ip} blocked due to {len(entries)} suspicious requests{scanner_msg}"
         logger.error(block_msg)
         security_logger.error(block_msg)
         
@@ -368,6 +370,11 @@ def log_suspicious_request(path, ip, user_agent, reason='suspicious_pattern'):
     
     return False
 
+def _expire_entries(entries, cutoff):
+    """Drop entries older than cutoff from the left of a time-ordered deque"""
+    while entries and entries[0]['timestamp'] <= cutoff:
+        entries.popleft()
+
 def is_ip_blocked(ip):
     """
     Check if IP is currently blocked
@@ -378,17 +385,15 @@ def is_ip_blocked(ip):
     Returns:
         bool: True if blocked, False otherwise
     """
-    if ip not in suspicious_ips:
+    recent_requests = suspicious_ips.get(ip)
+    if recent_requests is None:
         return False
     
     # Check if IP has exceeded threshold
-    cutoff = datetime.now() - timedelta(seconds=BLOCK_DURATION)
-    recent_requests = [
-        entry for entry in suspicious_ips[ip]
-        if entry['timestamp'] > cutoff
-    ]
+    _expire_entries(recent_requests, datetime.now() - timedelta(seconds=BLOCK_DURATION))
     
     if not recent_requests:
+        del suspicious_ips[ip]
         return False
     
     # Use scanner threshold if any recent request is from a known scanner
@@ -450,24 +455,15 @@ def check_api_rate_limit(ip):
     except:
         user_limit = API_RATE_LIMIT
     
-    current_time = time.time()
+    from utils.rate_limiter import rate_limiter
     
-    # Clean old requests
-    api_rate_limits[ip] = [
-        timestamp for timestamp in api_rate_limits[ip]
-        if current_time - timestamp < API_RATE_WINDOW
-    ]
-    
-    # Check rate limit
-    if len(api_rate_limits[ip]) >= user_limit:
+    if not rate_limiter.check_rate_limit(ip, user_limit, API_RATE_WINDOW, bucket='api'):
         security_logger.warning(
             f"🚫 API rate limit exceeded for IP {ip}: "
-            f"{len(api_rate_limits[ip])} requests in {API_RATE_WINDOW} seconds (limit: {user_limit})"
+            f"more than {user_limit} requests in {API_RATE_WINDOW} seconds"
         )
         return True
     
-    # Add current request
-    api_rate_limits[ip].append(current_time)
     return False
 
 def check_and_log_security_alert():
@@ -551,21 +547,14 @@ def security_middleware():
     
     # Check legitimate bots - but be more strict if they access suspicious paths
     if is_legitimate_bot(user_agent):
-        path_lower = path.lower()
-        
         # Check for obvious exploits first
-        critical_exploits = [
-            r'/\.env', r'/\.git', r'\.php$', r'/\.aws', r'/\.ssh',
-            r'/\.htaccess', r'/shell\.php', r'/c99\.php', r'/r57\.php'
-        ]
-        for pattern in critical_exploits:
-            if re.search(pattern, path_lower, re.IGNORECASE):
-                # Even legitimate bots shouldn't access exploits
-                # If bot tries exploits, it's likely a fake bot
-                security_logger.warning(f"🚨 Legitimate bot {user_agent} attempted exploit: {path}")
-                # Treat as suspicious request instead of just returning 404
-                log_suspicious_request(path, ip, user_agent, reason='fake_bot_exploit')
-                abort(404)
+        if is_critical_exploit(path):
+            # Even legitimate bots shouldn't access exploits
+            # If bot tries exploits, it's likely a fake bot
+            security_logger.warning(f"🚨 Legitimate bot {user_agent} attempted exploit: {path}")
+            # Treat as suspicious request instead of just returning 404
+            log_suspicious_request(path, ip, user_agent, reason='fake_bot_exploit')
+            abort(404)
         
         # If bot accesses other suspicious patterns, treat as suspicious
         # Real bots don't scan for swagger, api-docs, etc.
@@ -606,30 +595,11 @@ def rate_limit_by_ip(max_requests=100, window=60):
         max_requests: Maximum requests per window
         window: Time window in seconds
     """
-    request_counts = defaultdict(list)
+    from utils.rate_limiter import rate_limit
     
     def decorator(f):
-        @wraps(f)
-        def decorated_function(*args, **kwargs):
-            ip = get_real_ip()
-            current_time = time.time()
-            
-            # Clean old requests
-            request_counts[ip] = [
-                timestamp for timestamp in request_counts[ip]
-                if current_time - timestamp < window
-            ]
-            
-            # Check rate limit
-            if len(request_counts[ip]) >= max_requests:
-                logger.warning(f"Rate limit exceeded for IP {ip}: {len(request_counts[ip])} requests")
-                abort(429)
-            
-            # Add current request
-            request_counts[ip].append(current_time)
-            
-            return f(*args, **kwargs)
-        return decorated_function
+        return rate_limit(max_requests, bucket=f'ip:{f.__name__}', key_func=get_real_ip,
+                          window_size=window)(f)
     return decorator
 
 def get_blocked_ips():
@@ -642,7 +612,7 @@ def get_blocked_ips():
     blocked = []
     cutoff = datetime.now() - timedelta(seconds=BLOCK_DURATION)
     
-    for ip, requests in suspicious_ips.items():
+    for ip, requests in list(suspicious_ips.items()):
         recent = [r for r in requests if r['timestamp'] > cutoff]
         if len(recent) >= BLOCK_THRESHOLD:
             blocked.append({
@@ -664,3 +634,63 @@ def unblock_ip(ip):
         del suspicious_ips[ip]
         logger.info(f"IP {ip} manually unblocked")
 
+
+def _pattern_loop_is_suspicious(path, user_agent):
+    """Per-pattern re.search loop (previous implementation), kept as a benchmark baseline"""
+    if path.startswith('/static/') or is_seo_path(path):
+        return False
+    path_lower = path.lower()
+    for pattern in SUSPICIOUS_PATTERNS:
+        if re.search(pattern, path_lower, re.IGNORECASE):
+            return True
+    ua_lower = (user_agent or '').lower()
+    if any(bot in ua_lower for bot in LEGITIMATE_BOTS) or not ua_lower.strip():
+        return False
+    return any(agent in ua_lower for agent in KNOWN_SCANNERS)
+
+def benchmark_security_matcher(iterations=20000):
+    """
+    Measure per-request matching overhead: pattern loop vs compiled matcher
+    
+    Args:
+        iterations: Number of classified requests per variant
+        
+    Returns:
+        dict: Microseconds per request (cold = unique paths, cached = repeated) and
+              number of verdict mismatches between the two implementations
+    """
+    user_agents = [
+        'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 Chrome/120.0 Safari/537.36',
+        'Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)',
+        'Mozilla/5.0 zgrab/0.x l9scan/2.0',
+        '',
+    ]
+    paths = [
+        '/nl/learning-map', '/api/v1/flashcards/review', '/dashboard', '/en/big-info',
+        '/wp-login.php', '/.env', '/api/graphql', '/search?q=union+select+1',
+    ]
+    samples = [
+        (f'{path}{"&" if "?" in path else "?"}n={index}', user_agents[index % len(user_agents)])
+        for index, path in enumerate(paths * (iterations // len(paths) + 1))
+    ][:iterations]
+
+    def timed(classify, requests):
+        started = time.perf_counter()
+        verdicts = [classify(path, user_agent) for path, user_agent in requests]
+        return (time.perf_counter() - started) / len(requests) * 1e6, verdicts
+
+    loop_us, loop_verdicts = timed(_pattern_loop_is_suspicious, samples)
+    _classify_request.cache_clear()
+    cold_us, compiled_verdicts = timed(is_suspicious_request, samples)
+    repeated = [(path, user_agent) for path in paths for user_agent in user_agents] * (iterations // 32 + 1)
+    is_suspicious_request(*repeated[0])
+    cached_us, _ = timed(is_suspicious_request, repeated[:iterations])
+
+    return {
+        'iterations': len(samples),
+        'pattern_loop_us': round(loop_us, 2),
+        'compiled_us': round(cold_us, 2),
+        'cached_us': round(cached_us, 2),
+        'mismatches': sum(a != b for a, b in zip(loop_verdicts, compiled_verdicts)),
+        'cache': _classify_request.cache_info()._asdict()
+    }
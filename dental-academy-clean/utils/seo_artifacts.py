@@ -0,0 +1,289 @@
+"""
+Materialized SEO artifacts
+Кеш готовых SEO файлов: sitemap.xml (с шардами), robots.txt, schema.json
+
+Каждый артефакт собирается один раз для канонического хоста (SERVER_NAME,
+схема PREFERRED_URL_SCHEME) и хранится в памяти вместе с gzip версией, ETag
+и Last-Modified; ответы поддерживают 304 и кешируются краулерами
+(Cache-Control: public). Заголовок Host запроса на ключ кеша не влияет, так
+что поддельные хосты не создают новых сборок; без SERVER_NAME кеш ведется по
+хосту запроса, но ограничен SEO_MAX_HOSTS. Пересборка происходит, когда
+меняется источник (mtime static/robots.txt), по TTL или после invalidate().
+
+Sitemap содержит публичные страницы для всех языков с hreflang
+альтернативами; при росте числа URL он делится на шарды
+/sitemap-<n>.xml, а /sitemap.xml становится sitemap index.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+from flask import current_app, make_response, render_template, request, url_for
+
+logger = logging.getLogger(__name__)
+
+SITEMAP_LANGUAGES = ['nl', 'en', 'ru', 'uk', 'tr', 'ar', 'es', 'pt', 'fa']
+SITEMAP_DEFAULT_LANGUAGE = 'nl'
+
+# Протокол sitemap допускает до 50 000 URL в файле
+SITEMAP_SHARD_SIZE = int(os.environ.get('SITEMAP_SHARD_SIZE', 45000))
+SEO_ARTIFACT_TTL = int(os.environ.get('SEO_ARTIFACT_TTL', 24 * 3600))
+SEO_MAX_AGE = int(os.environ.get('SEO_MAX_AGE', 3600))
+# Сколько хостов хранится, если SERVER_NAME не задан
+SEO_MAX_HOSTS = int(os.environ.get('SEO_MAX_HOSTS', 4))
+
+BIG_PROFESSIONS = ['tandarts', 'huisarts', 'apotheker', 'verpleegkundige']
+
+# Публичные страницы: (endpoint, параметры, priority, changefreq); URL строится для каждого языка
+PUBLIC_PAGES = [
+    ('main.index', {}, 1.0, 'daily'),
+    ('main.big_info', {}, 0.9, 'weekly'),
+    *[('main.big_info_profession', {'profession': profession}, 0.8, 'weekly') for profession in BIG_PROFESSIONS],
+    *[('main.big_info_eu_profession', {'profession': profession}, 0.8, 'weekly') for profession in BIG_PROFESSIONS],
+    ('main.features', {}, 0.6, 'monthly'),
+    ('main.how_it_works', {}, 0.6, 'monthly'),
+    ('main.about', {}, 0.5, 'monthly'),
+    ('main.our_story', {}, 0.5, 'monthly'),
+    ('main.faq', {}, 0.5, 'monthly'),
+    ('main.contact', {}, 0.5, 'monthly'),
+    ('main.privacy', {}, 0.3, 'yearly'),
+    ('main.terms', {}, 0.3, 'yearly'),
+]
+
+
+@dataclass
+class SeoArtifact:
+    """Готовый ответ: тело, gzip, ETag и Last-Modified"""
+    body: bytes
+    gzipped: bytes
+    etag: str
+    last_modified: datetime
+    mimetype: str
+
+    @classmethod
+    def build(cls, content: str, mimetype: str) -> 'SeoArtifact':
+        body = content.encode('utf-8')
+        return cls(
+            body=body,
+            gzipped=gzip.compress(body, compresslevel=9, mtime=0),
+            etag=hashlib.sha1(body).hexdigest(),
+            last_modified=datetime.now(timezone.utc).replace(microsecond=0),
+            mimetype=mimetype
+        )
+
+
+def sitemap_urls() -> List[Dict]:
+    """URL публичных страниц для всех языков с hreflang альтернативами"""
+    lastmod = datetime.now(timezone.utc).strftime('%Y-%m-%d')
+    urls = []
+    for endpoint, params, priority, changefreq in PUBLIC_PAGES:
+        try:
+            alternates = [
+                (lang, url_for(endpoint, lang=lang, _external=True, **params))
+                for lang in SITEMAP_LANGUAGES
+            ]
+        except Exception as e:
+            logger.warning(f"Sitemap: skipping {endpoint}: {e}")
+            continue
+        default_url = dict(alternates)[SITEMAP_DEFAULT_LANGUAGE]
+        for _, loc in alternates:
+            urls.append({
+                'loc': loc,
+                'lastmod': lastmod,
+                'priority': priority,
+                'changefreq': changefreq,
+                'alternates': alternates,
+                'default': default_url
+            })
+    return urls
+
+
+def build_sitemap_artifacts(shard_size: int = SITEMAP_SHARD_SIZE) -> Dict[str, SeoArtifact]:
+    """sitemap.xml (index при нескольких шардах) и шарды sitemap-<n>.xml"""
+    urls = sitemap_urls()
+    shards = [urls[start:start + shard_size] for start in range(0, len(urls), shard_size)] or [[]]
+    mimetype = 'application/xml'
+
+    if len(shards) == 1:
+        return {'sitemap.xml': SeoArtifact.build(render_template('seo/sitemap.xml', pages=shards[0]), mimetype)}
+
+    artifacts = {
+        f'sitemap-{number}.xml': SeoArtifact.build(render_template('seo/sitemap.xml', pages=shard), mimetype)
+        for number, shard in enumerate(shards, 1)
+    }
+    lastmod = datetime.now(timezone.utc).strftime('%Y-%m-%d')
+    index = [
+        {'loc': url_for('seo.sitemap_shard', number=number, _external=True), 'lastmod': lastmod}
+        for number in range(1, len(shards) + 1)
+    ]
+    artifacts['sitemap.xml'] = SeoArtifact.build(render_template('seo/sitemap_index.xml', sitemaps=index), mimetype)
+    return artifacts
+
+
+def robots_path() -> str:
+    return os.path.join(current_app.static_folder, 'robots.txt')
+
+
+def build_robots_artifact() -> SeoArtifact:
+    """static/robots.txt со ссылкой Sitemap на текущий хост"""
+    path = robots_path()
+    with open(path, 'r', encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    sitemap_line = f"Sitemap: {url_for('seo.sitemap', _external=True)}"
+    lines = [sitemap_line if line.startswith('Sitemap:') else line for line in lines]
+    if sitemap_line not in lines:
+        lines += ['', sitemap_line]
+    return SeoArtifact.build('\n'.join(lines) + '\n', 'text/plain')
+
+
+def build_schema_artifact() -> SeoArtifact:
+    """JSON-LD structured data for organization"""
+    schema = {
+        "@context": "https://schema.org",
+        "@type": "EducationalOrganization",
+        "name": "Mentora",
+        "description": "Professional BIG exam preparation platform for healthcare workers in the Netherlands",
+        "url": url_for('main.index', lang=SITEMAP_DEFAULT_LANGUAGE, _external=True),
+        "logo": url_for('static', filename='images/favicon.png', _external=True),
+        "sameAs": [
+            # Add social media links here when available
+        ],
+        "address": {
+            "@type": "PostalAddress",
+            "addressCountry": "NL"
+        },
+        "hasOfferCatalog": {
+            "@type": "OfferCatalog",
+            "name": "Medical Education Courses",
+            "itemListElement": [
+                {
+                    "@type": "Course",
+                    "name": "BIG Exam Preparation",
+                    "description": "Comprehensive preparation for healthcare professionals",
+                    "provider": {
+                        "@type": "Organization",
+                        "name": "Mentora"
+                    }
+                }
+            ]
+        }
+    }
+    return SeoArtifact.build(json.dumps(schema, ensure_ascii=False), 'application/ld+json')
+
+
+@dataclass
+class _ArtifactGroup:
+    artifacts: Dict[str, SeoArtifact]
+    source_version: Optional[float]
+    built_at: float
+
+
+def canonical_host() -> Optional[str]:
+    """Канонический хост из SERVER_NAME (None - не настроен)"""
+    server_name = current_app.config.get('SERVER_NAME')
+    return server_name.lower() if server_name else None
+
+
+class SeoArtifactCache:
+    """Группы артефактов по (хост, группа); пересборка по версии источника, TTL или invalidate()"""
+
+    def __init__(self, ttl: int = SEO_ARTIFACT_TTL, max_hosts: int = SEO_MAX_HOSTS):
+        self.ttl = ttl
+        self.max_hosts = max_hosts
+        self._groups: 'OrderedDict[Tuple[str, str], _ArtifactGroup]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.builds = 0
+
+    def _fresh(self, group: Optional[_ArtifactGroup], source_version: Optional[float]) -> bool:
+        return (
+            group is not None
+            and group.source_version == source_version
+            and time.time() - group.built_at < self.ttl
+        )
+
+    def get(self, group_name: str, name: str, builder: Callable[[], Dict[str, SeoArtifact]],
+            source_version: Optional[float] = None) -> Optional[SeoArtifact]:
+        """
+        Артефакт для текущего хоста
+
+        Args:
+            group_name: Группа, собираемая вместе (sitemap, robots, schema)
+            name: Имя файла в группе (sitemap.xml, sitemap-2.xml, ...)
+            builder: Собирает все артефакты группы
+            source_version: Версия источника (например mtime файла)
+        """
+        host = canonical_host()
+        key = (host or request.host.lower(), group_name)
+        group = self._groups.get(key)
+        if not self._fresh(group, source_version):
+            with self._lock:
+                group = self._groups.get(key)
+                if not self._fresh(group, source_version):
+                    group = _ArtifactGroup(self._build(builder, host), source_version, time.time())
+                    self._groups[key] = group
+                    self.builds += 1
+                    logger.info(f"SEO artifacts built for {key[0]}: {', '.join(sorted(group.artifacts))}")
+                self._groups.move_to_end(key)
+                # Без SERVER_NAME ключ зависит от Host запроса - храним не больше max_hosts хостов
+                while len({cached_host for cached_host, _ in self._groups}) > self.max_hosts:
+                    self._groups.popitem(last=False)
+        return group.artifacts.get(name)
+
+    @staticmethod
+    def _build(builder: Callable[[], Dict[str, SeoArtifact]], host: Optional[str]) -> Dict[str, SeoArtifact]:
+        """Собрать группу; URL строятся для канонического хоста, а не для Host запроса"""
+        if host is None:
+            return builder()
+        base_url = f"{current_app.config.get('PREFERRED_URL_SCHEME', 'https')}://{host}"
+        with current_app.test_request_context('/', base_url=base_url):
+            return builder()
+
+    def invalidate(self):
+        with self._lock:
+            self._groups.clear()
+
+
+# Глобальный экземпляр
+seo_artifacts = SeoArtifactCache()
+
+
+def get_sitemap_artifact(name: str = 'sitemap.xml') -> Optional[SeoArtifact]:
+    return seo_artifacts.get('sitemap', name, build_sitemap_artifacts)
+
+
+def get_robots_artifact() -> SeoArtifact:
+    return seo_artifacts.get('robots', 'robots.txt', lambda: {'robots.txt': build_robots_artifact()},
+                             os.path.getmtime(robots_path()))
+
+
+def get_schema_artifact() -> SeoArtifact:
+    return seo_artifacts.get('schema', 'schema.json', lambda: {'schema.json': build_schema_artifact()})
+
+
+def invalidate_seo_artifacts():
+    """Пересобрать артефакты при следующем запросе (после изменения публичных страниц)"""
+    seo_artifacts.invalidate()
+
+
+def artifact_response(artifact: SeoArtifact):
+    """Ответ с gzip (если клиент принимает), ETag/Last-Modified и условным 304"""
+    use_gzip = 'gzip' in request.headers.get('Accept-Encoding', '').lower()
+    response = make_response(artifact.gzipped if use_gzip else artifact.body)
+    response.content_type = f'{artifact.mimetype}; charset=utf-8'
+    if use_gzip:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    response.set_etag(artifact.etag + ('-gz' if use_gzip else ''))
+    response.last_modified = artifact.last_modified
+    response.cache_control.public = True
+    response.cache_control.max_age = SEO_MAX_AGE
+    return response.make_conditional(request)
@@ -9,6 +9,7 @@ from typing import Dict, List, Optional, Tuple
 from datetime import datetime, timedelta, timezone
 from extensions import db
 from models import User, Question, UserProgress, SpacedRepetitionItem, IRTParameters
+from utils.sr_scheduler import sr_scheduler
 
 class SimpleSpacedRepetition:
     """Система интервального повторения с SM-2 алгоритмом"""
@@ -82,10 +83,19 @@ class SimpleSpacedRepetition:
             SpacedRepetitionItem.next_review.asc()
         ).limit(limit).all()
         
-        # Преобразуем в словари с данными вопросов
-        due_reviews = []
-        for item in due_items:
-            question = Question.query.get(item.question_id)
+        return self._review_dicts(due_items)
+    
+    def _review_dicts(self, items: List[SpacedRepetitionItem]) -> List[Dict]:
+        """Элементы повторения с данными вопросов (вопросы загружаются одним запросом)"""
+        question_ids = [item.question_id for item in items]
+        questions = {
+            question.id: question
+            for question in Question.query.filter(Question.id.in_(question_ids)).all()
+        } if question_ids else {}
+        
+        reviews = []
+        for item in items:
+            question = questions.get(item.question_id)
             if question:
                 review_data = item.to_dict()
                 review_data['question'] = {
@@ -95,9 +105,9 @@ class SimpleSpacedRepetition:
                     'category': question.category,
                     'domain': question.domain
                 }
-                due_reviews.append(review_data)
+                reviews.append(review_data)
         
-        return due_reviews
+        return reviews
     
     def get_review_statistics(self, user_id: int, days: int = 30) -> Dict:
         """
@@ -195,39 +205,13 @@ class SimpleSpacedRepetition:
     
     def _get_or_create_item(self, user_id: int, question_id: int) -> SpacedRepetitionItem:
         """Получение или создание элемента повторения"""
-        item = SpacedRepetitionItem.query.filter_by(
-            user_id=user_id,
-            question_id=question_id
-        ).first()
-        
-        if not item:
-            # Получаем вопрос для определения домена
-            question = Question.query.get(question_id)
-            domain = question.domain if question else None
-            
-            # Создаем новый элемент
-            item = SpacedRepetitionItem(
-                user_id=user_id,
-                question_id=question_id,
-                domain=domain,
-                next_review=datetime.now(timezone.utc) + timedelta(days=1),
-                ease_factor=self.initial_ease_factor
-            )
-            db.session.add(item)
-            db.session.flush()  # Получаем ID
-        
-        return item
+        return sr_scheduler.get_or_create_items(
+            user_id, [question_id], ease_factor=self.initial_ease_factor
+        )[question_id]
     
     def _get_irt_parameters(self, question_id: int) -> Optional[Dict]:
         """Получение IRT параметров вопроса"""
-        irt_params = IRTParameters.query.filter_by(question_id=question_id).first()
-        if irt_params:
-            return {
-                'difficulty': irt_params.difficulty,
-                'discrimination': irt_params.discrimination,
-                'guessing': irt_params.guessing
-            }
-        return None
+        return sr_scheduler.irt_parameters([question_id]).get(question_id)
     
     def _get_review_reason(self, item: SpacedRepetitionItem, quality: int) -> str:
         """Получение причины повторения"""
@@ -257,20 +241,19 @@ class SimpleReviewScheduler:
         Returns:
             Список запланированных повторений
         """
-        # Получаем вопросы, готовые к повторению
-        due_reviews = self.srs.get_due_reviews(user_id, limit=100)
-        
-        # Сортируем по приоритету
-        prioritized_reviews = self._prioritize_reviews(due_reviews)
-        
-        # Оцениваем время на каждый вопрос (2 минуты в среднем)
-        estimated_time_per_question = 2
+        # Готовые к повторению вопросы, упорядоченные единым планировщиком (2 минуты на вопрос)
+        ranked = sr_scheduler.rank_due(user_id)
+        positions = ranked.top(sr_scheduler.limit(available_time, 100, minutes_per_item=2))
+        priorities = dict(zip(ranked.queue.item_ids[positions].tolist(), ranked.priority[positions].tolist()))
+        if not priorities:
+            return []
         
-        # Рассчитываем максимальное количество вопросов
-        max_questions = available_time // estimated_time_per_question
+        items = SpacedRepetitionItem.query.filter(SpacedRepetitionItem.id.in_(list(priorities))).all()
+        items.sort(key=lambda item: priorities[item.id], reverse=True)
         
-        # Выбираем вопросы в рамках доступного времени
-        scheduled_reviews = prioritized_reviews[:max_questions]
+        scheduled_reviews = self.srs._review_dicts(items)
+        for review in scheduled_reviews:
+            review['calculated_priority'] = priorities[review['id']]
         
         return scheduled_reviews
     
@@ -341,30 +324,3 @@ class SimpleReviewScheduler:
             'recommendations': recommendations,
             'total_recommendations': len(recommendations)
         }
-    
-    def _prioritize_reviews(self, reviews: List[Dict]) -> List[Dict]:
-        """Приоритизация повторений"""
-        for review in reviews:
-            # Рассчитываем приоритет на основе нескольких факторов
-            priority_score = 0
-            
-            # Фактор просрочки (самый важный)
-            days_overdue = review.get('days_overdue', 0)
-            priority_score += days_overdue * 10
-            
-            # Фактор качества ответов
-            avg_quality = review.get('average_quality', 3.0)
-            if avg_quality < 3.0:
-                priority_score += (3.0 - avg_quality) * 5
-            
-            # Фактор количества повторений (меньше повторений = выше приоритет)
-            repetitions = review.get('repetitions', 0)
-            priority_score += max(0, 5 - repetitions)
-            
-            # Фактор приоритета из модели
-            priority_score += review.get('priority_score', 0)
-            
-            review['calculated_priority'] = priority_score
-        
-        # Сортируем по приоритету (убывание)
-        return sorted(reviews, key=lambda x: x['calculated_priority'], reverse=True) 
\ No newline at end of file
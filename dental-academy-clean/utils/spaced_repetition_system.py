@@ -7,25 +7,10 @@ Spaced Repetition System
 
 import math
 from typing import Dict, List, Optional, Tuple
-from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
 from extensions import db
-from models import User, Question, IRTParameters, UserProgress
-
-@dataclass
-class SpacedRepetitionItem:
-    """Элемент системы интервального повторения"""
-    question_id: int
-    user_id: int
-    domain: str
-    ease_factor: float = 2.5  # Фактор легкости (SM-2)
-    interval: int = 1  # Интервал в днях
-    repetitions: int = 0  # Количество повторений
-    quality: int = 0  # Качество ответа (0-5)
-    next_review: datetime = None
-    last_review: datetime = None
-    irt_difficulty: float = 0.0
-    user_ability: float = 0.0
+from models import User, Question, IRTParameters, UserProgress, SpacedRepetitionItem
+from utils.sr_scheduler import sr_scheduler
 
 class SpacedRepetitionSystem:
     """Система интервального повторения с IRT интеграцией"""
@@ -73,10 +58,13 @@ class SpacedRepetitionSystem:
         next_review = datetime.now(timezone.utc) + timedelta(days=new_interval)
         
         # Обновляем элемент
+        total_reviews = (item.total_reviews or 0) + 1
         item.interval = new_interval
         item.ease_factor = new_ease_factor
         item.repetitions = new_repetitions
         item.quality = quality
+        item.average_quality = ((item.average_quality or 0.0) * (total_reviews - 1) + quality) / total_reviews
+        item.total_reviews = total_reviews
         item.last_review = datetime.now(timezone.utc)
         item.next_review = next_review
         
@@ -115,7 +103,7 @@ class SpacedRepetitionSystem:
         
         # Рассчитываем ожидаемую вероятность правильного ответа
         expected_probability = self._3pl_probability(
-            item.user_ability, difficulty, discrimination, guessing
+            item.user_ability or 0.0, difficulty, discrimination, guessing
         )
         
         # Корректируем качество на основе ожидаемой вероятности
@@ -162,21 +150,22 @@ class SpacedRepetitionSystem:
         # SM-2 алгоритм
         if quality >= 3:
             # Правильный ответ
-            if item.repetitions == 0:
+            repetitions = item.repetitions or 0
+            if repetitions == 0:
                 new_interval = 1
-            elif item.repetitions == 1:
+            elif repetitions == 1:
                 new_interval = 6
             else:
-                new_interval = int(item.interval * item.ease_factor)
+                new_interval = int((item.interval or 1) * (item.ease_factor or self.initial_ease_factor))
             
-            new_repetitions = item.repetitions + 1
+            new_repetitions = repetitions + 1
         else:
             # Неправильный ответ
             new_interval = 1
             new_repetitions = 0
         
         # Обновляем ease factor
-        new_ease_factor = item.ease_factor + (0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+        new_ease_factor = (item.ease_factor or self.initial_ease_factor) + (0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
         new_ease_factor = max(self.min_ease_factor, min(self.max_ease_factor, new_ease_factor))
         
         return new_interval, new_ease_factor, new_repetitions
@@ -193,17 +182,21 @@ class SpacedRepetitionSystem:
         Returns:
             Список элементов для повторения
         """
-        current_time = datetime.now(timezone.utc)
+        # Очередь и IRT параметры загружаются пакетно, приоритеты считаются единым планировщиком
+        ranked = sr_scheduler.rank_due(user_id, domain=domain)
+        queue = ranked.queue
         
-        # Здесь должна быть логика получения из БД
-        # Пока возвращаем заглушку
         due_items = []
-        
-        # Пример логики:
-        # SELECT * FROM spaced_repetition_items 
-        # WHERE user_id = ? AND next_review <= ? 
-        # AND (domain = ? OR ? IS NULL)
-        # ORDER BY next_review ASC LIMIT ?
+        for position in ranked.top(limit):
+            due_items.append({
+                'question_id': int(queue.question_ids[position]),
+                'domain': queue.domains[position],
+                'last_review': queue.last_review[position],
+                'interval': int(queue.interval[position]),
+                'irt_difficulty': float(queue.difficulty[position]),
+                'average_quality': float(queue.average_quality[position]),
+                'priority_score': float(ranked.priority[position])
+            })
         
         return due_items
     
@@ -235,35 +228,19 @@ class SpacedRepetitionSystem:
         return stats
     
     def _get_or_create_item(self, question_id: int, user_id: int) -> SpacedRepetitionItem:
-        """Получение или создание элемента повторения"""
-        # Здесь должна быть логика работы с БД
-        # Пока возвращаем новый элемент
-        return SpacedRepetitionItem(
-            question_id=question_id,
-            user_id=user_id,
-            domain='THER',  # Должно получаться из вопроса
-            ease_factor=self.initial_ease_factor
-        )
+        """Получение или создание элемента повторения (домен - из вопроса)"""
+        return sr_scheduler.get_or_create_items(
+            user_id, [question_id], ease_factor=self.initial_ease_factor
+        )[question_id]
     
     def _get_irt_parameters(self, question_id: int) -> Optional[Dict]:
         """Получение IRT параметров вопроса"""
-        try:
-            irt_params = IRTParameters.query.filter_by(question_id=question_id).first()
-            if irt_params:
-                return {
-                    'difficulty': irt_params.difficulty,
-                    'discrimination': irt_params.discrimination,
-                    'guessing': irt_params.guessing
-                }
-        except:
-            pass
-        return None
+        return sr_scheduler.irt_parameters([question_id]).get(question_id)
     
     def _save_item(self, item: SpacedRepetitionItem):
         """Сохранение элемента в БД"""
-        # Здесь должна быть логика сохранения в БД
-        # Пока просто pass
-        pass
+        db.session.add(item)
+        db.session.commit()
 
 class AdaptiveReviewScheduler:
     """Адаптивный планировщик повторений с IRT"""
@@ -312,36 +289,9 @@ class AdaptiveReviewScheduler:
     
     def _prioritize_items(self, items: List[Dict], user_id: int) -> List[Dict]:
         """Приоритизация элементов для повторения"""
-        for item in items:
-            # Рассчитываем приоритет на основе:
-            # 1. Времени с последнего повторения
-            # 2. Сложности вопроса (IRT)
-            # 3. Истории ответов пользователя
-            
-            priority_score = self._calculate_item_priority(item, user_id)
-            item['priority_score'] = priority_score
-        
-        # Сортируем по приоритету
+        # priority_score рассчитан планировщиком (просрочка, IRT сложность, уверенность)
         return sorted(items, key=lambda x: x['priority_score'], reverse=True)
     
-    def _calculate_item_priority(self, item: Dict, user_id: int) -> float:
-        """Расчет приоритета элемента"""
-        # Базовый приоритет на основе времени
-        days_overdue = (datetime.now(timezone.utc) - item['last_review']).days
-        base_priority = days_overdue / max(1, item['interval'])
-        
-        # Корректировка на основе IRT сложности
-        irt_penalty = 1.0
-        if item.get('irt_difficulty', 0) > 1.0:
-            irt_penalty = 1.2  # Сложные вопросы получают приоритет
-        
-        # Корректировка на основе истории ответов
-        history_penalty = 1.0
-        if item.get('average_quality', 3.0) < 3.0:
-            history_penalty = 1.3  # Проблемные вопросы получают приоритет
-        
-        return base_priority * irt_penalty * history_penalty
-    
     def _estimate_review_time(self, item: Dict) -> int:
         """Оценка времени на повторение"""
         # Базовое время
@@ -0,0 +1,528 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Spaced Repetition Scheduler
+Единый планировщик повторений над SpacedRepetitionItem
+
+Очередь пользователя (или всех пользователей) загружается одним запросом
+вместе с IRT параметрами вопросов и доменом; способности по доменам - одним
+запросом к последним диагностическим сессиям. IRT-скорректированные
+интервалы, уверенность, скорость обучения и приоритеты считаются над
+массивами numpy по тем же формулам, что IRTSpacedIntegration.
+
+Очереди на следующий день для всех пользователей (schedule_all) сохраняются
+в ReviewQueueSnapshot; в этот день rank_due ранжирует только элементы
+сохраненной очереди, пока они не повторены.
+
+Используется IRTSpacedIntegration, SimpleSpacedRepetition / SimpleReviewScheduler
+и SpacedRepetitionSystem / AdaptiveReviewScheduler.
+"""
+
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from sqlalchemy import func
+
+from extensions import db
+from models import (
+    SpacedRepetitionItem, IRTParameters, Question, BIGDomain, DiagnosticSession, ReviewQueueSnapshot
+)
+
+logger = logging.getLogger(__name__)
+
+# Константы интеграции IRT + SR (общие с IRTSpacedIntegration)
+IRT_WEIGHT = 0.6
+SR_WEIGHT = 0.4
+EASY_QUESTION_MULTIPLIER = 1.2
+HARD_QUESTION_MULTIPLIER = 0.8
+INTERVAL_GAP = 0.5
+
+DEFAULT_DIFFICULTY = 0.0
+DEFAULT_DISCRIMINATION = 1.0
+DEFAULT_GUESSING = 0.0
+UNKNOWN_DOMAIN = 'unknown'
+
+SECONDS_PER_DAY = 86400.0
+
+
+def _as_utc(value: Optional[datetime]) -> Optional[datetime]:
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def _parse_session_data(data) -> Dict:
+    if not data:
+        return {}
+    if isinstance(data, str):
+        try:
+            return json.loads(data)
+        except ValueError:
+            return {}
+    return data
+
+
+# ----------------------------------------------------------------------
+# Векторные формулы
+# ----------------------------------------------------------------------
+
+def irt_adjusted_interval(difficulty: np.ndarray, ability: np.ndarray, base_interval: np.ndarray) -> np.ndarray:
+    """Интервал длиннее для легких (theta > b + 0.5) и короче для сложных (theta < b - 0.5) вопросов"""
+    base_interval = np.asarray(base_interval, dtype=np.float64)
+    return np.where(
+        ability > difficulty + INTERVAL_GAP, np.trunc(base_interval * EASY_QUESTION_MULTIPLIER),
+        np.where(ability < difficulty - INTERVAL_GAP, np.trunc(base_interval * HARD_QUESTION_MULTIPLIER), base_interval)
+    ).astype(np.int64)
+
+
+def confidence_level(difficulty: np.ndarray, ability: np.ndarray,
+                     repetitions: np.ndarray, quality: np.ndarray) -> np.ndarray:
+    """Взвешенная уверенность: логистическая IRT часть + история повторений"""
+    irt_confidence = 1.0 / (1.0 + np.exp(-(ability - difficulty)))
+    sr_confidence = np.minimum(1.0, repetitions * 0.2 + quality * 0.1)
+    return IRT_WEIGHT * irt_confidence + SR_WEIGHT * sr_confidence
+
+
+def learning_rate(ability: np.ndarray, difficulty: np.ndarray,
+                  repetitions: np.ndarray, quality: np.ndarray) -> np.ndarray:
+    base_rate = np.where(ability < difficulty, 1.2, 0.8)
+    return base_rate * (1.0 + (quality - 2.5) * 0.1) * (1.0 - repetitions * 0.05)
+
+
+def priority_score(next_review: np.ndarray, now: float, difficulty: np.ndarray,
+                   ability: np.ndarray, confidence: np.ndarray) -> np.ndarray:
+    """
+    Приоритет повторения: просрочка (до 10), близость сложности к theta,
+    неуверенность
+
+    Args:
+        next_review: Время следующего повторения (epoch seconds, NaN - нет)
+        now: Текущее время (epoch seconds)
+    """
+    overdue = np.where(next_review < now, np.floor((now - next_review) / SECONDS_PER_DAY), 0.0)
+    overdue_score = np.minimum(10.0, np.nan_to_num(overdue) * 0.5)
+    irt_score = 5.0 * (1.0 - np.abs(difficulty - ability))
+    return overdue_score + irt_score + (1.0 - confidence) * 3.0
+
+
+# ----------------------------------------------------------------------
+# Очередь
+# ----------------------------------------------------------------------
+
+@dataclass
+class ReviewQueue:
+    """Элементы повторения в виде параллельных массивов (порядок - по id)"""
+    item_ids: np.ndarray
+    user_ids: np.ndarray
+    question_ids: np.ndarray
+    domains: List[str]
+    ease_factor: np.ndarray
+    interval: np.ndarray
+    repetitions: np.ndarray
+    quality: np.ndarray
+    average_quality: np.ndarray
+    next_review: np.ndarray  # epoch seconds
+    last_review: List[Optional[datetime]]
+    difficulty: np.ndarray
+    discrimination: np.ndarray
+    guessing: np.ndarray
+    ability: np.ndarray = field(default=None)
+
+    def __len__(self):
+        return len(self.item_ids)
+
+
+@dataclass
+class RankedQueue:
+    """Очередь с рассчитанными IRT показателями и порядком по приоритету"""
+    queue: ReviewQueue
+    adjusted_interval: np.ndarray
+    confidence: np.ndarray
+    learning_rate: np.ndarray
+    priority: np.ndarray
+    order: np.ndarray  # позиции по убыванию приоритета
+
+    def top(self, k: Optional[int] = None) -> np.ndarray:
+        return self.order if k is None else self.order[:max(0, k)]
+
+
+def _empty_queue() -> ReviewQueue:
+    empty_int = np.empty(0, dtype=np.int64)
+    empty = np.empty(0)
+    return ReviewQueue(empty_int, empty_int, empty_int, [], empty, empty, empty, empty, empty,
+                       empty, [], empty, empty, empty, empty)
+
+
+class SpacedRepetitionScheduler:
+    """Пакетная загрузка очередей повторения и векторное ранжирование"""
+
+    def load_queue(self, user_ids: Optional[Iterable[int]] = None, domain: Optional[str] = None,
+                   due_before: Optional[datetime] = None,
+                   question_ids: Optional[Iterable[int]] = None) -> ReviewQueue:
+        """
+        Активные элементы повторения с IRT параметрами (один запрос)
+
+        Args:
+            user_ids: Пользователи (None - все)
+            domain: Фильтр по SpacedRepetitionItem.domain
+            due_before: Только элементы с next_review <= due_before
+            question_ids: Только эти вопросы (None - все)
+        """
+        query = db.session.query(
+            SpacedRepetitionItem.id,
+            SpacedRepetitionItem.user_id,
+            SpacedRepetitionItem.question_id,
+            SpacedRepetitionItem.ease_factor,
+            SpacedRepetitionItem.interval,
+            SpacedRepetitionItem.repetitions,
+            SpacedRepetitionItem.quality,
+            SpacedRepetitionItem.average_quality,
+            SpacedRepetitionItem.next_review,
+            SpacedRepetitionItem.last_review,
+            BIGDomain.code,
+            IRTParameters.difficulty,
+            IRTParameters.discrimination,
+            IRTParameters.guessing
+        ).join(
+            Question, Question.id == SpacedRepetitionItem.question_id
+        ).outerjoin(
+            BIGDomain, BIGDomain.id == Question.big_domain_id
+        ).outerjoin(
+            IRTParameters, IRTParameters.question_id == SpacedRepetitionItem.question_id
+        ).filter(SpacedRepetitionItem.is_active == True)
+
+        if user_ids is not None:
+            query = query.filter(SpacedRepetitionItem.user_id.in_(list(user_ids)))
+        if domain:
+            query = query.filter(SpacedRepetitionItem.domain == domain)
+        if due_before is not None:
+            query = query.filter(SpacedRepetitionItem.next_review <= due_before)
+        if question_ids is not None:
+            query = query.filter(SpacedRepetitionItem.question_id.in_(list(question_ids)))
+
+        rows = query.order_by(SpacedRepetitionItem.id).all()
+        if not rows:
+            return _empty_queue()
+
+        def column(index, default, dtype=np.float64):
+            return np.array([default if row[index] is None else row[index] for row in rows], dtype=dtype)
+
+        next_review = [_as_utc(row[8]) for row in rows]
+        return ReviewQueue(
+            item_ids=column(0, 0, np.int64),
+            user_ids=column(1, 0, np.int64),
+            question_ids=column(2, 0, np.int64),
+            domains=[row[10] or UNKNOWN_DOMAIN for row in rows],
+            ease_factor=column(3, 2.5),
+            interval=column(4, 1),
+            repetitions=column(5, 0),
+            quality=column(6, 0),
+            average_quality=column(7, 0.0),
+            next_review=np.array([value.timestamp() if value else np.nan for value in next_review]),
+            last_review=[_as_utc(row[9]) for row in rows],
+            difficulty=column(11, DEFAULT_DIFFICULTY),
+            discrimination=column(12, DEFAULT_DISCRIMINATION),
+            guessing=column(13, DEFAULT_GUESSING)
+        )
+
+    def load_abilities(self, user_ids: Optional[Iterable[int]] = None) -> Dict[int, Dict[str, float]]:
+        """Способности по доменам из последней диагностической сессии каждого пользователя"""
+        latest = db.session.query(func.max(DiagnosticSession.id)).group_by(DiagnosticSession.user_id)
+        if user_ids is not None:
+            latest = latest.filter(DiagnosticSession.user_id.in_(list(user_ids)))
+
+        abilities = {}
+        for user_id, session_data in db.session.query(
+            DiagnosticSession.user_id, DiagnosticSession.session_data
+        ).filter(DiagnosticSession.id.in_(latest)).all():
+            domain_abilities = _parse_session_data(session_data).get('domain_abilities') or {}
+            abilities[user_id] = {
+                code: float(value) for code, value in domain_abilities.items()
+                if isinstance(value, (int, float))
+            }
+        return abilities
+
+    def _attach_abilities(self, queue: ReviewQueue, abilities: Dict[int, Dict[str, float]]):
+        queue.ability = np.array([
+            abilities.get(int(user_id), {}).get(domain, 0.0)
+            for user_id, domain in zip(queue.user_ids, queue.domains)
+        ], dtype=np.float64)
+
+    def rank(self, queue: ReviewQueue, now: Optional[datetime] = None) -> RankedQueue:
+        """IRT показатели и приоритеты для всей очереди"""
+        now = (now or datetime.now(timezone.utc)).timestamp()
+        adjusted = irt_adjusted_interval(queue.difficulty, queue.ability, queue.interval)
+        confidence = confidence_level(queue.difficulty, queue.ability, queue.repetitions, queue.quality)
+        rate = learning_rate(queue.ability, queue.difficulty, queue.repetitions, queue.quality)
+        priority = priority_score(queue.next_review, now, queue.difficulty, queue.ability, confidence)
+        return RankedQueue(
+            queue=queue,
+            adjusted_interval=adjusted,
+            confidence=confidence,
+            learning_rate=rate,
+            priority=priority,
+            order=np.argsort(-priority, kind='stable')
+        )
+
+    def rank_due(self, user_id: int, domain: Optional[str] = None,
+                 now: Optional[datetime] = None) -> RankedQueue:
+        """
+        Готовые к повторению элементы пользователя, упорядоченные по приоритету
+
+        Если на сегодня сохранена очередь (schedule_all), ранжируются ее еще не
+        повторенные элементы; когда она пройдена - все готовые элементы.
+        """
+        now = now or datetime.now(timezone.utc)
+        queue = None
+        scheduled = self.scheduled_queue(user_id, now.date()) if domain is None else None
+        if scheduled:
+            queue = self.load_queue([user_id], due_before=now, question_ids=scheduled)
+        if queue is None or not len(queue):
+            queue = self.load_queue([user_id], domain=domain, due_before=now)
+        self._attach_abilities(queue, self.load_abilities([user_id]) if len(queue) else {})
+        return self.rank(queue, now)
+
+    @staticmethod
+    def limit(minutes: Optional[float] = None, k: Optional[int] = None, minutes_per_item: float = 3) -> Optional[int]:
+        """Количество элементов, помещающихся в N минут (и не больше k)"""
+        limits = [value for value in (k, int(minutes // minutes_per_item) if minutes is not None else None)
+                  if value is not None]
+        return min(limits) if limits else None
+
+    def top_k_due(self, user_id: int, minutes: Optional[float] = None, k: Optional[int] = None,
+                  domain: Optional[str] = None, minutes_per_item: float = 3) -> List:
+        """
+        Топ-k готовых к повторению элементов, помещающихся в N минут
+
+        Returns:
+            Список IRTSpacedItem по убыванию приоритета
+        """
+        ranked = self.rank_due(user_id, domain=domain)
+        return self.to_items(ranked, ranked.top(self.limit(minutes, k, minutes_per_item)))
+
+    def to_items(self, ranked: RankedQueue, positions: np.ndarray) -> List:
+        """IRTSpacedItem для выбранных позиций очереди"""
+        from utils.irt_spaced_integration import IRTSpacedItem
+
+        queue = ranked.queue
+        items = []
+        for position in positions:
+            next_review = queue.next_review[position]
+            items.append(IRTSpacedItem(
+                question_id=int(queue.question_ids[position]),
+                user_id=int(queue.user_ids[position]),
+                domain=queue.domains[position],
+                irt_difficulty=float(queue.difficulty[position]),
+                irt_discrimination=float(queue.discrimination[position]),
+                irt_guessing=float(queue.guessing[position]),
+                user_ability=float(queue.ability[position]),
+                ease_factor=float(queue.ease_factor[position]),
+                interval=int(queue.interval[position]),
+                repetitions=int(queue.repetitions[position]),
+                quality=int(queue.quality[position]),
+                next_review=None if np.isnan(next_review) else datetime.fromtimestamp(next_review, timezone.utc),
+                last_review=queue.last_review[position],
+                irt_adjusted_interval=int(ranked.adjusted_interval[position]),
+                confidence_level=float(ranked.confidence[position]),
+                learning_rate=float(ranked.learning_rate[position])
+            ))
+        return items
+
+    # ------------------------------------------------------------------
+    # Пакетные get/create
+    # ------------------------------------------------------------------
+
+    def irt_parameters(self, question_ids: Iterable[int]) -> Dict[int, Dict]:
+        """IRT параметры вопросов одним запросом"""
+        question_ids = list(question_ids)
+        if not question_ids:
+            return {}
+        return {
+            question_id: {'difficulty': difficulty, 'discrimination': discrimination, 'guessing': guessing}
+            for question_id, difficulty, discrimination, guessing in db.session.query(
+                IRTParameters.question_id, IRTParameters.difficulty,
+                IRTParameters.discrimination, IRTParameters.guessing
+            ).filter(IRTParameters.question_id.in_(question_ids)).all()
+        }
+
+    def get_or_create_items(self, user_id: int, question_ids: Iterable[int],
+                            ease_factor: float = 2.5) -> Dict[int, SpacedRepetitionItem]:
+        """Элементы повторения пользователя; отсутствующие создаются (домен - из вопроса)"""
+        question_ids = list(dict.fromkeys(question_ids))
+        items = {
+            item.question_id: item
+            for item in SpacedRepetitionItem.query.filter(
+                SpacedRepetitionItem.user_id == user_id,
+                SpacedRepetitionItem.question_id.in_(question_ids)
+            ).all()
+        } if question_ids else {}
+
+        missing = [question_id for question_id in question_ids if question_id not in items]
+        if missing:
+            domains = dict(db.session.query(Question.id, Question.domain).filter(Question.id.in_(missing)).all())
+            next_review = datetime.now(timezone.utc) + timedelta(days=1)
+            for question_id in missing:
+                item = SpacedRepetitionItem(
+                    user_id=user_id,
+                    question_id=question_id,
+                    domain=domains.get(question_id),
+                    next_review=next_review,
+                    ease_factor=ease_factor
+                )
+                db.session.add(item)
+                items[question_id] = item
+            db.session.flush()  # Получаем ID
+        return items
+
+    # ------------------------------------------------------------------
+    # Пакетный режим (все пользователи)
+    # ------------------------------------------------------------------
+
+    def schedule_all(self, minutes: float = 30, minutes_per_item: float = 3,
+                     due_before: Optional[datetime] = None, persist: bool = True) -> Dict[int, List[int]]:
+        """
+        Очереди повторений на следующий день для всех пользователей за один проход
+
+        Args:
+            minutes: Время на повторения в день
+            minutes_per_item: Оценка времени на одно повторение
+            due_before: Граница готовности (по умолчанию - конец следующего дня UTC)
+            persist: Сохранить очереди в ReviewQueueSnapshot на день due_before
+
+        Returns:
+            {user_id: [question_id, ...]} по убыванию приоритета
+        """
+        if due_before is None:
+            tomorrow = datetime.now(timezone.utc).date() + timedelta(days=1)
+            due_before = datetime.combine(tomorrow, datetime.max.time()).replace(tzinfo=timezone.utc)
+
+        queue = self.load_queue(due_before=due_before)
+        queues = {}
+        if len(queue):
+            self._attach_abilities(queue, self.load_abilities())
+            # Просрочка считается на момент следующего дня
+            ranked = self.rank(queue, due_before)
+
+            per_user = self.limit(minutes, None, minutes_per_item)
+            order = np.lexsort((-ranked.priority, queue.user_ids))
+            users, starts, counts = np.unique(queue.user_ids[order], return_index=True, return_counts=True)
+            queues = {
+                int(user_id): queue.question_ids[order[start:start + min(count, per_user)]].tolist()
+                for user_id, start, count in zip(users, starts, counts)
+            }
+        if persist:
+            self.save_queues(queues, due_before.date(), minutes)
+        return queues
+
+    # ------------------------------------------------------------------
+    # Сохраненные очереди
+    # ------------------------------------------------------------------
+
+    def save_queues(self, queues: Dict[int, List[int]], queue_date: date, minutes: float = 30) -> int:
+        """Заменить очереди на день queue_date (удаление + пакетная вставка)"""
+        ReviewQueueSnapshot.query.filter(ReviewQueueSnapshot.queue_date == queue_date).delete(
+            synchronize_session=False
+        )
+        if queues:
+            generated_at = datetime.now(timezone.utc)
+            db.session.execute(ReviewQueueSnapshot.__table__.insert(), [
+                {
+                    'user_id': user_id,
+                    'queue_date': queue_date,
+                    'minutes': int(minutes),
+                    'question_ids': question_ids,
+                    'generated_at': generated_at
+                }
+                for user_id, question_ids in queues.items()
+            ])
+        db.session.commit()
+        return len(queues)
+
+    def scheduled_queue(self, user_id: int, queue_date: Optional[date] = None) -> Optional[List[int]]:
+        """Сохраненная очередь пользователя на день (None - не рассчитана)"""
+        queue_date = queue_date or datetime.now(timezone.utc).date()
+        row = db.session.query(ReviewQueueSnapshot.question_ids).filter(
+            ReviewQueueSnapshot.user_id == user_id,
+            ReviewQueueSnapshot.queue_date == queue_date
+        ).first()
+        return list(row[0]) if row and row[0] is not None else None
+
+
+# Глобальный экземпляр планировщика
+sr_scheduler = SpacedRepetitionScheduler()
+
+
+def top_k_due(user_id: int, minutes: Optional[float] = None, k: Optional[int] = None,
+              domain: Optional[str] = None, minutes_per_item: float = 3) -> List:
+    """Топ-k готовых к повторению элементов в пределах N минут"""
+    return sr_scheduler.top_k_due(user_id, minutes, k, domain, minutes_per_item)
+
+
+def schedule_all_review_queues(minutes: float = 30, minutes_per_item: float = 3,
+                               persist: bool = True) -> Dict[int, List[int]]:
+    """Очереди повторений на следующий день для всех пользователей (сохраняются в ReviewQueueSnapshot)"""
+    return sr_scheduler.schedule_all(minutes, minutes_per_item, persist=persist)
+
+
+def benchmark_scheduler(user_ids: Optional[List[int]] = None, sample: int = 50, max_items: int = 20) -> Dict:
+    """
+    Сравнение с поэлементным путем (create_integrated_item + _calculate_priority_score)
+
+    Returns:
+        Время, количество SQL запросов и совпадение топ-k для обоих путей
+    """
+    from utils.irt_spaced_integration import get_irt_spaced_integration
+    from utils.plan_instrumentation import instrument_plan_build
+
+    integration = get_irt_spaced_integration()
+    if user_ids is None:
+        user_ids = [row[0] for row in db.session.query(SpacedRepetitionItem.user_id).filter(
+            SpacedRepetitionItem.is_active == True
+        ).distinct().limit(sample).all()]
+
+    result = {'users': len(user_ids), 'max_items': max_items, 'matching_users': 0}
+    now = datetime.now(timezone.utc)
+
+    started = time.perf_counter()
+    with instrument_plan_build(None, 'sr_per_item_benchmark') as per_item_stats:
+        per_item = {}
+        for user_id in user_ids:
+            items = []
+            for sr_item in SpacedRepetitionItem.query.filter_by(user_id=user_id, is_active=True).filter(
+                SpacedRepetitionItem.next_review <= now
+            ).all():
+                try:
+                    items.append(integration.create_integrated_item(sr_item.question_id, user_id))
+                except Exception:
+                    continue
+            items.sort(key=integration._calculate_priority_score, reverse=True)
+            per_item[user_id] = [item.question_id for item in items[:max_items]]
+    result['per_item_seconds'] = round(time.perf_counter() - started, 4)
+    result['per_item_queries'] = per_item_stats.query_count
+
+    started = time.perf_counter()
+    with instrument_plan_build(None, 'sr_vectorized_benchmark') as vectorized_stats:
+        vectorized = {
+            user_id: [item.question_id for item in sr_scheduler.top_k_due(user_id, k=max_items)]
+            for user_id in user_ids
+        }
+    result['vectorized_seconds'] = round(time.perf_counter() - started, 4)
+    result['vectorized_queries'] = vectorized_stats.query_count
+
+    started = time.perf_counter()
+    with instrument_plan_build(None, 'sr_bulk_benchmark') as bulk_stats:
+        bulk = sr_scheduler.schedule_all(minutes=max_items * 3, due_before=now, persist=False)
+    result['bulk_seconds'] = round(time.perf_counter() - started, 4)
+    result['bulk_queries'] = bulk_stats.query_count
+    result['bulk_users'] = len(bulk)
+
+    # Совпадение наборов (порядок равных приоритетов может различаться)
+    result['matching_users'] = sum(
+        1 for user_id in user_ids if set(per_item[user_id]) == set(vectorized[user_id])
+    )
+    return result
@@ -1,158 +1,303 @@
 """
 Единая система статистики для всего приложения
 Унифицирует расчет и отображение статистики на всех страницах
+
+Все агрегаты пользователя считаются одним сгруппированным запросом по
+(пользователь, путь обучения, день). Результаты хранятся в хранилище кэша
+utils.cache_manager (пространство имен 'user_stats'): track_lesson_progress
+удаляет запись пользователя. Для SQLite хранилища или локального с журналом
+инвалидаций (IRT_CACHE_BACKEND / IRT_CACHE_INVALIDATION_PATH) удаление видят
+все воркеры; с локальным хранилищем без журнала другие воркеры отдают старую
+статистику до истечения STATS_CACHE_TTL_SECONDS.
+
+Версии пользователей (_stats_versions) локальны для процесса и ограничены
+STATS_CACHE_MAX_USERS: они только не дают сохранить результат расчета,
+начатого до изменения прогресса в этом же процессе. В пределах одного
+запроса статистика дополнительно мемоизируется в flask.g.
 """
 
-from flask import current_app
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app, g, has_request_context
 from flask_login import current_user
-from sqlalchemy import func
+from sqlalchemy import func, case
 from datetime import datetime, timedelta, timezone
 from models import db, UserProgress, Lesson, Module, Subject, LearningPath
+from utils.cache_manager import cache_manager
 import logging
 
-# Кэш для статистики
-_stats_cache = {}
+# Ограничения кэша статистики
+STATS_CACHE_MAX_USERS = 5000
+STATS_CACHE_TTL_SECONDS = 300
+CATALOG_CACHE_TTL_SECONDS = 600
+BULK_CHUNK_SIZE = 500
+
+# Пространство имен статистики в хранилище cache_manager: str(user_id) -> {'day', 'stats'}
+STATS_NAMESPACE = 'user_stats'
+
+# Версии статистики в этом процессе: user_id -> version (LRU, не более STATS_CACHE_MAX_USERS)
+_stats_versions = OrderedDict()
+_stats_lock = threading.Lock()
+
+# Кэш каталога (количество уроков по путям обучения) - одинаков для всех пользователей
+_catalog_cache = {'loaded_at': 0.0, 'catalog': None}
+
+
+def bump_stats_version(user_id):
+    """Увеличивает версию статистики пользователя - кэшированные данные становятся устаревшими"""
+    with _stats_lock:
+        _stats_versions[user_id] = _stats_versions.get(user_id, 0) + 1
+        _stats_versions.move_to_end(user_id)
+        while len(_stats_versions) > STATS_CACHE_MAX_USERS:
+            _stats_versions.popitem(last=False)
+    cache_manager.backend.delete(STATS_NAMESPACE, str(user_id))
+    if has_request_context():
+        g.pop('_unified_stats', None)
+
 
 def clear_stats_cache(user_id=None):
     """Очищает кэш статистики"""
-    global _stats_cache
     if user_id is None:
-        _stats_cache.clear()
+        cache_manager.backend.clear(STATS_NAMESPACE)
+        _catalog_cache['catalog'] = None
+        if has_request_context():
+            g.pop('_unified_stats', None)
     else:
-        _stats_cache.pop(user_id, None)
+        bump_stats_version(user_id)
 
-def get_unified_user_stats(user_id):
+
+def _request_memo():
+    """Мемоизация статистики в пределах одного HTTP запроса"""
+    if not has_request_context():
+        return None
+    if '_unified_stats' not in g:
+        g._unified_stats = {}
+    return g._unified_stats
+
+
+def _get_cached(user_id, today):
+    entry = cache_manager.backend.get(STATS_NAMESPACE, str(user_id))
+    if entry is None or entry.get('day') != today.isoformat():
+        return None
+    return entry['stats']
+
+
+def _store_cached(user_id, today, stats, version):
+    with _stats_lock:
+        if version != _stats_versions.get(user_id, 0):
+            # Прогресс изменился во время расчета - не кэшируем
+            return
+    cache_manager.backend.set(STATS_NAMESPACE, str(user_id), {'day': today.isoformat(), 'stats': stats},
+                              ttl_seconds=STATS_CACHE_TTL_SECONDS)
+
+
+def _get_lesson_catalog():
+    """Количество уроков всего и по путям обучения (два запроса, кэшируется)"""
+    now = time.monotonic()
+    catalog = _catalog_cache['catalog']
+    if catalog is not None and now - _catalog_cache['loaded_at'] < CATALOG_CACHE_TTL_SECONDS:
+        return catalog
+    
+    path_counts = dict(
+        db.session.query(Subject.learning_path_id, func.count(Lesson.id)).join(
+            Module, Module.id == Lesson.module_id
+        ).join(
+            Subject, Subject.id == Module.subject_id
+        ).group_by(Subject.learning_path_id).all()
+    )
+    
+    catalog = {
+        'total_lessons': Lesson.query.count(),
+        'paths': [
+            {'id': path_id, 'name': name, 'total_lessons': path_counts.get(path_id, 0)}
+            for path_id, name in db.session.query(LearningPath.id, LearningPath.name).order_by(LearningPath.id).all()
+        ]
+    }
+    _catalog_cache['catalog'] = catalog
+    _catalog_cache['loaded_at'] = now
+    return catalog
+
+
+def _empty_stats():
+    return {
+        'overall_progress': 0,
+        'completed_lessons': 0,
+        'total_lessons': 0,
+        'total_time_spent': 0,
+        'active_days': 0,
+        'learning_paths': [],
+        'last_activity': None,
+        'today_lessons': 0,
+        'weekly_lessons': 0,
+        'level': 1,
+        'experience_points': 0,
+        'next_level_progress': 0
+    }
+
+
+def _compute_stats_bulk(user_ids):
     """
-    Единая функция получения статистики пользователя
-    Используется на всех страницах приложения
+    Рассчитать статистику для списка пользователей одним сгруппированным запросом
+    
+    Группировка по (пользователь, путь обучения, день последнего доступа) дает
+    все агрегаты: завершенные уроки по путям, время, активные дни,
+    последнюю активность, активность за сегодня и за неделю.
     """
-    # Проверяем кэш
-    if user_id in _stats_cache:
-        return _stats_cache[user_id]
+    catalog = _get_lesson_catalog()
+    today = datetime.now().date()
+    today_key = today.isoformat()
+    week_ago_key = (today - timedelta(days=7)).isoformat()
     
-    try:
-        current_app.logger.info(f"=== Получение унифицированной статистики для пользователя {user_id} ===")
-        
-        # 1. Общее количество завершенных уроков
-        completed_lessons_count = UserProgress.query.filter_by(
-            user_id=user_id,
-            completed=True
-        ).count()
-        
-        # 2. Общее количество уроков
-        total_lessons_count = Lesson.query.count()
-        
-        # 3. Расчет общего прогресса
-        overall_progress = round((completed_lessons_count / total_lessons_count) * 100) if total_lessons_count > 0 else 0
-        
-        # 4. Общее время обучения (в минутах)
-        total_time_spent = db.session.query(
-            func.sum(UserProgress.time_spent)
-        ).filter_by(
-            user_id=user_id
-        ).scalar() or 0
-        
-        # 5. Количество дней активности
-        active_days_count = db.session.query(
-            func.count(func.distinct(func.date(UserProgress.last_accessed)))
-        ).filter_by(
-            user_id=user_id
-        ).scalar() or 0
+    accumulators = {
+        user_id: {
+            'completed': 0, 'time': 0.0, 'days': set(), 'last': None,
+            'today': 0, 'weekly': 0, 'paths': {}
+        }
+        for user_id in user_ids
+    }
+    
+    day = func.date(UserProgress.last_accessed)
+    for start in range(0, len(user_ids), BULK_CHUNK_SIZE):
+        chunk = user_ids[start:start + BULK_CHUNK_SIZE]
+        rows = db.session.query(
+            UserProgress.user_id,
+            Subject.learning_path_id,
+            day,
+            func.count(UserProgress.id),
+            func.sum(case((UserProgress.completed == True, 1), else_=0)),
+            func.coalesce(func.sum(UserProgress.time_spent), 0),
+            func.max(UserProgress.last_accessed)
+        ).outerjoin(
+            Lesson, Lesson.id == UserProgress.lesson_id
+        ).outerjoin(
+            Module, Module.id == Lesson.module_id
+        ).outerjoin(
+            Subject, Subject.id == Module.subject_id
+        ).filter(
+            UserProgress.user_id.in_(chunk)
+        ).group_by(
+            UserProgress.user_id, Subject.learning_path_id, day
+        ).all()
         
-        # 6. Статистика по путям обучения
+        for user_id, path_id, day_value, row_count, completed, time_spent, last_accessed in rows:
+            acc = accumulators[user_id]
+            completed = int(completed or 0)
+            acc['completed'] += completed
+            acc['time'] += float(time_spent or 0)
+            if path_id is not None:
+                acc['paths'][path_id] = acc['paths'].get(path_id, 0) + completed
+            if last_accessed is not None and (acc['last'] is None or last_accessed > acc['last']):
+                acc['last'] = last_accessed
+            if day_value is not None:
+                day_key = str(day_value)[:10]
+                acc['days'].add(day_key)
+                if day_key == today_key:
+                    acc['today'] += row_count
+                if day_key >= week_ago_key:
+                    acc['weekly'] += row_count
+    
+    total_lessons = catalog['total_lessons']
+    results = {}
+    for user_id, acc in accumulators.items():
+        completed_lessons_count = acc['completed']
         learning_paths_stats = []
-        for path in LearningPath.query.all():
-            # Получаем все уроки для данного пути обучения
-            path_lessons = db.session.query(Lesson.id).join(
-                Module, Module.id == Lesson.module_id
-            ).join(
-                Subject, Subject.id == Module.subject_id
-            ).filter(
-                Subject.learning_path_id == path.id
-            ).all()
-            
-            path_lesson_ids = [lesson[0] for lesson in path_lessons]
-            path_total_lessons = len(path_lesson_ids)
-            
-            # Количество завершенных уроков для этого пути
-            path_completed_lessons = UserProgress.query.filter(
-                UserProgress.user_id == user_id,
-                UserProgress.lesson_id.in_(path_lesson_ids),
-                UserProgress.completed == True
-            ).count() if path_lesson_ids else 0
-            
-            # Расчет прогресса для данного пути
-            path_progress = round((path_completed_lessons / path_total_lessons) * 100) if path_total_lessons > 0 else 0
-            
+        for path in catalog['paths']:
+            path_total_lessons = path['total_lessons']
+            path_completed_lessons = acc['paths'].get(path['id'], 0) if path_total_lessons else 0
             learning_paths_stats.append({
-                'id': path.id,
-                'name': path.name,
-                'progress': path_progress,
+                'id': path['id'],
+                'name': path['name'],
+                'progress': round((path_completed_lessons / path_total_lessons) * 100) if path_total_lessons > 0 else 0,
                 'completed_lessons': path_completed_lessons,
                 'total_lessons': path_total_lessons
             })
         
-        # 7. Дополнительная статистика
-        # Последняя активность
-        last_activity = db.session.query(
-            func.max(UserProgress.last_accessed)
-        ).filter_by(
-            user_id=user_id
-        ).scalar()
-        
-        # Сегодняшняя активность
-        today = datetime.now().date()
-        today_lessons = UserProgress.query.filter(
-            UserProgress.user_id == user_id,
-            func.date(UserProgress.last_accessed) == today
-        ).count()
-        
-        # Недельная активность
-        week_ago = today - timedelta(days=7)
-        weekly_lessons = UserProgress.query.filter(
-            UserProgress.user_id == user_id,
-            UserProgress.last_accessed >= week_ago
-        ).count()
-        
-        # Формируем итоговую статистику
-        stats = {
-            'overall_progress': overall_progress,
+        results[user_id] = {
+            'overall_progress': round((completed_lessons_count / total_lessons) * 100) if total_lessons > 0 else 0,
             'completed_lessons': completed_lessons_count,
-            'total_lessons': total_lessons_count,
-            'total_time_spent': round(float(total_time_spent), 1),
-            'active_days': active_days_count,
+            'total_lessons': total_lessons,
+            'total_time_spent': round(acc['time'], 1),
+            'active_days': len(acc['days']),
             'learning_paths': learning_paths_stats,
-            'last_activity': last_activity.isoformat() if last_activity else None,
-            'today_lessons': today_lessons,
-            'weekly_lessons': weekly_lessons,
+            'last_activity': acc['last'].isoformat() if acc['last'] else None,
+            'today_lessons': acc['today'],
+            'weekly_lessons': acc['weekly'],
             'level': min(completed_lessons_count // 10 + 1, 10),
             'experience_points': completed_lessons_count * 10,
             'next_level_progress': (completed_lessons_count % 10) * 10
         }
-        
-        current_app.logger.info(f"=== Унифицированная статистика получена: {stats} ===")
-        
-        # Сохраняем в кэш
-        _stats_cache[user_id] = stats
-        
+    
+    return results
+
+
+def get_unified_user_stats_bulk(user_ids):
+    """
+    Статистика для многих пользователей сразу (админка, рейтинги)
+    
+    Кэшированные пользователи берутся из кэша, остальные считаются
+    одним сгруппированным запросом на пачку из BULK_CHUNK_SIZE пользователей.
+    
+    Returns:
+        dict user_id -> stats
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    today = datetime.now().date()
+    results = {}
+    missing = []
+    
+    for user_id in user_ids:
+        stats = _get_cached(user_id, today)
+        if stats is not None:
+            results[user_id] = stats
+        else:
+            missing.append(user_id)
+    
+    if missing:
+        with _stats_lock:
+            versions = {user_id: _stats_versions.get(user_id, 0) for user_id in missing}
+        try:
+            computed = _compute_stats_bulk(missing)
+        except Exception as e:
+            current_app.logger.error(f"Ошибка в get_unified_user_stats_bulk: {str(e)}", exc_info=True)
+            computed = {user_id: _empty_stats() for user_id in missing}
+            versions = {}
+        for user_id, stats in computed.items():
+            if user_id in versions:
+                _store_cached(user_id, today, stats, versions[user_id])
+            results[user_id] = stats
+    
+    return results
+
+
+def get_unified_user_stats(user_id):
+    """
+    Единая функция получения статистики пользователя
+    Используется на всех страницах приложения
+    """
+    memo = _request_memo()
+    if memo is not None and user_id in memo:
+        return memo[user_id]
+    
+    today = datetime.now().date()
+    stats = _get_cached(user_id, today)
+    if stats is not None:
+        if memo is not None:
+            memo[user_id] = stats
+        return stats
+    
+    try:
+        with _stats_lock:
+            version = _stats_versions.get(user_id, 0)
+        stats = _compute_stats_bulk([user_id])[user_id]
+        _store_cached(user_id, today, stats, version)
+        if memo is not None:
+            memo[user_id] = stats
         return stats
         
     except Exception as e:
         current_app.logger.error(f"Ошибка в get_unified_user_stats: {str(e)}", exc_info=True)
-        return {
-            'overall_progress': 0,
-            'completed_lessons': 0,
-            'total_lessons': 0,
-            'total_time_spent': 0,
-            'active_days': 0,
-            'learning_paths': [],
-            'last_activity': None,
-            'today_lessons': 0,
-            'weekly_lessons': 0,
-            'level': 1,
-            'experience_points': 0,
-            'next_level_progress': 0
-        }
+        return _empty_stats()
 
 def track_lesson_progress(user_id, lesson_id, time_spent=None, completed=False):
     """
@@ -205,9 +350,9 @@ def track_lesson_progress(user_id, lesson_id, time_spent=None, completed=False):
         print(f"✅ Прогресс сохранен в БД для урока {lesson_id}")
         current_app.logger.info(f"✅ Прогресс сохранен в БД для урока {lesson_id}")
         
-        # Очищаем кэш статистики пользователя
-        clear_stats_cache(user_id)
-        print(f"🗑️ Кэш статистики очищен для пользователя {user_id}")
+        # Новая версия статистики пользователя - кэш устарел
+        bump_stats_version(user_id)
+        print(f"🗑️ Версия статистики обновлена для пользователя {user_id}")
         
         return True
         
@@ -294,8 +439,10 @@ def get_subject_stats_unified(subject_id, user_id):
 # Экспортируем функции для использования в других модулях
 __all__ = [
     'get_unified_user_stats',
+    'get_unified_user_stats_bulk',
     'track_lesson_progress', 
     'get_module_stats_unified',
     'get_subject_stats_unified',
-    'clear_stats_cache'
+    'clear_stats_cache',
+    'bump_stats_version'
 ] 
\ No newline at end of file